@@ -16,6 +16,8 @@ import time
 from collections import defaultdict
 
 from app.core.database import get_db
+from app.core.api_keys import api_key_digest, api_key_cache, last_used_recorder
+from app.core.principals import principal_cache
 from app.core.security import (
     verify_password,
     get_password_hash,
@@ -238,6 +240,46 @@ class UserResponse(BaseModel):
 
 
 # Dependency to get current user
+def _verify_api_key(db: Session, raw_key: str) -> Optional[dict]:
+    """Resolve a raw ``dk_`` key to ``{key_id, user_id, expires_at}`` or None.
+
+    Order: in-memory cache → indexed digest lookup → bcrypt fallback over
+    legacy keys sharing the prefix that have no digest yet. A bcrypt match
+    stores the digest so later requests take the indexed path; keys that
+    already have a digest never go through bcrypt.
+    """
+    digest = api_key_digest(raw_key)
+    cached = api_key_cache.get(digest)
+    if cached is not None:
+        return cached
+
+    key = db.query(ApiKey).filter(ApiKey.key_digest == digest, ApiKey.is_active == True).first()
+    if key is None:
+        candidates = (
+            db.query(ApiKey)
+            .filter(
+                ApiKey.key_prefix == raw_key[:8],
+                ApiKey.key_digest.is_(None),
+                ApiKey.is_active == True,
+            )
+            .all()
+        )
+        for candidate in candidates:
+            if verify_password(raw_key, candidate.key_hash):
+                key = candidate
+                break
+        if key is None:
+            return None
+        try:
+            key.key_digest = digest
+            db.commit()
+        except Exception:
+            db.rollback()
+
+    api_key_cache.put(digest, key.id, key.user_id, key.expires_at)
+    return api_key_cache.get(digest)
+
+
 async def get_current_user(
     request: Request,
     token: Optional[str] = Depends(oauth2_scheme),
@@ -252,21 +294,7 @@ async def get_current_user(
     # --- Try X-API-Key header first ---
     api_key_header = request.headers.get("X-API-Key")
     if api_key_header and api_key_header.startswith("dk_"):
-        # Look up all active keys for this user prefix (first 8 chars)
-        prefix = api_key_header[:8]
-        candidate_keys = (
-            db.query(ApiKey)
-            .filter(
-                ApiKey.key_prefix == prefix,
-                ApiKey.is_active == True,
-            )
-            .all()
-        )
-        matched_key = None
-        for candidate in candidate_keys:
-            if verify_password(api_key_header, candidate.key_hash):
-                matched_key = candidate
-                break
+        matched_key = _verify_api_key(db, api_key_header)
 
         if matched_key is None:
             raise HTTPException(
@@ -276,34 +304,32 @@ async def get_current_user(
             )
 
         # Check expiry
-        if matched_key.expires_at and matched_key.expires_at < datetime.utcnow():
+        if matched_key["expires_at"] and matched_key["expires_at"] < datetime.utcnow():
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="API key has expired",
             )
 
         # Rate limit per API key
+        key_id = matched_key["key_id"]
         now = time.time()
         cutoff = now - 60
-        _api_key_rate[matched_key.id] = [t for t in _api_key_rate[matched_key.id] if t > cutoff]
-        if len(_api_key_rate[matched_key.id]) >= _API_KEY_RPM:
+        _api_key_rate[key_id] = [t for t in _api_key_rate[key_id] if t > cutoff]
+        if len(_api_key_rate[key_id]) >= _API_KEY_RPM:
             raise HTTPException(
                 status_code=status.HTTP_429_TOO_MANY_REQUESTS,
                 detail="API key rate limit exceeded (60 req/min)",
             )
-        _api_key_rate[matched_key.id].append(now)
+        _api_key_rate[key_id].append(now)
 
-        # Update last_used
-        try:
-            matched_key.last_used = datetime.utcnow()
-            db.commit()
-        except Exception:
-            db.rollback()
+        # Update last_used (coalesced, written in batches)
+        last_used_recorder.record(key_id)
 
         # Load the associated user
-        user = db.query(User).filter(User.id == matched_key.user_id).first()
+        user = db.query(User).filter(User.id == matched_key["user_id"]).first()
         if user is None or not user.is_active:
             raise HTTPException(status_code=400, detail="Inactive user")
+        request.state.user_id = user.id
         return user
 
     # --- Fall back to JWT Bearer token ---
@@ -318,19 +344,26 @@ async def get_current_user(
     if username is None:
         raise credentials_exception
 
-    user = db.query(User).filter(User.username == username).first()
+    # Resolved principals are cached per (username, token_version); any change
+    # to the user row (role, active flag, token_version) evicts the entry.
+    token_version = payload.get("tv", 0)
+    user = principal_cache.get(db, username, token_version)
     if user is None:
-        raise credentials_exception
+        user = db.query(User).filter(User.username == username).first()
+        if user is None:
+            raise credentials_exception
+        principal_cache.put(user, token_version)
 
     if not user.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
 
     # Check token_version for session invalidation
-    token_version = payload.get("tv", 0)
     user_token_version = getattr(user, "token_version", 0) or 0
     if token_version < user_token_version:
         raise credentials_exception
 
+    # Shared with audit_middleware so it doesn't decode the token again
+    request.state.user_id = user.id
     return user
 
 
@@ -1358,6 +1391,7 @@ async def create_api_key(
         user_id=current_user.id,
         name=data.name.strip(),
         key_hash=key_hash,
+        key_digest=api_key_digest(raw_key),
         key_prefix=key_prefix,
         expires_at=data.expires_at,
         is_active=True,
@@ -1408,6 +1442,7 @@ async def revoke_api_key(
 
     api_key.is_active = False
     db.commit()
+    api_key_cache.invalidate_key(api_key.id)
 
     # Audit log: API key revoked
     try:
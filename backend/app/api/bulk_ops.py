@@ -1,13 +1,12 @@
 """Bulk VM operations and automation scripts — operate on many VMs at once."""
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import Optional, List, Any, Dict
 from app.core.database import get_db
-from app.models import ProxmoxHost
+from app.models import ProxmoxHost, UserRole
 from app.api.auth import get_current_user, require_operator
 from app.services.proxmox import ProxmoxService
-from app.core.cache import pve_cache
 import logging
 import time as _time
 
@@ -30,6 +29,51 @@ def _pve(host: ProxmoxHost):
     return ProxmoxService(host).proxmox
 
 
+def _targets(vms: List["VMTarget"]) -> List[Dict[str, Any]]:
+    return [{"host_id": vm.host_id, "node": vm.node, "vmid": vm.vmid} for vm in vms]
+
+
+def _qemu_targets(host_id: int, pve) -> List[Dict[str, Any]]:
+    """Every QEMU VM on the host, from a single cluster/resources call."""
+    try:
+        resources = pve.cluster.resources.get(type="vm")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return [
+        {
+            "host_id": host_id,
+            "node": r["node"],
+            "vmid": r["vmid"],
+            "name": r.get("name", str(r["vmid"])),
+            "status": r.get("status", ""),
+            "maxcpu": r.get("maxcpu", 0),
+            "maxmem": r.get("maxmem", 0) or 0,
+        }
+        for r in resources
+        if r.get("type") == "qemu" and r.get("node") and r.get("vmid")
+    ]
+
+
+def _submit(kind: str, items: List[Dict[str, Any]], work, db: Session, current_user, **kwargs):
+    """Hand per-VM work to the bulk executor and return the job handle.
+
+    The response carries ``job_id``; poll ``GET /bulk/jobs/{job_id}?since=n``
+    for results as they finish. Hosts are resolved once here — VMs on an
+    unknown or inactive host fail individually.
+    """
+    from app.services.bulk_executor import bulk_executor
+
+    host_ids = {item["host_id"] for item in items}
+    hosts = {
+        h.id: h for h in db.query(ProxmoxHost).filter(
+            ProxmoxHost.id.in_(host_ids), ProxmoxHost.is_active == True
+        ).all()
+    } if host_ids else {}
+    return bulk_executor.submit(
+        kind, items, work, hosts, user_id=getattr(current_user, "id", None), **kwargs
+    )
+
+
 # ── Pydantic models ───────────────────────────────────────────────────────────
 
 class VMTarget(BaseModel):
@@ -87,58 +131,30 @@ class RollingRestartRequest(BaseModel):
 def bulk_power(req: BulkPowerRequest, db: Session = Depends(get_db),
                current_user=Depends(require_operator)):
     """Execute a power action on a list of VMs.
-    Returns per-VM result: {host_id, node, vmid, upid, error}.
+    Returns a bulk job; per-VM results {host_id, node, vmid, upid, error}
+    stream from GET /bulk/jobs/{job_id}.
     """
     VALID_ACTIONS = {"start", "stop", "shutdown", "reboot", "reset"}
     if req.action not in VALID_ACTIONS:
         raise HTTPException(status_code=400,
                             detail=f"Invalid action. Must be one of: {', '.join(VALID_ACTIONS)}")
 
-    results = []
-    # Group by host_id so we only look up each host once
-    host_cache: Dict[int, ProxmoxHost] = {}
+    # stop/shutdown: force uses stop, graceful uses shutdown
+    if req.action in ("stop", "shutdown"):
+        verb = "stop" if req.shutdown_mode == "force" else "shutdown"
+    else:
+        verb = req.action
 
-    for vm in req.vms:
-        entry: Dict[str, Any] = {
-            "host_id": vm.host_id,
-            "node": vm.node,
-            "vmid": vm.vmid,
-            "upid": None,
-            "error": None,
-        }
+    def work(pve, vm):
+        entry: Dict[str, Any] = {**vm, "upid": None, "error": None}
         try:
-            if vm.host_id not in host_cache:
-                host_cache[vm.host_id] = _get_host(vm.host_id, db)
-            pve = _pve(host_cache[vm.host_id])
-            qemu = pve.nodes(vm.node).qemu(vm.vmid)
-
-            if req.action == "start":
-                entry["upid"] = qemu.status.start.post()
-            elif req.action == "stop":
-                # force stop always uses stop; graceful uses shutdown
-                if req.shutdown_mode == "force":
-                    entry["upid"] = qemu.status.stop.post()
-                else:
-                    entry["upid"] = qemu.status.shutdown.post()
-            elif req.action == "shutdown":
-                if req.shutdown_mode == "force":
-                    entry["upid"] = qemu.status.stop.post()
-                else:
-                    entry["upid"] = qemu.status.shutdown.post()
-            elif req.action == "reboot":
-                entry["upid"] = qemu.status.reboot.post()
-            elif req.action == "reset":
-                entry["upid"] = qemu.status.reset.post()
-
-            pve_cache.clear_prefix(f"pve:{vm.host_id}:")
-        except HTTPException as e:
-            entry["error"] = e.detail
+            status = pve.nodes(vm["node"]).qemu(vm["vmid"]).status
+            entry["upid"] = getattr(status, verb).post()
         except Exception as e:
             entry["error"] = str(e)
+        return entry
 
-        results.append(entry)
-
-    return {"results": results}
+    return _submit(f"power:{req.action}", _targets(req.vms), work, db, current_user)
 
 
 # ── Rolling Restart ───────────────────────────────────────────────────────────
@@ -147,27 +163,24 @@ def bulk_power(req: BulkPowerRequest, db: Session = Depends(get_db),
 def bulk_rolling_restart(req: RollingRestartRequest, db: Session = Depends(get_db),
                           current_user=Depends(require_operator)):
     """Restart VMs one by one with a configurable delay between each.
-    Performs shutdown -> wait for stop -> start for each VM sequentially.
-    Returns per-VM result with status at each step.
+    Performs shutdown -> wait for stop -> start for each VM sequentially in a
+    single-lane bulk job; per-VM results report the status at each step.
     """
-    results = []
-    host_cache: Dict[int, ProxmoxHost] = {}
+    items = _targets(req.vms)
+    for idx, item in enumerate(items):
+        item["pause"] = req.delay_seconds if idx < len(items) - 1 else 0
 
-    for idx, vm in enumerate(req.vms):
+    def work(pve, vm):
+        pause = vm.pop("pause")
         entry: Dict[str, Any] = {
-            "host_id": vm.host_id,
-            "node": vm.node,
-            "vmid": vm.vmid,
+            **vm,
             "shutdown_upid": None,
             "start_upid": None,
             "error": None,
             "status": "pending",
         }
         try:
-            if vm.host_id not in host_cache:
-                host_cache[vm.host_id] = _get_host(vm.host_id, db)
-            pve = _pve(host_cache[vm.host_id])
-            qemu = pve.nodes(vm.node).qemu(vm.vmid)
+            qemu = pve.nodes(vm["node"]).qemu(vm["vmid"])
 
             # Step 1: shutdown or force-stop
             if req.shutdown_mode == "force":
@@ -190,25 +203,18 @@ def bulk_rolling_restart(req: RollingRestartRequest, db: Session = Depends(get_d
                     pass
 
             # Step 3: start the VM
-            start_upid = qemu.status.start.post()
-            entry["start_upid"] = start_upid
+            entry["start_upid"] = qemu.status.start.post()
             entry["status"] = "restarted"
-            pve_cache.clear_prefix(f"pve:{vm.host_id}:")
 
-            # Step 4: delay before next VM (skip delay after last VM)
-            if idx < len(req.vms) - 1 and req.delay_seconds > 0:
-                _time.sleep(req.delay_seconds)
-
-        except HTTPException as e:
-            entry["error"] = e.detail
-            entry["status"] = "failed"
+            # Step 4: delay before next VM (zero after the last VM)
+            if pause > 0:
+                _time.sleep(pause)
         except Exception as e:
             entry["error"] = str(e)
             entry["status"] = "failed"
+        return entry
 
-        results.append(entry)
-
-    return {"results": results}
+    return _submit("rolling-restart", items, work, db, current_user, sequential=True)
 
 
 # ── Bulk Snapshot ─────────────────────────────────────────────────────────────
@@ -222,33 +228,21 @@ def bulk_snapshot(req: BulkSnapshotRequest, db: Session = Depends(get_db),
     from datetime import datetime
     today = datetime.utcnow().strftime("%Y%m%d")
 
-    results = []
-    host_cache: Dict[int, ProxmoxHost] = {}
-
-    for vm in req.vms:
-        entry: Dict[str, Any] = {
-            "host_id": vm.host_id,
-            "node": vm.node,
-            "vmid": vm.vmid,
-            "snapname": None,
-            "upid": None,
-            "error": None,
-        }
+    def work(pve, vm):
+        entry: Dict[str, Any] = {**vm, "snapname": None, "upid": None, "error": None}
         try:
-            if vm.host_id not in host_cache:
-                host_cache[vm.host_id] = _get_host(vm.host_id, db)
-            pve = _pve(host_cache[vm.host_id])
-
-            # Resolve VM name for template
-            try:
-                cfg = pve.nodes(vm.node).qemu(vm.vmid).config.get()
-                vm_name = cfg.get("name", str(vm.vmid))
-            except Exception:
-                vm_name = str(vm.vmid)
+            qemu = pve.nodes(vm["node"]).qemu(vm["vmid"])
+            # The config is only needed to resolve {name}
+            vm_name = str(vm["vmid"])
+            if "{name}" in req.snapname_template:
+                try:
+                    vm_name = qemu.config.get().get("name", vm_name)
+                except Exception:
+                    pass
 
             snapname = (
                 req.snapname_template
-                .replace("{vmid}", str(vm.vmid))
+                .replace("{vmid}", str(vm["vmid"]))
                 .replace("{name}", vm_name)
                 .replace("{date}", today)
             )
@@ -256,21 +250,16 @@ def bulk_snapshot(req: BulkSnapshotRequest, db: Session = Depends(get_db),
             snapname = snapname[:40]
 
             entry["snapname"] = snapname
-            upid = pve.nodes(vm.node).qemu(vm.vmid).snapshot.post(
+            entry["upid"] = qemu.snapshot.post(
                 snapname=snapname,
                 description=req.description,
                 vmstate=int(req.vmstate),
             )
-            entry["upid"] = upid
-            pve_cache.clear_prefix(f"pve:{vm.host_id}:")
-        except HTTPException as e:
-            entry["error"] = e.detail
         except Exception as e:
             entry["error"] = str(e)
+        return entry
 
-        results.append(entry)
-
-    return {"results": results}
+    return _submit("snapshot", _targets(req.vms), work, db, current_user)
 
 
 @router.post("/bulk/delete-snapshots")
@@ -278,47 +267,28 @@ def bulk_delete_old_snapshots(req: BulkDeleteSnapshotsRequest,
                                db: Session = Depends(get_db),
                                current_user=Depends(require_operator)):
     """Delete snapshots older than N days across the selected VMs."""
-    import time as _time
     cutoff = _time.time() - (req.older_than_days * 86400)
 
-    results = []
-    host_cache: Dict[int, ProxmoxHost] = {}
-
-    for vm in req.vms:
-        entry: Dict[str, Any] = {
-            "host_id": vm.host_id,
-            "node": vm.node,
-            "vmid": vm.vmid,
-            "deleted": [],
-            "errors": [],
-        }
+    def work(pve, vm):
+        entry: Dict[str, Any] = {**vm, "deleted": [], "errors": []}
         try:
-            if vm.host_id not in host_cache:
-                host_cache[vm.host_id] = _get_host(vm.host_id, db)
-            pve = _pve(host_cache[vm.host_id])
-
-            snaps = pve.nodes(vm.node).qemu(vm.vmid).snapshot.get()
-            for snap in snaps:
+            qemu = pve.nodes(vm["node"]).qemu(vm["vmid"])
+            for snap in qemu.snapshot.get():
                 name = snap.get("name", "")
                 if name == "current":
                     continue
                 snap_time = snap.get("snaptime", 0)
                 if snap_time and snap_time < cutoff:
                     try:
-                        pve.nodes(vm.node).qemu(vm.vmid).snapshot(name).delete()
+                        qemu.snapshot(name).delete()
                         entry["deleted"].append(name)
                     except Exception as e:
                         entry["errors"].append({"snap": name, "error": str(e)})
-
-            pve_cache.clear_prefix(f"pve:{vm.host_id}:")
-        except HTTPException as e:
-            entry["errors"].append({"snap": "*", "error": e.detail})
         except Exception as e:
             entry["errors"].append({"snap": "*", "error": str(e)})
+        return entry
 
-        results.append(entry)
-
-    return {"results": results}
+    return _submit("delete-snapshots", _targets(req.vms), work, db, current_user)
 
 
 # ── Bulk Config Update ────────────────────────────────────────────────────────
@@ -327,43 +297,36 @@ def bulk_delete_old_snapshots(req: BulkDeleteSnapshotsRequest,
 def bulk_config_update(req: BulkConfigRequest, db: Session = Depends(get_db),
                        current_user=Depends(require_operator)):
     """Update config fields on a list of VMs.
-    Returns per-VM result: {vmid, changes_applied, error}.
+    Per-VM result: {vmid, changes_applied, error}.
     Supports dry_run=true to simulate without applying.
     """
-    results = []
-    host_cache: Dict[int, ProxmoxHost] = {}
-
-    for vm in req.vms:
+    base: Dict[str, Any] = {}
+    if req.cores is not None:
+        base["cores"] = req.cores
+    if req.memory is not None:
+        base["memory"] = req.memory
+    if req.agent is not None:
+        base["agent"] = req.agent
+    if req.balloon is not None:
+        base["balloon"] = req.balloon
+    if req.onboot is not None:
+        base["onboot"] = int(req.onboot)
+
+    def work(pve, vm):
         entry: Dict[str, Any] = {
-            "host_id": vm.host_id,
-            "node": vm.node,
-            "vmid": vm.vmid,
+            **vm,
             "changes_applied": {},
             "dry_run": req.dry_run,
             "error": None,
         }
         try:
-            if vm.host_id not in host_cache:
-                host_cache[vm.host_id] = _get_host(vm.host_id, db)
-            pve = _pve(host_cache[vm.host_id])
-
-            payload: Dict[str, Any] = {}
-            if req.cores is not None:
-                payload["cores"] = req.cores
-            if req.memory is not None:
-                payload["memory"] = req.memory
-            if req.agent is not None:
-                payload["agent"] = req.agent
-            if req.balloon is not None:
-                payload["balloon"] = req.balloon
-            if req.onboot is not None:
-                payload["onboot"] = int(req.onboot)
+            qemu = pve.nodes(vm["node"]).qemu(vm["vmid"])
+            payload = dict(base)
 
             # Handle tag add/remove
             if req.tags_add or req.tags_remove:
                 try:
-                    cfg = pve.nodes(vm.node).qemu(vm.vmid).config.get()
-                    raw = cfg.get("tags", "")
+                    raw = qemu.config.get().get("tags", "")
                     tags = [t.strip() for t in raw.split(";") if t.strip()] if raw else []
                     if req.tags_add:
                         for t in req.tags_add:
@@ -376,27 +339,24 @@ def bulk_config_update(req: BulkConfigRequest, db: Session = Depends(get_db),
                     payload["tags"] = ";".join(tags)
                 except Exception as e:
                     entry["error"] = f"Tag fetch failed: {e}"
-                    results.append(entry)
-                    continue
+                    return entry
 
             if not payload:
                 entry["error"] = "Nothing to update"
-                results.append(entry)
-                continue
+                return entry
 
             if not req.dry_run:
-                pve.nodes(vm.node).qemu(vm.vmid).config.put(**payload)
-                pve_cache.clear_prefix(f"pve:{vm.host_id}:")
+                qemu.config.put(**payload)
 
             entry["changes_applied"] = payload
-        except HTTPException as e:
-            entry["error"] = e.detail
         except Exception as e:
             entry["error"] = str(e)
+        return entry
 
-        results.append(entry)
-
-    return {"results": results, "dry_run": req.dry_run}
+    return _submit(
+        "config", _targets(req.vms), work, db, current_user,
+        summarize=lambda results: {"results": results, "dry_run": req.dry_run},
+    )
 
 
 @router.post("/bulk/config/preview")
@@ -481,162 +441,76 @@ def bulk_config_preview(req: BulkConfigRequest, db: Session = Depends(get_db),
 @router.post("/bulk/migrate")
 def bulk_migrate(req: BulkMigrateRequest, db: Session = Depends(get_db),
                  current_user=Depends(require_operator)):
-    """Migrate a list of VMs to a target node (sequential)."""
-    results = []
-    host_cache: Dict[int, ProxmoxHost] = {}
-
-    for vm in req.vms:
-        entry: Dict[str, Any] = {
-            "host_id": vm.host_id,
-            "node": vm.node,
-            "vmid": vm.vmid,
-            "upid": None,
-            "error": None,
-        }
+    """Start migrating a list of VMs to a target node."""
+    def work(pve, vm):
+        entry: Dict[str, Any] = {**vm, "upid": None, "error": None}
         try:
-            if vm.host_id not in host_cache:
-                host_cache[vm.host_id] = _get_host(vm.host_id, db)
-            pve = _pve(host_cache[vm.host_id])
-
-            upid = pve.nodes(vm.node).qemu(vm.vmid).migrate.post(
+            entry["upid"] = pve.nodes(vm["node"]).qemu(vm["vmid"]).migrate.post(
                 target=req.target_node,
                 online=int(req.online),
                 with_local_disks=int(req.with_local_disks),
             )
-            entry["upid"] = upid
-            pve_cache.clear_prefix(f"pve:{vm.host_id}:")
-        except HTTPException as e:
-            entry["error"] = e.detail
         except Exception as e:
             entry["error"] = str(e)
+        return entry
 
-        results.append(entry)
-
-    return {"results": results}
-
+    return _submit("migrate", _targets(req.vms), work, db, current_user)
 
-# ── Orphaned Disk Finder ──────────────────────────────────────────────────────
-
-@router.get("/orphaned-disks/{host_id}")
-def get_orphaned_disks(host_id: int, db: Session = Depends(get_db),
-                       current_user=Depends(require_operator)):
-    """Find storage volumes not referenced by any VM config on any node.
 
-    Returns list of {storage, volid, format, size, node} for each orphan.
-    """
-    host = _get_host(host_id, db)
-    pve = _pve(host)
+# ── Bulk Jobs ─────────────────────────────────────────────────────────────────
 
-    try:
-        nodes_list = pve.nodes.get()
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to list nodes: {e}")
+def _job_or_404(job_id: str, current_user):
+    from app.services.bulk_executor import bulk_executor
 
-    # Build the set of all volids referenced by any VM config
-    referenced: set = set()
+    owner = bulk_executor.owner(job_id)
+    if owner is None or (current_user.role != UserRole.ADMIN and owner != current_user.id):
+        raise HTTPException(status_code=404, detail="Bulk job not found")
+    return bulk_executor
 
-    for node_info in nodes_list:
-        node = node_info.get("node", "")
-        if not node:
-            continue
 
-        # Collect from QEMU VMs
-        try:
-            vms = pve.nodes(node).qemu.get()
-        except Exception:
-            vms = []
+@router.get("/bulk/jobs")
+def list_bulk_jobs(current_user=Depends(require_operator)):
+    """Bulk jobs, newest first (kept for a day after finishing). Admins see everyone's."""
+    from app.services.bulk_executor import bulk_executor
+    return bulk_executor.list(None if current_user.role == UserRole.ADMIN else current_user.id)
 
-        for vm in vms:
-            vmid = vm.get("vmid")
-            if not vmid:
-                continue
-            try:
-                cfg = pve.nodes(node).qemu(vmid).config.get()
-                _collect_disk_volids(cfg, referenced)
-            except Exception:
-                pass
 
-        # Collect from LXC containers
-        try:
-            ctrs = pve.nodes(node).lxc.get()
-        except Exception:
-            ctrs = []
+@router.get("/bulk/jobs/{job_id}")
+def get_bulk_job(job_id: str, since: int = Query(0, ge=0),
+                 current_user=Depends(require_operator)):
+    """Progress of one bulk job plus the per-VM results finished after cursor *since*.
 
-        for ct in ctrs:
-            vmid = ct.get("vmid")
-            if not vmid:
-                continue
-            try:
-                cfg = pve.nodes(node).lxc(vmid).config.get()
-                _collect_disk_volids(cfg, referenced)
-            except Exception:
-                pass
+    Pass the previous response's ``next`` as ``since`` to receive only new
+    results. ``result`` holds the full response body once the job finishes.
+    """
+    return _job_or_404(job_id, current_user).get(job_id, since)
 
-    # Now scan each storage on each node for volumes NOT in referenced
-    orphans = []
 
-    for node_info in nodes_list:
-        node = node_info.get("node", "")
-        if not node:
-            continue
+@router.post("/bulk/jobs/{job_id}/cancel")
+def cancel_bulk_job(job_id: str, current_user=Depends(require_operator)):
+    """Stop dispatching the remaining VMs; calls already sent still finish."""
+    return _job_or_404(job_id, current_user).cancel(job_id)
 
-        try:
-            storages = pve.nodes(node).storage.get()
-        except Exception:
-            continue
 
-        for st in storages:
-            storage_name = st.get("storage", "")
-            if not storage_name:
-                continue
+# ── Orphaned Disk Finder ──────────────────────────────────────────────────────
 
-            try:
-                volumes = pve.nodes(node).storage(storage_name).content.get()
-            except Exception:
-                continue
+@router.get("/orphaned-disks/{host_id}")
+def get_orphaned_disks(host_id: int, refresh: bool = Query(False),
+                       db: Session = Depends(get_db),
+                       current_user=Depends(require_operator)):
+    """Find storage volumes not referenced by any VM config on any node.
 
-            for vol in volumes:
-                volid = vol.get("volid", "")
-                content_type = vol.get("content", "")
-                # Only look at disk-type content (images, rootdir, subvol)
-                if content_type not in ("images", "rootdir", "subvol"):
-                    continue
-                if volid and volid not in referenced:
-                    orphans.append({
-                        "node": node,
-                        "storage": storage_name,
-                        "volid": volid,
-                        "format": vol.get("format", ""),
-                        "size": vol.get("size", 0),
-                        "content": content_type,
-                        "ctime": vol.get("ctime"),
-                    })
-
-    return {"host_id": host_id, "orphans": orphans, "count": len(orphans)}
-
-
-def _collect_disk_volids(cfg: dict, result: set):
-    """Extract volids from a Proxmox VM/CT config dict into result set."""
-    disk_prefixes = (
-        "scsi", "virtio", "ide", "sata",  # QEMU disks
-        "rootfs", "mp",                    # LXC disks
-        "efidisk", "tpmstate",
-    )
-    for key, val in cfg.items():
-        if not isinstance(val, str):
-            continue
-        # Check if this key is a disk key
-        is_disk = False
-        for pfx in disk_prefixes:
-            if key.startswith(pfx) and (key[len(pfx):].isdigit() or key == pfx):
-                is_disk = True
-                break
+    Returns {host_id, orphans: [{storage, volid, format, size, node, …}], count,
+    generation, cached, …}. Guest configs are indexed and re-read only when
+    they change; ``refresh=true`` rebuilds the index and relists storage.
+    """
+    from app.services.orphan_scanner import orphan_scanner
 
-        if is_disk or key.startswith("unused"):
-            # volid is the part before the first comma
-            volid = val.split(",")[0].strip()
-            if ":" in volid:  # valid volid format: storage:volume
-                result.add(volid)
+    host = _get_host(host_id, db)
+    try:
+        return orphan_scanner.scan(host, refresh=refresh)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Orphan scan failed: {e}")
 
 
 # ── Automation Scripts ────────────────────────────────────────────────────────
@@ -675,8 +549,13 @@ class ScriptVmHealthCheckRequest(BaseModel):
 
 class ScriptResourceRebalancerRequest(BaseModel):
     host_id: int
-    cpu_imbalance_threshold: float = 30.0   # % difference from mean triggers suggestion
-    ram_imbalance_threshold: float = 30.0
+    history_hours: int = Field(24, ge=1, le=72)       # window for demand percentiles
+    percentile: float = Field(95.0, ge=50, le=100)
+    max_moves: int = Field(10, ge=1, le=100)
+    min_gain: float = Field(0.1, ge=0)               # score points the whole plan must gain
+    cpu_limit_pct: float = Field(85.0, gt=0, le=100)  # target node must stay under these
+    mem_limit_pct: float = Field(90.0, gt=0, le=100)
+    include_containers: bool = False                 # LXC migration restarts the container
 
 
 class ScriptBulkTagUpdaterRequest(BaseModel):
@@ -701,63 +580,50 @@ def script_cleanup_snapshots(req: ScriptCleanupSnapsRequest,
                               db: Session = Depends(get_db),
                               current_user=Depends(require_operator)):
     """Find (and optionally delete) all snapshots older than N days across all VMs."""
-    import time as _time
     host = _get_host(req.host_id, db)
-    pve = _pve(host)
     cutoff = _time.time() - (req.older_than_days * 86400)
+    items = _qemu_targets(req.host_id, _pve(host))
 
-    try:
-        nodes_list = pve.nodes.get()
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-
-    findings = []
-
-    for node_info in nodes_list:
-        node = node_info.get("node", "")
-        if not node:
-            continue
+    def work(pve, vm):
+        qemu = pve.nodes(vm["node"]).qemu(vm["vmid"])
         try:
-            vms = pve.nodes(node).qemu.get()
+            snaps = qemu.snapshot.get()
         except Exception:
-            continue
-        for vm in vms:
-            vmid = vm.get("vmid")
-            vm_name = vm.get("name", str(vmid))
-            try:
-                snaps = pve.nodes(node).qemu(vmid).snapshot.get()
-            except Exception:
+            return []
+        findings = []
+        for snap in snaps:
+            name = snap.get("name", "")
+            if name == "current":
                 continue
-            for snap in snaps:
-                name = snap.get("name", "")
-                if name == "current":
-                    continue
-                snap_time = snap.get("snaptime", 0)
-                if snap_time and snap_time < cutoff:
-                    finding = {
-                        "node": node,
-                        "vmid": vmid,
-                        "vm_name": vm_name,
-                        "snapname": name,
-                        "snaptime": snap_time,
-                        "deleted": False,
-                        "error": None,
-                    }
-                    if not req.dry_run:
-                        try:
-                            pve.nodes(node).qemu(vmid).snapshot(name).delete()
-                            finding["deleted"] = True
-                            pve_cache.clear_prefix(f"pve:{req.host_id}:")
-                        except Exception as e:
-                            finding["error"] = str(e)
-                    findings.append(finding)
+            snap_time = snap.get("snaptime", 0)
+            if snap_time and snap_time < cutoff:
+                finding = {
+                    "node": vm["node"],
+                    "vmid": vm["vmid"],
+                    "vm_name": vm["name"],
+                    "snapname": name,
+                    "snaptime": snap_time,
+                    "deleted": False,
+                    "error": None,
+                }
+                if not req.dry_run:
+                    try:
+                        qemu.snapshot(name).delete()
+                        finding["deleted"] = True
+                    except Exception as e:
+                        finding["error"] = str(e)
+                findings.append(finding)
+        return findings
 
-    return {
-        "dry_run": req.dry_run,
-        "older_than_days": req.older_than_days,
-        "total_found": len(findings),
-        "findings": findings,
-    }
+    return _submit(
+        "cleanup-snapshots", items, work, db, current_user,
+        summarize=lambda findings: {
+            "dry_run": req.dry_run,
+            "older_than_days": req.older_than_days,
+            "total_found": len(findings),
+            "findings": findings,
+        },
+    )
 
 
 @router.post("/scripts/tag-compliance")
@@ -774,7 +640,7 @@ def script_tag_compliance(req: ScriptTagComplianceRequest,
         raise HTTPException(status_code=500, detail=str(e))
 
     required = {t.strip().lower() for t in req.required_tags if t.strip()}
-    findings = []
+    items = []
 
     for item in resources:
         raw_tags = item.get("tags", "")
@@ -782,40 +648,40 @@ def script_tag_compliance(req: ScriptTagComplianceRequest,
         missing = required - current_tags
         if not missing:
             continue
-
-        finding = {
+        items.append({
+            "host_id": req.host_id,
             "node": item.get("node", ""),
             "vmid": item.get("vmid"),
             "vm_name": item.get("name", ""),
             "current_tags": list(current_tags),
             "missing_tags": list(missing),
-            "fixed": False,
-            "error": None,
-        }
+        })
 
+    def work(pve, item):
+        finding = {k: v for k, v in item.items() if k != "host_id"}
+        finding.update({"fixed": False, "error": None})
         if not req.dry_run:
-            node = item.get("node", "")
-            vmid = item.get("vmid")
             try:
-                cfg = pve.nodes(node).qemu(vmid).config.get()
-                all_tags = [t.strip() for t in cfg.get("tags", "").split(";") if t.strip()]
-                for t in missing:
+                qemu = pve.nodes(item["node"]).qemu(item["vmid"])
+                all_tags = [t.strip() for t in qemu.config.get().get("tags", "").split(";") if t.strip()]
+                for t in item["missing_tags"]:
                     if t not in all_tags:
                         all_tags.append(t)
-                pve.nodes(node).qemu(vmid).config.put(tags=";".join(all_tags))
+                qemu.config.put(tags=";".join(all_tags))
                 finding["fixed"] = True
-                pve_cache.clear_prefix(f"pve:{req.host_id}:")
             except Exception as e:
                 finding["error"] = str(e)
+        return finding
 
-        findings.append(finding)
-
-    return {
-        "dry_run": req.dry_run,
-        "required_tags": list(required),
-        "non_compliant_count": len(findings),
-        "findings": findings,
-    }
+    return _submit(
+        "tag-compliance", items, work, db, current_user,
+        summarize=lambda findings: {
+            "dry_run": req.dry_run,
+            "required_tags": list(required),
+            "non_compliant_count": len(findings),
+            "findings": findings,
+        },
+    )
 
 
 @router.post("/scripts/resource-audit")
@@ -824,28 +690,14 @@ def script_resource_audit(req: ScriptResourceAuditRequest,
                           current_user=Depends(require_operator)):
     """Find over-provisioned VMs by comparing allocation vs recent RRD usage."""
     host = _get_host(req.host_id, db)
-    pve = _pve(host)
-
-    try:
-        resources = pve.cluster.resources.get(type="vm")
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-
-    report = []
-
-    for item in resources:
-        if item.get("status") != "running":
-            continue
-        node = item.get("node", "")
-        vmid = item.get("vmid")
-        if not node or not vmid:
-            continue
+    items = [vm for vm in _qemu_targets(req.host_id, _pve(host)) if vm["status"] == "running"]
 
+    def work(pve, vm):
         # Get RRD data for the past hour
         cpu_avg = None
         mem_avg_pct = None
         try:
-            rrd = pve.nodes(node).qemu(vmid).rrddata.get(timeframe="hour", cf="AVERAGE")
+            rrd = pve.nodes(vm["node"]).qemu(vm["vmid"]).rrddata.get(timeframe="hour", cf="AVERAGE")
             if rrd:
                 cpu_vals = [r.get("cpu", 0) for r in rrd if r.get("cpu") is not None]
                 mem_vals = [r.get("mem", 0) for r in rrd if r.get("mem") is not None]
@@ -862,26 +714,29 @@ def script_resource_audit(req: ScriptResourceAuditRequest,
 
         over_provisioned_cpu = (cpu_avg is not None and cpu_avg < req.cpu_threshold_pct)
         over_provisioned_ram = (mem_avg_pct is not None and mem_avg_pct < req.ram_threshold_pct)
+        if not (over_provisioned_cpu or over_provisioned_ram):
+            return []
+        return {
+            "node": vm["node"],
+            "vmid": vm["vmid"],
+            "vm_name": vm["name"],
+            "allocated_cores": vm["maxcpu"],
+            "allocated_memory_mb": int(vm["maxmem"] / 1024 / 1024),
+            "cpu_avg_pct": round(cpu_avg, 2) if cpu_avg is not None else None,
+            "mem_avg_pct": round(mem_avg_pct, 2) if mem_avg_pct is not None else None,
+            "over_provisioned_cpu": over_provisioned_cpu,
+            "over_provisioned_ram": over_provisioned_ram,
+        }
 
-        if over_provisioned_cpu or over_provisioned_ram:
-            report.append({
-                "node": node,
-                "vmid": vmid,
-                "vm_name": item.get("name", str(vmid)),
-                "allocated_cores": item.get("maxcpu", 0),
-                "allocated_memory_mb": int(item.get("maxmem", 0) / 1024 / 1024),
-                "cpu_avg_pct": round(cpu_avg, 2) if cpu_avg is not None else None,
-                "mem_avg_pct": round(mem_avg_pct, 2) if mem_avg_pct is not None else None,
-                "over_provisioned_cpu": over_provisioned_cpu,
-                "over_provisioned_ram": over_provisioned_ram,
-            })
-
-    return {
-        "cpu_threshold_pct": req.cpu_threshold_pct,
-        "ram_threshold_pct": req.ram_threshold_pct,
-        "over_provisioned_count": len(report),
-        "report": report,
-    }
+    return _submit(
+        "resource-audit", items, work, db, current_user,
+        summarize=lambda report: {
+            "cpu_threshold_pct": req.cpu_threshold_pct,
+            "ram_threshold_pct": req.ram_threshold_pct,
+            "over_provisioned_count": len(report),
+            "report": report,
+        },
+    )
 
 
 @router.post("/scripts/nightly-snapshot")
@@ -893,77 +748,54 @@ def script_nightly_snapshot(req: ScriptNightlySnapshotRequest,
     """
     from datetime import datetime
     host = _get_host(req.host_id, db)
-    pve = _pve(host)
     today = datetime.utcnow().strftime("%Y%m%d")
+    items = [
+        vm for vm in _qemu_targets(req.host_id, _pve(host))
+        if not req.only_running or vm["status"] == "running"
+    ]
 
-    try:
-        nodes_list = pve.nodes.get()
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-
-    results = []
-
-    for node_info in nodes_list:
-        node = node_info.get("node", "")
-        if not node:
-            continue
-        try:
-            vms = pve.nodes(node).qemu.get()
-        except Exception:
-            continue
-
-        for vm in vms:
-            vmid = vm.get("vmid")
-            vm_name = vm.get("name", str(vmid))
-            status = vm.get("status", "")
-
-            if req.only_running and status != "running":
-                continue
-
-            snapname = (
-                req.snapname_template
-                .replace("{vmid}", str(vmid))
-                .replace("{name}", vm_name)
-                .replace("{date}", today)
-            )[:40]
-
-            entry: Dict[str, Any] = {
-                "node": node,
-                "vmid": vmid,
-                "vm_name": vm_name,
-                "status": status,
-                "snapname": snapname,
-                "upid": None,
-                "error": None,
-                "dry_run": req.dry_run,
-            }
+    def work(pve, vm):
+        snapname = (
+            req.snapname_template
+            .replace("{vmid}", str(vm["vmid"]))
+            .replace("{name}", vm["name"])
+            .replace("{date}", today)
+        )[:40]
 
-            if not req.dry_run:
-                try:
-                    upid = pve.nodes(node).qemu(vmid).snapshot.post(
-                        snapname=snapname,
-                        description=req.description,
-                        vmstate=int(req.vmstate),
-                    )
-                    entry["upid"] = upid
-                    pve_cache.clear_prefix(f"pve:{req.host_id}:")
-                except Exception as e:
-                    entry["error"] = str(e)
+        entry: Dict[str, Any] = {
+            "node": vm["node"],
+            "vmid": vm["vmid"],
+            "vm_name": vm["name"],
+            "status": vm["status"],
+            "snapname": snapname,
+            "upid": None,
+            "error": None,
+            "dry_run": req.dry_run,
+        }
 
-            results.append(entry)
+        if not req.dry_run:
+            try:
+                entry["upid"] = pve.nodes(vm["node"]).qemu(vm["vmid"]).snapshot.post(
+                    snapname=snapname,
+                    description=req.description,
+                    vmstate=int(req.vmstate),
+                )
+            except Exception as e:
+                entry["error"] = str(e)
+        return entry
 
-    total_ok = sum(1 for r in results if not r["error"] and not r["dry_run"])
-    total_err = sum(1 for r in results if r["error"])
+    def summarize(results):
+        return {
+            "dry_run": req.dry_run,
+            "snapname_template": req.snapname_template,
+            "only_running": req.only_running,
+            "total_vms": len(results),
+            "total_ok": sum(1 for r in results if not r["error"] and not r["dry_run"]),
+            "total_errors": sum(1 for r in results if r["error"]),
+            "results": results,
+        }
 
-    return {
-        "dry_run": req.dry_run,
-        "snapname_template": req.snapname_template,
-        "only_running": req.only_running,
-        "total_vms": len(results),
-        "total_ok": total_ok,
-        "total_errors": total_err,
-        "results": results,
-    }
+    return _submit("nightly-snapshot", items, work, db, current_user, summarize=summarize)
 
 
 @router.post("/scripts/vm-health-check")
@@ -1042,110 +874,50 @@ def script_vm_health_check(req: ScriptVmHealthCheckRequest,
 def script_resource_rebalancer(req: ScriptResourceRebalancerRequest,
                                 db: Session = Depends(get_db),
                                 current_user=Depends(require_operator)):
-    """Analyze CPU/RAM load across nodes and suggest VM migrations for better balance."""
+    """Plan VM migrations that balance CPU/RAM across nodes.
+
+    Demand comes from percentile guest history, so the plan is stable between
+    runs. Steps are ordered; apply them in sequence.
+    """
+    from app.services.placement import build_placement_inputs, plan_placement
+
     host = _get_host(req.host_id, db)
     pve = _pve(host)
 
     try:
-        nodes_list = pve.nodes.get()
-        resources = pve.cluster.resources.get(type="vm")
+        nodes, guests = build_placement_inputs(
+            db, host, pve,
+            history_hours=req.history_hours,
+            percentile=req.percentile,
+            include_containers=req.include_containers,
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-    # Build per-node stats
-    node_stats: Dict[str, Dict] = {}
-    for n in nodes_list:
-        node = n.get("node", "")
-        if not node:
-            continue
-        node_stats[node] = {
-            "node": node,
-            "maxcpu": n.get("maxcpu", 0) or 0,
-            "maxmem": n.get("maxmem", 0) or 0,
-            "cpu_used": n.get("cpu", 0) or 0,
-            "mem_used": n.get("mem", 0) or 0,
-            "vms": [],
-        }
-
-    for vm in resources:
-        node = vm.get("node", "")
-        if node in node_stats:
-            node_stats[node]["vms"].append({
-                "vmid": vm.get("vmid"),
-                "name": vm.get("name", ""),
-                "status": vm.get("status", ""),
-                "maxcpu": vm.get("maxcpu", 0),
-                "maxmem": vm.get("maxmem", 0),
-                "cpu": vm.get("cpu", 0),
-                "mem": vm.get("mem", 0),
-            })
-
-    # Compute CPU and RAM usage % per node
-    nodes_info = []
-    for node, stats in node_stats.items():
-        cpu_pct = (stats["cpu_used"] / stats["maxcpu"] * 100) if stats["maxcpu"] else 0
-        mem_pct = (stats["mem_used"] / stats["maxmem"] * 100) if stats["maxmem"] else 0
-        nodes_info.append({
-            "node": node,
-            "cpu_pct": round(cpu_pct, 2),
-            "mem_pct": round(mem_pct, 2),
-            "maxcpu": stats["maxcpu"],
-            "maxmem_gb": round(stats["maxmem"] / 1024 / 1024 / 1024, 1),
-            "vm_count": len(stats["vms"]),
-            "vms": stats["vms"],
-        })
-
-    if not nodes_info:
-        return {"nodes": [], "suggestions": [], "balanced": True}
-
-    # Compute mean CPU/RAM
-    mean_cpu = sum(n["cpu_pct"] for n in nodes_info) / len(nodes_info)
-    mean_mem = sum(n["mem_pct"] for n in nodes_info) / len(nodes_info)
-
-    # Identify overloaded and underloaded nodes
-    overloaded = [
-        n for n in nodes_info
-        if (n["cpu_pct"] - mean_cpu) > req.cpu_imbalance_threshold
-        or (n["mem_pct"] - mean_mem) > req.ram_imbalance_threshold
-    ]
-    underloaded = [
-        n for n in nodes_info
-        if (mean_cpu - n["cpu_pct"]) > req.cpu_imbalance_threshold
-        or (mean_mem - n["mem_pct"]) > req.ram_imbalance_threshold
-    ]
-
-    suggestions = []
-    for over in overloaded:
-        for under in underloaded:
-            if over["node"] == under["node"]:
-                continue
-            # Suggest migrating one running VM from the overloaded node
-            running_vms = [
-                v for v in node_stats[over["node"]]["vms"] if v["status"] == "running"
-            ]
-            if running_vms:
-                vm = running_vms[0]
-                suggestions.append({
-                    "from_node": over["node"],
-                    "to_node": under["node"],
-                    "vmid": vm["vmid"],
-                    "vm_name": vm["name"],
-                    "reason": (
-                        f"{over['node']} is overloaded "
-                        f"(CPU {over['cpu_pct']}%, RAM {over['mem_pct']}%) vs "
-                        f"{under['node']} (CPU {under['cpu_pct']}%, RAM {under['mem_pct']}%)"
-                    ),
-                })
+    if len(nodes) < 2:
+        return {"nodes": [], "plan": [], "suggestions": [], "balanced": True}
 
-    return {
-        "mean_cpu_pct": round(mean_cpu, 2),
-        "mean_mem_pct": round(mean_mem, 2),
-        "nodes": nodes_info,
-        "overloaded_nodes": [n["node"] for n in overloaded],
-        "underloaded_nodes": [n["node"] for n in underloaded],
-        "suggestions": suggestions,
-        "balanced": len(suggestions) == 0,
-    }
+    started = _time.time()
+    result = plan_placement(
+        nodes, guests,
+        max_moves=req.max_moves,
+        min_gain=req.min_gain,
+        cpu_limit=req.cpu_limit_pct / 100,
+        mem_limit=req.mem_limit_pct / 100,
+    )
+    result.update({
+        "guests": len(guests),
+        "guests_with_history": sum(1 for g in guests if g.from_history),
+        "planning_ms": int((_time.time() - started) * 1000),
+        "balanced": not result["plan"],
+        # Pre-planner response shape, kept for existing callers
+        "suggestions": [
+            {"from_node": m["from_node"], "to_node": m["to_node"], "vmid": m["vmid"],
+             "vm_name": m["name"], "reason": f"balance score {round(m['score_after'] + m['gain'], 2)} → {m['score_after']}"}
+            for m in result["plan"]
+        ],
+    })
+    return result
 
 
 @router.post("/scripts/bulk-tag-updater")
@@ -1167,20 +939,18 @@ def script_bulk_tag_updater(req: ScriptBulkTagUpdaterRequest,
     if not tags_add and not tags_remove:
         raise HTTPException(status_code=400, detail="Provide tags_add or tags_remove")
 
-    results = []
-
-    for item in resources:
-        vmid = item.get("vmid")
-        if req.vmids and vmid not in req.vmids:
-            continue
-
-        node = item.get("node", "")
-        vm_name = item.get("name", str(vmid))
+    items = [
+        {"host_id": req.host_id, "node": item.get("node", ""), "vmid": item.get("vmid"),
+         "name": item.get("name", str(item.get("vmid")))}
+        for item in resources
+        if not req.vmids or item.get("vmid") in req.vmids
+    ]
 
+    def work(pve, vm):
         entry: Dict[str, Any] = {
-            "node": node,
-            "vmid": vmid,
-            "vm_name": vm_name,
+            "node": vm["node"],
+            "vmid": vm["vmid"],
+            "vm_name": vm["name"],
             "tags_before": [],
             "tags_after": [],
             "changed": False,
@@ -1189,8 +959,8 @@ def script_bulk_tag_updater(req: ScriptBulkTagUpdaterRequest,
         }
 
         try:
-            cfg = pve.nodes(node).qemu(vmid).config.get()
-            raw = cfg.get("tags", "")
+            qemu = pve.nodes(vm["node"]).qemu(vm["vmid"])
+            raw = qemu.config.get().get("tags", "")
             current = [t.strip() for t in raw.split(";") if t.strip()] if raw else []
             entry["tags_before"] = current[:]
 
@@ -1204,20 +974,20 @@ def script_bulk_tag_updater(req: ScriptBulkTagUpdaterRequest,
             entry["changed"] = set(current) != set(updated)
 
             if entry["changed"] and not req.dry_run:
-                pve.nodes(node).qemu(vmid).config.put(tags=";".join(updated))
-                pve_cache.clear_prefix(f"pve:{req.host_id}:")
+                qemu.config.put(tags=";".join(updated))
         except Exception as e:
             entry["error"] = str(e)
+        return entry
 
-        results.append(entry)
-
-    changed_count = sum(1 for r in results if r["changed"])
-    return {
-        "dry_run": req.dry_run,
-        "total_vms": len(results),
-        "changed_count": changed_count,
-        "results": results,
-    }
+    return _submit(
+        "bulk-tag-updater", items, work, db, current_user,
+        summarize=lambda results: {
+            "dry_run": req.dry_run,
+            "total_vms": len(results),
+            "changed_count": sum(1 for r in results if r["changed"]),
+            "results": results,
+        },
+    )
 
 
 @router.post("/scripts/config-standardizer")
@@ -1226,88 +996,67 @@ def script_config_standardizer(req: ScriptConfigStandardizerRequest,
                                 current_user=Depends(require_operator)):
     """Ensure all VMs have consistent settings: backup enabled, agent enabled, onboot, required tags."""
     host = _get_host(req.host_id, db)
-    pve = _pve(host)
-
-    try:
-        nodes_list = pve.nodes.get()
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    items = _qemu_targets(req.host_id, _pve(host))
 
-    results = []
+    def work(pve, vm):
+        entry: Dict[str, Any] = {
+            "node": vm["node"],
+            "vmid": vm["vmid"],
+            "vm_name": vm["name"],
+            "issues": [],
+            "fixes_applied": [],
+            "error": None,
+            "dry_run": req.dry_run,
+        }
 
-    for node_info in nodes_list:
-        node = node_info.get("node", "")
-        if not node:
-            continue
         try:
-            vms = pve.nodes(node).qemu.get()
-        except Exception:
-            continue
-
-        for vm in vms:
-            vmid = vm.get("vmid")
-            vm_name = vm.get("name", str(vmid))
-
-            entry: Dict[str, Any] = {
-                "node": node,
-                "vmid": vmid,
-                "vm_name": vm_name,
-                "issues": [],
-                "fixes_applied": [],
-                "error": None,
-                "dry_run": req.dry_run,
-            }
+            qemu = pve.nodes(vm["node"]).qemu(vm["vmid"])
+            cfg = qemu.config.get()
+            payload: Dict[str, Any] = {}
 
-            try:
-                cfg = pve.nodes(node).qemu(vmid).config.get()
-                payload: Dict[str, Any] = {}
-
-                # Check agent
-                if req.ensure_agent_enabled:
-                    agent_val = cfg.get("agent", "")
-                    agent_enabled = str(agent_val).startswith("1") or str(agent_val) == "enabled=1"
-                    if not agent_enabled:
-                        entry["issues"].append("QEMU agent disabled")
-                        payload["agent"] = "enabled=1"
-                        entry["fixes_applied"].append("Enable QEMU agent")
-
-                # Check onboot
-                if req.ensure_onboot:
-                    onboot_val = cfg.get("onboot", 0)
-                    if not onboot_val:
-                        entry["issues"].append("Start at boot disabled")
-                        payload["onboot"] = 1
-                        entry["fixes_applied"].append("Enable start at boot")
-
-                # Check required tags
-                if req.required_tags:
-                    raw = cfg.get("tags", "")
-                    current_tags = [t.strip() for t in raw.split(";") if t.strip()] if raw else []
-                    missing_tags = [t for t in req.required_tags if t.strip().lower() not in {x.lower() for x in current_tags}]
-                    if missing_tags:
-                        entry["issues"].append(f"Missing tags: {', '.join(missing_tags)}")
-                        new_tags = current_tags + [t.strip().lower() for t in missing_tags]
-                        payload["tags"] = ";".join(new_tags)
-                        entry["fixes_applied"].append(f"Add tags: {', '.join(missing_tags)}")
-
-                if payload and not req.dry_run:
-                    pve.nodes(node).qemu(vmid).config.put(**payload)
-                    pve_cache.clear_prefix(f"pve:{req.host_id}:")
+            # Check agent
+            if req.ensure_agent_enabled:
+                agent_val = cfg.get("agent", "")
+                agent_enabled = str(agent_val).startswith("1") or str(agent_val) == "enabled=1"
+                if not agent_enabled:
+                    entry["issues"].append("QEMU agent disabled")
+                    payload["agent"] = "enabled=1"
+                    entry["fixes_applied"].append("Enable QEMU agent")
+
+            # Check onboot
+            if req.ensure_onboot:
+                onboot_val = cfg.get("onboot", 0)
+                if not onboot_val:
+                    entry["issues"].append("Start at boot disabled")
+                    payload["onboot"] = 1
+                    entry["fixes_applied"].append("Enable start at boot")
+
+            # Check required tags
+            if req.required_tags:
+                raw = cfg.get("tags", "")
+                current_tags = [t.strip() for t in raw.split(";") if t.strip()] if raw else []
+                missing_tags = [t for t in req.required_tags if t.strip().lower() not in {x.lower() for x in current_tags}]
+                if missing_tags:
+                    entry["issues"].append(f"Missing tags: {', '.join(missing_tags)}")
+                    new_tags = current_tags + [t.strip().lower() for t in missing_tags]
+                    payload["tags"] = ";".join(new_tags)
+                    entry["fixes_applied"].append(f"Add tags: {', '.join(missing_tags)}")
 
-            except Exception as e:
-                entry["error"] = str(e)
+            if payload and not req.dry_run:
+                qemu.config.put(**payload)
 
-            results.append(entry)
+        except Exception as e:
+            entry["error"] = str(e)
+        return entry
 
-    compliant = [r for r in results if not r["issues"] and not r["error"]]
-    non_compliant = [r for r in results if r["issues"]]
-    errors = [r for r in results if r["error"]]
+    def summarize(results):
+        return {
+            "dry_run": req.dry_run,
+            "total_vms": len(results),
+            "compliant_count": sum(1 for r in results if not r["issues"] and not r["error"]),
+            "non_compliant_count": sum(1 for r in results if r["issues"]),
+            "error_count": sum(1 for r in results if r["error"]),
+            "results": results,
+        }
 
-    return {
-        "dry_run": req.dry_run,
-        "total_vms": len(results),
-        "compliant_count": len(compliant),
-        "non_compliant_count": len(non_compliant),
-        "error_count": len(errors),
-        "results": results,
-    }
+    return _submit("config-standardizer", items, work, db, current_user, summarize=summarize)
@@ -2,7 +2,7 @@
 from fastapi import APIRouter, Depends, HTTPException, Body
 from sqlalchemy.orm import Session
 from typing import Optional, List
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from app.core.database import get_db
 from app.models import ProxmoxHost
 from app.api.auth import get_current_user, require_operator, require_admin
@@ -312,58 +312,86 @@ def force_replication(
 
 # ── Node evacuation ───────────────────────────────────────────────────────────
 
+class EvacuateRequest(BaseModel):
+    target: Optional[str] = None                 # pin every guest to one node
+    include_stopped: bool = True
+    include_containers: bool = True
+    max_per_source: int = Field(2, ge=1, le=8)   # concurrent migrations leaving the node
+    max_per_target: int = Field(1, ge=1, le=4)   # concurrent migrations into any one node
+    max_attempts: int = Field(3, ge=1, le=5)
+
+
 @router.post("/{host_id}/nodes/{node}/evacuate")
 def evacuate_node(
     host_id: int,
     node: str,
-    body: dict = {},
+    req: Optional[EvacuateRequest] = None,
     db: Session = Depends(get_db),
     current_user=Depends(require_operator),
 ):
     """
-    Migrate all VMs off a node to other online nodes.
-    Optional body: { target: 'nodename' }  — if not given, picks first available online node.
-    Returns list of UPIDs for queued migrations.
+    Migrate all guests off a node as a background job.
+    Targets are picked by free memory; concurrent migrations are capped per
+    source and per target, and failures are retried on another node.
+    Returns the job (``job_id``) — poll ``/evacuations/{job_id}`` for progress.
     """
-    host = _get_host(host_id, db)
-    pve = _pve(host)
+    from app.services.evacuation import evacuation_scheduler
 
-    # Get all online nodes
+    req = req or EvacuateRequest()
+    host = _get_host(host_id, db)
     try:
-        all_nodes = pve.nodes.get()
+        return evacuation_scheduler.start(
+            host, node,
+            user_id=getattr(current_user, "id", None),
+            target=req.target,
+            include_stopped=req.include_stopped,
+            include_containers=req.include_containers,
+            max_per_source=req.max_per_source,
+            max_per_target=req.max_per_target,
+            max_attempts=req.max_attempts,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to list nodes: {e}")
+        raise HTTPException(status_code=500, detail=f"Failed to start evacuation: {e}")
 
-    online_nodes = [n["node"] for n in all_nodes if n.get("status") == "online" and n["node"] != node]
-    if not online_nodes:
-        raise HTTPException(status_code=400, detail="No online target nodes available for evacuation")
 
-    # Get VMs on the source node
-    try:
-        vms = pve.nodes(node).qemu.get()
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to list VMs: {e}")
+@router.get("/{host_id}/evacuations")
+def list_evacuations(
+    host_id: int,
+    current_user=Depends(get_current_user),
+):
+    """Evacuation jobs for a host, newest first (kept for a day after finishing)."""
+    from app.services.evacuation import evacuation_scheduler
+    return evacuation_scheduler.list(host_id)
 
-    # Pick target from body or round-robin
-    explicit_target = body.get("target")
-    upids = []
-    errors = []
 
-    for i, vm in enumerate(vms):
-        vmid = vm.get("vmid")
-        if not vmid:
-            continue
-        target_node = explicit_target or online_nodes[i % len(online_nodes)]
-        try:
-            upid = pve.nodes(node).qemu(vmid).migrate.post(
-                target=target_node,
-                online=1,
-            )
-            upids.append({"vmid": vmid, "target": target_node, "upid": upid})
-        except Exception as e:
-            errors.append({"vmid": vmid, "error": str(e)})
-
-    return {"queued": upids, "errors": errors, "total": len(vms)}
+@router.get("/{host_id}/evacuations/{job_id}")
+def get_evacuation(
+    host_id: int,
+    job_id: str,
+    current_user=Depends(get_current_user),
+):
+    """Live progress of one evacuation job."""
+    from app.services.evacuation import evacuation_scheduler
+    job = evacuation_scheduler.get(job_id)
+    if not job or job["host_id"] != host_id:
+        raise HTTPException(status_code=404, detail="Evacuation job not found")
+    return job
+
+
+@router.post("/{host_id}/evacuations/{job_id}/cancel")
+def cancel_evacuation(
+    host_id: int,
+    job_id: str,
+    current_user=Depends(require_operator),
+):
+    """Stop queuing migrations; ones already running are left to finish."""
+    from app.services.evacuation import evacuation_scheduler
+    job = evacuation_scheduler.get(job_id)
+    if not job or job["host_id"] != host_id:
+        raise HTTPException(status_code=404, detail="Evacuation job not found")
+    return evacuation_scheduler.cancel(job_id)
 
 
 # ── Cluster event log ─────────────────────────────────────────────────────────
@@ -6,6 +6,7 @@ from pydantic import BaseModel
 import logging
 
 from app.core.database import get_db
+from app.core.upstream_trace import in_context
 from app.models import (
     VirtualMachine,
     VMStatus,
@@ -70,7 +71,7 @@ async def get_dashboard_stats(
     # Fetch all hosts concurrently
     loop = asyncio.get_event_loop()
     with ThreadPoolExecutor(max_workers=min(len(active_hosts) or 1, 8)) as pool:
-        futures = [loop.run_in_executor(pool, fetch_resources_for_host, h) for h in active_hosts]
+        futures = [loop.run_in_executor(pool, in_context(fetch_resources_for_host), h) for h in active_hosts]
         results = await asyncio.gather(*futures, return_exceptions=True)
 
     total_vms = 0
@@ -242,7 +243,7 @@ async def get_dashboard_summary(
     from concurrent.futures import ThreadPoolExecutor
     loop = asyncio.get_event_loop()
     with ThreadPoolExecutor(max_workers=min(len(active_hosts) or 1, 8)) as pool:
-        futures = [loop.run_in_executor(pool, fetch_vm_summary, h) for h in active_hosts]
+        futures = [loop.run_in_executor(pool, in_context(fetch_vm_summary), h) for h in active_hosts]
         results = await asyncio.gather(*futures, return_exceptions=True)
 
     total_vms = 0
@@ -0,0 +1,70 @@
+"""Live event stream — Server-Sent Events fed by the server-side event hub."""
+import asyncio
+import json
+import logging
+import time
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session
+
+from app.api.auth import get_current_user
+from app.core.database import get_db
+from app.models import User, UserRole
+from app.services.event_hub import ADMIN_TOPICS, TOPICS, event_hub
+
+logger = logging.getLogger(__name__)
+router = APIRouter()
+
+# Seconds between keep-alive comments so proxies don't drop an idle stream.
+_KEEPALIVE = 15
+# Streams end after this long; the client reconnects with a fresh token, so a
+# revoked or expired session doesn't keep receiving data indefinitely.
+_MAX_STREAM_SECONDS = 900
+
+
+@router.get("/stream")
+async def event_stream(
+    request: Request,
+    topics: str = Query("nodes,guests,tasks", description="Comma-separated: " + ",".join(TOPICS)),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    """
+    Subscribe to live state. Emits one ``snapshot`` event per topic, then
+    ``delta`` events with ``upsert`` (changed items) and ``remove`` (keys).
+    Topics the caller may not see (``alerts`` for non-admins) are skipped.
+    """
+    wanted = [t.strip() for t in topics.split(",") if t.strip()]
+    unknown = [t for t in wanted if t not in TOPICS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown topic(s): {', '.join(unknown)}")
+    if current_user.role != UserRole.ADMIN:
+        wanted = [t for t in wanted if t not in ADMIN_TOPICS]
+    user_id = current_user.id
+    # The stream can stay open for minutes — don't pin a pooled DB connection to it.
+    db.close()
+
+    sub = event_hub.subscribe(wanted, user_id)
+
+    async def _stream():
+        deadline = time.monotonic() + _MAX_STREAM_SECONDS
+        try:
+            yield f"event: hello\ndata: {json.dumps({'topics': sorted(sub.topics)})}\n\n"
+            while time.monotonic() < deadline:
+                if await request.is_disconnected():
+                    break
+                try:
+                    message = await asyncio.wait_for(sub.queue.get(), timeout=_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield message
+        finally:
+            event_hub.unsubscribe(sub)
+
+    return StreamingResponse(
+        _stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
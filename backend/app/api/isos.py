@@ -1,11 +1,11 @@
 """ISO Images API routes"""
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, status, Request
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from pydantic import BaseModel, HttpUrl
 from typing import List, Optional, Dict
 from datetime import datetime
 import os
-import hashlib
 import shutil
 import requests
 import tempfile
@@ -18,6 +18,7 @@ from app.core.database import get_db
 from app.core.config import settings
 from app.models import ISOImage, OSType, User
 from app.api.auth import get_current_user, require_operator
+from app.services.iso_ingest import IsoIngestError, hash_file, receive_iso_upload, verify_many
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -107,17 +108,7 @@ def download_iso_background(
 
         # Calculate checksum
         logger.info(f"Calculating checksum for ISO ID {iso_id}...")
-        sha256_hash = hashlib.sha256()
-        chunk_size = 1024 * 1024  # 1MB chunks
-
-        with open(storage_path, "rb") as f:
-            while True:
-                chunk = f.read(chunk_size)
-                if not chunk:
-                    break
-                sha256_hash.update(chunk)
-
-        checksum = sha256_hash.hexdigest()
+        checksum = hash_file(storage_path)
         logger.info(f"Checksum calculated for ISO ID {iso_id}: {checksum}")
 
         # Update database
@@ -155,17 +146,7 @@ def calculate_checksum_background(
         logger.info(f"Calculating checksum for ISO ID {iso_id} at {storage_path}")
 
         # Calculate checksum
-        sha256_hash = hashlib.sha256()
-        chunk_size = 1024 * 1024  # 1MB chunks
-
-        with open(storage_path, "rb") as f:
-            while True:
-                chunk = f.read(chunk_size)
-                if not chunk:
-                    break
-                sha256_hash.update(chunk)
-
-        checksum = sha256_hash.hexdigest()
+        checksum = hash_file(storage_path)
         logger.info(f"Checksum calculated for ISO ID {iso_id}: {checksum}")
 
         # Update database
@@ -194,94 +175,6 @@ def calculate_checksum_background(
             db.close()
 
 
-def process_iso_file(
-    temp_path: str,
-    storage_path: str,
-    upload_id: str,
-    iso_id: int,
-    db_session
-):
-    """Process ISO file in background: copy with progress and calculate checksum"""
-    try:
-        upload_progress[upload_id] = {
-            "status": "copying",
-            "progress": 0,
-            "message": "Copying file to storage..."
-        }
-
-        # Get file size
-        file_size = os.path.getsize(temp_path)
-
-        # Copy with progress tracking
-        bytes_copied = 0
-        chunk_size = 1024 * 1024  # 1MB chunks
-
-        with open(temp_path, 'rb') as src:
-            with open(storage_path, 'wb') as dst:
-                while True:
-                    chunk = src.read(chunk_size)
-                    if not chunk:
-                        break
-                    dst.write(chunk)
-                    bytes_copied += len(chunk)
-                    progress = int((bytes_copied / file_size) * 50)  # First 50% for copying
-                    upload_progress[upload_id]["progress"] = progress
-
-        # Remove temp file
-        os.remove(temp_path)
-
-        # Calculate checksum with progress
-        upload_progress[upload_id].update({
-            "status": "calculating_checksum",
-            "progress": 50,
-            "message": "Calculating checksum..."
-        })
-
-        sha256_hash = hashlib.sha256()
-        bytes_hashed = 0
-
-        with open(storage_path, "rb") as f:
-            while True:
-                chunk = f.read(chunk_size)
-                if not chunk:
-                    break
-                sha256_hash.update(chunk)
-                bytes_hashed += len(chunk)
-                progress = 50 + int((bytes_hashed / file_size) * 50)  # Last 50% for checksum
-                upload_progress[upload_id]["progress"] = progress
-
-        checksum = sha256_hash.hexdigest()
-
-        # Update database
-        from app.core.database import SessionLocal
-        db = SessionLocal()
-        try:
-            iso = db.query(ISOImage).filter(ISOImage.id == iso_id).first()
-            if iso:
-                iso.checksum = checksum
-                db.commit()
-        finally:
-            db.close()
-
-        upload_progress[upload_id] = {
-            "status": "completed",
-            "progress": 100,
-            "message": "Upload completed successfully",
-            "checksum": checksum
-        }
-
-    except Exception as e:
-        logger.error(f"Error processing ISO: {e}")
-        upload_progress[upload_id] = {
-            "status": "error",
-            "progress": 0,
-            "message": f"Error: {str(e)}"
-        }
-        # Clean up on error
-        if os.path.exists(storage_path):
-            os.remove(storage_path)
-
-
 @router.get("/", response_model=List[ISOImageResponse])
 async def list_isos(
     skip: int = 0,
@@ -302,8 +195,7 @@ async def list_isos(
 
 @router.post("/", response_model=ISOImageResponse, status_code=status.HTTP_201_CREATED)
 async def upload_iso(
-    background_tasks: BackgroundTasks,
-    file: UploadFile = File(...),
+    request: Request,
     name: str = None,
     os_type: OSType = OSType.UBUNTU,
     version: str = None,
@@ -311,50 +203,54 @@ async def upload_iso(
     current_user: User = Depends(require_operator),
     db: Session = Depends(get_db),
 ):
-    """Upload an ISO image with progress tracking"""
-    # Validate file extension
-    if not file.filename.endswith('.iso'):
-        raise HTTPException(status_code=400, detail="Only ISO files are allowed")
+    """Upload an ISO image (multipart field ``file``).
 
+    The body is streamed straight into ISO storage and checksummed during
+    that single write; ``name``, ``os_type``, ``version`` and ``architecture``
+    may be sent as form fields or query parameters.
+    """
     # Create storage directory if it doesn't exist
     os.makedirs(settings.ISO_STORAGE_PATH, exist_ok=True)
 
-    # Generate unique filename — use basename to prevent path traversal
-    filename = os.path.basename(file.filename)
-    if not filename:
-        raise HTTPException(status_code=400, detail="Invalid filename")
-    storage_path = os.path.join(settings.ISO_STORAGE_PATH, filename)
-
-    # Check if file already exists
-    if os.path.exists(storage_path):
-        raise HTTPException(status_code=400, detail="ISO file already exists")
+    def _check_filename(client_name: str) -> str:
+        # Use basename to prevent path traversal
+        filename = os.path.basename(client_name.replace("\\", "/"))
+        if not filename.endswith('.iso'):
+            raise IsoIngestError("Only ISO files are allowed")
+        if os.path.exists(os.path.join(settings.ISO_STORAGE_PATH, filename)):
+            raise IsoIngestError("ISO file already exists")
+        return filename
 
     try:
-        # Save to temporary file first (fast - already in memory from upload)
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.iso') as tmp_file:
-            shutil.copyfileobj(file.file, tmp_file)
-            temp_path = tmp_file.name
-
-        # Calculate file size
-        file_size = os.path.getsize(temp_path)
+        storage_path, fields, file_size, checksum = await receive_iso_upload(
+            request.stream(),
+            request.headers.get("content-type", ""),
+            settings.ISO_STORAGE_PATH,
+            settings.MAX_ISO_SIZE,
+            _check_filename,
+        )
+    except IsoIngestError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to upload ISO: {str(e)}")
 
-        if file_size > settings.MAX_ISO_SIZE:
-            os.remove(temp_path)
-            raise HTTPException(
-                status_code=400,
-                detail=f"File too large. Maximum size is {settings.MAX_ISO_SIZE / (1024**3)}GB"
-            )
+    filename = os.path.basename(storage_path)
+    try:
+        os_type = OSType(fields["os_type"]) if fields.get("os_type") else os_type
+    except ValueError:
+        os.remove(storage_path)
+        raise HTTPException(status_code=400, detail=f"Invalid os_type '{fields['os_type']}'")
 
-        # Create database record with "processing" status
-        iso_name = name or filename.replace('.iso', '')
+    try:
+        iso_name = fields.get("name") or name or filename.replace('.iso', '')
         new_iso = ISOImage(
             name=iso_name,
             filename=filename,
             os_type=os_type,
-            version=version,
-            architecture=architecture,
+            version=fields.get("version") or version,
+            architecture=fields.get("architecture") or architecture,
             file_size=file_size,
-            checksum="processing...",
+            checksum=checksum,
             storage_path=storage_path,
             uploaded_by=current_user.id,
             is_available=True,
@@ -363,33 +259,23 @@ async def upload_iso(
         db.add(new_iso)
         db.commit()
         db.refresh(new_iso)
-
-        # Generate upload ID for progress tracking
-        upload_id = f"upload_{new_iso.id}"
-        upload_progress[upload_id] = {
-            "status": "queued",
-            "progress": 0,
-            "message": "Upload queued for processing..."
-        }
-
-        # Process file in background
-        background_tasks.add_task(
-            process_iso_file,
-            temp_path,
-            storage_path,
-            upload_id,
-            new_iso.id,
-            db
-        )
-
-        return new_iso
-
     except Exception as e:
-        # Clean up temp file if database operation fails
-        if 'temp_path' in locals() and os.path.exists(temp_path):
-            os.remove(temp_path)
+        # Don't leave an untracked file behind if the database write fails
+        if os.path.exists(storage_path):
+            os.remove(storage_path)
         raise HTTPException(status_code=500, detail=f"Failed to upload ISO: {str(e)}")
 
+    # Processing already happened during the upload; report it as done for
+    # clients that poll /{iso_id}/progress afterwards.
+    upload_progress[f"upload_{new_iso.id}"] = {
+        "status": "completed",
+        "progress": 100,
+        "message": "Upload completed successfully",
+        "checksum": checksum,
+    }
+    logger.info(f"ISO {filename} uploaded ({file_size} bytes, sha256 {checksum})")
+    return new_iso
+
 
 @router.post("/download", response_model=ISOImageResponse, status_code=status.HTTP_201_CREATED)
 async def download_iso_from_url(
@@ -550,12 +436,8 @@ async def verify_iso(
         db.commit()
         raise HTTPException(status_code=404, detail="ISO file not found on disk")
 
-    # Calculate current checksum
-    sha256_hash = hashlib.sha256()
-    with open(iso.storage_path, "rb") as f:
-        for byte_block in iter(lambda: f.read(4096), b""):
-            sha256_hash.update(byte_block)
-    current_checksum = sha256_hash.hexdigest()
+    # Calculate current checksum off the event loop
+    current_checksum = await run_in_threadpool(hash_file, iso.storage_path)
 
     # Compare with stored checksum
     if current_checksum == iso.checksum:
@@ -571,3 +453,36 @@ async def verify_iso(
             "expected": iso.checksum,
             "actual": current_checksum,
         }
+
+
+@router.post("/verify-all")
+async def verify_all_isos(
+    workers: int = 4,
+    current_user: User = Depends(require_operator),
+    db: Session = Depends(get_db),
+):
+    """Verify every available ISO's checksum, hashing several files in parallel"""
+    isos = db.query(ISOImage).filter(ISOImage.is_available == True).all()
+    present = [i for i in isos if os.path.exists(i.storage_path)]
+    checksums = await run_in_threadpool(
+        verify_many, [i.storage_path for i in present], max(1, min(workers, 8)),
+    )
+
+    results = []
+    for iso in isos:
+        actual = checksums.get(iso.storage_path)
+        if actual is None:
+            status_ = "missing"
+        elif actual == iso.checksum:
+            status_ = "valid"
+        else:
+            status_ = "invalid"
+        results.append({"id": iso.id, "filename": iso.filename, "status": status_,
+                        "expected": iso.checksum, "actual": actual})
+    return {
+        "total": len(results),
+        "valid": sum(1 for r in results if r["status"] == "valid"),
+        "invalid": sum(1 for r in results if r["status"] == "invalid"),
+        "missing": sum(1 for r in results if r["status"] == "missing"),
+        "results": results,
+    }
@@ -983,9 +983,8 @@ async def ai_tune_vm(
             password = vm.password
 
     try:
-        client = paramiko.SSHClient()
-        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-        client.connect(vm.ip_address, username=vm.username, password=password, timeout=30)
+        from app.services.ssh_pool import ssh_pool
+        client = ssh_pool.client(vm.ip_address, vm.username, password=password, timeout=30)
 
         def run(cmd):
             try:
@@ -1100,15 +1099,13 @@ _apply_jobs: dict = {}  # job_id → {status, output, error, created_at}
 
 def _run_apply_job(job_id: str, commands: list, ip: str, username: str, password):
     """Execute tuning commands via SSH, streaming output to the job store."""
-    import paramiko, shlex, time as _t
+    import shlex, time as _t
+    from app.services.ssh_pool import ssh_pool
     job = _apply_jobs[job_id]
     try:
-        client = paramiko.SSHClient()
-        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-        client.connect(ip, username=username, password=password, timeout=30)
-        # Send SSH keepalives every 30 s so NAT/firewalls don't drop long-running
-        # transfers (e.g. ollama pull of a several-GB model).
-        client.get_transport().set_keepalive(30)
+        # Pooled transports send keepalives every 30 s, so NAT/firewalls don't
+        # drop long-running transfers (e.g. ollama pull of a several-GB model).
+        client = ssh_pool.client(ip, username, password=password, timeout=30)
 
         for cmd in commands:
             job["output"] += f"$ {cmd}\n"
@@ -1294,9 +1291,8 @@ async def get_vm_models(
             password = vm.password
 
     try:
-        client = paramiko.SSHClient()
-        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-        client.connect(vm.ip_address, username=vm.username, password=password, timeout=30)
+        from app.services.ssh_pool import ssh_pool
+        client = ssh_pool.client(vm.ip_address, vm.username, password=password, timeout=30)
         _, stdout, _ = client.exec_command("ollama list 2>/dev/null", timeout=20)
         raw = stdout.read().decode("utf-8", errors="replace")
         stdout.channel.recv_exit_status()
@@ -1334,18 +1330,18 @@ async def get_vm_models(
 def _run_pull_job(job_id: str, model: str, ip: str, username: str, password):
     """Launch `ollama pull` as a background process on the VM, then poll the log file.
 
-    Uses short, independent SSH sessions for each poll so NAT timeouts and
-    SSH keepalive issues can never stall a large model download.
+    Uses a short, independent exec channel for each poll so NAT timeouts and
+    SSH keepalive issues can never stall a large model download; the pool
+    health-checks the underlying connection and reconnects if it dropped.
     """
-    import paramiko as _pm, shlex, time as _t, re as _re
+    import shlex, time as _t, re as _re
+    from app.services.ssh_pool import ssh_pool
 
     job = _apply_jobs[job_id]
     log_file = f"/tmp/depl0y-pull-{job_id}.log"
 
     def _ssh_run(cmd, timeout=20):
-        c = _pm.SSHClient()
-        c.set_missing_host_key_policy(_pm.AutoAddPolicy())
-        c.connect(ip, username=username, password=password, timeout=20)
+        c = ssh_pool.client(ip, username, password=password, timeout=20)
         stdin, stdout, _ = c.exec_command(
             f"sudo -S bash -c {shlex.quote(cmd)}", timeout=timeout
         )
@@ -1498,9 +1494,8 @@ async def delete_ollama_model(
             password = vm.password
 
     try:
-        client = paramiko.SSHClient()
-        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-        client.connect(vm.ip_address, username=vm.username, password=password, timeout=30)
+        from app.services.ssh_pool import ssh_pool
+        client = ssh_pool.client(vm.ip_address, vm.username, password=password, timeout=30)
         cmd = f"ollama rm {_shlex.quote(model_name)}"
         stdin, stdout, stderr = client.exec_command(
             f"sudo -S bash -c {_shlex.quote(cmd)}", timeout=30
@@ -1537,11 +1532,10 @@ async def delete_ollama_model(
 
 
 def _ssh_run_quick(ip: str, username: str, password: str, cmd: str, timeout: int = 15) -> str:
-    """Open a short SSH session, run one command, return stdout."""
-    import paramiko as _pm, shlex
-    c = _pm.SSHClient()
-    c.set_missing_host_key_policy(_pm.AutoAddPolicy())
-    c.connect(ip, username=username, password=password, timeout=15)
+    """Run one command on a pooled SSH connection, return stdout."""
+    import shlex
+    from app.services.ssh_pool import ssh_pool
+    c = ssh_pool.client(ip, username, password=password, timeout=15)
     stdin, stdout, _ = c.exec_command(
         f"sudo -S bash -c {shlex.quote(cmd)}", timeout=timeout
     )
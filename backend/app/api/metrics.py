@@ -0,0 +1,143 @@
+"""Metric history API — range queries over the node and guest metric stores."""
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+
+from app.api.auth import get_current_user
+from app.core.database import get_db
+from app.models import ProxmoxNode
+from app.services.guest_metrics import METRICS as GUEST_METRICS, SAMPLE, guest_metrics
+from app.services.metrics_store import DAY, HOUR, RAW, node_metrics_store
+
+router = APIRouter()
+
+_RESOLUTIONS = {"raw": RAW, "5m": RAW, "1h": HOUR, "1d": DAY}
+_GUEST_RESOLUTIONS = {"raw": SAMPLE, "1m": SAMPLE, "1h": HOUR}
+
+
+def _parse_ids(raw: Optional[str]) -> Optional[list]:
+    if not raw:
+        return None
+    try:
+        return [int(x) for x in raw.split(",") if x.strip()]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="ids must be a comma-separated list of integers")
+
+
+def _utc_naive(dt: datetime) -> datetime:
+    """Naive UTC, as stored; naive input is taken to be UTC already."""
+    return dt.astimezone(timezone.utc).replace(tzinfo=None) if dt.tzinfo else dt
+
+
+def _window(hours: int, start: Optional[datetime], end: Optional[datetime]):
+    end = _utc_naive(end) if end else datetime.utcnow()
+    start = _utc_naive(start) if start else end - timedelta(hours=hours)
+    if start >= end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+    return start, end
+
+
+@router.get("/nodes")
+def node_metric_history(
+    node_ids: Optional[str] = Query(None, description="Comma-separated ProxmoxNode ids (default: all)"),
+    host_id: Optional[int] = Query(None),
+    hours: int = Query(24, ge=1, le=24 * 730),
+    start: Optional[datetime] = Query(None, description="UTC; overrides hours"),
+    end: Optional[datetime] = Query(None, description="UTC; default now"),
+    resolution: str = Query("auto", description="auto | raw | 1h | 1d"),
+    db: Session = Depends(get_db),
+    current_user=Depends(get_current_user),
+) -> Dict[str, Any]:
+    """
+    CPU / memory / disk history for one or more nodes as parallel arrays.
+
+    ``auto`` uses raw 5-minute samples for ranges up to 2 days inside the last
+    week, hourly rollups up to 31 days inside the last 90 days, and daily
+    rollups beyond that. Rollups include min, avg, max and p95 per metric.
+    """
+    if resolution != "auto" and resolution not in _RESOLUTIONS:
+        raise HTTPException(status_code=400, detail="resolution must be auto, raw, 1h or 1d")
+    window_start, window_end = _window(hours, start, end)
+
+    q = db.query(ProxmoxNode.id, ProxmoxNode.node_name, ProxmoxNode.host_id)
+    ids = _parse_ids(node_ids)
+    if ids is not None:
+        q = q.filter(ProxmoxNode.id.in_(ids))
+    if host_id is not None:
+        q = q.filter(ProxmoxNode.host_id == host_id)
+    nodes = q.all()
+
+    result = node_metrics_store.query(
+        db, [n.id for n in nodes], window_start, window_end,
+        resolution=None if resolution == "auto" else _RESOLUTIONS[resolution],
+    )
+    for n in nodes:
+        result["nodes"][n.id].update({"node_name": n.node_name, "host_id": n.host_id})
+    result.update({"start": window_start.isoformat(), "end": window_end.isoformat()})
+    return result
+
+
+def _guest_resolution(resolution: str) -> Optional[int]:
+    if resolution == "auto":
+        return None
+    if resolution not in _GUEST_RESOLUTIONS:
+        raise HTTPException(status_code=400, detail="resolution must be auto, raw or 1h")
+    return _GUEST_RESOLUTIONS[resolution]
+
+
+@router.get("/guests/top")
+def guest_metric_top(
+    metric: str = Query("disk_write", description=" | ".join(GUEST_METRICS)),
+    agg: str = Query("max", description="max (peak, with time) | avg"),
+    limit: int = Query(10, ge=1, le=100),
+    host_id: Optional[int] = Query(None),
+    hours: int = Query(12, ge=1, le=24 * 90),
+    start: Optional[datetime] = Query(None, description="UTC; overrides hours"),
+    end: Optional[datetime] = Query(None, description="UTC; default now"),
+    resolution: str = Query("auto", description="auto | raw | 1h"),
+    db: Session = Depends(get_db),
+    current_user=Depends(get_current_user),
+) -> Dict[str, Any]:
+    """
+    Guests ranked by one metric over a window, e.g. the top disk writers
+    overnight. cpu / memory are percent of the guest's allocation; disk and
+    net metrics are bytes per second.
+    """
+    if metric not in GUEST_METRICS:
+        raise HTTPException(status_code=400, detail=f"metric must be one of: {', '.join(GUEST_METRICS)}")
+    if agg not in ("max", "avg"):
+        raise HTTPException(status_code=400, detail="agg must be max or avg")
+    window_start, window_end = _window(hours, start, end)
+    result = guest_metrics.top(
+        db, metric, window_start, window_end, limit=limit, agg=agg,
+        host_id=host_id, resolution=_guest_resolution(resolution),
+    )
+    result.update({"start": window_start.isoformat(), "end": window_end.isoformat()})
+    return result
+
+
+@router.get("/guests/{host_id}/{vmid}")
+def guest_metric_history(
+    host_id: int,
+    vmid: int,
+    hours: int = Query(24, ge=1, le=24 * 90),
+    start: Optional[datetime] = Query(None, description="UTC; overrides hours"),
+    end: Optional[datetime] = Query(None, description="UTC; default now"),
+    resolution: str = Query("auto", description="auto | raw | 1h"),
+    db: Session = Depends(get_db),
+    current_user=Depends(get_current_user),
+) -> Dict[str, Any]:
+    """
+    CPU, memory, disk and network history for one VM or container.
+
+    ``auto`` uses 1-minute samples for ranges up to 2 days inside the last
+    3 days and hourly avg / max rollups (kept 90 days) otherwise.
+    """
+    window_start, window_end = _window(hours, start, end)
+    result = guest_metrics.history(
+        db, host_id, vmid, window_start, window_end, resolution=_guest_resolution(resolution),
+    )
+    result.update({"start": window_start.isoformat(), "end": window_end.isoformat()})
+    return result
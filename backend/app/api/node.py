@@ -1,5 +1,6 @@
 """Node-level Proxmox management: status, RRD charts, tasks, storage content, network"""
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Body
+from fastapi import APIRouter, Depends, HTTPException, Body, Request
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from pydantic import BaseModel, Field, validator
 from typing import Optional, List, Any, Dict
@@ -8,7 +9,10 @@ from app.models import ProxmoxHost
 from app.api.auth import get_current_user, require_operator, require_admin
 from app.services.proxmox import ProxmoxService
 from app.services.task_tracker import task_tracker
-from app.core.cache import pve_cache
+from app.services.storage_upload import (
+    UploadError, new_upload_id, storage_upload_progress, stream_upload,
+)
+from app.core.cache import pve_cache, guest_list_tag, vm_tag
 import logging
 import re
 import time as _time
@@ -255,11 +259,8 @@ def cluster_resources(host_id: int, type: Optional[str] = None, nocache: bool =
                       db: Session = Depends(get_db), current_user=Depends(get_current_user)):
     host = _get_host(host_id, db)
     cache_key = f"pve:{host_id}:cluster/resources:{type or ''}"
-    if not nocache:
-        cached = pve_cache.get(cache_key)
-        if cached is not None:
-            return cached
-    try:
+
+    def _load():
         # Proxmox /cluster/resources only accepts type=vm|storage|node|sdn.
         # LXC containers are returned as type=vm at the API level but have
         # item["type"]=="lxc". Map "lxc"/"qemu" → "vm" then post-filter.
@@ -274,8 +275,15 @@ def cluster_resources(host_id: int, type: Optional[str] = None, nocache: bool =
         result = _pve(host).cluster.resources.get(**params)
         if filter_subtype:
             result = [r for r in result if r.get("type") == filter_subtype]
-        pve_cache.set(cache_key, result, ttl=15)
         return result
+
+    try:
+        if nocache:
+            result = _load()
+            pve_cache.set(cache_key, result, ttl=15, tags=(guest_list_tag(host_id),))
+            return result
+        # Concurrent misses (dashboards polling together) share one PVE call
+        return pve_cache.get_or_load(cache_key, _load, ttl=15, tags=(guest_list_tag(host_id),))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -285,7 +293,20 @@ def get_disk_io_rates(host_id: int, db: Session = Depends(get_db),
                       current_user=Depends(get_current_user)):
     """Return per-node disk I/O rates (B/s) computed from VM counter deltas.
     First call primes the state and returns the last cached result (or []).
-    Subsequent calls return live rates. State persists for the backend lifetime."""
+    Subsequent calls return live rates. State persists for the backend lifetime.
+    Served from the guest metric collector's latest sample when it is fresh."""
+    from app.services.guest_metrics import SAMPLE, guest_metrics
+
+    latest = guest_metrics.latest(host_id, max_age=SAMPLE * 2)
+    if latest and any(g["disk_read"] is not None for g in latest):
+        node_agg: dict = {}
+        for g in latest:
+            agg = node_agg.setdefault(g["node"] or "unknown",
+                                      {"node": g["node"] or "unknown", "read": 0.0, "write": 0.0})
+            agg["read"] += g["disk_read"] or 0.0
+            agg["write"] += g["disk_write"] or 0.0
+        return sorted(node_agg.values(), key=lambda x: x["node"])
+
     host = _get_host(host_id, db)
     try:
         resources = _pve(host).cluster.resources.get()
@@ -787,7 +808,7 @@ def node_vms(host_id: int, node: str, db: Session = Depends(get_db),
         for v in vms:
             v["type"] = "qemu"
         result = {"vms": vms, "containers": cts}
-        pve_cache.set(cache_key, result, ttl=15)
+        pve_cache.set(cache_key, result, ttl=15, tags=(guest_list_tag(host_id),))
         return result
     except Exception as e:
         if _is_offline_error(e):
@@ -1139,7 +1160,7 @@ def list_containers(host_id: int, node: str, db: Session = Depends(get_db),
         return cached
     try:
         result = _pve(host).nodes(node).lxc.get()
-        pve_cache.set(cache_key, result, ttl=15)
+        pve_cache.set(cache_key, result, ttl=15, tags=(guest_list_tag(host_id),))
         return result
     except Exception as e:
         if _is_offline_error(e):
@@ -1428,7 +1449,7 @@ def ct_rrddata(host_id: int, node: str, vmid: int,
         return cached
     try:
         result = _pve(host).nodes(node).lxc(vmid).rrddata.get(timeframe=timeframe, cf=cf)
-        pve_cache.set(cache_key, result, ttl=60)
+        pve_cache.set(cache_key, result, ttl=60, tags=(vm_tag(host_id, vmid),))
         return result
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -1699,24 +1720,44 @@ def get_certificates(host_id: int, node: str, db: Session = Depends(get_db),
 # ── Storage upload ────────────────────────────────────────────────────────────
 
 @router.post("/{host_id}/nodes/{node}/storage/{storage}/upload")
-async def upload_to_storage(host_id: int, node: str, storage: str,
-                            file: UploadFile = File(...),
+async def upload_to_storage(host_id: int, node: str, storage: str, request: Request,
+                            content: Optional[str] = None,
+                            upload_id: Optional[str] = None,
                             db: Session = Depends(get_db),
                             current_user=Depends(require_operator)):
-    """Upload an ISO or file to Proxmox storage."""
+    """Upload an ISO or file to Proxmox storage.
+
+    The multipart body is streamed to Proxmox as it arrives (never held in
+    memory). Pass ``upload_id`` to poll ``/uploads/{upload_id}/progress``
+    while the request is in flight.
+    """
     host = _get_host(host_id, db)
+    upload_id = upload_id or new_upload_id()
     try:
-        content = await file.read()
-        result = _pve(host).nodes(node).storage(storage).upload.post(
-            content="iso",
-            filename=file.filename,
-            file=(file.filename, content, file.content_type or "application/octet-stream"),
+        proxmox = await run_in_threadpool(_pve, host)
+        length = request.headers.get("content-length")
+        return await stream_upload(
+            proxmox, node, storage, request.stream(),
+            request.headers.get("content-type", ""),
+            int(length) if length and length.isdigit() else None,
+            upload_id, content=content,
         )
-        return {"upid": result}
+    except UploadError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get("/{host_id}/uploads/{upload_id}/progress")
+def get_storage_upload_progress(host_id: int, upload_id: str,
+                                current_user=Depends(get_current_user)):
+    """Progress of a streaming storage upload."""
+    entry = storage_upload_progress.get(upload_id)
+    if entry is None:
+        return {"status": "not_found", "progress": 0, "message": "Upload not tracked"}
+    return entry
+
+
 # ── Storage download-url ──────────────────────────────────────────────────────
 
 @router.post("/{host_id}/nodes/{node}/storage/{storage}/download-url")
@@ -17,6 +17,7 @@ from sqlalchemy.orm import Session
 
 from app.api.auth import get_current_user, require_admin, require_operator
 from app.core.database import get_db
+from app.core.upstream_trace import in_context
 from app.models import PBSServer, User
 from app.services.pbs import PBSService
 
@@ -573,12 +574,12 @@ def get_server_summary(
             return None
 
     with ThreadPoolExecutor(max_workers=4) as pool:
-        f_ds = pool.submit(_safe, svc.get_datastores)
-        f_jobs = pool.submit(_safe, svc.get_sync_jobs)
-        f_remotes = pool.submit(_safe, svc.get_remotes)
+        f_ds = pool.submit(in_context(_safe), svc.get_datastores)
+        f_jobs = pool.submit(in_context(_safe), svc.get_sync_jobs)
+        f_remotes = pool.submit(in_context(_safe), svc.get_remotes)
         since_epoch = int(time.time()) - 86400
         f_tasks = pool.submit(
-            _safe,
+            in_context(_safe),
             lambda: svc.list_recent_tasks(
                 since_epoch=since_epoch,
                 types=["backup", "verificationjob", "sync", "prune", "garbage_collection"],
@@ -605,7 +606,7 @@ def get_server_summary(
                 errors.append(f"{name}: {exc}")
                 return name, {}
         with ThreadPoolExecutor(max_workers=min(6, len(store_names))) as pool:
-            for name, status in pool.map(_store_status, store_names):
+            for name, status in pool.map(in_context(_store_status), store_names):
                 usage_by_store[name] = status or {}
 
     # Datastore totals
@@ -12,7 +12,10 @@ from app.models import ProxmoxHost, ProxmoxNode
 from app.api.auth import get_current_user, require_admin
 from app.models import User, UserRole
 from app.services.proxmox import ProxmoxService, poll_proxmox_resources
+from app.services.proxmox_pool import proxmox_pool
+from app.services.inventory import inventory_poller
 from app.core.cache import pve_cache
+from app.core.upstream_trace import in_context
 import logging
 import time
 from concurrent.futures import ThreadPoolExecutor, as_completed
@@ -522,7 +525,7 @@ async def get_federation_summary(
     summaries = []
     if hosts:
         with ThreadPoolExecutor(max_workers=min(len(hosts), 10)) as executor:
-            futures = {executor.submit(_fetch_host_summary, h): h for h in hosts}
+            futures = {executor.submit(in_context(_fetch_host_summary), h): h for h in hosts}
             for future in as_completed(futures):
                 try:
                     summaries.append(future.result())
@@ -634,6 +637,7 @@ async def update_proxmox_host(
     host.updated_at = datetime.utcnow()
     db.commit()
     db.refresh(host)
+    proxmox_pool.invalidate(host_id)
 
     # Invalidate federation summary cache so map updates immediately
     for key in (f"proxmox:version:{host_id}", f"datacenter:summary:{host_id}", "federation:summary"):
@@ -655,6 +659,8 @@ async def delete_proxmox_host(
 
     db.delete(host)
     db.commit()
+    proxmox_pool.invalidate(host_id)
+    inventory_poller.forget(host_id)
 
     return None
 
@@ -923,6 +929,7 @@ async def reconnect_proxmox_host(
         "federation:summary",
     ):
         pve_cache.delete(key) if hasattr(pve_cache, "delete") else None
+    proxmox_pool.invalidate(host_id)
 
     try:
         svc = ProxmoxService(host)
@@ -1,5 +1,5 @@
 """System information API endpoints"""
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Response
 from sqlalchemy.orm import Session
 from app.core.database import get_db
 from app.models.database import SystemSettings
@@ -315,6 +315,8 @@ def get_metrics(
         pass
 
     uptime_seconds = int(time.time() - _app_start_time)
+    from app.core.audit_writer import audit_writer
+    audit = audit_writer.stats()
 
     return {
         "depl0y_users_total": users_total,
@@ -322,9 +324,21 @@ def get_metrics(
         "depl0y_api_keys_total": api_keys_total,
         "depl0y_requests_total": _request_counter,
         "depl0y_uptime_seconds": uptime_seconds,
+        "depl0y_audit_queue_depth": audit["queue_depth"],
+        "depl0y_audit_events_written_total": audit["written"],
+        "depl0y_audit_events_dropped_total": audit["dropped"],
     }
 
 
+@router.get("/metrics/prometheus")
+def get_prometheus_metrics(
+    current_user: User = Depends(require_admin),
+) -> Response:
+    """Return request, upstream, scheduler, DB pool and cache metrics in Prometheus text format (admin only)"""
+    from app.core import telemetry
+    return Response(content=telemetry.render(), media_type=telemetry.CONTENT_TYPE)
+
+
 @router.get("/settings")
 def get_all_settings(
     db: Session = Depends(get_db),
@@ -439,6 +453,163 @@ def cache_stats(
     return pve_cache.stats()
 
 
+@router.get("/proxmox-pool/stats")
+def proxmox_pool_stats(
+    current_user: User = Depends(require_admin),
+) -> Dict[str, Any]:
+    """Return pooled Proxmox client statistics (admin only)"""
+    from app.services.proxmox_pool import proxmox_pool
+    return proxmox_pool.stats()
+
+
+@router.get("/inventory/stats")
+def inventory_stats(
+    current_user: User = Depends(require_admin),
+) -> Dict[str, Any]:
+    """Return inventory poller snapshot ages and last-run statistics (admin only)"""
+    from app.services.inventory import inventory_poller
+    return inventory_poller.stats()
+
+
+@router.get("/audit-queue/stats")
+def audit_queue_stats(
+    current_user: User = Depends(require_admin),
+) -> Dict[str, Any]:
+    """Return audit log write-behind queue statistics (admin only)"""
+    from app.core.audit_writer import audit_writer
+    return audit_writer.stats()
+
+
+@router.get("/delivery-engine/stats")
+def delivery_engine_stats(
+    current_user: User = Depends(require_admin),
+) -> Dict[str, Any]:
+    """Return webhook/Slack/PagerDuty delivery engine statistics (admin only)"""
+    from app.services.delivery_engine import delivery_engine
+    return delivery_engine.stats()
+
+
+@router.get("/event-hub/stats")
+def event_hub_stats(
+    current_user: User = Depends(require_admin),
+) -> Dict[str, Any]:
+    """Return live event stream subscriber and refresh statistics (admin only)"""
+    from app.services.event_hub import event_hub
+    return event_hub.stats()
+
+
+@router.get("/guest-metrics/stats")
+def guest_metrics_stats(
+    current_user: User = Depends(require_admin),
+) -> Dict[str, Any]:
+    """Return per-guest metric collector statistics (admin only)"""
+    from app.services.guest_metrics import guest_metrics
+    return guest_metrics.stats()
+
+
+@router.get("/bulk-executor/stats")
+def bulk_executor_stats(
+    current_user: User = Depends(require_admin),
+) -> Dict[str, Any]:
+    """Return bulk operation executor statistics (admin only)"""
+    from app.services.bulk_executor import bulk_executor
+    return bulk_executor.stats()
+
+
+@router.get("/orphan-scanner/stats")
+def orphan_scanner_stats(
+    current_user: User = Depends(require_admin),
+) -> Dict[str, Any]:
+    """Return orphaned-disk index statistics (admin only)"""
+    from app.services.orphan_scanner import orphan_scanner
+    return orphan_scanner.stats()
+
+
+@router.get("/ssh-pool/stats")
+def ssh_pool_stats(
+    current_user: User = Depends(require_admin),
+) -> Dict[str, Any]:
+    """Return SSH connection pool statistics (admin only)"""
+    from app.services.ssh_pool import ssh_pool
+    return ssh_pool.stats()
+
+
+@router.get("/vm-scans/stats")
+def vm_scans_stats(
+    current_user: User = Depends(require_admin),
+) -> Dict[str, Any]:
+    """Return scheduled update / security scan statistics (admin only)"""
+    from app.services.vm_scans import vm_scan_runner
+    return vm_scan_runner.stats()
+
+
+@router.get("/alert-engine/stats")
+def alert_engine_stats(
+    current_user: User = Depends(require_admin),
+) -> Dict[str, Any]:
+    """Return alert evaluation cycle statistics (admin only)"""
+    from app.services.alert_engine import alert_engine
+    return alert_engine.stats()
+
+
+@router.get("/alert-notifier/stats")
+def alert_notifier_stats(
+    current_user: User = Depends(require_admin),
+) -> Dict[str, Any]:
+    """Return alert notification queue statistics (admin only)"""
+    from app.services.alert_notifier import alert_notifier
+    return alert_notifier.stats()
+
+
+@router.get("/analysis-engine/stats")
+def analysis_engine_stats(
+    current_user: User = Depends(require_admin),
+) -> Dict[str, Any]:
+    """Return incremental analysis cycle statistics (admin only)"""
+    from app.services.analysis_engine import analysis_engine
+    return analysis_engine.stats()
+
+
+@router.get("/upstream-calls")
+def upstream_calls(
+    limit: int = 25,
+    system: Optional[str] = None,
+    current_user: User = Depends(require_admin),
+) -> Dict[str, Any]:
+    """Return the top outbound PVE/PBS/Redfish endpoints by total time and the slowest calls (admin only)"""
+    from app.core.upstream_trace import upstream_tracer
+    limit = max(1, min(limit, 500))
+    return {
+        **upstream_tracer.stats(),
+        "endpoints": upstream_tracer.top_endpoints(limit=limit, system=system),
+        "slowest": upstream_tracer.slowest(limit=limit),
+    }
+
+
+@router.get("/upstream-calls/requests/{request_id}")
+def upstream_calls_for_request(
+    request_id: str,
+    current_user: User = Depends(require_admin),
+) -> Dict[str, Any]:
+    """Return the outbound calls made while serving one API request, by X-Request-ID (admin only)"""
+    from app.core.upstream_trace import upstream_tracer
+    trace = upstream_tracer.request_trace(request_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail="No upstream calls recorded for this request ID")
+    return trace
+
+
+@router.post("/upstream-calls/reset")
+def reset_upstream_calls(
+    current_user: User = Depends(require_admin),
+) -> Dict[str, str]:
+    """Clear the outbound call aggregates and slow-call buffer (admin only)"""
+    from app.core.upstream_trace import upstream_tracer
+    upstream_tracer.reset()
+    logger.info(f"Upstream call statistics cleared by {current_user.username}")
+    return {"success": "true", "message": "Upstream call statistics cleared"}
+
+
 @router.post("/cache/clear")
 def clear_cache(
     current_user: User = Depends(require_admin),
@@ -40,18 +40,28 @@ def _pve(host: ProxmoxHost):
 @router.get("/running")
 def get_running_tasks(db: Session = Depends(get_db), current_user=Depends(get_current_user)):
     """List all currently-running tasks: Depl0y-tracked + live poll from Proxmox."""
+    return collect_running_tasks(db)
+
+
+def collect_running_tasks(db: Session) -> list:
+    """Running tasks from the tracker, every PVE node and every PBS server.
+
+    Shared by GET /tasks/running and the live event hub's ``tasks`` topic.
+    """
     # Start with Depl0y in-memory tracked tasks
     tracked = task_tracker.get_running()
     tracked_upids = {t["upid"] for t in tracked}
 
     # Also query Proxmox directly for any running tasks across all active hosts/nodes
     pve_running = []
+    clients = {}  # host_id → client, reused for the log-progress reads below
     try:
         hosts = db.query(ProxmoxHost).filter(ProxmoxHost.is_active == True).all()
         from app.models.database import ProxmoxNode
         for host in hosts:
             try:
                 pve = _pve(host)
+                clients[host.id] = pve
                 db_nodes = db.query(ProxmoxNode).filter(ProxmoxNode.host_id == host.id).all()
                 # Fall back to live Proxmox node query if DB has no records yet
                 if db_nodes:
@@ -139,6 +149,7 @@ def get_running_tasks(db: Session = Depends(get_db), current_user=Depends(get_cu
                 node=t.get("node"),
                 started_at_ts=t.get("started_at"),
                 task_type=t.get("task_type") or "",
+                pve=clients.get(t.get("host_id")),
             )
         elif t.get("source") == "pbs":
             # PBS tasks — use a time-based estimate for now (no log-parse yet).
@@ -165,7 +176,7 @@ def get_task_history(
     user_id: Optional[int] = None,
     current_user=Depends(get_current_user),
 ):
-    """List recent completed tasks from the in-memory tracker."""
+    """List recent completed tasks from the task history table."""
     # Non-admins only see their own tasks
     from app.models import UserRole
     effective_user_id = user_id
@@ -21,6 +21,7 @@ from sqlalchemy.orm import Session
 
 from app.api.auth import get_current_user
 from app.core.database import get_db
+from app.core.upstream_trace import in_context
 from app.models.database import (
     PBSServer,
     ProxmoxHost,
@@ -436,7 +437,7 @@ def _collect_host_subtree(
     # Fan out one worker per node (most hosts are single-node, clusters are 3-5)
     max_workers = max(2, min(len(pve_nodes) or 1, 8))
     with ThreadPoolExecutor(max_workers=max_workers) as pool:
-        futures = [pool.submit(_process_node, n) for n in pve_nodes]
+        futures = [pool.submit(in_context(_process_node), n) for n in pve_nodes]
         for fut in as_completed(futures):
             try:
                 partial = fut.result()
@@ -593,7 +594,7 @@ async def get_topology_graph(
         with ThreadPoolExecutor(max_workers=max(2, min(len(hosts), 8))) as pool:
             futs = {
                 pool.submit(
-                    _collect_host_subtree,
+                    in_context(_collect_host_subtree),
                     h,
                     include_stopped,
                     include_bridges,
@@ -694,7 +695,7 @@ async def get_topology_graph(
             with ThreadPoolExecutor(
                 max_workers=max(2, min(len(pbs_servers), 8))
             ) as pool:
-                futs = {pool.submit(_collect_pbs_subtree, p): p for p in pbs_servers}
+                futs = {pool.submit(in_context(_collect_pbs_subtree), p): p for p in pbs_servers}
                 for fut in as_completed(futs):
                     p = futs[fut]
                     try:
@@ -26,6 +26,7 @@ from sqlalchemy.orm import Session
 
 from app.api.auth import get_current_user, require_admin, require_operator
 from app.core.database import get_db
+from app.core.upstream_trace import in_context
 from app.models import ProxmoxHost, PBSServer, User
 from app.models.database import AuditLog
 from app.services.proxmox import ProxmoxService
@@ -221,10 +222,10 @@ def updates_overview(
 
     results: List[Dict[str, Any]] = []
     with ThreadPoolExecutor(max_workers=6) as pool:
-        for r in pool.map(_pve_one, pve_targets):
+        for r in pool.map(in_context(_pve_one), pve_targets):
             if r is not None:
                 results.append(r)
-        for r in pool.map(_pbs_one, pbs_servers):
+        for r in pool.map(in_context(_pbs_one), pbs_servers):
             if r is not None:
                 results.append(r)
 
@@ -8,7 +8,7 @@ from app.models import ProxmoxHost
 from app.api.auth import get_current_user, require_operator
 from app.services.proxmox import ProxmoxService
 from app.services.task_tracker import task_tracker
-from app.core.cache import pve_cache
+from app.core.cache import pve_cache, vm_tag
 import logging
 
 logger = logging.getLogger(__name__)
@@ -185,13 +185,11 @@ def get_vm_config(host_id: int, node: str, vmid: int, db: Session = Depends(get_
                   current_user=Depends(get_current_user)):
     host = _get_host(host_id, db)
     cache_key = f"pve:{host_id}:{node}/{vmid}/config"
-    cached = pve_cache.get(cache_key)
-    if cached is not None:
-        return cached
     try:
-        cfg = _pve(_svc(host)).nodes(node).qemu(vmid).config.get()
-        pve_cache.set(cache_key, cfg, ttl=30)
-        return cfg
+        return pve_cache.get_or_load(
+            cache_key, lambda: _pve(_svc(host)).nodes(node).qemu(vmid).config.get(),
+            ttl=30, tags=(vm_tag(host_id, vmid),),
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -210,7 +208,7 @@ def update_vm_config(host_id: int, node: str, vmid: int, update: ConfigUpdate,
         payload[_HYPHEN_KEYS.get(k, k)] = v
     try:
         _pve(_svc(host)).nodes(node).qemu(vmid).config.put(**payload)
-        pve_cache.clear_prefix(f"pve:{host_id}:")
+        pve_cache.invalidate_vm(host_id, vmid)
         return {"success": True}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -326,11 +324,11 @@ def get_vm_guest_agent(host_id: int, node: str, vmid: int,
     ])
     if not any_success:
         payload = {"available": False, "data": None, "error": last_err or "Guest agent not responding"}
-        pve_cache.set(cache_key, payload, ttl=15)
+        pve_cache.set(cache_key, payload, ttl=15, tags=(vm_tag(host_id, vmid),))
         return payload
 
     payload = {"available": True, "data": data, "error": None}
-    pve_cache.set(cache_key, payload, ttl=30)
+    pve_cache.set(cache_key, payload, ttl=30, tags=(vm_tag(host_id, vmid),))
     return payload
 
 
@@ -339,13 +337,11 @@ def get_vm_status(host_id: int, node: str, vmid: int, db: Session = Depends(get_
                   current_user=Depends(get_current_user)):
     host = _get_host(host_id, db)
     cache_key = f"pve:{host_id}:{node}/{vmid}/status"
-    cached = pve_cache.get(cache_key)
-    if cached is not None:
-        return cached
     try:
-        st = _pve(_svc(host)).nodes(node).qemu(vmid).status.current.get()
-        pve_cache.set(cache_key, st, ttl=10)
-        return st
+        return pve_cache.get_or_load(
+            cache_key, lambda: _pve(_svc(host)).nodes(node).qemu(vmid).status.current.get(),
+            ttl=10, tags=(vm_tag(host_id, vmid),),
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -390,7 +386,7 @@ def start_vm(host_id: int, node: str, vmid: int, db: Session = Depends(get_db),
     host = _get_host(host_id, db)
     try:
         upid = _pve(_svc(host)).nodes(node).qemu(vmid).status.start.post()
-        pve_cache.clear_prefix(f"pve:{host_id}:")
+        pve_cache.invalidate_vm(host_id, vmid)
         _register_vm_task(upid, host_id, node, vmid, "start", current_user)
         _fire_vm_webhook(db, "vm.start", host, node, vmid, current_user, host_id)
         return {"upid": upid}
@@ -404,7 +400,7 @@ def stop_vm(host_id: int, node: str, vmid: int, db: Session = Depends(get_db),
     host = _get_host(host_id, db)
     try:
         upid = _pve(_svc(host)).nodes(node).qemu(vmid).status.stop.post()
-        pve_cache.clear_prefix(f"pve:{host_id}:")
+        pve_cache.invalidate_vm(host_id, vmid)
         _register_vm_task(upid, host_id, node, vmid, "stop", current_user)
         _fire_vm_webhook(db, "vm.stop", host, node, vmid, current_user, host_id)
         return {"upid": upid}
@@ -418,7 +414,7 @@ def shutdown_vm(host_id: int, node: str, vmid: int, db: Session = Depends(get_db
     host = _get_host(host_id, db)
     try:
         upid = _pve(_svc(host)).nodes(node).qemu(vmid).status.shutdown.post()
-        pve_cache.clear_prefix(f"pve:{host_id}:")
+        pve_cache.invalidate_vm(host_id, vmid)
         _register_vm_task(upid, host_id, node, vmid, "shutdown", current_user)
         _fire_vm_webhook(db, "vm.shutdown", host, node, vmid, current_user, host_id)
 
@@ -433,7 +429,7 @@ def reboot_vm(host_id: int, node: str, vmid: int, db: Session = Depends(get_db),
     host = _get_host(host_id, db)
     try:
         upid = _pve(_svc(host)).nodes(node).qemu(vmid).status.reboot.post()
-        pve_cache.clear_prefix(f"pve:{host_id}:")
+        pve_cache.invalidate_vm(host_id, vmid)
         _register_vm_task(upid, host_id, node, vmid, "reboot", current_user)
         return {"upid": upid}
     except Exception as e:
@@ -446,7 +442,7 @@ def reset_vm(host_id: int, node: str, vmid: int, db: Session = Depends(get_db),
     host = _get_host(host_id, db)
     try:
         upid = _pve(_svc(host)).nodes(node).qemu(vmid).status.reset.post()
-        pve_cache.clear_prefix(f"pve:{host_id}:")
+        pve_cache.invalidate_vm(host_id, vmid)
         _register_vm_task(upid, host_id, node, vmid, "reset", current_user)
         return {"upid": upid}
     except Exception as e:
@@ -459,7 +455,7 @@ def suspend_vm(host_id: int, node: str, vmid: int, db: Session = Depends(get_db)
     host = _get_host(host_id, db)
     try:
         upid = _pve(_svc(host)).nodes(node).qemu(vmid).status.suspend.post()
-        pve_cache.clear_prefix(f"pve:{host_id}:")
+        pve_cache.invalidate_vm(host_id, vmid)
         _register_vm_task(upid, host_id, node, vmid, "suspend", current_user)
         return {"upid": upid}
     except Exception as e:
@@ -472,7 +468,7 @@ def resume_vm(host_id: int, node: str, vmid: int, db: Session = Depends(get_db),
     host = _get_host(host_id, db)
     try:
         upid = _pve(_svc(host)).nodes(node).qemu(vmid).status.resume.post()
-        pve_cache.clear_prefix(f"pve:{host_id}:")
+        pve_cache.invalidate_vm(host_id, vmid)
         _register_vm_task(upid, host_id, node, vmid, "resume", current_user)
         return {"upid": upid}
     except Exception as e:
@@ -491,7 +487,7 @@ def list_snapshots(host_id: int, node: str, vmid: int, db: Session = Depends(get
         return cached
     try:
         snaps = _pve(_svc(host)).nodes(node).qemu(vmid).snapshot.get()
-        pve_cache.set(cache_key, snaps, ttl=30)
+        pve_cache.set(cache_key, snaps, ttl=30, tags=(vm_tag(host_id, vmid),))
         return snaps
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -507,7 +503,7 @@ def create_snapshot(host_id: int, node: str, vmid: int, snap: SnapshotCreate,
             description=snap.description,
             vmstate=int(snap.vmstate),
         )
-        pve_cache.clear_prefix(f"pve:{host_id}:")
+        pve_cache.invalidate_vm(host_id, vmid)
         task_tracker.register(
             upid, host_id, node,
             f"Snapshot VM {vmid}: {snap.snapname}",
@@ -526,7 +522,7 @@ def delete_snapshot(host_id: int, node: str, vmid: int, snapname: str,
     host = _get_host(host_id, db)
     try:
         upid = _pve(_svc(host)).nodes(node).qemu(vmid).snapshot(snapname).delete()
-        pve_cache.clear_prefix(f"pve:{host_id}:")
+        pve_cache.invalidate_vm(host_id, vmid)
         task_tracker.register(
             upid, host_id, node,
             f"Delete snapshot {snapname} VM {vmid}",
@@ -545,7 +541,7 @@ def rollback_snapshot(host_id: int, node: str, vmid: int, snapname: str,
     host = _get_host(host_id, db)
     try:
         upid = _pve(_svc(host)).nodes(node).qemu(vmid).snapshot(snapname).rollback.post()
-        pve_cache.clear_prefix(f"pve:{host_id}:")
+        pve_cache.invalidate_vm(host_id, vmid)
         task_tracker.register(
             upid, host_id, node,
             f"Rollback VM {vmid} to {snapname}",
@@ -583,7 +579,7 @@ def clone_vm(host_id: int, node: str, vmid: int, req: CloneRequest,
         params["target"] = req.target
     try:
         upid = _pve(_svc(host)).nodes(node).qemu(vmid).clone.post(**params)
-        pve_cache.clear_prefix(f"pve:{host_id}:")
+        pve_cache.invalidate_vm(host_id, vmid)
         task_tracker.register(
             upid, host_id, node,
             f"Clone VM {vmid} → {req.newid}",
@@ -618,7 +614,7 @@ def migrate_vm(host_id: int, node: str, vmid: int, req: MigrateRequest,
         if req.migration_network:
             kwargs["migration_network"] = req.migration_network
         upid = _pve(_svc(host)).nodes(node).qemu(vmid).migrate.post(**kwargs)
-        pve_cache.clear_prefix(f"pve:{host_id}:")
+        pve_cache.invalidate_vm(host_id, vmid)
         task_tracker.register(
             upid, host_id, node,
             f"Migrate VM {vmid} → {req.target}",
@@ -653,7 +649,7 @@ def convert_to_template(host_id: int, node: str, vmid: int, db: Session = Depend
     host = _get_host(host_id, db)
     try:
         _pve(_svc(host)).nodes(node).qemu(vmid).template.post()
-        pve_cache.clear_prefix(f"pve:{host_id}:")
+        pve_cache.invalidate_vm(host_id, vmid)
         return {"success": True}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -673,7 +669,7 @@ def delete_vm(host_id: int, node: str, vmid: int,
         if destroy_unreferenced_disks:
             params["destroy-unreferenced-disks"] = 1
         upid = _pve(_svc(host)).nodes(node).qemu(vmid).delete(**params)
-        pve_cache.clear_prefix(f"pve:{host_id}:")
+        pve_cache.invalidate_vm(host_id, vmid)
         task_tracker.register(
             upid, host_id, node,
             f"Delete VM {vmid}",
@@ -717,7 +713,7 @@ def add_disk(host_id: int, node: str, vmid: int, req: DiskAdd,
         if not req.replicate:
             disk_val += ",replicate=0"
         pve.nodes(node).qemu(vmid).config.post(**{disk_key: disk_val})
-        pve_cache.clear_prefix(f"pve:{host_id}:")
+        pve_cache.invalidate_vm(host_id, vmid)
         return {"success": True, "disk": disk_key}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -729,7 +725,7 @@ def resize_disk(host_id: int, node: str, vmid: int, disk_key: str, req: DiskResi
     host = _get_host(host_id, db)
     try:
         _pve(_svc(host)).nodes(node).qemu(vmid).resize.put(disk=disk_key, size=req.size)
-        pve_cache.clear_prefix(f"pve:{host_id}:")
+        pve_cache.invalidate_vm(host_id, vmid)
         return {"success": True}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -755,7 +751,7 @@ def detach_disk(host_id: int, node: str, vmid: int, disk_key: str,
                 pve.nodes(node).qemu(vmid).unlink.put(idlist=volid, force=1)
             except Exception:
                 pass
-        pve_cache.clear_prefix(f"pve:{host_id}:")
+        pve_cache.invalidate_vm(host_id, vmid)
         return {"success": True}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -776,7 +772,7 @@ def move_disk(host_id: int, node: str, vmid: int, req: DiskMove,
         if req.format:
             params["format"] = req.format
         upid = pve.nodes(node).qemu(vmid).move_disk.post(**params)
-        pve_cache.clear_prefix(f"pve:{host_id}:")
+        pve_cache.invalidate_vm(host_id, vmid)
         return {"upid": upid}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -819,7 +815,7 @@ def reattach_disk(host_id: int, node: str, vmid: int,
         disk_key = f"{bus}{idx}"
         # Set the new slot to the volid, clear the unused entry
         pve.nodes(node).qemu(vmid).config.put(**{disk_key: volid, unused_key: None})
-        pve_cache.clear_prefix(f"pve:{host_id}:")
+        pve_cache.invalidate_vm(host_id, vmid)
         return {"success": True, "disk": disk_key}
     except HTTPException:
         raise
@@ -865,7 +861,7 @@ def add_nic(host_id: int, node: str, vmid: int, req: NICAdd,
         net_val = _build_nic_val(req.model, req.mac, req.bridge, req.vlan,
                                   req.firewall, req.rate, req.link_down, req.queues)
         pve.nodes(node).qemu(vmid).config.put(**{net_key: net_val})
-        pve_cache.clear_prefix(f"pve:{host_id}:")
+        pve_cache.invalidate_vm(host_id, vmid)
         return {"success": True, "interface": net_key}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -881,7 +877,7 @@ def update_nic(host_id: int, node: str, vmid: int, net_key: str, req: NICUpdate,
         net_val = _build_nic_val(req.model, req.mac, req.bridge, req.vlan,
                                   req.firewall, req.rate, req.link_down, req.queues)
         pve.nodes(node).qemu(vmid).config.put(**{net_key: net_val})
-        pve_cache.clear_prefix(f"pve:{host_id}:")
+        pve_cache.invalidate_vm(host_id, vmid)
         return {"success": True}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -893,7 +889,7 @@ def remove_nic(host_id: int, node: str, vmid: int, net_key: str,
     host = _get_host(host_id, db)
     try:
         _pve(_svc(host)).nodes(node).qemu(vmid).config.put(**{net_key: None})
-        pve_cache.clear_prefix(f"pve:{host_id}:")
+        pve_cache.invalidate_vm(host_id, vmid)
         return {"success": True}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -911,7 +907,7 @@ def get_vm_firewall_rules(host_id: int, node: str, vmid: int, db: Session = Depe
         return cached
     try:
         result = _pve(_svc(host)).nodes(node).qemu(vmid).firewall.rules.get()
-        pve_cache.set(cache_key, result, ttl=30)
+        pve_cache.set(cache_key, result, ttl=30, tags=(vm_tag(host_id, vmid),))
         return result
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -924,7 +920,7 @@ def add_vm_firewall_rule(host_id: int, node: str, vmid: int, rule: FirewallRule,
     params = {k: v for k, v in rule.model_dump().items() if v is not None}
     try:
         _pve(_svc(host)).nodes(node).qemu(vmid).firewall.rules.post(**params)
-        pve_cache.clear_prefix(f"pve:{host_id}:")
+        pve_cache.invalidate_vm(host_id, vmid)
         return {"success": True}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -937,7 +933,7 @@ def update_vm_firewall_rule(host_id: int, node: str, vmid: int, pos: int, rule:
     params = {k: v for k, v in rule.model_dump().items() if v is not None}
     try:
         _pve(_svc(host)).nodes(node).qemu(vmid).firewall.rules(pos).put(**params)
-        pve_cache.clear_prefix(f"pve:{host_id}:")
+        pve_cache.invalidate_vm(host_id, vmid)
         return {"success": True}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -949,7 +945,7 @@ def delete_vm_firewall_rule(host_id: int, node: str, vmid: int, pos: int,
     host = _get_host(host_id, db)
     try:
         _pve(_svc(host)).nodes(node).qemu(vmid).firewall.rules(pos).delete()
-        pve_cache.clear_prefix(f"pve:{host_id}:")
+        pve_cache.invalidate_vm(host_id, vmid)
         return {"success": True}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -971,7 +967,7 @@ def set_vm_firewall_options(host_id: int, node: str, vmid: int, options: dict,
     host = _get_host(host_id, db)
     try:
         _pve(_svc(host)).nodes(node).qemu(vmid).firewall.options.put(**options)
-        pve_cache.clear_prefix(f"pve:{host_id}:")
+        pve_cache.invalidate_vm(host_id, vmid)
         return {"success": True}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -1007,7 +1003,7 @@ def regenerate_cloudinit(host_id: int, node: str, vmid: int,
     try:
         # Proxmox API: PUT /nodes/{node}/qemu/{vmid}/cloudinit regenerates the drive
         pve.nodes(node).qemu(vmid).cloudinit.put()
-        pve_cache.clear_prefix(f"pve:{host_id}:")
+        pve_cache.invalidate_vm(host_id, vmid)
         return {"success": True, "message": "Cloud-init drive regenerated"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -1046,7 +1042,7 @@ def update_cloudinit_config(host_id: int, node: str, vmid: int,
         raise HTTPException(status_code=400, detail="Nothing to update")
     try:
         pve.nodes(node).qemu(vmid).config.put(**payload)
-        pve_cache.clear_prefix(f"pve:{host_id}:")
+        pve_cache.invalidate_vm(host_id, vmid)
         return {"success": True}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -1063,7 +1059,7 @@ def get_vm_rrddata(host_id: int, node: str, vmid: int,
         return cached
     try:
         data = _pve(_svc(host)).nodes(node).qemu(vmid).rrddata.get(timeframe=timeframe, cf=cf)
-        pve_cache.set(cache_key, data, ttl=60)
+        pve_cache.set(cache_key, data, ttl=60, tags=(vm_tag(host_id, vmid),))
         return data
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -1272,7 +1268,7 @@ def bulk_tag_vms(
                     current_tags.append(t)
             current_tags = [t for t in current_tags if t not in tags_remove]
             pve.nodes(node).qemu(vmid).config.put(tags=_tags_to_str(current_tags))
-            pve_cache.clear_prefix(f"pve:{h_id}:")
+            pve_cache.invalidate_vm(int(h_id), vmid)
             results.append({"host_id": h_id, "node": node, "vmid": vmid,
                              "success": True, "tags": current_tags})
         except HTTPException as e:
@@ -1342,7 +1338,7 @@ def add_vm_tag(host_id: int, node: str, vmid: int, body: TagBody,
         if tag not in tags:
             tags.append(tag)
             pve.nodes(node).qemu(vmid).config.put(tags=_tags_to_str(tags))
-            pve_cache.clear_prefix(f"pve:{host_id}:")
+            pve_cache.invalidate_vm(host_id, vmid)
         return {"tags": tags}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -1359,7 +1355,7 @@ def remove_vm_tag(host_id: int, node: str, vmid: int, tag: str,
         tags = _parse_tags(cfg.get("tags", ""))
         tags = [t for t in tags if t != tag]
         pve.nodes(node).qemu(vmid).config.put(tags=_tags_to_str(tags))
-        pve_cache.clear_prefix(f"pve:{host_id}:")
+        pve_cache.invalidate_vm(host_id, vmid)
         return {"tags": tags}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -1399,7 +1395,7 @@ def add_pci_device(host_id: int, node: str, vmid: int, req: PCIAdd,
         if not req.rombar:
             val += ",rombar=0"
         pve.nodes(node).qemu(vmid).config.put(**{hostpci_key: val})
-        pve_cache.clear_prefix(f"pve:{host_id}:")
+        pve_cache.invalidate_vm(host_id, vmid)
         return {"success": True, "key": hostpci_key, "value": val}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -1419,7 +1415,7 @@ def remove_pci_device(host_id: int, node: str, vmid: int, index: int,
             raise HTTPException(status_code=404, detail=f"{hostpci_key} not found in VM config")
         # Set to None / delete the key — Proxmox API uses delete= parameter
         pve.nodes(node).qemu(vmid).config.put(**{hostpci_key: None})
-        pve_cache.clear_prefix(f"pve:{host_id}:")
+        pve_cache.invalidate_vm(host_id, vmid)
         return {"success": True}
     except HTTPException:
         raise
@@ -1451,7 +1447,7 @@ def add_usb_device(host_id: int, node: str, vmid: int, req: USBAdd,
         if req.usb3:
             val += ",usb3=1"
         pve.nodes(node).qemu(vmid).config.put(**{usb_key: val})
-        pve_cache.clear_prefix(f"pve:{host_id}:")
+        pve_cache.invalidate_vm(host_id, vmid)
         return {"success": True, "key": usb_key, "value": val}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -1470,7 +1466,7 @@ def remove_usb_device(host_id: int, node: str, vmid: int, index: int,
         if usb_key not in cfg:
             raise HTTPException(status_code=404, detail=f"{usb_key} not found in VM config")
         pve.nodes(node).qemu(vmid).config.put(**{usb_key: None})
-        pve_cache.clear_prefix(f"pve:{host_id}:")
+        pve_cache.invalidate_vm(host_id, vmid)
         return {"success": True}
     except HTTPException:
         raise
@@ -1498,7 +1494,7 @@ def add_serial_port(host_id: int, node: str, vmid: int, req: SerialAdd,
             idx += 1
         serial_key = f"serial{idx}"
         pve.nodes(node).qemu(vmid).config.put(**{serial_key: req.type})
-        pve_cache.clear_prefix(f"pve:{host_id}:")
+        pve_cache.invalidate_vm(host_id, vmid)
         return {"success": True, "key": serial_key}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -1517,7 +1513,7 @@ def remove_serial_port(host_id: int, node: str, vmid: int, index: int,
         if serial_key not in cfg:
             raise HTTPException(status_code=404, detail=f"{serial_key} not found in VM config")
         pve.nodes(node).qemu(vmid).config.put(**{serial_key: None})
-        pve_cache.clear_prefix(f"pve:{host_id}:")
+        pve_cache.invalidate_vm(host_id, vmid)
         return {"success": True}
     except HTTPException:
         raise
@@ -1544,7 +1540,7 @@ def add_tpm(host_id: int, node: str, vmid: int, req: TpmAdd,
             raise HTTPException(status_code=400, detail="tpmstate0 already present")
         val = f"{req.storage}:1,version={req.version}"
         pve.nodes(node).qemu(vmid).config.put(tpmstate0=val)
-        pve_cache.clear_prefix(f"pve:{host_id}:")
+        pve_cache.invalidate_vm(host_id, vmid)
         return {"success": True, "tpmstate0": val}
     except HTTPException:
         raise
@@ -1564,7 +1560,7 @@ def remove_tpm(host_id: int, node: str, vmid: int,
             raise HTTPException(status_code=404, detail="tpmstate0 not present")
         # Use the `delete` query param to also destroy the backing volume
         pve.nodes(node).qemu(vmid).config.put(delete="tpmstate0")
-        pve_cache.clear_prefix(f"pve:{host_id}:")
+        pve_cache.invalidate_vm(host_id, vmid)
         return {"success": True}
     except HTTPException:
         raise
@@ -1590,7 +1586,7 @@ def add_efidisk(host_id: int, node: str, vmid: int, req: EfiDiskAdd,
             raise HTTPException(status_code=400, detail="efidisk0 already present")
         val = f"{req.storage}:1,efitype={req.efitype},pre-enrolled-keys={1 if req.pre_enrolled_keys else 0}"
         pve.nodes(node).qemu(vmid).config.put(efidisk0=val)
-        pve_cache.clear_prefix(f"pve:{host_id}:")
+        pve_cache.invalidate_vm(host_id, vmid)
         return {"success": True, "efidisk0": val}
     except HTTPException:
         raise
@@ -1609,7 +1605,7 @@ def remove_efidisk(host_id: int, node: str, vmid: int,
         if "efidisk0" not in cfg:
             raise HTTPException(status_code=404, detail="efidisk0 not present")
         pve.nodes(node).qemu(vmid).config.put(delete="efidisk0")
-        pve_cache.clear_prefix(f"pve:{host_id}:")
+        pve_cache.invalidate_vm(host_id, vmid)
         return {"success": True}
     except HTTPException:
         raise
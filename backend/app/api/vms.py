@@ -7,6 +7,7 @@ from datetime import datetime
 
 from app.core.database import get_db
 from app.core.security import encrypt_data
+from app.core.upstream_trace import in_context
 from app.models import VirtualMachine, VMStatus, OSType, User
 from app.api.auth import get_current_user, require_operator
 from app.services.deployment import DeploymentService
@@ -156,7 +157,7 @@ async def list_vms(
 
     loop = asyncio.get_event_loop()
     with ThreadPoolExecutor(max_workers=min(len(active_hosts) or 1, 8)) as pool:
-        futures = [loop.run_in_executor(pool, fetch_for_host, h) for h in active_hosts]
+        futures = [loop.run_in_executor(pool, in_context(fetch_for_host), h) for h in active_hosts]
         results = await asyncio.gather(*futures, return_exceptions=True)
 
     all_vms = []
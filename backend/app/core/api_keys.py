@@ -0,0 +1,155 @@
+"""Fast API-key verification.
+
+API keys used to be checked by running bcrypt against every active key sharing
+the 8-character prefix — ~250 ms of CPU on every request. Keys now also carry a
+keyed digest (HMAC-SHA256) stored in a uniquely indexed ``key_digest`` column, so
+verification is a single indexed lookup. Recently verified keys are kept in a
+small LRU cache, and ``last_used`` timestamps are coalesced in memory and
+written in batches.
+
+Keys created before the digest column existed are verified once with bcrypt
+and get their digest filled in on that first successful use.
+"""
+import hashlib
+import hmac
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Optional
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Derive the HMAC key from ENCRYPTION_KEY rather than SECRET_KEY: rotating the
+# JWT signing key must not invalidate every stored API key digest.
+_DIGEST_KEY = hashlib.sha256(b"depl0y-api-key-digest:" + settings.ENCRYPTION_KEY.encode()).digest()
+
+
+def api_key_digest(raw_key: str) -> str:
+    """Keyed SHA-256 digest of a raw API key (hex, 64 chars)."""
+    return hmac.new(_DIGEST_KEY, raw_key.encode(), hashlib.sha256).hexdigest()
+
+
+class ApiKeyCache:
+    """Bounded LRU cache of recently verified keys: digest → key metadata.
+
+    Entries expire after ``ttl`` seconds so that changes made outside this
+    process (e.g. a key revoked by another worker) are picked up eventually;
+    revocations in this process call ``invalidate_key`` immediately.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 300.0):
+        self._entries: "OrderedDict[str, dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._max_entries = max_entries
+        self._ttl = ttl
+        self._hits = 0
+        self._misses = 0
+
+    def get(self, digest: str) -> Optional[dict]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is None or now - entry["cached_at"] > self._ttl:
+                if entry is not None:
+                    del self._entries[digest]
+                self._misses += 1
+                return None
+            self._entries.move_to_end(digest)
+            self._hits += 1
+            return entry
+
+    def put(self, digest: str, key_id: int, user_id: int, expires_at: Optional[datetime]) -> None:
+        with self._lock:
+            self._entries[digest] = {
+                "key_id": key_id,
+                "user_id": user_id,
+                "expires_at": expires_at,
+                "cached_at": time.monotonic(),
+            }
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate_key(self, key_id: int) -> None:
+        with self._lock:
+            for digest in [d for d, e in self._entries.items() if e["key_id"] == key_id]:
+                del self._entries[digest]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"size": len(self._entries), "max_entries": self._max_entries,
+                    "hits": self._hits, "misses": self._misses}
+
+
+class LastUsedRecorder:
+    """Coalesces ``ApiKey.last_used`` updates and writes them in batches.
+
+    ``record()`` only touches memory; a daemon thread flushes pending
+    timestamps every ``interval`` seconds with one executemany UPDATE.
+    """
+
+    def __init__(self, interval: float = 30.0):
+        self._pending: Dict[int, datetime] = {}
+        self._lock = threading.Lock()
+        self._interval = interval
+        self._thread: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+
+    def record(self, key_id: int, when: Optional[datetime] = None) -> None:
+        with self._lock:
+            self._pending[key_id] = when or datetime.utcnow()
+        self._ensure_running()
+
+    def flush(self) -> int:
+        """Write all pending timestamps now. Returns the number of keys updated."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        from sqlalchemy import text
+        from app.core.database import engine
+        try:
+            with engine.begin() as conn:
+                conn.execute(
+                    text("UPDATE api_keys SET last_used = :ts WHERE id = :id"),
+                    [{"id": k, "ts": ts} for k, ts in pending.items()],
+                )
+        except Exception as exc:
+            logger.warning("API key last_used flush failed: %s", exc)
+            # Keep the newest timestamps for the next attempt
+            with self._lock:
+                for k, ts in pending.items():
+                    if k not in self._pending or self._pending[k] < ts:
+                        self._pending[k] = ts
+            return 0
+        return len(pending)
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        self.flush()
+
+    def _ensure_running(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._run, daemon=True, name="api-key-last-used")
+            self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stop_event.wait(self._interval):
+            self.flush()
+
+
+api_key_cache = ApiKeyCache()
+last_used_recorder = LastUsedRecorder()
@@ -0,0 +1,180 @@
+"""Write-behind audit log pipeline.
+
+The audit middleware used to open a session and commit one ``AuditLog`` row
+inline on the event loop for every mutating request, so a bulk operation firing
+hundreds of calls serialised on SQLite commits. Rows are now put on a bounded
+in-memory queue and a daemon thread bulk-inserts them in batches.
+
+When the queue is full, ``submit_async`` waits briefly for the writer to catch
+up (slowing the producing request rather than blocking the loop) and drops the
+event only if it still cannot enqueue; drops are counted in ``stats()``.
+"""
+import asyncio
+import logging
+import queue
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class AuditLogWriter:
+    """Bounded queue of audit rows drained by a background bulk-insert thread."""
+
+    def __init__(self, max_queue: int = 10000, batch_size: int = 500,
+                 interval: float = 1.0, max_wait: float = 0.5):
+        self._queue: "queue.Queue[dict]" = queue.Queue(maxsize=max_queue)
+        self._max_queue = max_queue
+        self._batch_size = batch_size
+        self._interval = interval
+        self._max_wait = max_wait
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+        self._enqueued = 0
+        self._written = 0
+        self._dropped = 0
+        self._write_errors = 0
+        self._batches = 0
+        self._throttled = 0
+        self._last_flush_ms = 0
+        self._last_drop_log = 0.0
+
+    # ── producers ────────────────────────────────────────────────────────────
+
+    def submit(self, row: Dict[str, Any]) -> bool:
+        """Enqueue one audit row without blocking. Returns False if it was dropped."""
+        row.setdefault("timestamp", datetime.utcnow())
+        self._ensure_running()
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            self._record_drop(1)
+            return False
+        with self._lock:
+            self._enqueued += 1
+        return True
+
+    async def submit_async(self, row: Dict[str, Any]) -> bool:
+        """Enqueue from the event loop, yielding for up to ``max_wait`` s while the queue is full."""
+        row.setdefault("timestamp", datetime.utcnow())
+        self._ensure_running()
+        deadline = time.monotonic() + self._max_wait
+        throttled = False
+        while True:
+            try:
+                self._queue.put_nowait(row)
+                break
+            except queue.Full:
+                if not throttled:
+                    throttled = True
+                    with self._lock:
+                        self._throttled += 1
+                if time.monotonic() >= deadline:
+                    self._record_drop(1)
+                    return False
+                await asyncio.sleep(0.01)
+        with self._lock:
+            self._enqueued += 1
+        return True
+
+    # ── writer ───────────────────────────────────────────────────────────────
+
+    def flush(self) -> int:
+        """Write everything currently queued. Returns the number of rows inserted."""
+        total = 0
+        while True:
+            batch = self._drain()
+            if not batch:
+                return total
+            total += self._write(batch)
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Stop the writer thread and flush whatever is still queued."""
+        self._stop_event.set()
+        thread = self._thread
+        if thread is not None and thread.is_alive():
+            thread.join(timeout)
+        self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "queue_depth": self._queue.qsize(),
+                "max_queue": self._max_queue,
+                "enqueued": self._enqueued,
+                "written": self._written,
+                "dropped": self._dropped,
+                "throttled": self._throttled,
+                "write_errors": self._write_errors,
+                "batches": self._batches,
+                "last_flush_ms": self._last_flush_ms,
+            }
+
+    def _drain(self, limit: Optional[int] = None) -> List[dict]:
+        limit = self._batch_size if limit is None else limit
+        batch: List[dict] = []
+        while len(batch) < limit:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch: List[dict]) -> int:
+        from app.core.database import engine
+        from app.models.database import AuditLog
+
+        started = time.monotonic()
+        try:
+            with engine.begin() as conn:
+                conn.execute(AuditLog.__table__.insert(), batch)
+        except Exception as exc:
+            logger.warning("Audit log batch insert failed (%d rows): %s", len(batch), exc)
+            with self._lock:
+                self._write_errors += 1
+            self._record_drop(len(batch))
+            return 0
+        with self._lock:
+            self._written += len(batch)
+            self._batches += 1
+            self._last_flush_ms = int((time.monotonic() - started) * 1000)
+        return len(batch)
+
+    def _record_drop(self, count: int) -> None:
+        now = time.monotonic()
+        with self._lock:
+            self._dropped += count
+            log_it = now - self._last_drop_log > 60
+            if log_it:
+                self._last_drop_log = now
+        if log_it:
+            logger.warning("Audit log queue full or unwritable — %d event(s) dropped so far", self._dropped)
+
+    def _ensure_running(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._run, daemon=True, name="audit-log-writer")
+            self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stop_event.is_set():
+            try:
+                # Block until at least one row arrives, then give the batch a
+                # moment to fill unless it is already full.
+                first = self._queue.get(timeout=self._interval)
+            except queue.Empty:
+                continue
+            if self._queue.qsize() < self._batch_size - 1:
+                self._stop_event.wait(0.05)
+            batch = [first] + self._drain(self._batch_size - 1)
+            self._write(batch)
+
+
+audit_writer = AuditLogWriter()
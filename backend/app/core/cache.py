@@ -1,49 +1,229 @@
+"""In-process cache for Proxmox API responses.
+
+Entries expire after their TTL and the cache is bounded: once ``max_entries``
+is reached the least recently used entry is evicted. Entries can carry tags
+(e.g. ``vm_tag(host_id, vmid)``) so a mutation drops only the responses it
+affects instead of the whole host's cache, and ``get_or_load`` coalesces
+concurrent misses for the same key into a single loader call.
+
+Services that keep their own derived state (e.g. the orphaned-disk index) can
+``add_listener`` to hear about tag and prefix invalidations.
+"""
+import threading
 import time
-from typing import Any, Optional
-from threading import Lock
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+
+def vm_tag(host_id: int, vmid: int) -> str:
+    """Tag for responses describing a single guest (config, status, snapshots, …)."""
+    return f"pve:{host_id}:vm:{vmid}"
+
+
+def guest_list_tag(host_id: int) -> str:
+    """Tag for responses listing guests (node VM/LXC lists, cluster resources)."""
+    return f"pve:{host_id}:guests"
+
+
+class _InFlight:
+    __slots__ = ("event", "value", "error", "tags", "stale")
+
+    def __init__(self, tags: Iterable[str]):
+        self.event = threading.Event()
+        self.value = None
+        self.error: Optional[BaseException] = None
+        self.tags = frozenset(tags)
+        self.stale = False   # invalidated while loading — result must not be cached
+
 
 class TTLCache:
-    def __init__(self):
-        self._cache = {}
-        self._lock = Lock()
+    def __init__(self, max_entries: int = 4096):
+        self._cache: "OrderedDict[str, dict]" = OrderedDict()
+        self._tags: Dict[str, Set[str]] = {}
+        self._inflight: Dict[str, _InFlight] = {}
+        self._lock = threading.Lock()
+        self._max_entries = max_entries
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+        self._invalidations = 0
+        self._coalesced = 0
+        self._listeners: List[Callable[[Tuple[str, ...], Optional[str]], None]] = []
+
+    def add_listener(self, callback: Callable[[Tuple[str, ...], Optional[str]], None]) -> None:
+        """Call ``callback(tags, prefix)`` after every invalidation.
+
+        Tag invalidations pass the tags and ``prefix=None``; ``clear_prefix``
+        passes ``()`` and the prefix; ``clear`` passes ``()`` and ``""``.
+        Callbacks run on the invalidating thread and must be cheap.
+        """
+        self._listeners.append(callback)
+
+    def _notify(self, tags: Tuple[str, ...], prefix: Optional[str]) -> None:
+        for callback in self._listeners:
+            try:
+                callback(tags, prefix)
+            except Exception:
+                pass
 
     def get(self, key: str) -> Optional[Any]:
         with self._lock:
-            entry = self._cache.get(key)
-            if entry and time.time() < entry['expires']:
-                return entry['value']
-            if entry:
-                del self._cache[key]
-            return None
+            return self._get_locked(key)
 
-    def set(self, key: str, value: Any, ttl: int = 30):
+    def set(self, key: str, value: Any, ttl: int = 30, tags: Iterable[str] = ()):
         with self._lock:
-            self._cache[key] = {'value': value, 'expires': time.time() + ttl}
+            self._set_locked(key, value, ttl, tags)
+
+    def get_or_load(self, key: str, loader: Callable[[], Any], ttl: int = 30,
+                    tags: Iterable[str] = ()) -> Any:
+        """Return the cached value for *key*, calling *loader* on a miss.
+
+        Concurrent misses for the same key wait for the first caller's load
+        instead of issuing their own request. Loader exceptions are re-raised
+        in every waiting caller and nothing is cached.
+        """
+        tags = tuple(tags)
+        with self._lock:
+            value = self._get_locked(key)
+            if value is not None:
+                return value
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = _InFlight(tags)
+            else:
+                self._coalesced += 1
+
+        if not leader:
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            value = loader()
+            flight.value = value
+            with self._lock:
+                if value is not None and not flight.stale:
+                    self._set_locked(key, value, ttl, tags)
+            return value
+        except BaseException as exc:
+            flight.error = exc
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            flight.event.set()
 
     def delete(self, key: str):
         with self._lock:
-            self._cache.pop(key, None)
+            self._remove_locked(key)
+            if key in self._inflight:
+                self._inflight[key].stale = True
+
+    def invalidate_tags(self, *tags: str) -> int:
+        """Drop every entry carrying any of *tags*. Returns the number removed."""
+        removed = 0
+        with self._lock:
+            for tag in tags:
+                for key in list(self._tags.get(tag, ())):
+                    if self._remove_locked(key):
+                        removed += 1
+            for flight in self._inflight.values():
+                if flight.tags.intersection(tags):
+                    flight.stale = True
+            self._invalidations += removed
+        self._notify(tags, None)
+        return removed
+
+    def invalidate_vm(self, host_id: int, vmid: int) -> int:
+        """Drop one guest's cached responses plus the host's guest lists."""
+        return self.invalidate_tags(vm_tag(host_id, vmid), guest_list_tag(host_id))
 
     def clear_prefix(self, prefix: str):
         with self._lock:
             keys = [k for k in self._cache if k.startswith(prefix)]
             for k in keys:
-                del self._cache[k]
+                self._remove_locked(k)
+            for k, flight in self._inflight.items():
+                if k.startswith(prefix):
+                    flight.stale = True
+            self._invalidations += len(keys)
+        self._notify((), prefix)
 
     def clear(self):
         """Clear all cache entries."""
         with self._lock:
             self._cache.clear()
+            self._tags.clear()
+            for flight in self._inflight.values():
+                flight.stale = True
+        self._notify((), "")
 
     def stats(self) -> dict:
-        """Return cache statistics: size and list of non-expired keys."""
+        """Return cache counters, size and the most recently used keys."""
         with self._lock:
             now = time.time()
-            live_keys = [k for k, v in self._cache.items() if now < v['expires']]
+            recent = []
+            for k in reversed(self._cache):
+                if now < self._cache[k]['expires']:
+                    recent.append(k)
+                    if len(recent) >= 100:
+                        break
+            lookups = self._hits + self._misses
             return {
-                "size": len(live_keys),
+                "size": len(self._cache),
                 "total_entries": len(self._cache),
-                "keys": live_keys,
+                "max_entries": self._max_entries,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_ratio": round(self._hits / lookups, 4) if lookups else 0.0,
+                "evictions": self._evictions,
+                "expirations": self._expirations,
+                "invalidations": self._invalidations,
+                "coalesced_loads": self._coalesced,
+                "tags": len(self._tags),
+                "keys": recent,
             }
 
+    # ── internals (caller holds self._lock) ──────────────────────────────────
+
+    def _get_locked(self, key: str) -> Optional[Any]:
+        entry = self._cache.get(key)
+        if entry and time.time() < entry['expires']:
+            self._cache.move_to_end(key)
+            self._hits += 1
+            return entry['value']
+        if entry:
+            self._remove_locked(key)
+            self._expirations += 1
+        self._misses += 1
+        return None
+
+    def _set_locked(self, key: str, value: Any, ttl: int, tags: Iterable[str]):
+        if key in self._cache:
+            self._remove_locked(key)
+        tags = tuple(tags)
+        self._cache[key] = {'value': value, 'expires': time.time() + ttl, 'tags': tags}
+        for tag in tags:
+            self._tags.setdefault(tag, set()).add(key)
+        while len(self._cache) > self._max_entries:
+            oldest = next(iter(self._cache))
+            self._remove_locked(oldest)
+            self._evictions += 1
+
+    def _remove_locked(self, key: str) -> bool:
+        entry = self._cache.pop(key, None)
+        if entry is None:
+            return False
+        for tag in entry['tags']:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+        return True
+
+
 pve_cache = TTLCache()
@@ -10,11 +10,14 @@ def get_app_version():
     try:
         import sqlite3
         db_path = os.getenv("DATABASE_URL", "sqlite:////var/lib/depl0y/db/depl0y.db")
-        # Extract path from sqlite URL
-        if db_path.startswith("sqlite:///"):
-            db_path = db_path.replace("sqlite:///", "")
-        
-        conn = sqlite3.connect(db_path)
+        # Extract path from sqlite URL; in-memory and non-SQLite URLs have no
+        # file to read (connecting to "sqlite://" would create a stray file)
+        if not db_path.startswith("sqlite:///") or ":memory:" in db_path:
+            raise ValueError("no SQLite database file")
+        db_path = db_path.replace("sqlite:///", "")
+
+        # Read-only so a missing database is not created as an empty file
+        conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
         cursor = conn.cursor()
         cursor.execute("SELECT value FROM system_settings WHERE key = 'app_version'")
         result = cursor.fetchone()
@@ -103,6 +106,10 @@ class Settings(BaseSettings):
     RATE_LIMIT_DEFAULT: int = 600  # requests per minute per IP (general)
     RATE_LIMIT_AUTH: int = 10      # requests per minute per IP (auth endpoints)
 
+    # Outbound PVE / PBS / Redfish call tracing
+    UPSTREAM_TRACE_SAMPLE_RATE: float = 0.0  # fraction of calls written to the log (0 = off)
+    UPSTREAM_SLOW_CALL_MS: int = 2000        # calls slower than this are always logged
+
     # Logging
     LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO")
     LOG_FILE: str = os.getenv("LOG_FILE", "/var/log/depl0y/app.log")
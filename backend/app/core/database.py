@@ -1,10 +1,29 @@
 """Database connection and session management"""
+import time
+
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
 from app.core.config import settings
 
+
+class _TimedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waited (incl. opening a connection)."""
+
+    def _do_get(self):
+        from app.core.telemetry import db_pool_checkout_wait
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            db_pool_checkout_wait.observe(time.perf_counter() - started)
+
+
 # Build engine kwargs — SQLite needs check_same_thread=False for background threads
 _engine_kwargs: dict = {"pool_pre_ping": True}
+# In-memory SQLite needs its single-connection pool; everything else uses QueuePool
+if ":memory:" not in settings.DATABASE_URL:
+    _engine_kwargs["poolclass"] = _TimedQueuePool
 if settings.DATABASE_URL.startswith("sqlite"):
     _engine_kwargs["connect_args"] = {"check_same_thread": False}
 else:
@@ -102,6 +121,40 @@ def init_db():
         except Exception:
             pass
 
+        # Add key_digest to api_keys if missing (indexed API key lookup)
+        try:
+            conn.execute(text("ALTER TABLE api_keys ADD COLUMN key_digest VARCHAR(64)"))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+        try:
+            conn.execute(text(
+                "CREATE UNIQUE INDEX IF NOT EXISTS ix_api_keys_key_digest ON api_keys (key_digest)"
+            ))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+
+        # Indexes for audit log filtering / retention (older installs lack them)
+        for col in ("timestamp", "user_id", "action"):
+            try:
+                conn.execute(text(
+                    f"CREATE INDEX IF NOT EXISTS ix_audit_logs_{col} ON audit_logs ({col})"
+                ))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+
+        # Raw metric snapshots are pruned by age — index the timestamp
+        try:
+            conn.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_node_metric_snapshots_captured_at "
+                "ON node_metric_snapshots (captured_at)"
+            ))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+
         # Add token_version to users if missing (session invalidation)
         try:
             conn.execute(text("ALTER TABLE users ADD COLUMN token_version INTEGER NOT NULL DEFAULT 0"))
@@ -0,0 +1,106 @@
+"""Principal cache for JWT-authenticated requests.
+
+Resolving a bearer token used to cost a ``users`` SELECT in ``get_current_user``
+and a second one in the audit middleware. Resolved users are now cached as
+plain column snapshots keyed by ``(username, token_version)``; a cache hit is
+re-attached to the request's session with ``merge(load=False)``, which issues
+no SQL.
+
+Any ORM update or delete of a ``User`` row (role, active flag, token_version,
+password, TOTP, …) invalidates that user's entries — once at flush and again
+after commit, so a concurrent request can't re-cache the pre-commit row.
+Entries also expire after ``ttl`` seconds to bound staleness across worker
+processes.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session, make_transient_to_detached, object_session
+
+from app.models.database import User
+
+
+class PrincipalCache:
+    """Bounded LRU of user column snapshots keyed by (username, token_version)."""
+
+    def __init__(self, max_entries: int = 512, ttl: float = 60.0):
+        self._entries: "OrderedDict[Tuple[str, int], dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._max_entries = max_entries
+        self._ttl = ttl
+        self._hits = 0
+        self._misses = 0
+
+    def get(self, db: Session, username: str, token_version: int) -> Optional[User]:
+        """Return a session-attached User for a cache hit, else None."""
+        key = (username, token_version)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or now - entry["cached_at"] > self._ttl:
+                if entry is not None:
+                    del self._entries[key]
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            values = dict(entry["values"])
+        user = User(**values)
+        make_transient_to_detached(user)
+        return db.merge(user, load=False)
+
+    def put(self, user: User, token_version: int) -> None:
+        values: Dict[str, Any] = {c.key: getattr(user, c.key) for c in User.__table__.columns}
+        with self._lock:
+            self._entries[(user.username, token_version)] = {
+                "values": values,
+                "user_id": user.id,
+                "cached_at": time.monotonic(),
+            }
+            self._entries.move_to_end((user.username, token_version))
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate_user(self, user_id: Optional[int] = None, username: Optional[str] = None) -> None:
+        with self._lock:
+            stale = [
+                k for k, e in self._entries.items()
+                if (user_id is not None and e["user_id"] == user_id)
+                or (username is not None and k[0] == username)
+            ]
+            for k in stale:
+                del self._entries[k]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"size": len(self._entries), "max_entries": self._max_entries,
+                    "hits": self._hits, "misses": self._misses, "ttl_seconds": self._ttl}
+
+
+principal_cache = PrincipalCache()
+
+
+# ── invalidation hooks ──────────────────────────────────────────────────────
+
+def _on_user_changed(mapper, connection, target):
+    principal_cache.invalidate_user(user_id=target.id, username=target.username)
+    sess = object_session(target)
+    if sess is not None:
+        sess.info.setdefault("principal_dirty", set()).add((target.id, target.username))
+
+
+event.listen(User, "after_update", _on_user_changed)
+event.listen(User, "after_delete", _on_user_changed)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_after_commit(session):
+    for user_id, username in session.info.pop("principal_dirty", ()):
+        principal_cache.invalidate_user(user_id=user_id, username=username)
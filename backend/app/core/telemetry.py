@@ -0,0 +1,369 @@
+"""In-process Prometheus metrics (text exposition format 0.0.4).
+
+A deliberately small registry — counters, gauges and histograms with fixed
+label names, plus callback gauges that read other components' ``stats()``
+at scrape time — so the backend needs no extra dependency to be scraped.
+``render()`` produces the body served by ``GET /system/metrics/prometheus``.
+
+Instruments defined here:
+
+- HTTP request latency per route template and status class, and requests
+  in flight (recorded by the request middleware in ``main.py``)
+- outbound Proxmox / PBS / Redfish call latency and errors per host
+  (``TimedHTTPAdapter``, mounted on each client's requests session)
+- APScheduler job durations, errors and overruns (``scheduler.py`` listener)
+- DB connection pool checkout wait (``database.py`` pool events)
+- cache hit ratios (callback gauges over the existing cache ``stats()``)
+"""
+import bisect
+import logging
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+from urllib.parse import urlsplit
+
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Request / upstream latency buckets (seconds)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# Scheduler jobs run from milliseconds up to the 30-minute scan budget
+JOB_BUCKETS = (0.1, 0.5, 1.0, 5.0, 15.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0)
+# Pool checkouts are normally instant; anything in the upper buckets is contention
+POOL_WAIT_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _num(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Sequence[str]) -> Tuple[str, ...]:
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {labels!r}")
+        return tuple(str(v) for v in labels)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_labels(self.labelnames, k)} {_num(v)}" for k, v in items]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def set(self, value: float, *labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, *labels: str, amount: float = 1) -> None:
+        self.inc(*labels, amount=-amount)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_labels(self.labelnames, k)} {_num(v)}" for k, v in items]
+
+
+class CallbackMetric(_Metric):
+    """Gauge or counter whose values are read from *fn* at scrape time: ``{label values: value}``."""
+
+    def __init__(self, name, documentation, labelnames, fn: Callable[[], Dict[Tuple[str, ...], float]],
+                 kind: str = "gauge"):
+        super().__init__(name, documentation, labelnames)
+        self.kind = kind
+        self._fn = fn
+
+    def samples(self) -> List[str]:
+        try:
+            values = self._fn()
+        except Exception as exc:
+            logger.debug(f"Metric {self.name} collection failed: {exc}")
+            return []
+        return [f"{self.name}{_labels(self.labelnames, k)} {_num(v)}" for k, v in sorted(values.items())]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # label values → [per-bucket counts..., +Inf count], sum
+        self._values: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        key = self._key(labels)
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = ([0] * (len(self.buckets) + 1), [0.0])
+            entry[0][idx] += 1
+            entry[1][0] += value
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted((k, (list(c), s[0])) for k, (c, s) in self._values.items())
+        lines = []
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = _labels(self.labelnames, key, f'le="{_num(bound)}"')
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_num(round(total, 6))}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """Ordered collection of metrics rendered together."""
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            if any(m.name == metric.name for m in self._metrics):
+                raise ValueError(f"Metric {metric.name} already registered")
+            self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics)
+        lines: List[str] = []
+        for metric in metrics:
+            samples = metric.samples()
+            if samples:
+                lines.extend(metric.header())
+                lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+
+def render() -> str:
+    """Render every registered metric in Prometheus text format."""
+    return registry.render()
+
+
+def status_class(status_code: Optional[int]) -> str:
+    return f"{status_code // 100}xx" if status_code else "error"
+
+
+# ── HTTP server ─────────────────────────────────────────────────────────────
+
+http_request_duration = registry.register(Histogram(
+    "depl0y_http_request_duration_seconds",
+    "API request latency by route template and status class.",
+    ("method", "route", "status"),
+))
+http_requests_in_flight = registry.register(Gauge(
+    "depl0y_http_requests_in_flight",
+    "API requests currently being handled.",
+))
+
+# ── outbound API calls ──────────────────────────────────────────────────────
+
+upstream_request_duration = registry.register(Histogram(
+    "depl0y_upstream_request_duration_seconds",
+    "Latency of outbound Proxmox / PBS / Redfish API calls by host and status class.",
+    ("system", "host", "status"),
+))
+upstream_errors = registry.register(Counter(
+    "depl0y_upstream_errors_total",
+    "Outbound API calls that failed (HTTP 4xx/5xx, timeout or connection error).",
+    ("system", "host", "reason"),
+))
+
+# ── scheduler ───────────────────────────────────────────────────────────────
+
+scheduler_job_duration = registry.register(Histogram(
+    "depl0y_scheduler_job_duration_seconds",
+    "Run time of APScheduler jobs.",
+    ("job",),
+    buckets=JOB_BUCKETS,
+))
+scheduler_job_errors = registry.register(Counter(
+    "depl0y_scheduler_job_errors_total",
+    "APScheduler job runs that raised.",
+    ("job",),
+))
+scheduler_job_overruns = registry.register(Counter(
+    "depl0y_scheduler_job_overruns_total",
+    "Job runs skipped because the previous run was still going (max_instances) or fired too late (missed).",
+    ("job", "reason"),
+))
+
+# ── database ────────────────────────────────────────────────────────────────
+
+db_pool_checkout_wait = registry.register(Histogram(
+    "depl0y_db_pool_checkout_wait_seconds",
+    "Time spent waiting for a database connection from the pool.",
+    buckets=POOL_WAIT_BUCKETS,
+))
+
+
+def _cache_stats() -> Dict[str, dict]:
+    from app.core.cache import pve_cache
+    from app.core.principals import principal_cache
+    from app.services.proxmox_pool import proxmox_pool
+    return {
+        "pve": pve_cache.stats(),
+        "principal": principal_cache.stats(),
+        "proxmox_client": proxmox_pool.stats(),
+    }
+
+
+def _cache_values(field: str) -> Callable[[], Dict[Tuple[str, ...], float]]:
+    def collect():
+        out = {}
+        for name, stats in _cache_stats().items():
+            if field == "hit_ratio":
+                lookups = stats.get("hits", 0) + stats.get("misses", 0)
+                out[(name,)] = round(stats.get("hits", 0) / lookups, 4) if lookups else 0.0
+            else:
+                out[(name,)] = stats.get(field, 0)
+        return out
+    return collect
+
+
+registry.register(CallbackMetric(
+    "depl0y_cache_hit_ratio", "Cache hits / lookups since start.", ("cache",), _cache_values("hit_ratio"),
+))
+registry.register(CallbackMetric(
+    "depl0y_cache_hits_total", "Cache hits.", ("cache",), _cache_values("hits"), kind="counter",
+))
+registry.register(CallbackMetric(
+    "depl0y_cache_misses_total", "Cache misses.", ("cache",), _cache_values("misses"), kind="counter",
+))
+registry.register(CallbackMetric(
+    "depl0y_cache_entries", "Entries currently held by the cache.", ("cache",), _cache_values("size"),
+))
+
+# ── process ─────────────────────────────────────────────────────────────────
+
+_process_start = time.time()
+
+registry.register(CallbackMetric(
+    "depl0y_process_start_time_seconds", "Unix time the backend process started.", (),
+    lambda: {(): round(_process_start, 3)},
+))
+
+
+# ── outbound instrumentation ────────────────────────────────────────────────
+
+class TimedHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter that records latency and errors of every call it sends.
+
+    *system* labels the upstream ("proxmox", "pbs", "redfish"); the host label
+    is the URL's hostname, so cardinality follows the configured hosts. Each
+    call is also handed to ``upstream_trace.upstream_tracer``.
+    """
+
+    __attrs__ = HTTPAdapter.__attrs__ + ["system"]
+
+    def __init__(self, system: str, *args, **kwargs):
+        self.system = system
+        super().__init__(*args, **kwargs)
+
+    def send(self, request, stream=False, *args, **kwargs):
+        import requests
+
+        url = urlsplit(request.url)
+        host = url.hostname or "unknown"
+        started = time.perf_counter()
+        try:
+            response = super().send(request, stream, *args, **kwargs)
+            if not stream:
+                # Session.send would read the body next anyway; read it here so the
+                # timing covers the transfer and the size is known
+                response.content
+        except requests.exceptions.Timeout:
+            self._record(request, url.path, host, started, None, None, "timeout")
+            raise
+        except requests.exceptions.RequestException:
+            self._record(request, url.path, host, started, None, None, "connection")
+            raise
+        status = response.status_code
+        if stream:
+            length = response.headers.get("Content-Length")
+            size = int(length) if length and length.isdigit() else None
+        else:
+            size = len(response.content)
+        self._record(request, url.path, host, started, status, size,
+                     f"http_{status_class(status)}" if status >= 400 else None)
+        return response
+
+    def _record(self, request, path: str, host: str, started: float, status: Optional[int],
+                size: Optional[int], error: Optional[str]) -> None:
+        from app.core.upstream_trace import upstream_tracer
+
+        duration = time.perf_counter() - started
+        upstream_request_duration.observe(duration, self.system, host, status_class(status))
+        if error:
+            upstream_errors.inc(self.system, host, error)
+        body = request.body
+        upstream_tracer.record(
+            self.system, host, request.method, path, status, duration,
+            len(body) if isinstance(body, (bytes, str)) else 0, size, error,
+        )
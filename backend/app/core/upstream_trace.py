@@ -0,0 +1,270 @@
+"""Outbound API call tracing for the Proxmox, PBS and Redfish clients.
+
+Every call sent through ``telemetry.TimedHTTPAdapter`` is recorded here with
+its upstream system, host, endpoint path template (``/nodes/{node}/qemu/{vmid}/status/current``),
+method, status, duration and bytes, and the ID of the API request that made
+it (``X-Request-ID``, set by ``RateLimitMiddleware``):
+
+- per-endpoint aggregates (calls, errors, total / max time, bytes) answer
+  "which upstream endpoints cost the most time"
+- the slowest ``slow_keep`` calls are kept in a min-heap ring buffer
+- the calls of the last ``keep_requests`` API requests are kept by request
+  ID, and the request's upstream call count and time are returned in the
+  ``X-Upstream-Calls`` / ``X-Upstream-Time`` response headers
+- ``UPSTREAM_TRACE_SAMPLE_RATE`` of all calls are written to the log, and
+  calls slower than ``UPSTREAM_SLOW_CALL_MS`` always are
+"""
+import contextvars
+import functools
+import heapq
+import itertools
+import logging
+import random
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Path segments that are followed by an identifier, per upstream API
+_PARAM_AFTER = {
+    # Proxmox VE / PBS
+    "nodes": "{node}", "qemu": "{vmid}", "lxc": "{vmid}", "storage": "{storage}",
+    "content": "{volume}", "tasks": "{upid}", "snapshot": "{snapname}", "pools": "{pool}",
+    "users": "{userid}", "groups": "{group}", "roles": "{role}", "domains": "{realm}",
+    "services": "{service}", "ipset": "{name}", "aliases": "{name}", "resources": "{sid}",
+    "replication": "{id}", "datastore": "{store}", "sync": "{id}", "verify": "{id}",
+    # Redfish
+    "Systems": "{id}", "Managers": "{id}", "Chassis": "{id}", "Members": "{id}",
+    "Jobs": "{id}", "Entries": "{id}", "LogServices": "{id}", "VirtualMedia": "{id}",
+    "EthernetInterfaces": "{id}", "Processors": "{id}", "Memory": "{id}", "Storage": "{id}",
+    "Drives": "{id}", "Volumes": "{id}",
+}
+# Leading API prefixes that carry no information
+_PREFIXES = ("/api2/json", "/api2/extjs")
+_ID_RE = re.compile(r"^(\d+|UPID:.*|[0-9a-fA-F-]{16,})$")
+# Stop adding endpoint aggregates past this many distinct templates
+_MAX_ENDPOINTS = 1000
+
+
+def path_template(path: str) -> str:
+    """Collapse identifiers in an upstream URL path into placeholders."""
+    for prefix in _PREFIXES:
+        if path.startswith(prefix):
+            path = path[len(prefix):]
+            break
+    out: List[str] = []
+    expect: Optional[str] = None
+    for seg in path.split("/"):
+        if not seg:
+            continue
+        if expect:
+            out.append(expect)
+            expect = None
+            continue
+        out.append("{id}" if _ID_RE.match(seg) else seg)
+        expect = _PARAM_AFTER.get(seg)
+    return "/" + "/".join(out)
+
+
+@dataclass
+class UpstreamCall:
+    system: str
+    host: str
+    method: str
+    endpoint: str
+    status: Optional[int]
+    duration_ms: float
+    request_bytes: int
+    response_bytes: Optional[int]
+    error: Optional[str] = None
+    request_id: Optional[str] = None
+    at: float = field(default_factory=time.time)
+
+
+@dataclass
+class RequestTrace:
+    """Upstream calls made while serving one API request."""
+    request_id: str
+    path: str = ""
+    calls: List[UpstreamCall] = field(default_factory=list)
+    total_ms: float = 0.0
+    count: int = 0
+
+
+# Set by RateLimitMiddleware for the duration of an API request; copied into
+# the threadpool that runs sync endpoints, so calls made there are attributed.
+# Plain executors do not copy context — wrap fan-out callables in ``in_context``.
+current_request: contextvars.ContextVar[Optional[RequestTrace]] = contextvars.ContextVar(
+    "upstream_request_trace", default=None,
+)
+
+
+def in_context(fn: Callable[..., Any]) -> Callable[..., Any]:
+    """Wrap *fn* to run in a copy of the caller's context on each call.
+
+    ``ThreadPoolExecutor.submit`` / ``map`` and ``loop.run_in_executor`` do not
+    carry context variables, so upstream calls made by per-host fan-outs would
+    lose their request attribution. A fresh copy is taken per call because one
+    ``Context`` cannot be entered by two threads at once.
+    """
+    ctx = contextvars.copy_context()
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        return ctx.copy().run(fn, *args, **kwargs)
+    return wrapper
+
+
+class _EndpointStats:
+    __slots__ = ("calls", "errors", "total_ms", "max_ms", "bytes")
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.bytes = 0
+
+
+class UpstreamTracer:
+    """Aggregates, slow-call buffer and per-request traces of outbound API calls."""
+
+    def __init__(self, slow_keep: int = 50, keep_requests: int = 500, calls_per_request: int = 200):
+        self._lock = threading.Lock()
+        self._slow_keep = slow_keep
+        self._keep_requests = keep_requests
+        self._calls_per_request = calls_per_request
+        self._endpoints: Dict[Tuple[str, str, str, str], _EndpointStats] = {}
+        self._slowest: List[Tuple[float, int, UpstreamCall]] = []   # min-heap on duration
+        self._seq = itertools.count()
+        self._requests: "OrderedDict[str, RequestTrace]" = OrderedDict()
+        self._overflow = 0
+        self._since = time.time()
+
+    # ── request scope ────────────────────────────────────────────────────────
+
+    def begin_request(self, request_id: str, path: str) -> contextvars.Token:
+        return current_request.set(RequestTrace(request_id=request_id, path=path))
+
+    def end_request(self, token: contextvars.Token) -> Optional[RequestTrace]:
+        """Close the request scope; keep its trace when it made upstream calls."""
+        trace = current_request.get()
+        current_request.reset(token)
+        if trace is not None and trace.count:
+            with self._lock:
+                self._requests[trace.request_id] = trace
+                while len(self._requests) > self._keep_requests:
+                    self._requests.popitem(last=False)
+        return trace
+
+    # ── recording ────────────────────────────────────────────────────────────
+
+    def record(self, system: str, host: str, method: str, path: str, status: Optional[int],
+               duration: float, request_bytes: int, response_bytes: Optional[int],
+               error: Optional[str] = None) -> None:
+        trace = current_request.get()
+        call = UpstreamCall(
+            system=system, host=host, method=method, endpoint=path_template(path),
+            status=status, duration_ms=round(duration * 1000, 2),
+            request_bytes=request_bytes, response_bytes=response_bytes, error=error,
+            request_id=trace.request_id if trace else None,
+        )
+        key = (system, host, method, call.endpoint)
+        with self._lock:
+            stats = self._endpoints.get(key)
+            if stats is None:
+                if len(self._endpoints) >= _MAX_ENDPOINTS:
+                    self._overflow += 1
+                else:
+                    stats = self._endpoints[key] = _EndpointStats()
+            if stats is not None:
+                stats.calls += 1
+                stats.errors += 1 if error else 0
+                stats.total_ms += call.duration_ms
+                stats.max_ms = max(stats.max_ms, call.duration_ms)
+                stats.bytes += response_bytes or 0
+            entry = (call.duration_ms, next(self._seq), call)
+            if len(self._slowest) < self._slow_keep:
+                heapq.heappush(self._slowest, entry)
+            elif call.duration_ms > self._slowest[0][0]:
+                heapq.heapreplace(self._slowest, entry)
+            if trace is not None:
+                trace.count += 1
+                trace.total_ms += call.duration_ms
+                if len(trace.calls) < self._calls_per_request:
+                    trace.calls.append(call)
+        self._log(call)
+
+    def _log(self, call: UpstreamCall) -> None:
+        from app.core.config import settings
+        slow = call.duration_ms >= settings.UPSTREAM_SLOW_CALL_MS
+        if not slow and not (settings.UPSTREAM_TRACE_SAMPLE_RATE > 0
+                             and random.random() < settings.UPSTREAM_TRACE_SAMPLE_RATE):
+            return
+        logger.log(
+            logging.WARNING if slow else logging.INFO,
+            f"upstream {call.system} {call.method} {call.host}{call.endpoint} "
+            f"status={call.status or call.error} {call.duration_ms:.0f}ms "
+            f"bytes={call.response_bytes} request_id={call.request_id or '-'}"
+            + (" (slow)" if slow else ""),
+        )
+
+    # ── queries ──────────────────────────────────────────────────────────────
+
+    def top_endpoints(self, limit: int = 25, system: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Upstream endpoints ordered by total time spent in them."""
+        with self._lock:
+            rows = [
+                {
+                    "system": k[0], "host": k[1], "method": k[2], "endpoint": k[3],
+                    "calls": s.calls, "errors": s.errors,
+                    "total_ms": round(s.total_ms, 1), "avg_ms": round(s.total_ms / s.calls, 1),
+                    "max_ms": round(s.max_ms, 1), "response_bytes": s.bytes,
+                }
+                for k, s in self._endpoints.items()
+                if system is None or k[0] == system
+            ]
+        rows.sort(key=lambda r: r["total_ms"], reverse=True)
+        return rows[:limit]
+
+    def slowest(self, limit: int = 50) -> List[Dict[str, Any]]:
+        with self._lock:
+            calls = sorted(self._slowest, key=lambda e: e[0], reverse=True)[:limit]
+        return [asdict(c) for _, _, c in calls]
+
+    def request_trace(self, request_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            trace = self._requests.get(request_id)
+        if trace is None:
+            return None
+        return {
+            "request_id": trace.request_id, "path": trace.path, "calls_total": trace.count,
+            "upstream_ms": round(trace.total_ms, 1), "calls": [asdict(c) for c in trace.calls],
+        }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._endpoints.clear()
+            self._slowest.clear()
+            self._requests.clear()
+            self._overflow = 0
+            self._since = time.time()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "since": self._since,
+                "endpoints": len(self._endpoints),
+                "endpoints_untracked_calls": self._overflow,
+                "calls": sum(s.calls for s in self._endpoints.values()),
+                "requests_traced": len(self._requests),
+                "slow_calls_kept": len(self._slowest),
+            }
+
+
+# Singleton instance
+upstream_tracer = UpstreamTracer()
@@ -18,12 +18,21 @@ from app.api import ai_reports as ai_reports_api
 from app.api import updates_mgmt
 from app.api import topology as topology_api
 from app.api import time_sync as time_sync_api
+from app.api import events as events_api
+from app.api import metrics as metrics_api
 from app.middleware.security import SecurityHeadersMiddleware
 from app.middleware.rate_limit import RateLimitMiddleware
 from app.middleware.ip_filter import IPFilterMiddleware
+from app.core.audit_writer import audit_writer
+from app.core import telemetry
+from app.core.database import SessionLocal
+from app.core.principals import principal_cache
+from app.core.security import decode_token
+from app.models.database import User as UserModel
 import logging
 from logging.handlers import RotatingFileHandler
 import os
+import re
 import time
 
 # Global request counter for metrics
@@ -90,22 +99,43 @@ app.add_middleware(RateLimitMiddleware, requests_per_minute=settings.RATE_LIMIT_
 app.add_middleware(IPFilterMiddleware)
 
 
-# Request counter middleware
+# Request counter / latency middleware (Prometheus: GET /system/metrics/prometheus)
 @app.middleware("http")
 async def count_requests(request: Request, call_next):
     global _request_counter
     _request_counter += 1
-    response = await call_next(request)
-    return response
+    telemetry.http_requests_in_flight.inc()
+    started = time.perf_counter()
+    status_code = None
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        telemetry.http_requests_in_flight.dec()
+        # Label by route template, not the raw path, to keep cardinality bounded
+        route = request.scope.get("route")
+        template = getattr(route, "path_format", None) or getattr(route, "path", None) or "unmatched"
+        telemetry.http_request_duration.observe(
+            time.perf_counter() - started, request.method, template,
+            telemetry.status_class(status_code or 500),
+        )
 
 
 # Audit middleware — logs mutating requests for authenticated users
+# (login/auth endpoints and user create/delete write their own audit entries)
+_AUDIT_SKIP_SUFFIXES = ("/auth/refresh", "/auth/login", "/auth/2fa/login",
+                        "/auth/logout", "/notifications/in-app/mark-read",
+                        "/auth/me/password", "/auth/totp/verify", "/auth/totp/disable",
+                        "/auth/api-keys")
+_AUDIT_USER_PATH_RE = re.compile(r'/users/\d+$')
+
+
 @app.middleware("http")
 async def audit_middleware(request: Request, call_next):
-    import time as _time
-    start = _time.time()
+    start = time.time()
     response = await call_next(request)
-    duration_ms = int((_time.time() - start) * 1000)
+    duration_ms = int((time.time() - start) * 1000)
 
     method = request.method
     path = request.url.path
@@ -117,35 +147,30 @@ async def audit_middleware(request: Request, call_next):
         return response
 
     # Skip certain noisy/login endpoints (those handle their own audit entries)
-    skip_suffixes = ("/auth/refresh", "/auth/login", "/auth/2fa/login",
-                     "/auth/logout", "/notifications/in-app/mark-read",
-                     "/auth/me/password", "/auth/totp/verify", "/auth/totp/disable",
-                     "/auth/api-keys")
-    if any(path.endswith(s) for s in skip_suffixes):
+    if path.endswith(_AUDIT_SKIP_SUFFIXES):
         return response
     # Also skip user creation/deletion which are logged explicitly
-    import re as _re
-    if _re.search(r'/users/\d+$', path) and method in ("DELETE", "PUT", "PATCH"):
+    if _AUDIT_USER_PATH_RE.search(path) and method in ("DELETE", "PUT", "PATCH"):
         return response
     if path.endswith("/users/") and method == "POST":
         return response
 
     # Try to identify the user from the request
     try:
-        from app.core.database import SessionLocal
-        from app.core.security import decode_token
-        from app.models.database import AuditLog, User as UserModel
-
-        user_id = None
+        # get_current_user stores the resolved principal on request.state;
+        # only decode the token here if the endpoint never authenticated.
+        user_id = getattr(request.state, "user_id", None)
         token = request.headers.get("Authorization", "")
-        if token.startswith("Bearer "):
+        if user_id is None and token.startswith("Bearer "):
             payload = decode_token(token[7:])
             if payload:
                 username = payload.get("sub")
                 if username:
                     _db = SessionLocal()
                     try:
-                        u = _db.query(UserModel).filter(UserModel.username == username).first()
+                        u = principal_cache.get(_db, username, payload.get("tv", 0))
+                        if u is None:
+                            u = _db.query(UserModel).filter(UserModel.username == username).first()
                         if u:
                             user_id = u.id
                     finally:
@@ -195,29 +220,22 @@ async def audit_middleware(request: Request, call_next):
         success = response.status_code < 400
 
         if user_id is not None:
-            _db = SessionLocal()
-            try:
-                client_ip = request.client.host if request.client else None
-                user_agent = request.headers.get("user-agent", "")
-                entry = AuditLog(
-                    user_id=user_id,
-                    action=action,
-                    resource_type=resource_type,
-                    details={"path": path, "method": method},
-                    ip_address=client_ip,
-                    user_agent=user_agent[:500] if user_agent else None,
-                    http_method=method,
-                    request_path=path,
-                    response_status=response.status_code,
-                    duration_ms=duration_ms,
-                    success=success,
-                )
-                _db.add(entry)
-                _db.commit()
-            except Exception:
-                _db.rollback()
-            finally:
-                _db.close()
+            # Queued for the background writer, which bulk-inserts in batches
+            client_ip = request.client.host if request.client else None
+            user_agent = request.headers.get("user-agent", "")
+            await audit_writer.submit_async({
+                "user_id": user_id,
+                "action": action,
+                "resource_type": resource_type,
+                "details": {"path": path, "method": method},
+                "ip_address": client_ip,
+                "user_agent": user_agent[:500] if user_agent else None,
+                "http_method": method,
+                "request_path": path,
+                "response_status": response.status_code,
+                "duration_ms": duration_ms,
+                "success": success,
+            })
     except Exception:
         pass
 
@@ -289,6 +307,26 @@ async def startup_event():
     logger.info("Analysis engine started")
 
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Flush buffered writes before the process exits"""
+    from app.core.api_keys import last_used_recorder
+    from app.services.alert_notifier import alert_notifier
+    from app.services.bulk_executor import bulk_executor
+    from app.services.delivery_engine import delivery_engine
+    from app.services.guest_metrics import guest_metrics
+    from app.services.ssh_pool import ssh_pool
+    from app.services.vm_scans import vm_scan_runner
+    last_used_recorder.stop()
+    alert_notifier.stop()
+    audit_writer.stop()
+    delivery_engine.stop()
+    guest_metrics.stop()
+    bulk_executor.stop()
+    vm_scan_runner.stop()
+    ssh_pool.stop()
+
+
 @app.get("/")
 async def root():
     """Root endpoint"""
@@ -369,6 +407,8 @@ app.include_router(ai_reports_api.router, prefix=f"{settings.API_V1_PREFIX}/ai-r
 app.include_router(updates_mgmt.router, prefix=f"{settings.API_V1_PREFIX}/updates-mgmt", tags=["System Updates Manager"])
 app.include_router(topology_api.router, prefix=f"{settings.API_V1_PREFIX}/topology", tags=["Topology"])
 app.include_router(time_sync_api.router, prefix=f"{settings.API_V1_PREFIX}/time-sync", tags=["Time Sync"])
+app.include_router(events_api.router, prefix=f"{settings.API_V1_PREFIX}/events", tags=["Live Events"])
+app.include_router(metrics_api.router, prefix=f"{settings.API_V1_PREFIX}/metrics", tags=["Metric History"])
 
 
 if __name__ == "__main__":
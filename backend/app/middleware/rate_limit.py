@@ -3,6 +3,7 @@ from starlette.middleware.base import BaseHTTPMiddleware
 from starlette.requests import Request
 from starlette.responses import JSONResponse
 from fastapi import status
+from app.core.upstream_trace import upstream_tracer
 import time
 import uuid
 from collections import defaultdict
@@ -24,7 +25,8 @@ class RateLimitMiddleware(BaseHTTPMiddleware):
 
     - Default: RATE_LIMIT_DEFAULT requests/minute per IP
     - Auth endpoints: RATE_LIMIT_AUTH requests/minute per IP (stricter)
-    - Adds X-Request-ID and X-Response-Time headers to every response
+    - Adds X-Request-ID and X-Response-Time headers to every response, plus
+      X-Upstream-Calls / X-Upstream-Time when the request called PVE/PBS/Redfish
     - Cleans up stale IP entries every ~5 minutes to bound memory usage
     """
 
@@ -136,11 +138,20 @@ class RateLimitMiddleware(BaseHTTPMiddleware):
                     )
                 self.requests[client_ip].append(current_time)
 
-        response = await call_next(request)
+        # Outbound PVE / PBS / Redfish calls made while serving this request are
+        # attributed to its request ID
+        trace_token = upstream_tracer.begin_request(request_id, request.url.path)
+        try:
+            response = await call_next(request)
+        finally:
+            trace = upstream_tracer.end_request(trace_token)
 
         # Inject diagnostic headers into every response
         duration_ms = int((time.time() - start_time) * 1000)
         response.headers["X-Request-ID"] = request_id
         response.headers["X-Response-Time"] = f"{duration_ms}ms"
+        if trace is not None and trace.count:
+            response.headers["X-Upstream-Calls"] = str(trace.count)
+            response.headers["X-Upstream-Time"] = f"{int(trace.total_ms)}ms"
 
         return response
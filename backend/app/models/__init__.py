@@ -34,6 +34,9 @@ from .database import (
     ReportRun,
     ReportSchedule,
     NodeMetricSnapshot,
+    NodeMetricRollup,
+    GuestMetricBlock,
+    TaskHistory,
 )
 from .security import (
     FailedLoginAttempt,
@@ -88,4 +91,7 @@ __all__ = [
     "ReportRun",
     "ReportSchedule",
     "NodeMetricSnapshot",
+    "NodeMetricRollup",
+    "GuestMetricBlock",
+    "TaskHistory",
 ]
@@ -2,7 +2,7 @@
 Database models for Depl0y
 """
 from datetime import datetime
-from sqlalchemy import Boolean, Column, Integer, String, DateTime, Float, ForeignKey, Text, Enum, JSON, UniqueConstraint, Index
+from sqlalchemy import Boolean, Column, Integer, String, DateTime, Float, ForeignKey, Text, Enum, JSON, UniqueConstraint, Index, LargeBinary
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 import enum
@@ -306,8 +306,8 @@ class AuditLog(Base):
     __tablename__ = "audit_logs"
 
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
-    action = Column(String(100), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=True, index=True)
+    action = Column(String(100), nullable=False, index=True)
     resource_type = Column(String(50), nullable=True)
     resource_id = Column(Integer, nullable=True)
     details = Column(JSON, nullable=True)
@@ -319,7 +319,7 @@ class AuditLog(Base):
     http_method = Column(String(10), nullable=True)  # GET, POST, PUT, DELETE, etc.
     request_path = Column(String(500), nullable=True) # URL path
     success = Column(Boolean, default=True, nullable=True)  # Whether the action succeeded
-    timestamp = Column(DateTime, default=datetime.utcnow, nullable=False)
+    timestamp = Column(DateTime, default=datetime.utcnow, nullable=False, index=True)
 
     # Relationships
     user = relationship("User", back_populates="audit_logs")
@@ -463,6 +463,7 @@ class ApiKey(Base):
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     name = Column(String(100), nullable=False)
     key_hash = Column(String(255), nullable=False, unique=True)  # bcrypt hash of the key
+    key_digest = Column(String(64), nullable=True, unique=True, index=True)  # HMAC-SHA256 for O(1) lookup
     key_prefix = Column(String(8), nullable=False)  # first 8 chars for display
     last_used = Column(DateTime, nullable=True)
     expires_at = Column(DateTime, nullable=True)
@@ -695,3 +696,77 @@ class NodeMetricSnapshot(Base):
     )
 
     node = relationship("ProxmoxNode")
+
+
+class NodeMetricRollup(Base):
+    """Downsampled node metrics (1-hour and 1-day buckets) built from NodeMetricSnapshot."""
+    __tablename__ = "node_metric_rollups"
+
+    id = Column(Integer, primary_key=True, index=True)
+    node_id = Column(Integer, ForeignKey("proxmox_nodes.id"), nullable=False)
+    resolution = Column(Integer, nullable=False)      # bucket width in seconds (3600 / 86400)
+    bucket_start = Column(DateTime, nullable=False)
+    samples = Column(Integer, nullable=False, default=0)
+    cpu_min = Column(Float, nullable=True)
+    cpu_avg = Column(Float, nullable=True)
+    cpu_max = Column(Float, nullable=True)
+    cpu_p95 = Column(Float, nullable=True)
+    memory_min = Column(Float, nullable=True)
+    memory_avg = Column(Float, nullable=True)
+    memory_max = Column(Float, nullable=True)
+    memory_p95 = Column(Float, nullable=True)
+    disk_min = Column(Float, nullable=True)
+    disk_avg = Column(Float, nullable=True)
+    disk_max = Column(Float, nullable=True)
+    disk_p95 = Column(Float, nullable=True)
+    vm_count = Column(Integer, nullable=True)         # max over the bucket
+    lxc_count = Column(Integer, nullable=True)
+
+    __table_args__ = (
+        Index("ix_node_metric_rollups_res_node_bucket", "resolution", "node_id", "bucket_start", unique=True),
+        Index("ix_node_metric_rollups_res_bucket", "resolution", "bucket_start"),
+    )
+
+
+class GuestMetricBlock(Base):
+    """Per-guest metric series packed into fixed-width float32 arrays.
+
+    A resolution-60 block holds one hour of 1-minute samples; a resolution-3600
+    block holds one day of hourly avg/max rollups. See app.services.guest_metrics.
+    """
+    __tablename__ = "guest_metric_blocks"
+
+    id = Column(Integer, primary_key=True, index=True)
+    host_id = Column(Integer, ForeignKey("proxmox_hosts.id"), nullable=False)
+    vmid = Column(Integer, nullable=False)
+    guest_type = Column(String(10), nullable=False)   # qemu / lxc
+    node = Column(String(100), nullable=True)         # last node seen in the block
+    name = Column(String(255), nullable=True)
+    resolution = Column(Integer, nullable=False)      # slot width in seconds (60 / 3600)
+    block_start = Column(DateTime, nullable=False)
+    samples = Column(Integer, nullable=False, default=0)
+    data = Column(LargeBinary, nullable=False)
+
+    __table_args__ = (
+        Index("ix_guest_metric_blocks_key", "resolution", "host_id", "vmid", "block_start", unique=True),
+        Index("ix_guest_metric_blocks_res_start", "resolution", "block_start"),
+    )
+
+
+class TaskHistory(Base):
+    """Completed Proxmox tasks started through Depl0y (persisted task tracker history)."""
+    __tablename__ = "task_history"
+
+    id = Column(Integer, primary_key=True, index=True)
+    upid = Column(String(255), unique=True, nullable=False, index=True)
+    host_id = Column(Integer, nullable=True)
+    node = Column(String(100), nullable=True)
+    description = Column(Text, nullable=True)
+    user_id = Column(Integer, nullable=True, index=True)
+    vmid = Column(Integer, nullable=True)
+    task_type = Column(String(50), nullable=True)
+    status = Column(String(50), nullable=False)
+    exit_status = Column(String(255), nullable=True)
+    registered_at = Column(DateTime, nullable=True)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=False, index=True)
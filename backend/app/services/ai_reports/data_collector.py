@@ -20,8 +20,8 @@ from app.models.database import (
     VirtualMachine,
     PBSServer,
     VMStatus,
-    NodeMetricSnapshot,
 )
+from app.services.metrics_store import RAW, node_metrics_store
 
 logger = logging.getLogger(__name__)
 
@@ -49,28 +49,6 @@ def _safe_decrypt(value: Optional[str]) -> Optional[str]:
         return value  # fall through — legacy plaintext
 
 
-def _collect_node_history(db: Session, node_id: int, window_hours: int = 24) -> List[Dict[str, Any]]:
-    cutoff = _utc_now() - timedelta(hours=window_hours)
-    rows = (
-        db.query(NodeMetricSnapshot)
-        .filter(NodeMetricSnapshot.node_id == node_id, NodeMetricSnapshot.captured_at >= cutoff)
-        .order_by(NodeMetricSnapshot.captured_at.desc())
-        .limit(500)
-        .all()
-    )
-    return [
-        {
-            "captured_at": r.captured_at.isoformat() if r.captured_at else None,
-            "cpu_pct": r.cpu_pct,
-            "memory_pct": r.memory_pct,
-            "disk_pct": r.disk_pct,
-            "vm_count": r.vm_count,
-            "lxc_count": r.lxc_count,
-        }
-        for r in rows
-    ]
-
-
 def _bmc_status_for_node(bmc_cache: Dict[str, Any], host_id: int, node_id: int) -> Dict[str, Any]:
     """Find BMC status entry covering this node, preferring pve_node over pve."""
     candidates = []
@@ -140,6 +118,10 @@ def collect_snapshot(db: Session, scope_type: str = "global", scope_ref: Optiona
             nodes_q = nodes_q.filter(ProxmoxNode.node_name == scope_ref)
         nodes = nodes_q.all()
         host_info["node_count"] = len(nodes)
+        # Last 24 h of raw samples for every node of this host in one query
+        histories = node_metrics_store.query(
+            db, [n.id for n in nodes], start=_utc_now() - timedelta(hours=24), resolution=RAW,
+        )["nodes"]
 
         for node in nodes:
             mem_pct = None
@@ -153,10 +135,10 @@ def collect_snapshot(db: Session, scope_type: str = "global", scope_ref: Optiona
             model = bmc.get("model") or ""
             aging = any(h in model.upper() for h in _AGING_MODEL_HINTS)
 
-            history = _collect_node_history(db, node.id, window_hours=24)
-            if history:
-                cpu_hist = [h["cpu_pct"] for h in history if h.get("cpu_pct") is not None]
-                mem_hist = [h["memory_pct"] for h in history if h.get("memory_pct") is not None]
+            history = histories.get(node.id) or {"t": []}
+            if history["t"]:
+                cpu_hist = [v for v in history["cpu"]["avg"] if v is not None]
+                mem_hist = [v for v in history["memory"]["avg"] if v is not None]
                 avg_cpu = round(statistics.fmean(cpu_hist), 1) if cpu_hist else node.cpu_usage
                 avg_mem = round(statistics.fmean(mem_hist), 1) if mem_hist else mem_pct
                 peak_cpu = round(max(cpu_hist), 1) if cpu_hist else node.cpu_usage
@@ -187,7 +169,7 @@ def collect_snapshot(db: Session, scope_type: str = "global", scope_ref: Optiona
                 "lxc_count": node.lxc_count or 0,
                 "last_updated": node.last_updated.isoformat() if node.last_updated else None,
                 "last_updated_age_s": _age_seconds(node.last_updated),
-                "history_samples": len(history),
+                "history_samples": len(history["t"]),
                 "bmc": {
                     "model": bmc.get("model"),
                     "serial_number": bmc.get("serial_number"),
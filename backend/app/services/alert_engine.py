@@ -1,14 +1,47 @@
 """
 Alert rules engine — runs periodically to check conditions and fire alerts
+
+Each cycle builds one inventory snapshot, works out which watched inputs
+changed since the previous cycle and evaluates only the rules affected by
+those changes (see ``alert_index``). Per-cycle latency and rule counts are
+kept for ``stats()``.
 """
 import threading
 import time
 import logging
+from collections import deque
 from datetime import datetime, timedelta
 from typing import Dict, Any, Optional, List
 
+from app.services.alert_index import AlertStateIndex, ChangeTracker, RuleIndex, RuleSlot
+
 logger = logging.getLogger(__name__)
 
+# Built-in checks: (name, method, watched (resource type, metric) pairs,
+# re-check interval in seconds for conditions that change with the clock alone)
+_BUILTIN_RULES = (
+    ("node_offline", "_check_node_offline", (("node", "heartbeat"),), 60),
+    ("storage_usage", "_check_storage_usage", (("storage", "usage"),), None),
+    ("vm_stopped", "_check_vm_stopped_unexpectedly", (("guest", "status"), ("task", "recent")), 300),
+    ("backup_failed", "_check_backup_failed", (("task", "recent"),), None),
+    ("long_running_tasks", "_check_long_running_tasks", (("task", "recent"),), 300),
+    ("high_cpu", "_check_high_cpu", (("node", "cpu"),), None),
+    ("high_memory", "_check_high_memory", (("node", "memory"),), None),
+    ("login_failures", "_check_login_failures", (("login", "failures"),), None),
+    # PBS is queried by the check itself, so there is nothing to diff
+    ("pbs_sync_failed", "_check_pbs_sync_failed", (), 60),
+)
+
+# What each user rule type reads; types without an evaluator watch nothing.
+_USER_RULE_WATCHES = {
+    "storage_usage": (("storage", "usage"),),
+    "node_cpu": (("node", "cpu"),),
+    "node_memory": (("node", "memory"),),
+    "login_failures": (("login", "failures"),),
+}
+
+_CYCLE_HISTORY = 60
+
 
 class AlertEngine:
     """Background engine that evaluates alert rules and fires alert events."""
@@ -16,8 +49,18 @@ class AlertEngine:
     def __init__(self):
         self._thread: Optional[threading.Thread] = None
         self._running = False
-        # Maps rule_key → datetime of last fired event (cooldown tracking)
-        self._alert_states: Dict[str, datetime] = {}
+        # Open alert keys and last fire time per rule key (dedup + cooldown)
+        self._state = AlertStateIndex()
+        self._changes = ChangeTracker()
+        self._rules = RuleIndex()
+        for name, method, watches, every in _BUILTIN_RULES:
+            self._rules.add(RuleSlot(key=f"builtin:{name}", watches=watches, every=every, definition=method))
+        self._cycle_lock = threading.Lock()
+        # The slot being evaluated on this thread, so fires can report suppression
+        self._local = threading.local()
+        self._cycles: deque = deque(maxlen=_CYCLE_HISTORY)
+        self._cycle_count = 0
+        self._cycle_fires = 0
 
     # ── Lifecycle ─────────────────────────────────────────────────────────────
 
@@ -35,7 +78,7 @@ class AlertEngine:
         self._running = False
 
     def _run(self):
-        """Poll every 60 s and evaluate all alert rules."""
+        """Poll every 60 s and evaluate the rules affected by changes."""
         # Initial delay so the app finishes starting up before the first check
         time.sleep(30)
         while self._running:
@@ -47,54 +90,122 @@ class AlertEngine:
 
     # ── Core evaluation ───────────────────────────────────────────────────────
 
-    def _evaluate_all(self):
-        """Evaluate built-in and DB-stored alert rules against current state."""
+    def _evaluate_all(self, force: bool = False):
+        """Evaluate the built-in and DB-stored rules whose inputs changed (all when *force*)."""
         from app.core.database import SessionLocal
-        db = SessionLocal()
-        try:
-            self._check_builtin_rules(db)
-            self._check_user_rules(db)
-        except Exception as exc:
-            logger.exception(f"Alert engine _evaluate_all error: {exc}")
-        finally:
-            db.close()
+        from app.models.alert_models import AlertRule
+        from app.services.alert_snapshot import CycleSnapshot
+
+        with self._cycle_lock:
+            started = time.monotonic()
+            db = SessionLocal()
+            try:
+                # Fetch every host's data once per cycle and share it across all checks
+                snap = CycleSnapshot.build(db)
+                snapshot_ms = (time.monotonic() - started) * 1000
+                logger.debug(f"Alert cycle snapshot: {len(snap.hosts)} host(s), {snap.api_calls} PVE call(s)")
+                released = self._state.refresh(db)
+                changed = self._changes.update(snap.fingerprints())
+
+                user_rules = {r.id: r for r in db.query(AlertRule).filter(AlertRule.enabled == True).all()}
+                self._rules.sync("user_rule:", (
+                    RuleSlot(
+                        key=f"user_rule:{r.id}",
+                        watches=_USER_RULE_WATCHES.get(r.rule_type, ()),
+                        host_id=r.host_id if r.rule_type == "storage_usage" else None,
+                        definition=(r.rule_type, r.threshold, r.host_id, r.node, r.cooldown_minutes,
+                                    r.notify_in_app, r.notify_webhook, r.notify_slack, r.name),
+                    )
+                    for r in user_rules.values()
+                ))
+
+                due = self._rules.due(changed, released, time.monotonic(), force=force)
+                self._cycle_fires = 0
+                builtin = user = 0
+                for slot in due:
+                    slot.retry_at = None
+                    slot.waiting_on = set()
+                    slot.last_eval = time.monotonic()
+                    self._local.slot = slot
+                    try:
+                        if slot.key.startswith("user_rule:"):
+                            user += 1
+                            self._evaluate_user_rule(db, user_rules[int(slot.key.split(":", 1)[1])], snap)
+                        else:
+                            builtin += 1
+                            getattr(self, slot.definition)(db, snap)
+                    except Exception as exc:
+                        logger.debug(f"Error evaluating {slot.key}: {exc}")
+                    finally:
+                        self._local.slot = None
+
+                self._record_cycle({
+                    "at": datetime.utcnow().isoformat(),
+                    "duration_ms": round((time.monotonic() - started) * 1000, 1),
+                    "snapshot_ms": round(snapshot_ms, 1),
+                    "forced": force,
+                    "changed_inputs": len(changed),
+                    "rules_total": len(self._rules),
+                    "rules_evaluated": builtin + user,
+                    "builtin_evaluated": builtin,
+                    "user_evaluated": user,
+                    "fired": self._cycle_fires,
+                })
+            except Exception as exc:
+                logger.exception(f"Alert engine _evaluate_all error: {exc}")
+            finally:
+                db.close()
+
+    def _record_cycle(self, cycle: Dict[str, Any]):
+        self._cycles.append(cycle)
+        self._cycle_count += 1
+        logger.debug(
+            f"Alert cycle: {cycle['rules_evaluated']}/{cycle['rules_total']} rule(s) evaluated, "
+            f"{cycle['changed_inputs']} changed input(s), {cycle['duration_ms']} ms"
+        )
 
     # ── Built-in rule helpers ─────────────────────────────────────────────────
 
     def _should_fire(self, rule_key: str, cooldown_minutes: int) -> bool:
-        """Return True if the cooldown period has passed for this rule key."""
-        last = self._alert_states.get(rule_key)
-        if last is None:
+        """Return True if the cooldown period has passed for this rule key.
+
+        When it has not, the rule being evaluated is scheduled to re-run
+        once the cooldown ends.
+        """
+        until = self._state.cooldown_until(rule_key, cooldown_minutes)
+        if until is None:
             return True
-        return datetime.utcnow() - last > timedelta(minutes=cooldown_minutes)
+        self._note_blocked(rule_key, until)
+        return False
 
     def _record_fire(self, rule_key: str):
         """Record that a rule just fired."""
-        self._alert_states[rule_key] = datetime.utcnow()
+        self._state.record_fire(rule_key)
+        if getattr(self._local, "slot", None) is not None:
+            self._cycle_fires += 1
+
+    def _note_blocked(self, rule_key: str, until: Optional[datetime] = None):
+        """Tell the slot under evaluation why *rule_key* did not fire (cooldown or open alert)."""
+        slot = getattr(self._local, "slot", None)
+        if slot is not None:
+            slot.note_blocked(rule_key, until)
 
     def _fire_builtin(self, db, rule_key: str, severity: str, title: str, message: str,
                       cooldown_minutes: int = 60, action_url: str = "/alerts"):
-        """Create an AlertEvent, broadcast in-app notifications, dispatch webhooks/Slack/PagerDuty."""
+        """Create an AlertEvent and queue in-app notifications and webhooks/Slack/PagerDuty."""
+        self._state.ensure_loaded(db)
         if not self._should_fire(rule_key, cooldown_minutes):
             return
 
         try:
             from app.models.alert_models import AlertEvent
-            from app.models.database import User, UserRole
-            from sqlalchemy import or_
+            from app.services.alert_notifier import AlertNotice, alert_notifier
 
             # Dedup: skip if an active (unacknowledged) or snoozed event already exists
             # for this rule_key. This prevents duplicates after restarts and respects
             # permanent silence (which sets snooze_until to a far-future date).
-            now = datetime.utcnow()
-            existing = db.query(AlertEvent).filter(
-                AlertEvent.rule_key == rule_key,
-                or_(
-                    AlertEvent.acknowledged == False,
-                    AlertEvent.snooze_until > now,
-                )
-            ).first()
-            if existing:
+            if self._state.is_open(rule_key):
+                self._note_blocked(rule_key)
                 return
 
             event = AlertEvent(
@@ -107,57 +218,24 @@ class AlertEngine:
                 acknowledged=False,
             )
             db.add(event)
-            db.flush()
-
-            # Broadcast to all admins
-            admins = db.query(User).filter(
-                User.is_active == True,
-                User.role == UserRole.ADMIN,
-            ).all()
-            from app.models.database import Notification
-            for admin in admins:
-                notif = Notification(
-                    user_id=admin.id,
-                    title=title,
-                    message=message,
-                    type=self._severity_to_notif_type(severity),
-                    action_url=action_url,
-                )
-                db.add(notif)
-
             db.commit()
             self._record_fire(rule_key)
+            self._state.mark_open(rule_key)
+            self._note_blocked(rule_key)
             logger.info(f"Alert fired [{severity}] {rule_key}: {title}")
 
-            # Webhook + Slack + PagerDuty dispatch (fire-and-forget thread)
-            threading.Thread(
-                target=self._dispatch_alert_fired,
-                args=(rule_key, severity, title, message),
-                daemon=True,
-            ).start()
+            # Admin notifications + webhook / Slack / PagerDuty, batched by the notifier
+            alert_notifier.submit(AlertNotice(
+                event_type="alert.fired", rule_key=rule_key, severity=severity,
+                title=title, message=message, in_app=True, action_url=action_url,
+            ))
         except Exception as exc:
             db.rollback()
             logger.error(f"Failed to fire alert {rule_key}: {exc}")
 
-    @staticmethod
-    def _severity_to_notif_type(severity: str) -> str:
-        return {"critical": "error", "warning": "warning"}.get(severity, "info")
-
     # ── Built-in rules ────────────────────────────────────────────────────────
 
-    def _check_builtin_rules(self, db):
-        """Run all hard-coded alert rule checks."""
-        self._check_node_offline(db)
-        self._check_storage_usage(db)
-        self._check_vm_stopped_unexpectedly(db)
-        self._check_backup_failed(db)
-        self._check_long_running_tasks(db)
-        self._check_high_cpu(db)
-        self._check_high_memory(db)
-        self._check_login_failures(db)
-        self._check_pbs_sync_failed(db)
-
-    def _check_pbs_sync_failed(self, db):
+    def _check_pbs_sync_failed(self, db, snap):
         """Fire when a configured PBS sync job's last run ended in an error state.
         Also resolves (acks) the alert when the job's next run comes back OK.
 
@@ -222,22 +300,21 @@ class AlertEngine:
                                 e.acknowledged = True
                                 e.acknowledged_at = _dt.utcnow()
                             db.commit()
+                            self._state.mark_closed(rule_key)
                             logger.info("Auto-acked %d PBS sync alerts for %s", len(open_evts), rule_key)
         except Exception as e:
             logger.debug("PBS sync-alert check errored: %s", e)
 
-    def _check_node_offline(self, db):
+    def _check_node_offline(self, db, snap):
         """Fire if any Proxmox node hasn't been updated for > 10 minutes."""
         try:
-            from app.models.database import ProxmoxNode, ProxmoxHost
             cutoff = datetime.utcnow() - timedelta(minutes=10)
             # Only check nodes whose host still exists and is active
-            active_host_ids = {h.id for h in db.query(ProxmoxHost).filter(ProxmoxHost.is_active == True).all()}
-            stale_nodes = db.query(ProxmoxNode).filter(
-                ProxmoxNode.last_updated < cutoff,
-                ProxmoxNode.status == "online",
-                ProxmoxNode.host_id.in_(active_host_ids),
-            ).all()
+            stale_nodes = [
+                n for n in snap.nodes
+                if n.last_updated is not None and n.last_updated < cutoff
+                and n.status == "online" and n.host_id in snap.active_host_ids
+            ]
             for node in stale_nodes:
                 key = f"node_offline:{node.id}"
                 self._fire_builtin(
@@ -250,39 +327,28 @@ class AlertEngine:
         except Exception as exc:
             logger.debug(f"check_node_offline error: {exc}")
 
-    def _check_storage_usage(self, db):
+    def _check_storage_usage(self, db, snap):
         """Check all Proxmox hosts for storage pools exceeding 85% / 95%."""
         try:
-            from app.models.database import ProxmoxHost
-            from app.services.proxmox import ProxmoxService
-
-            hosts = db.query(ProxmoxHost).filter(ProxmoxHost.is_active == True).all()
-            for host in hosts:
+            for hs in snap.hosts:
+                if not hs.ok:
+                    continue
                 try:
-                    svc = ProxmoxService(host)
-                    nodes = svc.get_nodes()
-                    for node_info in nodes:
-                        node_name = node_info.get("node")
-                        if not node_name:
-                            continue
-                        try:
-                            storage_list = svc.proxmox.nodes(node_name).storage.get(content="images")
-                        except Exception:
-                            continue
-                        for store in storage_list:
-                            total = store.get("total", 0)
-                            used = store.get("used", 0)
+                    for node_name in hs.node_names():
+                        for store in hs.storage_on(node_name, content="images"):
+                            total = store.get("maxdisk", 0)
+                            used = store.get("disk", 0)
                             if not total:
                                 continue
                             pct = (used / total) * 100
                             store_name = store.get("storage", "unknown")
-                            key95 = f"storage_critical:{host.id}:{node_name}:{store_name}"
-                            key85 = f"storage_warning:{host.id}:{node_name}:{store_name}"
+                            key95 = f"storage_critical:{hs.host_id}:{node_name}:{store_name}"
+                            key85 = f"storage_warning:{hs.host_id}:{node_name}:{store_name}"
                             if pct >= 95:
                                 self._fire_builtin(
                                     db, key95, "critical",
                                     f"Storage critically full: {store_name}",
-                                    f"Storage pool '{store_name}' on {node_name} ({host.name}) is "
+                                    f"Storage pool '{store_name}' on {node_name} ({hs.host_name}) is "
                                     f"{pct:.1f}% full (>= 95%). Immediate action required.",
                                     cooldown_minutes=60,
                                 )
@@ -290,40 +356,24 @@ class AlertEngine:
                                 self._fire_builtin(
                                     db, key85, "warning",
                                     f"Storage high usage: {store_name}",
-                                    f"Storage pool '{store_name}' on {node_name} ({host.name}) is "
+                                    f"Storage pool '{store_name}' on {node_name} ({hs.host_name}) is "
                                     f"{pct:.1f}% full (>= 85%).",
                                     cooldown_minutes=120,
                                 )
                 except Exception as host_exc:
-                    logger.debug(f"check_storage_usage host {host.id} error: {host_exc}")
+                    logger.debug(f"check_storage_usage host {hs.host_id} error: {host_exc}")
         except Exception as exc:
             logger.debug(f"check_storage_usage error: {exc}")
 
-    def _check_vm_stopped_unexpectedly(self, db):
+    def _check_vm_stopped_unexpectedly(self, db, snap):
         """Detect VMs that were running but now stopped with no user-initiated stop task in last 5 min."""
         try:
-            from app.models.database import ProxmoxHost
-            from app.services.proxmox import ProxmoxService
-
-            hosts = db.query(ProxmoxHost).filter(ProxmoxHost.is_active == True).all()
-            for host in hosts:
+            for hs in snap.hosts:
+                if not hs.ok:
+                    continue
+                muted_vmids = snap.muted_vmids.get(hs.host_id, set())
                 try:
-                    svc = ProxmoxService(host)
-                    nodes = svc.get_nodes()
-                    for node_info in nodes:
-                        node_name = node_info.get("node")
-                        if not node_name:
-                            continue
-                        try:
-                            vms = svc.proxmox.nodes(node_name).qemu.get()
-                        except Exception:
-                            continue
-                        # Get recent tasks for this node
-                        try:
-                            tasks = svc.proxmox.nodes(node_name).tasks.get(limit=50)
-                        except Exception:
-                            tasks = []
-
+                    for node_name, tasks in hs.tasks.items():
                         # Tasks started in the last 5 minutes that are stop/shutdown
                         cutoff_ts = time.time() - 300
                         recent_stop_vmids = set()
@@ -336,20 +386,7 @@ class AlertEngine:
                             ):
                                 recent_stop_vmids.add(vmid_str)
 
-                        # Load muted VMs for this host
-                        try:
-                            import json
-                            from app.models.database import SystemSettings
-                            mute_row = db.query(SystemSettings).filter(SystemSettings.key == "vm_alert_mutes").first()
-                            muted_vmids = set()
-                            if mute_row:
-                                for m in json.loads(mute_row.value or "[]"):
-                                    if m.get("host_id") == host.id:
-                                        muted_vmids.add(str(m.get("vmid", "")))
-                        except Exception:
-                            muted_vmids = set()
-
-                        for vm in vms:
+                        for vm in hs.qemu_on(node_name):
                             status = vm.get("status", "")
                             vmid = str(vm.get("vmid", ""))
                             name = vm.get("name", vmid)
@@ -357,79 +394,53 @@ class AlertEngine:
                             if vm.get("template") == 1 or vm.get("template") is True:
                                 continue
                             if status == "stopped" and vmid not in recent_stop_vmids and vmid not in muted_vmids:
-                                key = f"vm_unexpected_stop:{host.id}:{node_name}:{vmid}"
+                                key = f"vm_unexpected_stop:{hs.host_id}:{node_name}:{vmid}"
                                 # Only fire once per cooldown — don't spam for long-stopped VMs
                                 self._fire_builtin(
                                     db, key, "warning",
                                     f"VM stopped unexpectedly: {name}",
-                                    f"VM '{name}' (VMID {vmid}) on {node_name} ({host.name}) "
+                                    f"VM '{name}' (VMID {vmid}) on {node_name} ({hs.host_name}) "
                                     f"is stopped with no matching stop task in the last 5 minutes.",
                                     cooldown_minutes=1440,  # once per day max
                                 )
                 except Exception as host_exc:
-                    logger.debug(f"check_vm_stopped host {host.id} error: {host_exc}")
+                    logger.debug(f"check_vm_stopped host {hs.host_id} error: {host_exc}")
         except Exception as exc:
             logger.debug(f"check_vm_stopped error: {exc}")
 
-    def _check_backup_failed(self, db):
+    def _check_backup_failed(self, db, snap):
         """Check for failed vzdump tasks in the last 24h."""
         try:
-            from app.models.database import ProxmoxHost
-            from app.services.proxmox import ProxmoxService
-
-            hosts = db.query(ProxmoxHost).filter(ProxmoxHost.is_active == True).all()
             cutoff_ts = time.time() - 86400
-            for host in hosts:
+            for hs in snap.hosts:
                 try:
-                    svc = ProxmoxService(host)
-                    nodes = svc.get_nodes()
-                    for node_info in nodes:
-                        node_name = node_info.get("node")
-                        if not node_name:
-                            continue
-                        try:
-                            tasks = svc.proxmox.nodes(node_name).tasks.get(limit=200)
-                        except Exception:
-                            continue
+                    for node_name, tasks in hs.tasks.items():
                         for t in tasks:
                             if (t.get("type", "") == "vzdump" and
                                     t.get("status", "") == "ERROR" and
                                     t.get("starttime", 0) >= cutoff_ts):
                                 upid = t.get("upid", "")
-                                key = f"backup_failed:{host.id}:{node_name}:{upid}"
+                                key = f"backup_failed:{hs.host_id}:{node_name}:{upid}"
                                 vmid = t.get("id", "?")
                                 self._fire_builtin(
                                     db, key, "warning",
                                     f"Backup failed on {node_name}",
-                                    f"A backup (vzdump) for VM/CT {vmid} on {node_name} ({host.name}) "
+                                    f"A backup (vzdump) for VM/CT {vmid} on {node_name} ({hs.host_name}) "
                                     f"failed within the last 24 hours. UPID: {upid}",
                                     cooldown_minutes=1440,
                                 )
                 except Exception as host_exc:
-                    logger.debug(f"check_backup_failed host {host.id} error: {host_exc}")
+                    logger.debug(f"check_backup_failed host {hs.host_id} error: {host_exc}")
         except Exception as exc:
             logger.debug(f"check_backup_failed error: {exc}")
 
-    def _check_long_running_tasks(self, db):
+    def _check_long_running_tasks(self, db, snap):
         """Fire if any Proxmox task has been running for > 2 hours."""
         try:
-            from app.models.database import ProxmoxHost
-            from app.services.proxmox import ProxmoxService
-
-            hosts = db.query(ProxmoxHost).filter(ProxmoxHost.is_active == True).all()
             cutoff_ts = time.time() - 7200  # 2 hours ago
-            for host in hosts:
+            for hs in snap.hosts:
                 try:
-                    svc = ProxmoxService(host)
-                    nodes = svc.get_nodes()
-                    for node_info in nodes:
-                        node_name = node_info.get("node")
-                        if not node_name:
-                            continue
-                        try:
-                            tasks = svc.proxmox.nodes(node_name).tasks.get(limit=50)
-                        except Exception:
-                            continue
+                    for node_name, tasks in hs.tasks.items():
                         for t in tasks:
                             # Running tasks have no endtime
                             if t.get("endtime"):
@@ -438,28 +449,27 @@ class AlertEngine:
                             if start_ts and start_ts <= cutoff_ts:
                                 upid = t.get("upid", "")
                                 task_type = t.get("type", "unknown")
-                                key = f"long_task:{host.id}:{node_name}:{upid}"
+                                key = f"long_task:{hs.host_id}:{node_name}:{upid}"
                                 duration_h = (time.time() - start_ts) / 3600
                                 self._fire_builtin(
                                     db, key, "warning",
                                     f"Long-running task on {node_name}",
-                                    f"Task '{task_type}' on {node_name} ({host.name}) has been running "
+                                    f"Task '{task_type}' on {node_name} ({hs.host_name}) has been running "
                                     f"for {duration_h:.1f} hours. UPID: {upid}",
                                     cooldown_minutes=120,
                                 )
                 except Exception as host_exc:
-                    logger.debug(f"check_long_tasks host {host.id} error: {host_exc}")
+                    logger.debug(f"check_long_tasks host {hs.host_id} error: {host_exc}")
         except Exception as exc:
             logger.debug(f"check_long_tasks error: {exc}")
 
-    def _check_high_cpu(self, db):
+    def _check_high_cpu(self, db, snap):
         """Fire if any node CPU average is > 90%."""
         try:
-            from app.models.database import ProxmoxNode
-            high_cpu_nodes = db.query(ProxmoxNode).filter(
-                ProxmoxNode.cpu_usage > 90,
-                ProxmoxNode.status == "online",
-            ).all()
+            high_cpu_nodes = [
+                n for n in snap.nodes
+                if n.cpu_usage is not None and n.cpu_usage > 90 and n.status == "online"
+            ]
             for node in high_cpu_nodes:
                 key = f"high_cpu:{node.id}"
                 self._fire_builtin(
@@ -471,16 +481,10 @@ class AlertEngine:
         except Exception as exc:
             logger.debug(f"check_high_cpu error: {exc}")
 
-    def _check_high_memory(self, db):
+    def _check_high_memory(self, db, snap):
         """Fire if any node memory usage is > 95%."""
         try:
-            from app.models.database import ProxmoxNode
-            nodes = db.query(ProxmoxNode).filter(
-                ProxmoxNode.memory_total > 0,
-                ProxmoxNode.memory_used > 0,
-                ProxmoxNode.status == "online",
-            ).all()
-            for node in nodes:
+            for node in _nodes_with_memory(snap):
                 pct = (node.memory_used / node.memory_total) * 100
                 if pct >= 95:
                     key = f"high_memory:{node.id}"
@@ -493,19 +497,12 @@ class AlertEngine:
         except Exception as exc:
             logger.debug(f"check_high_memory error: {exc}")
 
-    def _check_login_failures(self, db):
+    def _check_login_failures(self, db, snap):
         """Fire if > 5 failed logins from the same IP in the last 10 minutes."""
         try:
-            from sqlalchemy import text
-            cutoff = datetime.utcnow() - timedelta(minutes=10)
-            rows = db.execute(text(
-                "SELECT ip_address, COUNT(*) as cnt FROM login_attempts "
-                "WHERE success = 0 AND timestamp >= :cutoff "
-                "GROUP BY ip_address HAVING cnt > 5"
-            ), {"cutoff": cutoff}).fetchall()
-            for row in rows:
-                ip = row[0]
-                cnt = row[1]
+            for ip, cnt in snap.login_failures.items():
+                if cnt <= 5:
+                    continue
                 key = f"login_failures:{ip}"
                 self._fire_builtin(
                     db, key, "warning",
@@ -518,23 +515,10 @@ class AlertEngine:
 
     # ── User-configured rule evaluation ──────────────────────────────────────
 
-    def _check_user_rules(self, db):
-        """Evaluate DB-stored user-configured alert rules."""
-        try:
-            from app.models.alert_models import AlertRule
-            rules = db.query(AlertRule).filter(AlertRule.enabled == True).all()
-            for rule in rules:
-                try:
-                    self._evaluate_user_rule(db, rule)
-                except Exception as exc:
-                    logger.debug(f"Error evaluating user rule {rule.id}: {exc}")
-        except Exception as exc:
-            logger.debug(f"check_user_rules error: {exc}")
-
-    def _evaluate_user_rule(self, db, rule):
-        """Evaluate a single user-configured rule."""
-        from app.models.alert_models import AlertRule, AlertEvent
-        from app.models.database import Notification, User, UserRole
+    def _evaluate_user_rule(self, db, rule, snap):
+        """Evaluate a single user-configured rule against the cycle snapshot."""
+        from app.models.alert_models import AlertEvent
+        from app.services.alert_notifier import AlertNotice, alert_notifier
 
         rule_key = f"user_rule:{rule.id}"
         if not self._should_fire(rule_key, rule.cooldown_minutes):
@@ -547,17 +531,17 @@ class AlertEngine:
 
         try:
             if rule.rule_type == "storage_usage":
-                triggered, title, message = self._eval_storage_usage_rule(db, rule)
+                triggered, title, message = self._eval_storage_usage_rule(db, rule, snap)
             elif rule.rule_type == "node_cpu":
-                triggered, title, message = self._eval_node_cpu_rule(db, rule)
+                triggered, title, message = self._eval_node_cpu_rule(db, rule, snap)
             elif rule.rule_type == "node_memory":
-                triggered, title, message = self._eval_node_memory_rule(db, rule)
+                triggered, title, message = self._eval_node_memory_rule(db, rule, snap)
             elif rule.rule_type == "vm_stopped":
                 triggered, title, message = self._eval_vm_stopped_rule(db, rule)
             elif rule.rule_type == "backup_failed":
                 triggered, title, message = self._eval_backup_failed_rule(db, rule)
             elif rule.rule_type == "login_failures":
-                triggered, title, message = self._eval_login_failures_rule(db, rule)
+                triggered, title, message = self._eval_login_failures_rule(db, rule, snap)
         except Exception as exc:
             logger.debug(f"User rule {rule.id} eval error: {exc}")
             return
@@ -581,92 +565,62 @@ class AlertEngine:
         # Update last_fired on rule
         rule.last_fired_at = datetime.utcnow()
 
-        # In-app notifications
-        if rule.notify_in_app:
-            admins = db.query(User).filter(
-                User.is_active == True,
-                User.role == UserRole.ADMIN,
-            ).all()
-            for admin in admins:
-                notif = Notification(
-                    user_id=admin.id,
-                    title=title,
-                    message=message,
-                    type=self._severity_to_notif_type(severity),
-                    action_url="/alerts",
-                )
-                db.add(notif)
-
         db.commit()
         self._record_fire(rule_key)
-
-        # Webhook + Slack + PagerDuty dispatch (fire-and-forget thread)
-        if rule.notify_webhook or rule.notify_slack:
-            threading.Thread(
-                target=self._dispatch_alert_fired,
-                args=(f"user_rule:{rule.id}", severity, title, message, rule.id, rule.name),
-                daemon=True,
-            ).start()
-
-    def _eval_storage_usage_rule(self, db, rule):
-        from app.models.database import ProxmoxHost
-        from app.services.proxmox import ProxmoxService
-
+        # User rules re-fire while the condition holds, once per cooldown
+        self._note_blocked(rule_key, datetime.utcnow() + timedelta(minutes=rule.cooldown_minutes))
+
+        # In-app notifications + webhook / Slack / PagerDuty, batched by the notifier
+        external = bool(rule.notify_webhook or rule.notify_slack)
+        if rule.notify_in_app or external:
+            alert_notifier.submit(AlertNotice(
+                event_type="alert.fired", rule_key=rule_key, severity=severity,
+                title=title, message=message, rule_id=rule.id, rule_name=rule.name,
+                in_app=bool(rule.notify_in_app), external=external,
+            ))
+
+    def _eval_storage_usage_rule(self, db, rule, snap):
         threshold = rule.threshold or 85.0
-        hosts = db.query(ProxmoxHost).filter(ProxmoxHost.is_active == True)
-        if rule.host_id:
-            hosts = hosts.filter(ProxmoxHost.id == rule.host_id)
-        for host in hosts.all():
+        for hs in snap.hosts:
+            if rule.host_id and hs.host_id != rule.host_id:
+                continue
             try:
-                svc = ProxmoxService(host)
-                nodes = svc.get_nodes()
-                for node_info in nodes:
-                    node_name = node_info.get("node")
+                for node_name in hs.node_names():
                     if rule.node and node_name != rule.node:
                         continue
-                    stores = svc.proxmox.nodes(node_name).storage.get(content="images")
-                    for store in stores:
-                        total = store.get("total", 0)
-                        used = store.get("used", 0)
+                    for store in hs.storage_on(node_name, content="images"):
+                        total = store.get("maxdisk", 0)
+                        used = store.get("disk", 0)
                         if not total:
                             continue
                         pct = (used / total) * 100
                         if pct >= threshold:
                             return True, \
                                 f"[{rule.name}] Storage at {pct:.1f}%", \
-                                f"Storage pool '{store.get('storage')}' on {node_name} ({host.name}) " \
+                                f"Storage pool '{store.get('storage')}' on {node_name} ({hs.host_name}) " \
                                 f"is {pct:.1f}% full (threshold {threshold}%)."
             except Exception:
                 pass
         return False, "", ""
 
-    def _eval_node_cpu_rule(self, db, rule):
-        from app.models.database import ProxmoxNode
+    def _eval_node_cpu_rule(self, db, rule, snap):
         threshold = rule.threshold or 90.0
-        query = db.query(ProxmoxNode).filter(
-            ProxmoxNode.cpu_usage >= threshold,
-            ProxmoxNode.status == "online",
-        )
-        if rule.node:
-            query = query.filter(ProxmoxNode.node_name == rule.node)
-        node = query.first()
+        node = next((
+            n for n in snap.nodes
+            if n.cpu_usage is not None and n.cpu_usage >= threshold and n.status == "online"
+            and (not rule.node or n.node_name == rule.node)
+        ), None)
         if node:
             return True, \
                 f"[{rule.name}] High CPU: {node.node_name}", \
                 f"Node '{node.node_name}' CPU at {node.cpu_usage}% (threshold {threshold}%)."
         return False, "", ""
 
-    def _eval_node_memory_rule(self, db, rule):
-        from app.models.database import ProxmoxNode
+    def _eval_node_memory_rule(self, db, rule, snap):
         threshold = rule.threshold or 95.0
-        query = db.query(ProxmoxNode).filter(
-            ProxmoxNode.memory_total > 0,
-            ProxmoxNode.memory_used > 0,
-            ProxmoxNode.status == "online",
-        )
-        if rule.node:
-            query = query.filter(ProxmoxNode.node_name == rule.node)
-        for node in query.all():
+        for node in _nodes_with_memory(snap):
+            if rule.node and node.node_name != rule.node:
+                continue
             pct = (node.memory_used / node.memory_total) * 100
             if pct >= threshold:
                 return True, \
@@ -681,17 +635,11 @@ class AlertEngine:
     def _eval_backup_failed_rule(self, db, rule):
         return False, "", ""
 
-    def _eval_login_failures_rule(self, db, rule):
-        from sqlalchemy import text
+    def _eval_login_failures_rule(self, db, rule, snap):
         threshold = int(rule.threshold or 5)
-        cutoff = datetime.utcnow() - timedelta(minutes=10)
-        rows = db.execute(text(
-            "SELECT ip_address, COUNT(*) as cnt FROM login_attempts "
-            "WHERE success = 0 AND timestamp >= :cutoff "
-            "GROUP BY ip_address HAVING cnt > :threshold"
-        ), {"cutoff": cutoff, "threshold": threshold}).fetchall()
+        rows = [(ip, cnt) for ip, cnt in snap.login_failures.items() if cnt > threshold]
         if rows:
-            ip, cnt = rows[0][0], rows[0][1]
+            ip, cnt = rows[0]
             return True, \
                 f"[{rule.name}] Login failures from {ip}", \
                 f"{cnt} failed login attempts from {ip} in last 10 min (threshold {threshold})."
@@ -699,45 +647,6 @@ class AlertEngine:
 
     # ── Webhook / Slack / PagerDuty dispatch ─────────────────────────────────
 
-    def _dispatch_alert_fired(
-        self,
-        rule_key: str,
-        severity: str,
-        title: str,
-        message: str,
-        rule_id: Optional[int] = None,
-        rule_name: Optional[str] = None,
-    ):
-        """Dispatch alert.fired to webhooks, Slack, and PagerDuty (runs in a separate thread)."""
-        try:
-            import asyncio
-            from app.core.database import SessionLocal
-            from app.services.webhook_dispatcher import dispatcher
-
-            db = SessionLocal()
-            try:
-                loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(loop)
-                try:
-                    loop.run_until_complete(
-                        dispatcher.dispatch_alert_event(
-                            db,
-                            event_type="alert.fired",
-                            title=title,
-                            message=message,
-                            severity=severity,
-                            rule_id=rule_id,
-                            rule_name=rule_name,
-                            dedup_key=rule_key,
-                        )
-                    )
-                finally:
-                    loop.close()
-            finally:
-                db.close()
-        except Exception as exc:
-            logger.debug(f"_dispatch_alert_fired error: {exc}")
-
     def dispatch_alert_resolved(
         self,
         rule_key: str,
@@ -749,57 +658,42 @@ class AlertEngine:
         """
         Public helper: dispatch alert.resolved to webhooks, Slack, and PagerDuty.
         Intended to be called when an alert is acknowledged/resolved.
-        Runs in a background thread.
+        Queued on the alert notifier; returns immediately.
         """
-        threading.Thread(
-            target=self._dispatch_alert_resolved_sync,
-            args=(rule_key, title, message, rule_id, rule_name),
-            daemon=True,
-        ).start()
-
-    def _dispatch_alert_resolved_sync(
-        self,
-        rule_key: str,
-        title: str,
-        message: str,
-        rule_id: Optional[int],
-        rule_name: Optional[str],
-    ):
-        """Synchronous worker for alert.resolved dispatch."""
-        try:
-            import asyncio
-            from app.core.database import SessionLocal
-            from app.services.webhook_dispatcher import dispatcher
+        from app.services.alert_notifier import AlertNotice, alert_notifier
 
-            db = SessionLocal()
-            try:
-                loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(loop)
-                try:
-                    loop.run_until_complete(
-                        dispatcher.dispatch_alert_event(
-                            db,
-                            event_type="alert.resolved",
-                            title=title,
-                            message=message,
-                            severity="info",
-                            rule_id=rule_id,
-                            rule_name=rule_name,
-                            dedup_key=rule_key,
-                        )
-                    )
-                finally:
-                    loop.close()
-            finally:
-                db.close()
-        except Exception as exc:
-            logger.debug(f"_dispatch_alert_resolved error: {exc}")
+        alert_notifier.submit(AlertNotice(
+            event_type="alert.resolved", rule_key=rule_key, severity="info",
+            title=title, message=message, rule_id=rule_id, rule_name=rule_name,
+        ))
 
     # ── Public helper: manually trigger rule evaluation ───────────────────────
 
     def evaluate_now(self):
-        """Trigger an immediate evaluation outside the polling loop."""
-        threading.Thread(target=self._evaluate_all, daemon=True).start()
+        """Trigger an immediate evaluation of every rule outside the polling loop."""
+        threading.Thread(target=self._evaluate_all, kwargs={"force": True}, daemon=True).start()
+
+    def stats(self) -> Dict[str, Any]:
+        cycles = list(self._cycles)
+        n = len(cycles) or 1
+        return {
+            "running": self._running,
+            "cycles": self._cycle_count,
+            "rules_total": len(self._rules),
+            "avg_duration_ms": round(sum(c["duration_ms"] for c in cycles) / n, 1),
+            "avg_rules_evaluated": round(sum(c["rules_evaluated"] for c in cycles) / n, 1),
+            **self._state.stats(),
+            "last": cycles[-1] if cycles else None,
+            "recent": cycles,
+        }
+
+
+def _nodes_with_memory(snap) -> List[Any]:
+    return [
+        n for n in snap.nodes
+        if n.memory_total and n.memory_total > 0 and n.memory_used and n.memory_used > 0
+        and n.status == "online"
+    ]
 
 
 alert_engine = AlertEngine()
@@ -0,0 +1,221 @@
+"""Change tracking, rule index and alert state for the alert engine.
+
+Instead of re-running every rule every cycle, the engine re-evaluates only
+the rules whose inputs moved:
+
+- ``ChangeTracker`` compares the cycle snapshot's watch fingerprints — one
+  per (resource type, metric, host), e.g. ``("storage", "usage", 3)`` —
+  with the previous cycle's and returns the keys that changed
+- ``RuleIndex`` maps each (resource type, metric) to the rules watching it.
+  A rule is due when one of its watch keys changed, when its periodic
+  interval elapsed (conditions that depend on the clock, such as "task
+  running for more than 2 h"), when a cooldown that suppressed it ends, or
+  when an open alert it was waiting on is acknowledged
+- ``AlertStateIndex`` keeps the open (unacknowledged or snoozed) alert keys
+  and the last fire time per key in memory. It is loaded from
+  ``alert_events`` on first use and the open set is re-read with one query
+  per cycle, so dedup and cooldown checks no longer query per candidate and
+  cooldowns survive a restart
+"""
+import logging
+import threading
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# (resource type, metric, host_id or None for data not tied to a host)
+WatchKey = Tuple[str, str, Optional[int]]
+Watch = Tuple[str, str]
+
+# Longest built-in check cooldown; user rules may configure longer ones.
+_BUILTIN_MAX_COOLDOWN = timedelta(days=1)
+
+
+class ChangeTracker:
+    """Remembers the last fingerprint per watch key and reports what changed."""
+
+    def __init__(self):
+        self._last: Dict[WatchKey, int] = {}
+
+    def update(self, fingerprints: Dict[WatchKey, Hashable]) -> Set[WatchKey]:
+        current = {key: hash(fp) for key, fp in fingerprints.items()}
+        changed = {key for key, h in current.items() if self._last.get(key) != h}
+        changed.update(key for key in self._last if key not in current)
+        self._last = current
+        return changed
+
+
+@dataclass
+class RuleSlot:
+    """Scheduling state of one rule (built-in check or user rule)."""
+    key: str
+    watches: Tuple[Watch, ...]
+    host_id: Optional[int] = None          # only react to changes on this host
+    every: Optional[float] = None          # re-evaluate at least this often (seconds)
+    definition: Any = None                 # user rule fields; a change forces re-evaluation
+    last_eval: Optional[float] = None      # time.monotonic() of the last evaluation
+    retry_at: Optional[datetime] = None    # a suppressing cooldown ends
+    waiting_on: Set[str] = field(default_factory=set)   # open alert keys blocking a fire
+
+    def note_blocked(self, alert_key: str, until: Optional[datetime] = None) -> None:
+        if until is None:
+            self.waiting_on.add(alert_key)
+        elif self.retry_at is None or until < self.retry_at:
+            self.retry_at = until
+
+
+class RuleIndex:
+    """Rule slots indexed by the (resource type, metric) pairs they watch."""
+
+    def __init__(self):
+        self._slots: Dict[str, RuleSlot] = {}
+        self._by_watch: Dict[Watch, Set[str]] = {}
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def add(self, slot: RuleSlot) -> None:
+        self.remove(slot.key)
+        self._slots[slot.key] = slot
+        for watch in slot.watches:
+            self._by_watch.setdefault(watch, set()).add(slot.key)
+
+    def remove(self, key: str) -> None:
+        slot = self._slots.pop(key, None)
+        if slot is None:
+            return
+        for watch in slot.watches:
+            keys = self._by_watch.get(watch)
+            if keys:
+                keys.discard(key)
+                if not keys:
+                    del self._by_watch[watch]
+
+    def get(self, key: str) -> Optional[RuleSlot]:
+        return self._slots.get(key)
+
+    def sync(self, prefix: str, slots: Iterable[RuleSlot]) -> None:
+        """Replace every slot whose key starts with *prefix* by *slots*.
+
+        A slot whose definition is unchanged keeps its scheduling state.
+        """
+        wanted = {s.key: s for s in slots}
+        for key in [k for k in self._slots if k.startswith(prefix) and k not in wanted]:
+            self.remove(key)
+        for key, slot in wanted.items():
+            old = self._slots.get(key)
+            if old is not None and old.definition == slot.definition and old.watches == slot.watches:
+                continue
+            self.add(slot)
+
+    def due(self, changed: Set[WatchKey], released: Set[str], now: float,
+            force: bool = False) -> List[RuleSlot]:
+        """Slots to evaluate this cycle, in registration order."""
+        if force:
+            return list(self._slots.values())
+        keys: Set[str] = set()
+        for rtype, metric, host_id in changed:
+            for key in self._by_watch.get((rtype, metric), ()):
+                slot = self._slots[key]
+                if slot.host_id is None or host_id is None or slot.host_id == host_id:
+                    keys.add(key)
+        wall = datetime.utcnow()
+        for key, slot in self._slots.items():
+            if key in keys:
+                continue
+            if (slot.last_eval is None
+                    or (slot.every is not None and now - slot.last_eval >= slot.every)
+                    or (slot.retry_at is not None and wall >= slot.retry_at)
+                    or (slot.waiting_on and slot.waiting_on & released)):
+                keys.add(key)
+        return [s for k, s in self._slots.items() if k in keys]
+
+
+class AlertStateIndex:
+    """Open alert keys and last fire times, mirrored from ``alert_events``."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._open: Set[str] = set()
+        self._last_fired: Dict[str, datetime] = {}
+        self._loaded = False
+
+    def ensure_loaded(self, db) -> None:
+        if not self._loaded:
+            self.refresh(db)
+
+    def refresh(self, db) -> Set[str]:
+        """Re-read the open alert keys; return the keys that are no longer open."""
+        from sqlalchemy import func, or_
+        from app.models.alert_models import AlertEvent, AlertRule
+
+        now = datetime.utcnow()
+        # Fire times older than the longest cooldown in use cannot suppress anything
+        longest = db.query(func.max(AlertRule.cooldown_minutes)).scalar() or 0
+        cutoff = now - max(_BUILTIN_MAX_COOLDOWN, timedelta(minutes=longest))
+        open_keys = {
+            row[0] for row in
+            db.query(AlertEvent.rule_key)
+            .filter(
+                AlertEvent.rule_key.isnot(None),
+                or_(AlertEvent.acknowledged == False, AlertEvent.snooze_until > now),  # noqa: E712
+            )
+            .distinct()
+            .all()
+        }
+        seed: Dict[str, datetime] = {}
+        if not self._loaded:
+            for key, fired in (
+                db.query(AlertEvent.rule_key, func.max(AlertEvent.fired_at))
+                .filter(AlertEvent.rule_key.isnot(None), AlertEvent.fired_at >= cutoff)
+                .group_by(AlertEvent.rule_key)
+                .all()
+            ):
+                seed[key] = fired
+            for rule_id, fired in db.query(AlertRule.id, AlertRule.last_fired_at).filter(
+                AlertRule.last_fired_at >= cutoff
+            ).all():
+                key = f"user_rule:{rule_id}"
+                seed[key] = max(fired, seed.get(key, fired))
+        with self._lock:
+            released = self._open - open_keys
+            self._open = open_keys
+            if not self._loaded:
+                for key, fired in seed.items():
+                    if key not in self._last_fired or fired > self._last_fired[key]:
+                        self._last_fired[key] = fired
+                self._loaded = True
+            for key in [k for k, t in self._last_fired.items() if t < cutoff]:
+                del self._last_fired[key]
+        return released
+
+    def is_open(self, key: str) -> bool:
+        with self._lock:
+            return key in self._open
+
+    def mark_open(self, key: str) -> None:
+        with self._lock:
+            self._open.add(key)
+
+    def mark_closed(self, key: str) -> None:
+        with self._lock:
+            self._open.discard(key)
+
+    def cooldown_until(self, key: str, cooldown_minutes: int) -> Optional[datetime]:
+        """End of *key*'s cooldown, or None when it may fire now."""
+        with self._lock:
+            last = self._last_fired.get(key)
+        if last is None:
+            return None
+        until = last + timedelta(minutes=cooldown_minutes)
+        return until if datetime.utcnow() <= until else None
+
+    def record_fire(self, key: str, when: Optional[datetime] = None) -> None:
+        with self._lock:
+            self._last_fired[key] = when or datetime.utcnow()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"open_alerts": len(self._open), "cooldowns_tracked": len(self._last_fired)}
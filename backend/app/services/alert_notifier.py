@@ -0,0 +1,261 @@
+"""Alert notification fan-out — one long-lived worker instead of a thread per alert.
+
+``submit()`` puts an alert on a bounded queue and returns immediately. A
+single worker thread, with one event loop it keeps for its whole life, drains
+the queue in batches: after the first alert arrives it waits up to
+``window`` seconds (or until ``max_batch`` alerts) and handles the batch with
+one DB session:
+
+- in-app notifications for all admins are bulk-inserted in one statement
+- Slack gets one message per alert for small batches and a single digest
+  when a batch holds ``digest_min`` alerts or more; in-app notifications are
+  digested the same way
+- webhooks and PagerDuty still get one event per alert, since receivers
+  route and deduplicate on them; the HTTP calls go through ``delivery_engine``
+
+When the queue is full, further alerts are counted and reported in the next
+digest instead of being queued.
+"""
+import asyncio
+import logging
+import queue
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class AlertNotice:
+    event_type: str                 # alert.fired | alert.resolved
+    rule_key: str
+    severity: str
+    title: str
+    message: str
+    rule_id: Optional[int] = None
+    rule_name: Optional[str] = None
+    in_app: bool = False            # insert a Notification for every active admin
+    external: bool = True           # webhooks / Slack / PagerDuty
+    action_url: str = "/alerts"
+
+
+def _notif_type(severity: str) -> str:
+    return {"critical": "error", "warning": "warning"}.get(severity, "info")
+
+
+class AlertNotifier:
+    """Bounded queue + single worker for alert notifications."""
+
+    def __init__(self, max_queue: int = 1000, window: float = 2.0, max_batch: int = 200,
+                 digest_min: int = 5):
+        self._queue: "queue.Queue[Optional[AlertNotice]]" = queue.Queue(maxsize=max_queue)
+        self._window = window
+        self._max_batch = max_batch
+        self._digest_min = digest_min
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._overflow = 0
+        self._counters = {
+            "submitted": 0, "dropped": 0, "batches": 0, "digests": 0,
+            "notifications_inserted": 0, "external_events": 0, "errors": 0,
+        }
+
+    # ── public API ───────────────────────────────────────────────────────────
+
+    def submit(self, notice: AlertNotice) -> bool:
+        """Queue *notice* from any thread; False when the queue is full."""
+        self._ensure_running()
+        try:
+            self._queue.put_nowait(notice)
+        except queue.Full:
+            with self._lock:
+                self._overflow += 1
+                self._counters["dropped"] += 1
+            logger.warning(f"Alert notification queue full — dropped {notice.rule_key}")
+            return False
+        with self._lock:
+            self._counters["submitted"] += 1
+        return True
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Deliver what is queued, then stop the worker."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is None or not thread.is_alive():
+            return
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            return
+        thread.join(timeout)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "running": self._thread is not None and self._thread.is_alive(),
+                "queued": self._queue.qsize(),
+                "max_queue": self._queue.maxsize,
+                "window_seconds": self._window,
+                "digest_min": self._digest_min,
+                **dict(self._counters),
+            }
+
+    # ── worker ───────────────────────────────────────────────────────────────
+
+    def _ensure_running(self) -> None:
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, daemon=True, name="alert-notifier")
+            self._thread.start()
+
+    def _run(self) -> None:
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            while True:
+                first = self._queue.get()
+                if first is None:
+                    break
+                batch, stopping = self._collect(first)
+                with self._lock:
+                    overflow, self._overflow = self._overflow, 0
+                try:
+                    loop.run_until_complete(self._handle(batch, overflow))
+                except Exception as exc:
+                    with self._lock:
+                        self._counters["errors"] += 1
+                    logger.error(f"Alert notification batch of {len(batch)} failed: {exc}")
+                if stopping:
+                    break
+        finally:
+            loop.close()
+
+    def _collect(self, first: AlertNotice):
+        batch = [first]
+        deadline = time.monotonic() + self._window
+        while len(batch) < self._max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    async def _handle(self, batch: List[AlertNotice], overflow: int) -> None:
+        from app.core.database import SessionLocal
+        from app.services.webhook_dispatcher import dispatcher
+
+        db = SessionLocal()
+        try:
+            in_app = [n for n in batch if n.in_app]
+            if in_app or overflow:
+                self._insert_notifications(db, in_app, overflow)
+
+            external = [n for n in batch if n.external]
+            for n in external:
+                # Webhooks and PagerDuty: one event per alert (routing / dedup keys)
+                await dispatcher.dispatch_alert_event(
+                    db,
+                    event_type=n.event_type,
+                    title=n.title,
+                    message=n.message,
+                    severity=n.severity,
+                    rule_id=n.rule_id,
+                    rule_name=n.rule_name,
+                    dedup_key=n.rule_key,
+                    slack=len(external) < self._digest_min and not overflow,
+                )
+            if external and (len(external) >= self._digest_min or overflow):
+                text, blocks = _slack_digest(external, overflow)
+                fired = any(n.event_type == "alert.fired" for n in external)
+                await dispatcher.dispatch_slack(db, text, blocks=blocks,
+                                                event_type="alert.fired" if fired else "alert.resolved")
+                with self._lock:
+                    self._counters["digests"] += 1
+            with self._lock:
+                self._counters["batches"] += 1
+                self._counters["external_events"] += len(external)
+        finally:
+            db.close()
+
+    def _insert_notifications(self, db, notices: List[AlertNotice], overflow: int) -> None:
+        from app.models.database import Notification, User, UserRole
+
+        admin_ids = [row[0] for row in db.query(User.id).filter(
+            User.is_active == True,  # noqa: E712
+            User.role == UserRole.ADMIN,
+        ).all()]
+        if not admin_ids:
+            return
+        now = datetime.utcnow()
+        if len(notices) >= self._digest_min or overflow:
+            worst = _worst_severity(notices)
+            title = f"{len(notices) + overflow} alerts"
+            lines = [f"[{n.severity.upper()}] {n.title}" for n in notices[:20]]
+            more = len(notices) + overflow - len(lines)
+            if more > 0:
+                lines.append(f"… and {more} more")
+            entries = [(title, "\n".join(lines), _notif_type(worst), "/alerts")]
+            with self._lock:
+                self._counters["digests"] += 1
+        else:
+            entries = [(n.title, n.message, _notif_type(n.severity), n.action_url) for n in notices]
+        rows = [
+            {"user_id": uid, "title": title[:255], "message": message, "type": ntype,
+             "action_url": url, "read": False, "created_at": now}
+            for title, message, ntype, url in entries
+            for uid in admin_ids
+        ]
+        try:
+            db.execute(Notification.__table__.insert(), rows)
+            db.commit()
+            with self._lock:
+                self._counters["notifications_inserted"] += len(rows)
+        except Exception as exc:
+            db.rollback()
+            with self._lock:
+                self._counters["errors"] += 1
+            logger.error(f"Failed to insert {len(rows)} alert notification(s): {exc}")
+
+
+def _worst_severity(notices: List[AlertNotice]) -> str:
+    order = {"critical": 3, "warning": 2, "info": 1}
+    return max((n.severity for n in notices), key=lambda s: order.get(s, 0), default="info")
+
+
+def _slack_digest(notices: List[AlertNotice], overflow: int):
+    fired = [n for n in notices if n.event_type == "alert.fired"]
+    resolved = [n for n in notices if n.event_type == "alert.resolved"]
+    emoji = {"critical": ":red_circle:", "warning": ":warning:"}.get(_worst_severity(fired), ":bell:")
+    parts = []
+    if fired:
+        parts.append(f"{len(fired)} fired")
+    if resolved:
+        parts.append(f"{len(resolved)} resolved")
+    if overflow:
+        parts.append(f"{overflow} dropped (queue full)")
+    header = f"{emoji} *Alert digest:* " + ", ".join(parts)
+    lines = []
+    for n in notices[:25]:
+        mark = ":white_check_mark:" if n.event_type == "alert.resolved" else f"[{n.severity.upper()}]"
+        lines.append(f"• {mark} {n.title}")
+    if len(notices) > 25:
+        lines.append(f"… and {len(notices) - 25} more")
+    blocks = [
+        {"type": "section", "text": {"type": "mrkdwn", "text": header}},
+        {"type": "section", "text": {"type": "mrkdwn", "text": "\n".join(lines)[:2900]}},
+    ]
+    return header, blocks
+
+
+# Singleton instance
+alert_notifier = AlertNotifier()
@@ -0,0 +1,192 @@
+"""Per-cycle inventory snapshot shared by the alert engine's rule checks.
+
+Every alert evaluation cycle fetches each host's data exactly once — in
+parallel across hosts — and hands the same snapshot to all built-in and
+user rule checks instead of letting each check re-list nodes, storage,
+guests and tasks on its own.
+
+Per host the snapshot costs one ``/cluster/resources`` call plus one task
+list call per online node. The node table and recent login failures are also
+read once per cycle, and ``fingerprints()`` reduces everything to one value per
+(resource type, metric, host) so the engine can tell which inputs changed.
+"""
+from __future__ import annotations
+
+import json
+import logging
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Any, Dict, Hashable, List, Optional, Set, Tuple
+
+from app.services.inventory import HostInventory, fetch_host_inventory
+
+logger = logging.getLogger(__name__)
+
+# Enough history to cover the 24 h backup-failure window on busy nodes.
+_TASK_LIMIT = 200
+# Window of the failed-login rules.
+LOGIN_WINDOW = timedelta(minutes=10)
+
+
+@dataclass
+class HostSnapshot:
+    host_id: int
+    host_name: str
+    inventory: Optional[HostInventory] = None
+    tasks: Dict[str, List[Dict[str, Any]]] = field(default_factory=dict)  # node_name → recent tasks
+    error: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.inventory is not None
+
+    def node_names(self) -> List[str]:
+        return list(self.inventory.nodes) if self.inventory else []
+
+    def storage_on(self, node_name: str, content: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Storage resources on a node, optionally restricted to a content type."""
+        if not self.inventory:
+            return []
+        stores = self.inventory.storage_on(node_name)
+        if content:
+            stores = [s for s in stores if content in (s.get("content") or "").split(",")]
+        return stores
+
+    def qemu_on(self, node_name: str) -> List[Dict[str, Any]]:
+        return self.inventory.guests_on(node_name, "qemu") if self.inventory else []
+
+
+@dataclass
+class CycleSnapshot:
+    """All data the alert checks need for one evaluation cycle."""
+    hosts: List[HostSnapshot] = field(default_factory=list)
+    muted_vmids: Dict[int, Set[str]] = field(default_factory=dict)  # host_id → muted VMIDs
+    nodes: List[Any] = field(default_factory=list)                  # ProxmoxNode rows, by id
+    active_host_ids: Set[int] = field(default_factory=set)
+    login_failures: Dict[str, int] = field(default_factory=dict)    # ip → failures in LOGIN_WINDOW
+
+    def for_host(self, host_id: int) -> Optional[HostSnapshot]:
+        for h in self.hosts:
+            if h.host_id == host_id:
+                return h
+        return None
+
+    @property
+    def api_calls(self) -> int:
+        return sum((1 + len(h.tasks)) for h in self.hosts if h.ok)
+
+    @classmethod
+    def build(cls, db, max_workers: int = 8) -> "CycleSnapshot":
+        """Fetch every active host's data in parallel and load the VM mute list once."""
+        from concurrent.futures import ThreadPoolExecutor
+        from app.models.database import ProxmoxHost
+
+        from app.models.database import ProxmoxNode
+
+        snap = cls(muted_vmids=_load_vm_mutes(db), login_failures=_load_login_failures(db))
+        snap.nodes = db.query(ProxmoxNode).order_by(ProxmoxNode.id).all()
+        hosts = db.query(ProxmoxHost).filter(ProxmoxHost.is_active == True).all()  # noqa: E712
+        snap.active_host_ids = {h.id for h in hosts}
+        if not hosts:
+            return snap
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(hosts))) as pool:
+            snap.hosts = list(pool.map(_fetch_host, hosts))
+        return snap
+
+    def fingerprints(self) -> Dict[Tuple[str, str, Optional[int]], Hashable]:
+        """One comparable value per (resource type, metric, host) the rules watch.
+
+        Usage figures are bucketed to whole percent so byte-level churn does
+        not count as a change.
+        """
+        fps: Dict[Tuple[str, str, Optional[int]], Hashable] = {}
+        for hs in self.hosts:
+            if not hs.ok:
+                continue
+            h = hs.host_id
+            stores = []
+            for node_name in hs.node_names():
+                for store in hs.storage_on(node_name, content="images"):
+                    total = store.get("maxdisk") or 0
+                    pct = int(store.get("disk", 0) * 100 / total) if total else None
+                    stores.append((node_name, store.get("storage"), pct))
+            fps[("storage", "usage", h)] = tuple(sorted(stores, key=repr))
+            guests = []
+            for node_name in hs.node_names():
+                for vm in hs.qemu_on(node_name):
+                    guests.append((node_name, str(vm.get("vmid", "")), vm.get("status"), vm.get("template")))
+            fps[("guest", "status", h)] = (tuple(sorted(guests, key=repr)),
+                                           tuple(sorted(self.muted_vmids.get(h, ()))))
+            fps[("task", "recent", h)] = tuple(
+                (node_name, t.get("upid"), t.get("status"), t.get("endtime"))
+                for node_name in sorted(hs.tasks) for t in hs.tasks[node_name]
+            )
+        by_host: Dict[int, List[Any]] = {}
+        for node in self.nodes:
+            by_host.setdefault(node.host_id, []).append(node)
+        for h, nodes in by_host.items():
+            fps[("node", "heartbeat", h)] = (h in self.active_host_ids, tuple(
+                (n.id, n.node_name, n.status, n.last_updated) for n in nodes))
+            fps[("node", "cpu", h)] = tuple((n.id, n.node_name, n.status, n.cpu_usage) for n in nodes)
+            fps[("node", "memory", h)] = tuple(
+                (n.id, n.node_name, n.status,
+                 int(n.memory_used * 100 / n.memory_total) if n.memory_total and n.memory_used else None)
+                for n in nodes
+            )
+        fps[("login", "failures", None)] = tuple(sorted(self.login_failures.items()))
+        return fps
+
+
+def _fetch_host(host) -> HostSnapshot:
+    from app.services.proxmox import ProxmoxService
+
+    hs = HostSnapshot(host_id=host.id, host_name=host.name)
+    try:
+        hs.inventory = fetch_host_inventory(host)
+    except Exception as exc:
+        hs.error = str(exc)
+        logger.debug(f"alert snapshot host {host.id} error: {exc}")
+        return hs
+
+    pve = ProxmoxService(host).proxmox
+    for node_name, fields in hs.inventory.nodes.items():
+        if fields.get("status") != "online":
+            continue
+        try:
+            # source=all includes still-running tasks, which the archive-only
+            # default omits (needed by the long-running task check).
+            hs.tasks[node_name] = pve.nodes(node_name).tasks.get(limit=_TASK_LIMIT, source="all") or []
+        except Exception as exc:
+            logger.debug(f"alert snapshot tasks {host.id}/{node_name} error: {exc}")
+    return hs
+
+
+def _load_vm_mutes(db) -> Dict[int, Set[str]]:
+    """Parse the ``vm_alert_mutes`` setting into host_id → set of VMID strings."""
+    from app.models.database import SystemSettings
+
+    muted: Dict[int, Set[str]] = {}
+    try:
+        row = db.query(SystemSettings).filter(SystemSettings.key == "vm_alert_mutes").first()
+        if row:
+            for m in json.loads(row.value or "[]"):
+                muted.setdefault(m.get("host_id"), set()).add(str(m.get("vmid", "")))
+    except Exception:
+        pass
+    return muted
+
+
+def _load_login_failures(db) -> Dict[str, int]:
+    """Failed logins per source IP within ``LOGIN_WINDOW``."""
+    from sqlalchemy import text
+
+    try:
+        rows = db.execute(text(
+            "SELECT ip_address, COUNT(*) as cnt FROM login_attempts "
+            "WHERE success = 0 AND timestamp >= :cutoff "
+            "GROUP BY ip_address ORDER BY ip_address"
+        ), {"cutoff": datetime.utcnow() - LOGIN_WINDOW}).fetchall()
+        return {row[0]: row[1] for row in rows}
+    except Exception as exc:
+        logger.debug(f"alert snapshot login failures error: {exc}")
+        return {}
@@ -2,18 +2,52 @@
 Analysis engine — runs periodically to generate optimization recommendations.
 Distinct from the alert engine: alerts fire on threshold breaches NOW;
 analysis looks at patterns, trends, and best practices to suggest improvements.
+
+Analysis is incremental. Rules are grouped into scopes (a node, a cluster,
+a host's storage, and three scopes per VM: usage, backup, snapshots). Each
+scope remembers a digest of the inputs its rules read and the
+recommendations they produced; a scope is re-run only when its digest
+changes, or — for the VM rules that make their own API calls — when its
+result is older than ``VM_RECHECK``. Guest and storage data come from the
+inventory poller's ``/cluster/resources`` snapshot rather than per-node
+listings.
+
+Recommendations are written by stable key (rule type + host + VM, node or
+storage): unchanged ones are left alone, changed ones are updated in place
+and only cleared ones are deleted, so IDs, ``created_at`` and snoozes
+survive across cycles. A dismissed recommendation stays dismissed while its
+finding persists and is only re-raised after the finding has cleared.
 """
 import threading
 import time
 import logging
+from dataclasses import dataclass
 from datetime import datetime, timedelta
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Callable, Hashable, Set, Tuple
 
 logger = logging.getLogger(__name__)
 
 # How often to run (seconds)
 ANALYSIS_INTERVAL = 600  # 10 minutes
 INITIAL_DELAY = 60       # wait for app to fully start
+# Re-run the VM backup / snapshot rules (API calls per VM) at least this often
+VM_RECHECK = 3600
+# Refresh the set of VMIDs with a recent PBS backup at most this often
+PBS_REFRESH = 1800
+# Accept an inventory snapshot up to this old before fetching a fresh one
+INVENTORY_MAX_AGE = 300
+
+_REC_FIELDS = (
+    "host_id", "node", "vmid", "vm_name", "resource_label", "category", "severity",
+    "title", "detail", "suggestion", "metric_value", "metric_unit", "threshold",
+)
+
+
+@dataclass
+class _ScopeResult:
+    digest: Hashable
+    at: float
+    recs: List[Dict]
 
 
 class AnalysisEngine:
@@ -22,6 +56,16 @@ class AnalysisEngine:
     def __init__(self):
         self._thread: Optional[threading.Thread] = None
         self._running = False
+        self._run_lock = threading.Lock()
+        # scope key → digest + recommendations of the last evaluation
+        self._scopes: Dict[Tuple, _ScopeResult] = {}
+        self._touched: Set[Tuple] = set()
+        self._cycle: Dict[str, int] = {}
+        # Recommendation keys found last cycle (None until the first cycle)
+        self._present: Optional[Set[Tuple]] = None
+        self._pbs_vmids: Set[int] = set()
+        self._pbs_at = 0.0
+        self._last_run: Dict[str, Any] = {}
 
     # ── Lifecycle ─────────────────────────────────────────────────────────────
 
@@ -46,21 +90,62 @@ class AnalysisEngine:
             time.sleep(ANALYSIS_INTERVAL)
 
     def run_now(self):
-        """Run a full analysis cycle synchronously."""
+        """Run an analysis cycle synchronously, re-evaluating only changed scopes."""
         from app.core.database import SessionLocal
-        db = SessionLocal()
-        try:
-            recs: List[Dict] = []
-            recs.extend(self._check_node_metrics(db))
-            recs.extend(self._check_vms(db))
-            recs.extend(self._check_storage(db))
-            recs.extend(self._check_cluster_balance(db))
-            self._upsert_recommendations(db, recs)
-            logger.info(f"Analysis cycle complete — {len(recs)} recommendations generated")
-        except Exception as exc:
-            logger.exception(f"Analysis run_now error: {exc}")
-        finally:
-            db.close()
+        with self._run_lock:
+            started = time.monotonic()
+            db = SessionLocal()
+            try:
+                self._touched = set()
+                self._cycle = {"evaluated": 0, "reused": 0}
+                recs: List[Dict] = []
+                recs.extend(self._check_node_metrics(db))
+                recs.extend(self._check_hosts(db))
+                recs.extend(self._check_cluster_balance(db))
+                # Scopes not seen this cycle belong to removed nodes / guests / hosts
+                for scope in [k for k in self._scopes if k not in self._touched]:
+                    del self._scopes[scope]
+                writes = self._sync_recommendations(db, recs)
+                self._last_run = {
+                    "at": datetime.utcnow().isoformat(),
+                    "duration_ms": round((time.monotonic() - started) * 1000, 1),
+                    "recommendations": len(recs),
+                    "scopes": len(self._scopes),
+                    "scopes_evaluated": self._cycle["evaluated"],
+                    "scopes_reused": self._cycle["reused"],
+                    **writes,
+                }
+                logger.info(
+                    f"Analysis cycle complete — {len(recs)} recommendations, "
+                    f"{self._cycle['evaluated']}/{len(self._scopes)} scope(s) re-evaluated, "
+                    f"{writes['inserted']} new / {writes['updated']} updated / {writes['deleted']} cleared"
+                )
+            except Exception as exc:
+                logger.exception(f"Analysis run_now error: {exc}")
+            finally:
+                db.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": self._running,
+            "scopes": len(self._scopes),
+            "pbs_backed_up_vmids": len(self._pbs_vmids),
+            "last_run": dict(self._last_run),
+        }
+
+    def _cached(self, scope: Tuple, digest: Hashable, fn: Callable[[], List[Dict]],
+                max_age: Optional[float] = None) -> List[Dict]:
+        """Return *scope*'s recommendations, re-running *fn* only if its inputs changed."""
+        self._touched.add(scope)
+        prev = self._scopes.get(scope)
+        if prev is not None and prev.digest == digest and (
+                max_age is None or time.monotonic() - prev.at < max_age):
+            self._cycle["reused"] += 1
+            return prev.recs
+        recs = fn()
+        self._scopes[scope] = _ScopeResult(digest, time.monotonic(), recs)
+        self._cycle["evaluated"] += 1
+        return recs
 
     # ── Node checks (uses DB snapshot — no live API call needed) ──────────────
 
@@ -68,134 +153,187 @@ class AnalysisEngine:
         recs = []
         try:
             from app.models.database import ProxmoxNode, ProxmoxHost
+            host_names = dict(db.query(ProxmoxHost.id, ProxmoxHost.name).all())
             nodes = db.query(ProxmoxNode).all()
             for node in nodes:
-                host = db.query(ProxmoxHost).filter(ProxmoxHost.id == node.host_id).first()
-                host_name = host.name if host else f"host:{node.host_id}"
-
+                host_name = host_names.get(node.host_id) or f"host:{node.host_id}"
                 # Skip stale nodes (not updated in >15 min)
-                if node.last_updated and (datetime.utcnow() - node.last_updated) > timedelta(minutes=15):
-                    continue
-
-                node_name = node.node_name
+                stale = bool(node.last_updated and (datetime.utcnow() - node.last_updated) > timedelta(minutes=15))
                 cpu_pct = node.cpu_usage or 0
                 mem_pct = round(node.memory_used / node.memory_total * 100, 1) if node.memory_total else 0
-
-                # High load (softer than alert threshold)
-                if cpu_pct >= 75:
-                    severity = "critical" if cpu_pct >= 90 else "warning"
-                    recs.append({
-                        "rule_type": "node_high_cpu",
-                        "category": "performance",
-                        "severity": severity,
-                        "host_id": node.host_id,
-                        "node": node_name,
-                        "title": f"Node {node_name} CPU at {cpu_pct}%",
-                        "detail": f"Node {node_name} on {host_name} is running at {cpu_pct}% CPU utilization.",
-                        "suggestion": "Consider migrating some VMs to less-loaded nodes, or reviewing which VMs are consuming the most CPU.",
-                        "metric_value": float(cpu_pct),
-                        "metric_unit": "%",
-                        "threshold": 75.0,
-                    })
-
-                if mem_pct >= 80:
-                    severity = "critical" if mem_pct >= 93 else "warning"
-                    recs.append({
-                        "rule_type": "node_high_memory",
-                        "category": "performance",
-                        "severity": severity,
-                        "host_id": node.host_id,
-                        "node": node_name,
-                        "title": f"Node {node_name} memory at {mem_pct}%",
-                        "detail": f"Node {node_name} on {host_name} has {mem_pct}% of RAM in use ({_fmt_bytes(node.memory_used)} / {_fmt_bytes(node.memory_total)}).",
-                        "suggestion": "Migrate memory-heavy VMs to other nodes, reduce VM RAM allocations, or add physical RAM to the host.",
-                        "metric_value": float(mem_pct),
-                        "metric_unit": "%",
-                        "threshold": 80.0,
-                    })
-
-                # Low utilization — consolidation opportunity
-                if cpu_pct < 5 and mem_pct < 20:
-                    recs.append({
-                        "rule_type": "node_underutilized",
-                        "category": "performance",
-                        "severity": "info",
-                        "host_id": node.host_id,
-                        "node": node_name,
-                        "title": f"Node {node_name} is underutilized",
-                        "detail": f"Node {node_name} is only using {cpu_pct}% CPU and {mem_pct}% RAM.",
-                        "suggestion": "Consider consolidating VMs from this node onto others and powering it down to save energy.",
-                        "metric_value": float(cpu_pct),
-                        "metric_unit": "%",
-                        "threshold": 5.0,
-                    })
+                digest = (node.node_name, host_name, stale, cpu_pct, mem_pct)
+                recs.extend(self._cached(
+                    ("node", node.id), digest,
+                    lambda node=node, host_name=host_name, stale=stale, cpu_pct=cpu_pct, mem_pct=mem_pct:
+                        [] if stale else self._node_recs(node, host_name, cpu_pct, mem_pct),
+                ))
         except Exception as exc:
             logger.error(f"_check_node_metrics error: {exc}")
         return recs
 
-    # ── VM checks (calls live Proxmox API) ────────────────────────────────────
+    def _node_recs(self, node, host_name: str, cpu_pct, mem_pct) -> List[Dict]:
+        recs = []
+        node_name = node.node_name
+
+        # High load (softer than alert threshold)
+        if cpu_pct >= 75:
+            severity = "critical" if cpu_pct >= 90 else "warning"
+            recs.append({
+                "rule_type": "node_high_cpu",
+                "category": "performance",
+                "severity": severity,
+                "host_id": node.host_id,
+                "node": node_name,
+                "title": f"Node {node_name} CPU at {cpu_pct}%",
+                "detail": f"Node {node_name} on {host_name} is running at {cpu_pct}% CPU utilization.",
+                "suggestion": "Consider migrating some VMs to less-loaded nodes, or reviewing which VMs are consuming the most CPU.",
+                "metric_value": float(cpu_pct),
+                "metric_unit": "%",
+                "threshold": 75.0,
+            })
 
-    def _check_vms(self, db) -> List[Dict]:
+        if mem_pct >= 80:
+            severity = "critical" if mem_pct >= 93 else "warning"
+            recs.append({
+                "rule_type": "node_high_memory",
+                "category": "performance",
+                "severity": severity,
+                "host_id": node.host_id,
+                "node": node_name,
+                "title": f"Node {node_name} memory at {mem_pct}%",
+                "detail": f"Node {node_name} on {host_name} has {mem_pct}% of RAM in use ({_fmt_bytes(node.memory_used)} / {_fmt_bytes(node.memory_total)}).",
+                "suggestion": "Migrate memory-heavy VMs to other nodes, reduce VM RAM allocations, or add physical RAM to the host.",
+                "metric_value": float(mem_pct),
+                "metric_unit": "%",
+                "threshold": 80.0,
+            })
+
+        # Low utilization — consolidation opportunity
+        if cpu_pct < 5 and mem_pct < 20:
+            recs.append({
+                "rule_type": "node_underutilized",
+                "category": "performance",
+                "severity": "info",
+                "host_id": node.host_id,
+                "node": node_name,
+                "title": f"Node {node_name} is underutilized",
+                "detail": f"Node {node_name} is only using {cpu_pct}% CPU and {mem_pct}% RAM.",
+                "suggestion": "Consider consolidating VMs from this node onto others and powering it down to save energy.",
+                "metric_value": float(cpu_pct),
+                "metric_unit": "%",
+                "threshold": 5.0,
+            })
+        return recs
+
+    # ── VM and storage checks (inventory snapshot + live API for backups / snapshots) ──
+
+    def _check_hosts(self, db) -> List[Dict]:
         recs = []
         try:
-            from app.models.database import ProxmoxHost, PBSServer
-            from app.services.proxmox import ProxmoxService
-            from app.services.pbs import PBSService
-
-            # Build a set of VMIDs that have a recent PBS backup (last 7 days)
-            pbs_backed_up_vmids: set = set()
-            cutoff_ts = (datetime.utcnow() - timedelta(days=7)).timestamp()
-            try:
-                pbs_servers = db.query(PBSServer).filter(PBSServer.is_active == True).all()
-                for pbs in pbs_servers:
-                    try:
-                        pbs_svc = PBSService(pbs)
-                        datastores = pbs_svc.get_datastores()
-                        for ds in datastores:
-                            ds_name = ds.get("store") or ds.get("name")
-                            if not ds_name:
-                                continue
-                            try:
-                                groups = pbs_svc.get_groups(ds_name)
-                                for g in groups:
-                                    backup_id = g.get("backup-id") or g.get("id")
-                                    last_backup = g.get("last-backup") or 0
-                                    if backup_id and last_backup > cutoff_ts:
-                                        try:
-                                            pbs_backed_up_vmids.add(int(backup_id))
-                                        except (ValueError, TypeError):
-                                            pass
-                            except Exception:
-                                pass
-                    except Exception:
-                        pass
-            except Exception:
-                pass
+            from app.models.database import ProxmoxHost
+            from app.services.inventory import inventory_poller, fetch_host_inventory
 
+            pbs_vmids = self._pbs_backed_up_vmids(db)
             hosts = db.query(ProxmoxHost).filter(ProxmoxHost.is_active == True).all()
             for host in hosts:
                 try:
-                    service = ProxmoxService(host)
-                    nodes = service.get_nodes()
-                    for node_data in nodes:
-                        node_name = node_data.get("node")
-                        if not node_name:
-                            continue
-                        try:
-                            vms = service.proxmox.nodes(node_name).qemu.get()
-                            for vm in vms:
-                                vm_recs = self._analyze_vm(host, node_name, vm, service, pbs_backed_up_vmids)
-                                recs.extend(vm_recs)
-                        except Exception as e:
-                            logger.debug(f"VM check skip {node_name}: {e}")
+                    inv = inventory_poller.get_snapshot(host.id, max_age=INVENTORY_MAX_AGE)
+                    if inv is None:
+                        inv = fetch_host_inventory(host)
+                        inventory_poller.remember(inv)
                 except Exception as e:
-                    logger.debug(f"VM check skip host {host.name}: {e}")
+                    logger.debug(f"Analysis skip host {host.name}: {e}")
+                    # Keep the host's last results rather than clearing them on a blip
+                    self._touched.update(k for k in self._scopes if k[0] in ("vm", "storage") and k[1] == host.id)
+                    recs.extend(r for k, v in self._scopes.items()
+                                if k[0] in ("vm", "storage") and k[1] == host.id for r in v.recs)
+                    continue
+                recs.extend(self._check_vms(host, inv, pbs_vmids))
+                recs.extend(self._check_storage(host, inv))
         except Exception as exc:
-            logger.error(f"_check_vms error: {exc}")
+            logger.error(f"_check_hosts error: {exc}")
         return recs
 
-    def _analyze_vm(self, host, node_name: str, vm: Dict, service, pbs_backed_up_vmids: set = None) -> List[Dict]:
+    def _pbs_backed_up_vmids(self, db) -> Set[int]:
+        """VMIDs with a PBS backup in the last 7 days, refreshed every ``PBS_REFRESH`` seconds."""
+        if self._pbs_at and time.monotonic() - self._pbs_at < PBS_REFRESH:
+            return self._pbs_vmids
+        from app.models.database import PBSServer
+        from app.services.pbs import PBSService
+
+        pbs_backed_up_vmids: Set[int] = set()
+        cutoff_ts = (datetime.utcnow() - timedelta(days=7)).timestamp()
+        try:
+            pbs_servers = db.query(PBSServer).filter(PBSServer.is_active == True).all()
+            for pbs in pbs_servers:
+                try:
+                    pbs_svc = PBSService(pbs)
+                    datastores = pbs_svc.get_datastores()
+                    for ds in datastores:
+                        ds_name = ds.get("store") or ds.get("name")
+                        if not ds_name:
+                            continue
+                        try:
+                            groups = pbs_svc.get_groups(ds_name)
+                            for g in groups:
+                                backup_id = g.get("backup-id") or g.get("id")
+                                last_backup = g.get("last-backup") or 0
+                                if backup_id and last_backup > cutoff_ts:
+                                    try:
+                                        pbs_backed_up_vmids.add(int(backup_id))
+                                    except (ValueError, TypeError):
+                                        pass
+                        except Exception:
+                            pass
+                except Exception:
+                    pass
+        except Exception:
+            pass
+        self._pbs_vmids = pbs_backed_up_vmids
+        self._pbs_at = time.monotonic()
+        return pbs_backed_up_vmids
+
+    def _check_vms(self, host, inv, pbs_vmids: Set[int]) -> List[Dict]:
+        recs = []
+        service = None
+        for vm in inv.guests:
+            if vm.get("type") != "qemu" or vm.get("vmid") is None:
+                continue
+            node_name = vm.get("node")
+            vmid = vm.get("vmid")
+            vm_name = vm.get("name", f"VM {vmid}")
+            status = vm.get("status", "")
+            template = vm.get("template", 0)
+            cpu_frac = vm.get("cpu") or 0.0
+            mem = vm.get("mem") or 0
+            maxmem = vm.get("maxmem") or 0
+            base = (node_name, vm_name, status, template)
+
+            usage_digest = base + (vm.get("maxcpu"), round(cpu_frac * 100, 1), maxmem,
+                                   round(mem / maxmem * 100) if maxmem else 0)
+            recs.extend(self._cached(("vm", host.id, vmid, "usage"), usage_digest,
+                                     lambda vm=vm: self._vm_usage_recs(host, vm)))
+            if status != "running":
+                continue
+
+            if service is None:
+                from app.services.proxmox import ProxmoxService
+                service = ProxmoxService(host)
+            recs.extend(self._cached(
+                ("vm", host.id, vmid, "backup"), base + (vmid in pbs_vmids,),
+                lambda vm=vm: self._vm_backup_recs(host, vm, service, pbs_vmids),
+                max_age=VM_RECHECK,
+            ))
+            recs.extend(self._cached(
+                ("vm", host.id, vmid, "snapshots"), base,
+                lambda vm=vm: self._vm_snapshot_recs(host, vm, service),
+                max_age=VM_RECHECK,
+            ))
+        return recs
+
+    def _vm_usage_recs(self, host, vm: Dict) -> List[Dict]:
         recs = []
+        node_name = vm.get("node")
         vmid = vm.get("vmid")
         vm_name = vm.get("name", f"VM {vmid}")
         status = vm.get("status", "")
@@ -203,7 +341,6 @@ class AnalysisEngine:
         maxmem = vm.get("maxmem") or 0
         mem = vm.get("mem") or 0
         cpu_frac = vm.get("cpu") or 0.0   # fraction of allocated (0.0 – 1.0+)
-        uptime = vm.get("uptime") or 0
 
         # VM stopped (not a template)
         template = vm.get("template", 0)
@@ -265,11 +402,19 @@ class AnalysisEngine:
                     "metric_unit": "%",
                     "threshold": 15.0,
                 })
+        return recs
+
+    def _vm_backup_recs(self, host, vm: Dict, service, pbs_backed_up_vmids: Set[int]) -> List[Dict]:
+        node_name = vm.get("node")
+        vmid = vm.get("vmid")
+        vm_name = vm.get("name", f"VM {vmid}")
+        if vm.get("template", 0):
+            return []
 
         # No recent backup — check Proxmox task log AND PBS
         try:
             # PBS check first (fast set lookup)
-            recent_backup = bool(pbs_backed_up_vmids and vmid in pbs_backed_up_vmids)
+            recent_backup = vmid in pbs_backed_up_vmids
 
             # Proxmox vzdump task log check (only needed if PBS didn't find a backup)
             if not recent_backup:
@@ -287,8 +432,8 @@ class AnalysisEngine:
                 except Exception:
                     pass
 
-            if not recent_backup and not template:
-                recs.append({
+            if not recent_backup:
+                return [{
                     "rule_type": "vm_no_backup",
                     "category": "reliability",
                     "severity": "warning",
@@ -302,9 +447,15 @@ class AnalysisEngine:
                     "metric_value": None,
                     "metric_unit": None,
                     "threshold": None,
-                })
+                }]
         except Exception:
             pass  # task query optional
+        return []
+
+    def _vm_snapshot_recs(self, host, vm: Dict, service) -> List[Dict]:
+        node_name = vm.get("node")
+        vmid = vm.get("vmid")
+        vm_name = vm.get("name", f"VM {vmid}")
 
         # Old snapshots — check if any snapshot is >14 days old
         try:
@@ -318,7 +469,7 @@ class AnalysisEngine:
                 oldest_ts = min(s.get("snaptime", 0) for s in old_snaps)
                 oldest_dt = datetime.utcfromtimestamp(oldest_ts)
                 age_days = (datetime.utcnow() - oldest_dt).days
-                recs.append({
+                return [{
                     "rule_type": "vm_old_snapshot",
                     "category": "storage",
                     "severity": "info",
@@ -333,65 +484,49 @@ class AnalysisEngine:
                     "metric_value": float(age_days),
                     "metric_unit": "days",
                     "threshold": 14.0,
-                })
+                }]
         except Exception:
             pass  # snapshot query optional
+        return []
 
-        return recs
-
-    # ── Storage checks ────────────────────────────────────────────────────────
+    def _check_storage(self, host, inv) -> List[Dict]:
+        storages = sorted(inv.storage, key=lambda st: (st.get("node") or "", st.get("storage") or ""))
+        digest = tuple(
+            (st.get("node"), st.get("storage"), st.get("disk") or 0, st.get("maxdisk") or 0)
+            for st in storages
+        )
+        return self._cached(("storage", host.id), digest, lambda: self._storage_recs(host, storages))
 
-    def _check_storage(self, db) -> List[Dict]:
+    def _storage_recs(self, host, storages: List[Dict]) -> List[Dict]:
         recs = []
-        try:
-            from app.models.database import ProxmoxHost
-            from app.services.proxmox import ProxmoxService
-
-            hosts = db.query(ProxmoxHost).filter(ProxmoxHost.is_active == True).all()
-            for host in hosts:
-                try:
-                    service = ProxmoxService(host)
-                    nodes = service.get_nodes()
-                    seen_storage = set()  # avoid duplicating shared storage
-                    for node_data in nodes:
-                        node_name = node_data.get("node")
-                        if not node_name:
-                            continue
-                        try:
-                            storages = service.get_storage_list(node_name)
-                            for st in storages:
-                                storage_name = st.get("storage", "")
-                                key = f"{host.id}:{storage_name}"
-                                if key in seen_storage:
-                                    continue
-                                total = st.get("total") or 0
-                                used = st.get("used") or 0
-                                if total == 0:
-                                    continue
-                                used_pct = used / total * 100
-                                if used_pct >= 75:
-                                    seen_storage.add(key)
-                                    severity = "critical" if used_pct >= 90 else ("warning" if used_pct >= 85 else "info")
-                                    recs.append({
-                                        "rule_type": "storage_high_usage",
-                                        "category": "storage",
-                                        "severity": severity,
-                                        "host_id": host.id,
-                                        "node": node_name,
-                                        "resource_label": storage_name,
-                                        "title": f"Storage '{storage_name}' is {used_pct:.0f}% full",
-                                        "detail": f"Storage pool '{storage_name}' on {host.name}/{node_name} has {_fmt_bytes(used)} used of {_fmt_bytes(total)} total.",
-                                        "suggestion": "Delete unused VMs, old snapshots, or ISO images. Consider expanding the storage pool.",
-                                        "metric_value": round(used_pct, 1),
-                                        "metric_unit": "%",
-                                        "threshold": 75.0,
-                                    })
-                        except Exception as e:
-                            logger.debug(f"Storage check skip {node_name}: {e}")
-                except Exception as e:
-                    logger.debug(f"Storage check skip host {host.name}: {e}")
-        except Exception as exc:
-            logger.error(f"_check_storage error: {exc}")
+        seen_storage = set()  # avoid duplicating shared storage
+        for st in storages:
+            node_name = st.get("node")
+            storage_name = st.get("storage", "")
+            if not node_name or storage_name in seen_storage:
+                continue
+            total = st.get("maxdisk") or 0
+            used = st.get("disk") or 0
+            if total == 0:
+                continue
+            used_pct = used / total * 100
+            if used_pct >= 75:
+                seen_storage.add(storage_name)
+                severity = "critical" if used_pct >= 90 else ("warning" if used_pct >= 85 else "info")
+                recs.append({
+                    "rule_type": "storage_high_usage",
+                    "category": "storage",
+                    "severity": severity,
+                    "host_id": host.id,
+                    "node": node_name,
+                    "resource_label": storage_name,
+                    "title": f"Storage '{storage_name}' is {used_pct:.0f}% full",
+                    "detail": f"Storage pool '{storage_name}' on {host.name}/{node_name} has {_fmt_bytes(used)} used of {_fmt_bytes(total)} total.",
+                    "suggestion": "Delete unused VMs, old snapshots, or ISO images. Consider expanding the storage pool.",
+                    "metric_value": round(used_pct, 1),
+                    "metric_unit": "%",
+                    "threshold": 75.0,
+                })
         return recs
 
     # ── Cluster balance check ─────────────────────────────────────────────────
@@ -400,91 +535,142 @@ class AnalysisEngine:
         recs = []
         try:
             from app.models.database import ProxmoxNode, ProxmoxHost
-            from sqlalchemy import func
-
-            # Group nodes by host and check imbalance within each cluster
-            hosts_ids = db.query(ProxmoxNode.host_id).distinct().all()
-            for (host_id,) in hosts_ids:
-                nodes = db.query(ProxmoxNode).filter(
-                    ProxmoxNode.host_id == host_id,
-                    ProxmoxNode.status == "online",
-                ).all()
-                if len(nodes) < 2:
-                    continue
 
-                cpu_vals = [n.cpu_usage or 0 for n in nodes]
-                max_cpu = max(cpu_vals)
-                min_cpu = min(cpu_vals)
-
-                # Significant imbalance: highest node is 3x more loaded than lowest
-                # and the highest is actually doing meaningful work (>30%)
-                if max_cpu >= 30 and max_cpu >= min_cpu * 3:
-                    host = db.query(ProxmoxHost).filter(ProxmoxHost.id == host_id).first()
-                    host_name = host.name if host else f"host:{host_id}"
-                    most_loaded = nodes[cpu_vals.index(max_cpu)]
-                    least_loaded = nodes[cpu_vals.index(min_cpu)]
-                    recs.append({
-                        "rule_type": "cluster_imbalanced",
-                        "category": "performance",
-                        "severity": "info",
-                        "host_id": host_id,
-                        "node": most_loaded.node_name,
-                        "title": f"Cluster {host_name} has uneven load distribution",
-                        "detail": (
-                            f"Node {most_loaded.node_name} is at {max_cpu}% CPU while "
-                            f"{least_loaded.node_name} is at {min_cpu}% CPU."
-                        ),
-                        "suggestion": f"Migrate some VMs from {most_loaded.node_name} to {least_loaded.node_name} to balance the load.",
-                        "metric_value": float(max_cpu),
-                        "metric_unit": "%",
-                        "threshold": None,
-                    })
+            host_names = dict(db.query(ProxmoxHost.id, ProxmoxHost.name).all())
+            by_host: Dict[int, List] = {}
+            for node in (db.query(ProxmoxNode)
+                         .filter(ProxmoxNode.status == "online")
+                         .order_by(ProxmoxNode.id).all()):
+                by_host.setdefault(node.host_id, []).append(node)
+            for host_id, nodes in by_host.items():
+                host_name = host_names.get(host_id) or f"host:{host_id}"
+                digest = (host_name,) + tuple((n.node_name, n.cpu_usage or 0) for n in nodes)
+                recs.extend(self._cached(("cluster", host_id), digest,
+                                         lambda host_id=host_id, host_name=host_name, nodes=nodes:
+                                             self._cluster_recs(host_id, host_name, nodes)))
         except Exception as exc:
             logger.error(f"_check_cluster_balance error: {exc}")
         return recs
 
-    # ── DB upsert ─────────────────────────────────────────────────────────────
-
-    def _upsert_recommendations(self, db, recs: List[Dict]):
+    def _cluster_recs(self, host_id: int, host_name: str, nodes: List) -> List[Dict]:
+        if len(nodes) < 2:
+            return []
+
+        cpu_vals = [n.cpu_usage or 0 for n in nodes]
+        max_cpu = max(cpu_vals)
+        min_cpu = min(cpu_vals)
+
+        # Significant imbalance: highest node is 3x more loaded than lowest
+        # and the highest is actually doing meaningful work (>30%)
+        if not (max_cpu >= 30 and max_cpu >= min_cpu * 3):
+            return []
+        most_loaded = nodes[cpu_vals.index(max_cpu)]
+        least_loaded = nodes[cpu_vals.index(min_cpu)]
+        return [{
+            "rule_type": "cluster_imbalanced",
+            "category": "performance",
+            "severity": "info",
+            "host_id": host_id,
+            "node": most_loaded.node_name,
+            "title": f"Cluster {host_name} has uneven load distribution",
+            "detail": (
+                f"Node {most_loaded.node_name} is at {max_cpu}% CPU while "
+                f"{least_loaded.node_name} is at {min_cpu}% CPU."
+            ),
+            "suggestion": f"Migrate some VMs from {most_loaded.node_name} to {least_loaded.node_name} to balance the load.",
+            "metric_value": float(max_cpu),
+            "metric_unit": "%",
+            "threshold": None,
+        }]
+
+    # ── DB sync ───────────────────────────────────────────────────────────────
+
+    def _sync_recommendations(self, db, recs: List[Dict]) -> Dict[str, int]:
         """
-        Replace non-dismissed recommendations with fresh results.
-        Dismissed recommendations are preserved.
+        Write *recs* as a diff against the stored recommendations, keyed by
+        ``_rec_key``: changed rows are updated in place, new findings inserted
+        and cleared ones deleted. A dismissed recommendation suppresses its key
+        until the finding clears for a cycle.
         """
+        counts = {"inserted": 0, "updated": 0, "deleted": 0}
         try:
             from app.models.analysis_models import Recommendation
 
-            # Delete all non-dismissed recommendations (will be re-generated)
-            db.query(Recommendation).filter(Recommendation.dismissed == False).delete()
-
+            wanted: Dict[Tuple, Dict] = {}
             for r in recs:
-                rec = Recommendation(
-                    host_id=r.get("host_id"),
-                    node=r.get("node"),
-                    vmid=r.get("vmid"),
-                    vm_name=r.get("vm_name"),
-                    resource_label=r.get("resource_label"),
-                    category=r["category"],
+                wanted.setdefault(_rec_key(r), r)
+
+            dismissed = {
+                _rec_key({"rule_type": rt, "host_id": h, "node": n, "vmid": v, "resource_label": lbl})
+                for rt, h, n, v, lbl in db.query(
+                    Recommendation.rule_type, Recommendation.host_id, Recommendation.node,
+                    Recommendation.vmid, Recommendation.resource_label,
+                ).filter(Recommendation.dismissed == True).all()
+            }
+
+            active: Dict[Tuple, Any] = {}
+            stale_ids: List[int] = []
+            for row in db.query(Recommendation).filter(Recommendation.dismissed == False).order_by(Recommendation.id).all():
+                key = _rec_key({c: getattr(row, c) for c in ("rule_type", "host_id", "node", "vmid", "resource_label")})
+                if key in active or key not in wanted:
+                    stale_ids.append(row.id)
+                else:
+                    active[key] = row
+
+            now = datetime.utcnow()
+            for key, r in wanted.items():
+                row = active.get(key)
+                if row is not None:
+                    changed = False
+                    for field in _REC_FIELDS:
+                        value = r.get(field)
+                        if getattr(row, field) != value:
+                            setattr(row, field, value)
+                            changed = True
+                    counts["updated"] += changed
+                    continue
+                # Stay dismissed while the finding persists; after a restart there is
+                # no history, so assume it did
+                if key in dismissed and (self._present is None or key in self._present):
+                    continue
+                db.add(Recommendation(
+                    **{field: r.get(field) for field in _REC_FIELDS},
                     rule_type=r["rule_type"],
-                    severity=r["severity"],
-                    title=r["title"],
-                    detail=r.get("detail"),
-                    suggestion=r.get("suggestion"),
-                    metric_value=r.get("metric_value"),
-                    metric_unit=r.get("metric_unit"),
-                    threshold=r.get("threshold"),
                     dismissed=False,
-                    created_at=datetime.utcnow(),
-                )
-                db.add(rec)
-
-            db.commit()
+                    created_at=now,
+                ))
+                counts["inserted"] += 1
+
+            for i in range(0, len(stale_ids), 500):
+                db.query(Recommendation).filter(
+                    Recommendation.id.in_(stale_ids[i:i + 500])
+                ).delete(synchronize_session=False)
+            counts["deleted"] = len(stale_ids)
+
+            if any(counts.values()):
+                db.commit()
+            self._present = set(wanted)
         except Exception as exc:
             db.rollback()
-            logger.error(f"_upsert_recommendations error: {exc}")
+            logger.error(f"_sync_recommendations error: {exc}")
+        return counts
 
 
 # ── Helpers ───────────────────────────────────────────────────────────────────
 
+def _rec_key(r: Dict) -> Tuple:
+    """Stable identity of a recommendation across cycles."""
+    rule_type, host_id = r["rule_type"], r.get("host_id")
+    if r.get("vmid") is not None:
+        return (rule_type, host_id, "vm", r["vmid"])
+    if rule_type == "storage_high_usage":
+        return (rule_type, host_id, "storage", r.get("resource_label"))
+    if rule_type == "cluster_imbalanced":
+        # The most-loaded node moves around; one imbalance finding per cluster
+        return (rule_type, host_id, "cluster", None)
+    return (rule_type, host_id, "node", r.get("node"))
+
+
 def _fmt_bytes(b: int) -> str:
     if not b:
         return "0 B"
@@ -0,0 +1,291 @@
+"""Bulk executor — run one action against many guests as a background job.
+
+``submit`` returns a job handle at once. Work items are grouped by
+(host, node) and each group is split into a few lanes that run on a shared
+thread pool, so:
+
+- at most ``max_workers`` Proxmox calls are in flight across all bulk jobs,
+  and at most ``per_node`` against any one node — lanes split a job's work,
+  and a per-node semaphore shared by every job caps concurrent jobs too
+- each host's API client is resolved once per job rather than once per guest
+- the Proxmox response cache is cleared once per host when the job finishes
+  instead of after every guest
+
+Per-guest results are appended as they complete; ``get(job_id, since=n)``
+returns only the results past cursor *n*, so a client can stream them by
+polling. When the last lane finishes, the job's ``result`` holds the same
+response body the endpoint used to return synchronously. Jobs are kept in
+memory for a day after they finish.
+"""
+from __future__ import annotations
+
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# work(pve, item) → one result dict, or a list of them (e.g. one per snapshot)
+WorkFn = Callable[[Any, Dict[str, Any]], Any]
+SummarizeFn = Callable[[List[Dict[str, Any]]], Dict[str, Any]]
+
+
+@dataclass
+class BulkJob:
+    id: str
+    kind: str
+    user_id: Optional[int]
+    total: int
+    host_ids: List[int]
+    status: str = "running"    # running | completed | cancelled | failed
+    done: int = 0
+    errors: int = 0
+    results: List[Dict[str, Any]] = field(default_factory=list)   # completion order
+    order: List[int] = field(default_factory=list)                # item index per result
+    result: Optional[Dict[str, Any]] = None
+    lanes_left: int = 0
+    created_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+    cancel_requested: bool = False
+
+    def to_dict(self, since: int = 0) -> Dict[str, Any]:
+        since = max(0, min(since, len(self.results)))
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "total": self.total,
+            "done": self.done,
+            "errors": self.errors,
+            "progress": round(self.done * 100.0 / self.total, 1) if self.total else 100.0,
+            "created_at": datetime.utcfromtimestamp(self.created_at).isoformat(),
+            "finished_at": datetime.utcfromtimestamp(self.finished_at).isoformat() if self.finished_at else None,
+            "since": since,
+            "next": len(self.results),
+            "results": self.results[since:],
+            "result": self.result,
+        }
+
+
+class BulkExecutor:
+    """Shared, bounded thread pool for bulk guest operations."""
+
+    _KEEP_FINISHED = 86400.0
+
+    def __init__(self, max_workers: int = 16, per_node: int = 4):
+        self._max_workers = max_workers
+        self._per_node = per_node
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._jobs: Dict[str, BulkJob] = {}
+        self._lock = threading.Lock()
+        # (host_id, node) → slots shared by every job's lanes
+        self._node_slots: Dict[Tuple[int, str], threading.BoundedSemaphore] = {}
+        self._submitted = 0
+        self._items = 0
+
+    # ── public API ───────────────────────────────────────────────────────────
+
+    def submit(
+        self,
+        kind: str,
+        items: List[Dict[str, Any]],
+        work: WorkFn,
+        hosts: Dict[int, Any],
+        user_id: Optional[int] = None,
+        per_node: Optional[int] = None,
+        sequential: bool = False,
+        summarize: Optional[SummarizeFn] = None,
+    ) -> Dict[str, Any]:
+        """Queue *work* for every item and return the job handle.
+
+        Each item needs ``host_id`` and ``node``; *hosts* maps host id to an
+        active ProxmoxHost (items whose host is missing fail individually).
+        ``sequential`` runs everything in one lane, in order, for operations
+        such as rolling restarts that must not overlap. *per_node* can only
+        lower the executor-wide per-node limit.
+        """
+        self._prune()
+        lanes = self._lanes(items, 1 if sequential else (per_node or self._per_node), sequential)
+        job = BulkJob(
+            id=uuid.uuid4().hex,
+            kind=kind,
+            user_id=user_id,
+            total=len(items),
+            host_ids=sorted({int(i["host_id"]) for i in items}),
+            lanes_left=len(lanes),
+        )
+        with self._lock:
+            self._jobs[job.id] = job
+            self._submitted += 1
+            self._items += len(items)
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self._max_workers, thread_name_prefix="bulk")
+            pool = self._pool
+
+        if not lanes:
+            self._finish(job, summarize)
+        clients: Dict[int, Any] = {}
+        for lane in lanes:
+            pool.submit(self._run_lane, job, lane, work, hosts, clients, summarize)
+        logger.info("Bulk %s job %s: %d item(s) in %d lane(s)", kind, job.id, len(items), len(lanes))
+        return job.to_dict()
+
+    def get(self, job_id: str, since: int = 0) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return job.to_dict(since) if job else None
+
+    def owner(self, job_id: str) -> Optional[int]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return job.user_id if job else None
+
+    def list(self, user_id: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Job summaries, newest first (results omitted)."""
+        self._prune()
+        with self._lock:
+            jobs = [j for j in self._jobs.values() if user_id is None or j.user_id == user_id]
+            out = []
+            for job in sorted(jobs, key=lambda j: j.created_at, reverse=True):
+                d = job.to_dict(len(job.results))
+                d.pop("result")
+                out.append(d)
+            return out
+
+    def cancel(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Stop dispatching new items; calls already sent to Proxmox still finish."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if not job:
+                return None
+            if job.status == "running":
+                job.cancel_requested = True
+            return job.to_dict(len(job.results))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            running = [j for j in self._jobs.values() if j.status == "running"]
+            return {
+                "max_workers": self._max_workers,
+                "per_node": self._per_node,
+                "jobs_submitted": self._submitted,
+                "items_submitted": self._items,
+                "jobs_running": len(running),
+                "items_pending": sum(j.total - j.done for j in running),
+                "jobs_retained": len(self._jobs),
+            }
+
+    def stop(self) -> None:
+        with self._lock:
+            for job in self._jobs.values():
+                if job.status == "running":
+                    job.cancel_requested = True
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    # ── internals ────────────────────────────────────────────────────────────
+
+    @staticmethod
+    def _lanes(items: List[Dict[str, Any]], per_node: int, sequential: bool) -> List[List[Tuple[int, Dict[str, Any]]]]:
+        indexed = list(enumerate(items))
+        if sequential:
+            return [indexed] if indexed else []
+        groups: Dict[Tuple[int, str], List[Tuple[int, Dict[str, Any]]]] = {}
+        for idx, item in indexed:
+            groups.setdefault((int(item["host_id"]), item.get("node") or ""), []).append((idx, item))
+        lanes = []
+        for members in groups.values():
+            n = max(1, min(per_node, len(members)))
+            lanes.extend(members[i::n] for i in range(n))
+        return lanes
+
+    def _client(self, clients: Dict[int, Any], hosts: Dict[int, Any], host_id: int):
+        pve = clients.get(host_id)
+        if pve is None:
+            from app.services.proxmox import ProxmoxService
+
+            host = hosts.get(host_id)
+            if host is None:
+                raise LookupError(f"Proxmox host {host_id} not found")
+            pve = clients[host_id] = ProxmoxService(host).proxmox
+        return pve
+
+    def _slots(self, host_id: int, node: str) -> threading.BoundedSemaphore:
+        with self._lock:
+            sem = self._node_slots.get((host_id, node))
+            if sem is None:
+                sem = self._node_slots[(host_id, node)] = threading.BoundedSemaphore(self._per_node)
+            return sem
+
+    def _run_lane(self, job: BulkJob, lane, work: WorkFn, hosts, clients, summarize) -> None:
+        try:
+            for idx, item in lane:
+                if job.cancel_requested:
+                    out: Any = {**_base(item), "error": "Cancelled"}
+                else:
+                    with self._slots(int(item["host_id"]), item.get("node") or ""):
+                        try:
+                            out = work(self._client(clients, hosts, int(item["host_id"])), item)
+                        except Exception as e:
+                            out = {**_base(item), "error": getattr(e, "detail", None) or str(e)}
+                self._record(job, idx, out)
+        except Exception:
+            logger.exception("Bulk %s job %s: lane crashed", job.kind, job.id)
+        finally:
+            with self._lock:
+                job.lanes_left -= 1
+                last = job.lanes_left == 0
+            if last:
+                self._finish(job, summarize)
+
+    def _record(self, job: BulkJob, idx: int, out: Any) -> None:
+        entries = out if isinstance(out, list) else [out]
+        with self._lock:
+            for entry in entries:
+                if entry is None:
+                    continue
+                job.results.append(entry)
+                job.order.append(idx)
+                if entry.get("error") or entry.get("errors"):
+                    job.errors += 1
+            job.done += 1
+
+    def _finish(self, job: BulkJob, summarize: Optional[SummarizeFn]) -> None:
+        from app.core.cache import pve_cache
+
+        for host_id in job.host_ids:
+            pve_cache.clear_prefix(f"pve:{host_id}:")
+        with self._lock:
+            ordered = [r for _, r in sorted(zip(job.order, job.results), key=lambda p: p[0])]
+        try:
+            result = summarize(ordered) if summarize else {"results": ordered}
+            status = "cancelled" if job.cancel_requested else "completed"
+        except Exception as e:
+            logger.exception("Bulk %s job %s: summary failed", job.kind, job.id)
+            result, status = {"results": ordered, "error": str(e)}, "failed"
+        with self._lock:
+            job.result = result
+            job.status = status
+            job.finished_at = time.time()
+        logger.info("Bulk %s job %s %s: %d/%d item(s), %d error(s)",
+                    job.kind, job.id, status, job.done, job.total, job.errors)
+
+    def _prune(self) -> None:
+        cutoff = time.time() - self._KEEP_FINISHED
+        with self._lock:
+            for job_id in [j.id for j in self._jobs.values() if j.finished_at and j.finished_at < cutoff]:
+                del self._jobs[job_id]
+
+
+def _base(item: Dict[str, Any]) -> Dict[str, Any]:
+    return {"host_id": item.get("host_id"), "node": item.get("node"), "vmid": item.get("vmid")}
+
+
+# Singleton instance
+bulk_executor = BulkExecutor()
@@ -0,0 +1,321 @@
+"""Outbound notification delivery engine (webhooks, Slack, PagerDuty).
+
+All outbound notification HTTP calls run on one background event loop that
+owns a single pooled ``httpx.AsyncClient``, so connections and TLS sessions
+are reused across deliveries no matter which thread or loop queued them.
+
+Per delivery:
+- at most ``per_endpoint_concurrency`` requests are in flight to the same
+  endpoint, so one slow receiver cannot tie up every connection;
+- transport errors, 5xx and 429 responses are retried with exponential
+  backoff plus jitter (a numeric ``Retry-After`` is honoured);
+- an endpoint (or ``breaker_key``, e.g. one PagerDuty routing key) that fails
+  ``breaker_threshold`` deliveries in a row has its circuit opened for
+  ``breaker_cooldown`` seconds, during which deliveries fail fast; after the
+  cooldown a single probe decides whether it closes. Only transport errors
+  and 5xx count as failures — a 4xx means the receiver is up but rejected
+  this request.
+
+Webhook deliveries are logged to ``webhook_deliveries`` in batches rather than
+with one commit per attempt.
+"""
+import asyncio
+import concurrent.futures
+import logging
+import random
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Delivery:
+    url: str
+    body: bytes
+    headers: Dict[str, str]
+    endpoint: str                          # concurrency (and default circuit-breaker) key
+    breaker_key: Optional[str] = None      # circuit-breaker key when it differs from endpoint
+    timeout: float = 10.0
+    ok_statuses: Tuple[int, ...] = ()      # empty → any 2xx
+    webhook_id: Optional[str] = None       # set → logged to webhook_deliveries
+    event: Optional[str] = None
+
+
+@dataclass
+class DeliveryResult:
+    success: bool
+    status_code: Optional[int] = None
+    response_text: str = ""
+    attempts: int = 0
+    error: Optional[str] = None
+
+
+class _CircuitBreaker:
+    def __init__(self, threshold: int, cooldown: float):
+        self._threshold = threshold
+        self._cooldown = cooldown
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at < self._cooldown:
+            return "open"
+        return "half_open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "open" or self._probing:
+            return False
+        self._probing = True   # half-open: let exactly one delivery through
+        return True
+
+    def record(self, success: bool) -> None:
+        self._probing = False
+        if success:
+            self.failures = 0
+            self.opened_at = None
+            return
+        self.failures += 1
+        if self.failures >= self._threshold:
+            self.opened_at = time.monotonic()
+
+
+class DeliveryEngine:
+    """Background event loop + pooled HTTP client for notification deliveries."""
+
+    def __init__(
+        self,
+        per_endpoint_concurrency: int = 4,
+        max_attempts: int = 4,
+        backoff_base: float = 1.0,
+        backoff_max: float = 30.0,
+        breaker_threshold: int = 5,
+        breaker_cooldown: float = 60.0,
+        log_batch_size: int = 100,
+        log_interval: float = 2.0,
+        start_timeout: float = 10.0,
+    ):
+        self._per_endpoint = per_endpoint_concurrency
+        self._max_attempts = max_attempts
+        self._backoff_base = backoff_base
+        self._backoff_max = backoff_max
+        self._breaker_threshold = breaker_threshold
+        self._breaker_cooldown = breaker_cooldown
+        self._log_batch_size = log_batch_size
+        self._log_interval = log_interval
+        self._start_timeout = start_timeout
+
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._ready = threading.Event()
+        self._client: Optional[httpx.AsyncClient] = None
+        self._flusher: Optional[asyncio.Task] = None
+
+        # Only touched from the engine loop
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._breakers: Dict[str, _CircuitBreaker] = {}
+        self._log_buffer: List[Dict[str, Any]] = []
+        self._counters = {
+            "submitted": 0, "delivered": 0, "failed": 0, "retries": 0,
+            "short_circuited": 0, "logged": 0, "log_errors": 0,
+        }
+
+    # ── public API ───────────────────────────────────────────────────────────
+
+    def submit(self, delivery: Delivery) -> "concurrent.futures.Future[DeliveryResult]":
+        """Queue *delivery* from any thread; returns a future with the result."""
+        loop = self._ensure_running()
+        with self._lock:
+            self._counters["submitted"] += 1
+        return asyncio.run_coroutine_threadsafe(self._deliver(delivery), loop)
+
+    async def deliver(self, delivery: Delivery) -> DeliveryResult:
+        """Await a delivery's result from any event loop."""
+        return await asyncio.wrap_future(self.submit(delivery))
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Flush the delivery log, close the HTTP client and stop the loop."""
+        with self._lock:
+            loop, thread = self._loop, self._thread
+            if loop is None or thread is None or not thread.is_alive():
+                return
+            self._loop = None
+        try:
+            asyncio.run_coroutine_threadsafe(self._shutdown(), loop).result(timeout)
+        except Exception as exc:
+            logger.warning(f"Delivery engine shutdown: {exc}")
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(timeout)
+
+    def stats(self) -> Dict[str, Any]:
+        endpoints = {
+            key: {"state": b.state, "consecutive_failures": b.failures}
+            for key, b in list(self._breakers.items())
+        }
+        return {
+            "running": self._loop is not None,
+            **dict(self._counters),
+            "pending_log_rows": len(self._log_buffer),
+            "endpoints": endpoints,
+        }
+
+    # ── loop management ──────────────────────────────────────────────────────
+
+    def _ensure_running(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is not None and self._thread is not None and self._thread.is_alive():
+                return self._loop
+            self._ready.clear()
+            self._thread = threading.Thread(target=self._run, daemon=True, name="delivery-engine")
+            self._thread.start()
+        if not self._ready.wait(self._start_timeout):
+            raise RuntimeError(f"Delivery engine did not start within {self._start_timeout:.0f}s")
+        return self._loop
+
+    def _run(self) -> None:
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        self._client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+            timeout=httpx.Timeout(10.0, connect=5.0),
+        )
+        self._semaphores.clear()
+        self._flusher = loop.create_task(self._log_flusher())
+        self._loop = loop
+        self._ready.set()
+        try:
+            loop.run_forever()
+        finally:
+            loop.close()
+
+    async def _shutdown(self) -> None:
+        if self._flusher is not None:
+            self._flusher.cancel()
+        await self._flush_log()
+        if self._client is not None:
+            await self._client.aclose()
+
+    # ── delivery ─────────────────────────────────────────────────────────────
+
+    def _backoff(self, attempt: int) -> float:
+        delay = min(self._backoff_max, self._backoff_base * (2 ** (attempt - 1)))
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    async def _deliver(self, d: Delivery) -> DeliveryResult:
+        breaker_key = d.breaker_key or d.endpoint
+        breaker = self._breakers.get(breaker_key)
+        if breaker is None:
+            breaker = self._breakers[breaker_key] = _CircuitBreaker(
+                self._breaker_threshold, self._breaker_cooldown,
+            )
+        if not breaker.allow():
+            self._counters["short_circuited"] += 1
+            result = DeliveryResult(success=False, error="circuit open", response_text="circuit open")
+            self._record(d, result)
+            return result
+
+        sem = self._semaphores.get(d.endpoint)
+        if sem is None:
+            sem = self._semaphores[d.endpoint] = asyncio.Semaphore(self._per_endpoint)
+
+        result = DeliveryResult(success=False)
+        while True:
+            result.attempts += 1
+            retry_after = None
+            async with sem:
+                try:
+                    resp = await self._client.post(d.url, content=d.body, headers=d.headers, timeout=d.timeout)
+                    result.status_code = resp.status_code
+                    result.response_text = resp.text[:500]
+                    result.error = None
+                    if d.ok_statuses:
+                        result.success = resp.status_code in d.ok_statuses
+                    else:
+                        result.success = 200 <= resp.status_code < 300
+                    retryable = resp.status_code == 429 or resp.status_code >= 500
+                    retry_after = _retry_after(resp)
+                except httpx.HTTPError as exc:
+                    result.status_code = None
+                    result.response_text = str(exc)[:500] or type(exc).__name__
+                    result.error = result.response_text
+                    retryable = True
+            if result.success or not retryable or result.attempts >= self._max_attempts:
+                break
+            self._counters["retries"] += 1
+            await asyncio.sleep(retry_after if retry_after is not None else self._backoff(result.attempts))
+
+        # 4xx (bad routing key, rejected payload) is not an outage of the receiver
+        breaker.record(result.status_code is not None and result.status_code < 500)
+        self._counters["delivered" if result.success else "failed"] += 1
+        if not result.success:
+            logger.warning(
+                f"Delivery to {d.endpoint} failed after {result.attempts} attempt(s): "
+                f"{result.status_code or ''} {result.response_text[:120]}"
+            )
+        self._record(d, result)
+        return result
+
+    # ── batched delivery log ─────────────────────────────────────────────────
+
+    def _record(self, d: Delivery, result: DeliveryResult) -> None:
+        if d.webhook_id is None:
+            return
+        self._log_buffer.append({
+            "webhook_id": d.webhook_id,
+            "event": d.event or "",
+            "status_code": result.status_code,
+            "success": result.success,
+            "response_body": result.response_text,
+            "created_at": datetime.utcnow(),
+        })
+        if len(self._log_buffer) >= self._log_batch_size:
+            asyncio.get_running_loop().create_task(self._flush_log())
+
+    async def _log_flusher(self) -> None:
+        while True:
+            await asyncio.sleep(self._log_interval)
+            await self._flush_log()
+
+    async def _flush_log(self) -> None:
+        rows, self._log_buffer = self._log_buffer, []
+        if not rows:
+            return
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, _insert_deliveries, rows)
+            self._counters["logged"] += len(rows)
+        except Exception as exc:
+            self._counters["log_errors"] += 1
+            logger.error(f"Failed to record {len(rows)} webhook deliveries: {exc}")
+
+
+def _retry_after(resp: httpx.Response) -> Optional[float]:
+    if resp.status_code not in (429, 503):
+        return None
+    try:
+        return min(float(resp.headers.get("Retry-After", "")), 300.0)
+    except ValueError:
+        return None
+
+
+def _insert_deliveries(rows: List[Dict[str, Any]]) -> None:
+    from app.core.database import engine
+    from app.models.database import WebhookDelivery
+
+    with engine.begin() as conn:
+        conn.execute(WebhookDelivery.__table__.insert(), rows)
+
+
+delivery_engine = DeliveryEngine()
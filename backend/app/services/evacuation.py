@@ -0,0 +1,404 @@
+"""Node evacuation scheduler — drain a node with a bounded number of migrations.
+
+``start`` snapshots the guests on the source node and returns a job at once;
+a worker thread then feeds migrations to Proxmox a few at a time:
+
+- at most ``max_per_source`` migrations leave the source node concurrently and
+  at most ``max_per_target`` land on any one target, so a 50-VM drain doesn't
+  saturate the migration network
+- each running guest goes to the online node with the most free memory after
+  the memory already promised to in-flight migrations is subtracted; a guest
+  waits rather than overcommit a target
+- every UPID is registered with the task tracker, which polls it to
+  completion; failed migrations are retried on another node with backoff
+
+Stopped guests migrate offline and containers use restart mode. Jobs are kept
+in memory for a day after they finish.
+"""
+from __future__ import annotations
+
+import logging
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+_GiB = 1024 ** 3
+_ACTIVE = ("queued", "retry_wait", "migrating")
+
+
+@dataclass
+class EvacuationItem:
+    vmid: int
+    name: str
+    guest_type: str            # qemu / lxc
+    running: bool
+    mem: int                   # bytes reserved on the target while migrating
+    status: str = "queued"     # queued | migrating | retry_wait | done | failed | cancelled
+    target: Optional[str] = None
+    upid: Optional[str] = None
+    attempts: int = 0
+    progress: float = 0.0
+    error: Optional[str] = None
+    not_before: float = 0.0
+    finished_at: Optional[float] = None
+    tried: Set[str] = field(default_factory=set)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "vmid": self.vmid, "name": self.name, "type": self.guest_type,
+            "online": self.running, "status": self.status, "target": self.target,
+            "upid": self.upid, "attempts": self.attempts, "progress": round(self.progress, 1),
+            "error": self.error,
+        }
+
+
+@dataclass
+class EvacuationJob:
+    id: str
+    host_id: int
+    source: str
+    user_id: Optional[int]
+    items: List[EvacuationItem]
+    explicit_target: Optional[str] = None
+    max_per_source: int = 2
+    max_per_target: int = 1
+    max_attempts: int = 3
+    status: str = "running"    # running | completed | partial | failed | cancelled
+    message: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+    cancel_requested: bool = False
+
+    def to_dict(self) -> Dict[str, Any]:
+        counts: Dict[str, int] = {}
+        for item in self.items:
+            counts[item.status] = counts.get(item.status, 0) + 1
+        total = len(self.items)
+        settled = sum(100.0 for i in self.items if i.status not in _ACTIVE)
+        in_flight = sum(i.progress for i in self.items if i.status == "migrating")
+        return {
+            "job_id": self.id,
+            "host_id": self.host_id,
+            "source": self.source,
+            "status": self.status,
+            "message": self.message,
+            "total": total,
+            "counts": counts,
+            "progress": round((settled + in_flight) / total, 1) if total else 100.0,
+            "limits": {"per_source": self.max_per_source, "per_target": self.max_per_target,
+                       "attempts": self.max_attempts},
+            "target": self.explicit_target,
+            "created_at": datetime.utcfromtimestamp(self.created_at).isoformat(),
+            "finished_at": datetime.utcfromtimestamp(self.finished_at).isoformat() if self.finished_at else None,
+            "items": [i.to_dict() for i in self.items],
+        }
+
+
+class EvacuationScheduler:
+    """Runs evacuation jobs, one worker thread per job."""
+
+    _TICK = 3.0
+    _RETRY_BACKOFF = 15.0       # seconds × attempt number
+    _RESERVE_GRACE = 60.0       # node memory stats lag a finished migration by a few polls
+    _KEEP_FINISHED = 86400.0
+
+    def __init__(self, mem_headroom: float = 0.10):
+        self._mem_headroom = mem_headroom
+        self._jobs: Dict[str, EvacuationJob] = {}
+        self._lock = threading.Lock()
+
+    # ── public API ───────────────────────────────────────────────────────────
+
+    def start(
+        self,
+        host,
+        source: str,
+        user_id: Optional[int] = None,
+        target: Optional[str] = None,
+        include_stopped: bool = True,
+        include_containers: bool = True,
+        max_per_source: int = 2,
+        max_per_target: int = 1,
+        max_attempts: int = 3,
+    ) -> Dict[str, Any]:
+        """Plan and start evacuating *source*. Raises ValueError if it can't start."""
+        from app.services.proxmox import ProxmoxService
+
+        self._prune()
+        with self._lock:
+            for job in self._jobs.values():
+                if job.host_id == host.id and job.source == source and job.status == "running":
+                    raise ValueError(f"Node {source} is already being evacuated (job {job.id})")
+
+        pve = ProxmoxService(host).proxmox
+        resources = pve.cluster.resources.get() or []
+        online = {r.get("node") for r in resources
+                  if r.get("type") == "node" and r.get("status") == "online" and r.get("node") != source}
+        if not online:
+            raise ValueError("No online target nodes available for evacuation")
+        if target and target not in online:
+            raise ValueError(f"Target node {target} is not online")
+
+        items = []
+        for r in resources:
+            if r.get("type") not in ("qemu", "lxc") or r.get("node") != source:
+                continue
+            running = r.get("status") == "running"
+            if not running and not include_stopped:
+                continue
+            if r.get("type") == "lxc" and not include_containers:
+                continue
+            items.append(EvacuationItem(
+                vmid=int(r["vmid"]),
+                name=r.get("name") or str(r["vmid"]),
+                guest_type=r.get("type"),
+                running=running,
+                mem=int(r.get("maxmem") or 0) if running else 0,
+            ))
+        # Running guests first, largest first — they are the hardest to place
+        items.sort(key=lambda i: (not i.running, -i.mem, i.vmid))
+
+        job = EvacuationJob(
+            id=uuid.uuid4().hex,
+            host_id=host.id,
+            source=source,
+            user_id=user_id,
+            items=items,
+            explicit_target=target,
+            max_per_source=max_per_source,
+            max_per_target=max_per_target,
+            max_attempts=max_attempts,
+        )
+        with self._lock:
+            self._jobs[job.id] = job
+        if not items:
+            self._finish(job)
+        else:
+            threading.Thread(
+                target=self._run, args=(job, pve), daemon=True, name=f"evacuation-{job.id[:8]}",
+            ).start()
+        logger.info("Evacuation %s of %s started: %d guest(s)", job.id[:8], source, len(items))
+        return self.get(job.id)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return job.to_dict() if job else None
+
+    def list(self, host_id: Optional[int] = None) -> List[Dict[str, Any]]:
+        with self._lock:
+            jobs = [j for j in self._jobs.values() if host_id is None or j.host_id == host_id]
+            return [j.to_dict() for j in sorted(jobs, key=lambda j: j.created_at, reverse=True)]
+
+    def cancel(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Stop launching new migrations; the ones already running finish normally."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            job.cancel_requested = True
+            for item in job.items:
+                if item.status in ("queued", "retry_wait"):
+                    item.status = "cancelled"
+            return job.to_dict()
+
+    # ── worker ───────────────────────────────────────────────────────────────
+
+    def _run(self, job: EvacuationJob, pve) -> None:
+        try:
+            while True:
+                self._poll(job, pve)
+                with self._lock:
+                    active = [i for i in job.items if i.status in _ACTIVE]
+                if not active:
+                    break
+                if not job.cancel_requested:
+                    self._launch(job, pve)
+                time.sleep(self._TICK)
+        except Exception as exc:
+            logger.error("Evacuation %s aborted: %s", job.id[:8], exc)
+            with self._lock:
+                job.message = f"Scheduler error: {exc}"
+                for item in job.items:
+                    if item.status in ("queued", "retry_wait"):
+                        item.status, item.error = "failed", "evacuation aborted"
+                    elif item.status == "migrating":
+                        # The PVE task keeps running; it is no longer tracked here
+                        item.status = "failed"
+                        item.error = f"evacuation aborted while migrating (task {item.upid})"
+                        item.finished_at = time.time()
+        self._finish(job)
+
+    def _poll(self, job: EvacuationJob, pve) -> None:
+        """Update migrating items from the task tracker (which polls the UPIDs)."""
+        from app.services.task_tracker import task_tracker
+
+        with self._lock:
+            migrating = [i for i in job.items if i.status == "migrating"]
+        for item in migrating:
+            task = task_tracker.get_task(item.upid)
+            if task is None:
+                try:
+                    result = pve.nodes(job.source).tasks(item.upid).status.get()
+                    task = {"status": result.get("status"), "exit_status": result.get("exitstatus")}
+                except Exception as exc:
+                    logger.debug("Evacuation status lookup for %s failed: %s", item.upid, exc)
+                    continue
+            with self._lock:
+                if task.get("status") == "running":
+                    item.progress = task_tracker.estimate_progress(task) if "started_at" in task else item.progress
+                    continue
+                exit_status = str(task.get("exit_status") or "")
+                if exit_status == "OK" or exit_status.startswith("WARNINGS"):
+                    item.status, item.progress, item.error = "done", 100.0, None
+                    item.finished_at = time.time()
+                else:
+                    self._failed_attempt(job, item, exit_status or "migration failed")
+
+    def _failed_attempt(self, job: EvacuationJob, item: EvacuationItem, error: str) -> None:
+        """Requeue *item* on another node after a backoff, or give up (caller holds the lock)."""
+        item.error = error
+        if item.target:
+            item.tried.add(item.target)
+        item.upid, item.progress = None, 0.0
+        if item.attempts >= job.max_attempts or job.cancel_requested:
+            item.status = "failed"
+            item.finished_at = time.time()
+            return
+        item.status = "retry_wait"
+        item.target = None
+        item.not_before = time.time() + self._RETRY_BACKOFF * item.attempts
+
+    def _free_memory(self, job: EvacuationJob, pve) -> Optional[Dict[str, float]]:
+        """Usable free memory per online target, before in-flight reservations.
+
+        ``None`` when the node list could not be read — the caller skips this
+        round rather than treating every target as full.
+        """
+        try:
+            nodes = pve.cluster.resources.get(type="node") or []
+        except Exception as exc:
+            logger.warning("Evacuation %s: reading node memory failed, retrying next round: %s",
+                           job.id[:8], exc)
+            return None
+        return {
+            n["node"]: float(n.get("maxmem") or 0) * (1 - self._mem_headroom) - float(n.get("mem") or 0)
+            for n in nodes
+            if n.get("status") == "online" and n.get("node") and n["node"] != job.source
+        }
+
+    def _launch(self, job: EvacuationJob, pve) -> None:
+        now = time.time()
+        with self._lock:
+            ready = [i for i in job.items if i.status in ("queued", "retry_wait") and i.not_before <= now]
+            migrating = [i for i in job.items if i.status == "migrating"]
+        if not ready or len(migrating) >= job.max_per_source:
+            return
+
+        free = self._free_memory(job, pve)
+        if free is None:
+            return
+        reserved: Dict[str, float] = {}
+        per_target: Dict[str, int] = {}
+        with self._lock:
+            for i in job.items:
+                recent = i.status == "done" and i.finished_at and now - i.finished_at < self._RESERVE_GRACE
+                if i.target and (i.status == "migrating" or recent):
+                    reserved[i.target] = reserved.get(i.target, 0.0) + i.mem
+                if i.status == "migrating":
+                    per_target[i.target] = per_target.get(i.target, 0) + 1
+        in_flight = len(migrating)
+
+        for item in ready:
+            if in_flight >= job.max_per_source:
+                break
+            candidates = [job.explicit_target] if job.explicit_target else sorted(free)
+            untried = [n for n in candidates if n in free and n not in item.tried]
+            candidates = untried or [n for n in candidates if n in free]
+            available = {n: free[n] - reserved.get(n, 0.0) for n in candidates}
+            feasible = [n for n in candidates
+                        if per_target.get(n, 0) < job.max_per_target and available[n] >= item.mem]
+            if not feasible:
+                if not reserved and not in_flight and all(free[n] < item.mem for n in candidates):
+                    # Nothing in flight will free up room — waiting won't help
+                    with self._lock:
+                        item.status = "failed"
+                        item.finished_at = now
+                        item.error = f"No target node has {item.mem / _GiB:.1f} GiB of free memory"
+                continue
+
+            target = max(feasible, key=lambda n: (available[n], n))
+            with self._lock:
+                item.attempts += 1
+                item.target = target
+            try:
+                upid = self._migrate(job, item, target, pve)
+            except Exception as exc:
+                logger.warning("Evacuation %s: migrating %s to %s failed to start: %s",
+                               job.id[:8], item.vmid, target, exc)
+                with self._lock:
+                    self._failed_attempt(job, item, str(exc))
+                continue
+            with self._lock:
+                item.status, item.upid, item.progress, item.error = "migrating", upid, 0.0, None
+            reserved[target] = reserved.get(target, 0.0) + item.mem
+            per_target[target] = per_target.get(target, 0) + 1
+            in_flight += 1
+
+    def _migrate(self, job: EvacuationJob, item: EvacuationItem, target: str, pve) -> str:
+        from app.core.cache import pve_cache
+        from app.services.task_tracker import task_tracker
+
+        node = pve.nodes(job.source)
+        if item.guest_type == "lxc":
+            params = {"target": target, "restart": 1} if item.running else {"target": target}
+            upid = node.lxc(item.vmid).migrate.post(**params)
+            task_type = "vzmigrate"
+        else:
+            params: Dict[str, Any] = {"target": target, "online": int(item.running)}
+            if item.running:
+                params["with-local-disks"] = 1
+            upid = node.qemu(item.vmid).migrate.post(**params)
+            task_type = "qmmigrate"
+        pve_cache.invalidate_vm(job.host_id, item.vmid)
+        task_tracker.register(
+            upid, job.host_id, job.source,
+            f"Evacuate {job.source}: {item.guest_type.upper()} {item.vmid} → {target}",
+            user_id=job.user_id,
+            vmid=item.vmid,
+            task_type=task_type,
+        )
+        return upid
+
+    # ── bookkeeping ──────────────────────────────────────────────────────────
+
+    def _finish(self, job: EvacuationJob) -> None:
+        with self._lock:
+            done = sum(1 for i in job.items if i.status == "done")
+            failed = sum(1 for i in job.items if i.status == "failed")
+            if job.cancel_requested:
+                job.status = "cancelled"
+            elif failed == 0:
+                job.status = "completed"
+            elif done:
+                job.status = "partial"
+            else:
+                job.status = "failed"
+            job.finished_at = time.time()
+        logger.info("Evacuation %s of %s %s: %d migrated, %d failed",
+                    job.id[:8], job.source, job.status, done, failed)
+
+    def _prune(self) -> None:
+        cutoff = time.time() - self._KEEP_FINISHED
+        with self._lock:
+            for job_id in [j.id for j in self._jobs.values() if j.finished_at and j.finished_at < cutoff]:
+                del self._jobs[job_id]
+
+
+# Singleton instance
+evacuation_scheduler = EvacuationScheduler()
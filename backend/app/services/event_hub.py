@@ -0,0 +1,358 @@
+"""Live state hub for server-push clients.
+
+Dashboard widgets used to poll ``/pve-node/{id}/cluster/resources``,
+``/tasks/running`` and friends on their own timers, per browser tab. The hub
+runs one server-side refresh loop instead — one ``/cluster/resources`` call
+per host, one running-task sweep, one alert and notification query — and
+only while at least one client is subscribed.
+
+State is kept per topic and scope (host id for inventory topics, user id for
+notifications). A subscriber first receives a ``snapshot`` of every topic it
+asked for, then ``delta`` messages carrying only the items that changed or
+disappeared. Messages are pre-rendered as Server-Sent Events so a delta is
+serialised once no matter how many clients receive it.
+"""
+import asyncio
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+TOPICS = ("nodes", "guests", "tasks", "alerts", "notifications")
+
+# Topics only admins may subscribe to (mirrors GET /alerts/active).
+ADMIN_TOPICS = frozenset({"alerts"})
+
+# Topics whose scope is a user id — subscribers only see their own scope.
+_USER_TOPICS = frozenset({"notifications"})
+
+# Counters and uptime move on every poll; leaving them out of the change check
+# keeps a running guest from producing a delta every refresh.
+_VOLATILE_KEYS = frozenset({"uptime", "netin", "netout", "diskread", "diskwrite"})
+
+
+def _sse(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str, separators=(',', ':'))}\n\n"
+
+
+def _default_fingerprint(item: Dict[str, Any]) -> str:
+    return json.dumps(item, sort_keys=True, default=str)
+
+
+def _resource_fingerprint(item: Dict[str, Any]) -> Tuple:
+    """Change key for a ``/cluster/resources`` entry: CPU to 1 %, memory/disk to 1 MiB."""
+    parts = []
+    for key in sorted(item):
+        if key in _VOLATILE_KEYS:
+            continue
+        value = item[key]
+        if key == "cpu":
+            value = round(value or 0, 2)
+        elif key in ("mem", "disk") and isinstance(value, (int, float)):
+            value = int(value) >> 20
+        elif isinstance(value, (list, dict)):
+            value = json.dumps(value, sort_keys=True, default=str)
+        parts.append((key, value))
+    return tuple(parts)
+
+
+class Subscription:
+    """One connected client: the topics it wants and its outbound message queue."""
+
+    def __init__(self, topics: Iterable[str], user_id: int, queue_size: int):
+        self.topics = frozenset(topics)
+        self.user_id = user_id
+        self.queue: "asyncio.Queue[str]" = asyncio.Queue(maxsize=queue_size)
+        self.connected_at = time.time()
+
+    def wants(self, topic: str, scope: str) -> bool:
+        if topic not in self.topics:
+            return False
+        if topic in _USER_TOPICS:
+            return scope == str(self.user_id)
+        return True
+
+
+class EventHub:
+    """Keeps the latest live state per topic and fans out changes to subscribers."""
+
+    def __init__(self, intervals: Optional[Dict[str, float]] = None, queue_size: int = 256):
+        self._intervals = {"nodes": 10.0, "guests": 10.0, "tasks": 5.0, "alerts": 10.0, "notifications": 10.0}
+        if intervals:
+            self._intervals.update(intervals)
+        self._queue_size = queue_size
+        # topic → scope → key → item / fingerprint
+        self._state: Dict[str, Dict[str, Dict[str, Dict[str, Any]]]] = {t: {} for t in TOPICS}
+        self._prints: Dict[str, Dict[str, Dict[str, Any]]] = {t: {} for t in TOPICS}
+        self._subs: Set[Subscription] = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional[asyncio.Task] = None
+        self._last_refresh: Dict[str, float] = {}
+        self._counters = {
+            "deltas_published": 0, "snapshots_sent": 0, "resyncs": 0,
+            "refreshes": 0, "refresh_errors": 0,
+        }
+
+    # ── subscribers (event loop only) ────────────────────────────────────────
+
+    def subscribe(self, topics: Iterable[str], user_id: int) -> Subscription:
+        """Register a client and queue its initial snapshot. Call from the event loop."""
+        self._loop = asyncio.get_running_loop()
+        sub = Subscription(topics, user_id, self._queue_size)
+        self._subs.add(sub)
+        self._send_snapshot(sub)
+        if self._task is None or self._task.done():
+            self._task = self._loop.create_task(self._refresh_loop())
+        return sub
+
+    def unsubscribe(self, sub: Subscription) -> None:
+        self._subs.discard(sub)
+
+    def stats(self) -> Dict[str, Any]:
+        topics = {}
+        for topic in TOPICS:
+            topics[topic] = {
+                "subscribers": sum(1 for s in self._subs if topic in s.topics),
+                "items": sum(len(items) for items in self._state[topic].values()),
+                "last_refresh_age": (
+                    round(time.monotonic() - self._last_refresh[topic], 1)
+                    if topic in self._last_refresh else None
+                ),
+            }
+        return {
+            "subscribers": len(self._subs),
+            "running": self._task is not None and not self._task.done(),
+            "topics": topics,
+            **dict(self._counters),
+        }
+
+    # ── publishing ───────────────────────────────────────────────────────────
+
+    def publish(
+        self,
+        topic: str,
+        scope: str,
+        items: Dict[str, Dict[str, Any]],
+        fingerprint: Callable[[Dict[str, Any]], Any] = _default_fingerprint,
+    ) -> None:
+        """Replace the state of *topic*/*scope* with *items* and push the difference.
+
+        Safe to call from any thread; work is handed to the hub's event loop.
+        """
+        loop = self._loop
+        if loop is None:
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            self._publish(topic, scope, items, fingerprint)
+        else:
+            loop.call_soon_threadsafe(self._publish, topic, scope, items, fingerprint)
+
+    def drop_scope(self, topic: str, scope: str) -> None:
+        """Forget a scope entirely (e.g. a host that was removed)."""
+        self.publish(topic, scope, {})
+
+    def _publish(self, topic, scope, items, fingerprint) -> None:
+        old_items = self._state[topic].get(scope, {})
+        old_prints = self._prints[topic].get(scope, {})
+        new_prints = {key: fingerprint(item) for key, item in items.items()}
+        upsert = [
+            {"key": key, **items[key]}
+            for key, fp in new_prints.items()
+            if old_prints.get(key) != fp
+        ]
+        remove = [key for key in old_items if key not in items]
+
+        if items:
+            self._state[topic][scope] = dict(items)
+            self._prints[topic][scope] = new_prints
+        else:
+            self._state[topic].pop(scope, None)
+            self._prints[topic].pop(scope, None)
+
+        if not upsert and not remove:
+            return
+        self._counters["deltas_published"] += 1
+        message = _sse("delta", {"topic": topic, "upsert": upsert, "remove": remove})
+        for sub in list(self._subs):
+            if sub.wants(topic, scope):
+                self._enqueue(sub, message)
+
+    def _enqueue(self, sub: Subscription, message: str) -> None:
+        try:
+            sub.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            # Client is too slow to keep up with deltas — start it over from a snapshot.
+            while not sub.queue.empty():
+                sub.queue.get_nowait()
+            self._counters["resyncs"] += 1
+            self._send_snapshot(sub)
+
+    def _send_snapshot(self, sub: Subscription, topics: Optional[Iterable[str]] = None) -> None:
+        for topic in sorted(sub.topics if topics is None else sub.topics.intersection(topics)):
+            items = [
+                {"key": key, **item}
+                for scope, scoped in self._state[topic].items()
+                if sub.wants(topic, scope)
+                for key, item in scoped.items()
+            ]
+            self._counters["snapshots_sent"] += 1
+            # ready=False: the topic has not been refreshed yet, a ready snapshot follows
+            message = _sse("snapshot", {"topic": topic, "items": items, "ready": topic in self._last_refresh})
+            if topics is None:
+                sub.queue.put_nowait(message)
+            else:
+                self._enqueue(sub, message)
+
+    # ── refresh loop ─────────────────────────────────────────────────────────
+
+    async def _refresh_loop(self) -> None:
+        """Refresh subscribed topics on their interval; exits when the last client leaves."""
+        loop = asyncio.get_running_loop()
+        while self._subs:
+            wanted: Set[str] = set()
+            for sub in self._subs:
+                wanted |= sub.topics
+            now = time.monotonic()
+            due = [t for t in wanted if now - self._last_refresh.get(t, 0.0) >= self._intervals[t]]
+            # nodes and guests come from the same /cluster/resources call
+            if "nodes" in due or "guests" in due:
+                due = [t for t in due if t not in ("nodes", "guests")] + ["inventory"]
+            for name in due:
+                try:
+                    await loop.run_in_executor(None, self._refreshers[name], self)
+                    self._counters["refreshes"] += 1
+                except Exception as exc:
+                    self._counters["refresh_errors"] += 1
+                    logger.warning(f"Event hub refresh of {name} failed: {exc}")
+                stamp = time.monotonic()
+                refreshed = ("nodes", "guests") if name == "inventory" else (name,)
+                first = [t for t in refreshed if t not in self._last_refresh]
+                for topic in refreshed:
+                    self._last_refresh[topic] = stamp
+                if first:
+                    for sub in list(self._subs):
+                        self._send_snapshot(sub, first)
+            await asyncio.sleep(1.0)
+        self._task = None
+
+    def _refresh_inventory(self) -> None:
+        from app.core.database import SessionLocal
+        from app.models import ProxmoxHost
+        from app.services.inventory import fetch_host_inventory, inventory_poller
+
+        max_age = min(self._intervals["nodes"], self._intervals["guests"])
+        db = SessionLocal()
+        try:
+            hosts = db.query(ProxmoxHost).filter(ProxmoxHost.is_active == True).all()  # noqa: E712
+            for host in hosts:
+                db.expunge(host)
+        finally:
+            db.close()
+
+        def _one(host):
+            inv = inventory_poller.get_snapshot(host.id, max_age=max_age)
+            if inv is None:
+                inv = fetch_host_inventory(host)
+                inventory_poller.remember(inv)
+            return inv
+
+        if hosts:
+            with ThreadPoolExecutor(max_workers=min(8, len(hosts))) as pool:
+                futures = [(host, pool.submit(_one, host)) for host in hosts]
+                for host, future in futures:
+                    try:
+                        inv = future.result()
+                    except Exception as exc:
+                        logger.debug(f"Event hub inventory fetch failed for {host.name}: {exc}")
+                        continue
+                    scope = str(host.id)
+                    base = {"host_id": host.id, "host_name": host.name}
+                    nodes = {
+                        f"{host.id}:{r.get('node')}": {**r, **base}
+                        for r in inv.resources if r.get("type") == "node"
+                    }
+                    guests = {f"{host.id}:{g.get('id')}": {**g, **base} for g in inv.guests}
+                    self.publish("nodes", scope, nodes, _resource_fingerprint)
+                    self.publish("guests", scope, guests, _resource_fingerprint)
+
+        live = {str(h.id) for h in hosts}
+        for topic in ("nodes", "guests"):
+            for scope in list(self._state[topic]):
+                if scope not in live:
+                    self.drop_scope(topic, scope)
+
+    def _refresh_tasks(self) -> None:
+        from app.api.tasks import collect_running_tasks
+        from app.core.database import SessionLocal
+
+        db = SessionLocal()
+        try:
+            tasks = collect_running_tasks(db)
+        finally:
+            db.close()
+        self.publish("tasks", "all", {t["upid"]: t for t in tasks if t.get("upid")})
+
+    def _refresh_alerts(self) -> None:
+        from sqlalchemy import or_
+        from datetime import datetime
+        from app.api.alerts import AlertEventOut
+        from app.core.database import SessionLocal
+        from app.models.alert_models import AlertEvent
+
+        db = SessionLocal()
+        try:
+            now = datetime.utcnow()
+            events = (
+                db.query(AlertEvent)
+                .filter(AlertEvent.acknowledged == False)  # noqa: E712
+                .filter(or_(AlertEvent.snooze_until == None, AlertEvent.snooze_until <= now))  # noqa: E711
+                .order_by(AlertEvent.fired_at.desc())
+                .limit(200)
+                .all()
+            )
+            items = {str(e.id): AlertEventOut.model_validate(e).model_dump(mode="json") for e in events}
+        finally:
+            db.close()
+        self.publish("alerts", "all", items)
+
+    def _refresh_notifications(self) -> None:
+        from app.api.notifications import NotificationOut
+        from app.core.database import SessionLocal
+        from app.models.database import Notification
+
+        user_ids = {s.user_id for s in list(self._subs) if "notifications" in s.topics}
+        db = SessionLocal()
+        try:
+            for user_id in user_ids:
+                rows = (
+                    db.query(Notification)
+                    .filter(Notification.user_id == user_id)
+                    .order_by(Notification.created_at.desc())
+                    .limit(50)
+                    .all()
+                )
+                items = {str(n.id): NotificationOut.model_validate(n).model_dump(mode="json") for n in rows}
+                self.publish("notifications", str(user_id), items)
+        finally:
+            db.close()
+        for scope in list(self._state["notifications"]):
+            if scope not in {str(u) for u in user_ids}:
+                self.drop_scope("notifications", scope)
+
+    _refreshers: Dict[str, Callable[["EventHub"], None]] = {
+        "inventory": _refresh_inventory,
+        "tasks": _refresh_tasks,
+        "alerts": _refresh_alerts,
+        "notifications": _refresh_notifications,
+    }
+
+
+# Singleton instance
+event_hub = EventHub()
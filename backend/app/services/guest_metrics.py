@@ -0,0 +1,551 @@
+"""Per-guest (VM / container) metric history.
+
+Every ``SAMPLE`` seconds the collector reads CPU, memory and the cumulative
+disk / network counters of every guest from one ``/cluster/resources`` call per
+host (reusing the inventory poller's snapshot when it is fresh enough), turns
+the counters into rates and appends the values to an in-memory block for the
+current hour. Blocks are stored in ``guest_metric_blocks`` as packed float32
+arrays — one row per guest per hour rather than one row per sample:
+
+- 1-minute samples, one row per guest-hour — 3 days
+- hourly avg / max rollups, one row per guest-day — 90 days
+
+A block is written when its hour closes and folded into the hourly tier at the
+same time; open blocks are also checkpointed every few minutes and on
+shutdown, and are restored on startup. Top-N and per-guest history queries
+decode the blocks locally, so neither needs per-VM ``rrddata`` calls.
+"""
+import logging
+import math
+import sys
+import threading
+import time
+from array import array
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import delete, select
+
+from app.services.metrics_store import _floor
+
+logger = logging.getLogger(__name__)
+
+SAMPLE = 60
+HOUR = 3600
+DAY = 86400
+
+RETENTION = {
+    SAMPLE: timedelta(days=3),
+    HOUR: timedelta(days=90),
+}
+
+# Stored series, in block order. cpu / memory are percentages of the guest's
+# allocation; the rest are bytes per second derived from counter deltas.
+METRICS = ("cpu", "memory", "disk_read", "disk_write", "net_in", "net_out")
+_COUNTERS = (("disk_read", "diskread"), ("disk_write", "diskwrite"),
+             ("net_in", "netin"), ("net_out", "netout"))
+
+# resolution → (seconds covered by one block, aggregates stored per slot)
+_TIERS = {
+    SAMPLE: (HOUR, ("avg",)),
+    HOUR: (DAY, ("avg", "max")),
+}
+
+# A counter delta over a longer gap than this is not a meaningful rate.
+_MAX_RATE_GAP = SAMPLE * 3
+# Seconds between checkpoints of the still-open hour blocks.
+_CHECKPOINT_EVERY = 600
+_PRUNE_EVERY = 3600
+_DELETE_CHUNK = 500
+
+_NAN = float("nan")
+
+
+def _pack(values: array) -> bytes:
+    if sys.byteorder != "little":
+        values = array("f", values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def _unpack(data: bytes) -> array:
+    values = array("f")
+    values.frombytes(data)
+    if sys.byteorder != "little":
+        values.byteswap()
+    return values
+
+
+def _clean(value: float) -> Optional[float]:
+    return None if value != value else round(value, 2)
+
+
+class _Block:
+    """One guest's series for one block span at one resolution."""
+
+    __slots__ = ("host_id", "vmid", "guest_type", "node", "name",
+                 "resolution", "block_start", "samples", "values")
+
+    def __init__(self, host_id: int, vmid: int, guest_type: str, resolution: int,
+                 block_start: datetime, values: Optional[array] = None,
+                 node: Optional[str] = None, name: Optional[str] = None, samples: int = 0):
+        self.host_id = host_id
+        self.vmid = vmid
+        self.guest_type = guest_type
+        self.node = node
+        self.name = name
+        self.resolution = resolution
+        self.block_start = block_start
+        self.samples = samples
+        self.values = values if values is not None else array("f", [_NAN]) * (
+            len(METRICS) * len(_TIERS[resolution][1]) * self.slots
+        )
+
+    @property
+    def slots(self) -> int:
+        return _TIERS[self.resolution][0] // self.resolution
+
+    @property
+    def key(self) -> Tuple[int, int]:
+        return self.host_id, self.vmid
+
+    def offset(self, metric: str, agg: str = "avg") -> int:
+        aggs = _TIERS[self.resolution][1]
+        return (METRICS.index(metric) * len(aggs) + aggs.index(agg)) * self.slots
+
+    def series(self, metric: str, agg: str = "avg") -> array:
+        start = self.offset(metric, agg)
+        return self.values[start:start + self.slots]
+
+    def slot_time(self, slot: int) -> datetime:
+        return self.block_start + timedelta(seconds=slot * self.resolution)
+
+    def copy(self) -> "_Block":
+        return _Block(self.host_id, self.vmid, self.guest_type, self.resolution, self.block_start,
+                      array("f", self.values), self.node, self.name, self.samples)
+
+    def row(self) -> Dict[str, Any]:
+        return {
+            "host_id": self.host_id, "vmid": self.vmid, "guest_type": self.guest_type,
+            "node": self.node, "name": self.name, "resolution": self.resolution,
+            "block_start": self.block_start, "samples": self.samples, "data": _pack(self.values),
+        }
+
+    @classmethod
+    def from_row(cls, row) -> "_Block":
+        return cls(row.host_id, row.vmid, row.guest_type, row.resolution, row.block_start,
+                   _unpack(row.data), row.node, row.name, row.samples or 0)
+
+
+class GuestMetricsCollector:
+    """Sample, store, roll up and query per-guest metrics."""
+
+    def __init__(self, max_workers: int = 8):
+        self._max_workers = max_workers
+        self._lock = threading.Lock()
+        self._open: Dict[Tuple[int, int], _Block] = {}
+        self._prev: Dict[Tuple[int, int], Tuple[float, Tuple[int, ...]]] = {}
+        self._latest: Dict[int, Tuple[float, List[Dict[str, Any]]]] = {}
+        self._restored = False
+        self._last_checkpoint = time.time()
+        self._last_prune = 0.0
+        self._last_run: Dict[str, Any] = {}
+
+    # ── collection ───────────────────────────────────────────────────────────
+
+    def collect(self, db) -> int:
+        """Take one sample of every running guest on every active host."""
+        from concurrent.futures import ThreadPoolExecutor
+
+        from app.models import ProxmoxHost
+        from app.services.inventory import fetch_host_inventory, inventory_poller
+
+        started = time.time()
+        if not self._restored:
+            self._restore(db)
+        hosts = db.query(ProxmoxHost).filter(ProxmoxHost.is_active == True).all()  # noqa: E712
+
+        def _inventory(host):
+            inv = inventory_poller.get_snapshot(host.id, max_age=SAMPLE / 2)
+            if inv is not None:
+                return inv
+            try:
+                inv = fetch_host_inventory(host)
+            except Exception as e:
+                logger.warning(f"Guest metric sample failed for host {host.name}: {e}")
+                return None
+            inventory_poller.remember(inv)
+            return inv
+
+        inventories = []
+        if hosts:
+            with ThreadPoolExecutor(max_workers=min(self._max_workers, len(hosts))) as pool:
+                inventories = [inv for inv in pool.map(_inventory, hosts) if inv is not None]
+
+        current = _floor(datetime.utcnow(), HOUR)
+        sampled = 0
+        with self._lock:
+            closed: List[_Block] = []
+            for inv in inventories:
+                sampled += self._ingest(inv, closed)
+            for key in [k for k, b in self._open.items() if b.block_start < current]:
+                closed.append(self._open.pop(key))
+
+        if closed:
+            try:
+                self._close(closed)
+            except Exception as e:
+                logger.error(f"Guest metric block write failed: {e}")
+        if time.time() - self._last_checkpoint >= _CHECKPOINT_EVERY:
+            self.checkpoint()
+        if time.time() - self._last_prune >= _PRUNE_EVERY:
+            try:
+                self.prune()
+            except Exception as e:
+                logger.warning(f"Guest metric prune failed: {e}")
+
+        self._last_run = {
+            "finished_at": datetime.utcnow().isoformat(),
+            "duration_ms": int((time.time() - started) * 1000),
+            "hosts": len(hosts),
+            "hosts_sampled": len(inventories),
+            "guests_sampled": sampled,
+            "blocks_closed": len(closed),
+        }
+        return sampled
+
+    def _ingest(self, inv, closed: List[_Block]) -> int:
+        """Append one inventory's guests to their open blocks (caller holds the lock)."""
+        ts = inv.fetched_at
+        when = datetime.utcfromtimestamp(ts)
+        block_start = _floor(when, HOUR)
+        slot = int((when - block_start).total_seconds()) // SAMPLE
+        latest: List[Dict[str, Any]] = []
+        prev_seen = {k: v for k, v in self._prev.items() if k[0] != inv.host_id}
+        sampled = 0
+
+        for g in inv.guests:
+            if g.get("template") or g.get("vmid") is None:
+                continue
+            key = (inv.host_id, int(g["vmid"]))
+            if g.get("status") != "running":
+                continue
+            counters = tuple(int(g.get(field) or 0) for _, field in _COUNTERS)
+            prev = self._prev.get(key)
+            prev_seen[key] = (ts, counters)
+            if prev is not None and ts <= prev[0]:
+                # Same snapshot as last time — nothing new to record
+                prev_seen[key] = prev
+                continue
+
+            maxmem = g.get("maxmem") or 0
+            sample = {
+                "cpu": float(g.get("cpu") or 0) * 100,
+                "memory": (g.get("mem") or 0) / maxmem * 100 if maxmem else _NAN,
+            }
+            elapsed = ts - prev[0] if prev is not None else 0
+            for i, (metric, _) in enumerate(_COUNTERS):
+                delta = counters[i] - prev[1][i] if prev is not None else -1
+                # A negative delta means the counter reset (reboot, migration)
+                sample[metric] = delta / elapsed if 0 < elapsed <= _MAX_RATE_GAP and delta >= 0 else _NAN
+
+            block = self._open.get(key)
+            if block is not None and block.block_start != block_start:
+                if block.block_start > block_start:
+                    continue   # stale snapshot from the previous hour
+                closed.append(self._open.pop(key))
+                block = None
+            if block is None:
+                block = _Block(inv.host_id, key[1], g.get("type") or "qemu", SAMPLE, block_start)
+                self._open[key] = block
+            if block.values[block.offset("cpu") + slot] != block.values[block.offset("cpu") + slot]:
+                block.samples += 1
+            for metric in METRICS:
+                block.values[block.offset(metric) + slot] = sample[metric]
+            block.node = g.get("node")
+            block.name = g.get("name")
+            block.guest_type = g.get("type") or block.guest_type
+
+            latest.append({
+                "vmid": key[1], "type": block.guest_type, "node": block.node, "name": block.name,
+                **{m: _clean(v) for m, v in sample.items()},
+            })
+            sampled += 1
+
+        self._prev = prev_seen
+        self._latest[inv.host_id] = (ts, latest)
+        return sampled
+
+    def _restore(self, db) -> None:
+        """Reload the current hour's checkpointed blocks after a restart."""
+        from app.models import GuestMetricBlock
+
+        self._restored = True
+        current = _floor(datetime.utcnow(), HOUR)
+        try:
+            rows = db.query(GuestMetricBlock).filter(
+                GuestMetricBlock.resolution == SAMPLE, GuestMetricBlock.block_start == current,
+            ).all()
+        except Exception as e:
+            logger.warning(f"Guest metric restore failed: {e}")
+            return
+        with self._lock:
+            for row in rows:
+                block = _Block.from_row(row)
+                self._open.setdefault(block.key, block)
+        if rows:
+            logger.info("Guest metrics: restored %d open block(s) for %s", len(rows), current.isoformat())
+
+    # ── writes ───────────────────────────────────────────────────────────────
+
+    def checkpoint(self) -> int:
+        """Write the still-open hour blocks so a restart loses at most one interval."""
+        from app.core.database import engine
+
+        self._last_checkpoint = time.time()
+        with self._lock:
+            blocks = [b.copy() for b in self._open.values()]
+        if not blocks:
+            return 0
+        try:
+            with engine.begin() as conn:
+                self._write(conn, SAMPLE, blocks)
+        except Exception as e:
+            logger.error(f"Guest metric checkpoint failed: {e}")
+            return 0
+        return len(blocks)
+
+    def _close(self, blocks: List[_Block]) -> None:
+        """Write closed hour blocks and fold each into its guest's hourly rollup block."""
+        from app.core.database import engine
+        from app.models import GuestMetricBlock
+
+        t = GuestMetricBlock.__table__
+        days = {_floor(b.block_start, DAY) for b in blocks}
+        with engine.begin() as conn:
+            self._write(conn, SAMPLE, blocks)
+
+            rows = conn.execute(
+                select(t).where(t.c.resolution == HOUR, t.c.block_start.in_(days))
+            ).all()
+            rollups = {(r.host_id, r.vmid, r.block_start): _Block.from_row(r) for r in rows}
+            touched = {}
+            for b in blocks:
+                day = _floor(b.block_start, DAY)
+                key = (b.host_id, b.vmid, day)
+                target = rollups.get(key)
+                if target is None:
+                    target = rollups[key] = _Block(b.host_id, b.vmid, b.guest_type, HOUR, day)
+                slot = int((b.block_start - day).total_seconds()) // HOUR
+                for metric in METRICS:
+                    values = [v for v in b.series(metric) if v == v]
+                    if values:
+                        target.values[target.offset(metric, "avg") + slot] = sum(values) / len(values)
+                        target.values[target.offset(metric, "max") + slot] = max(values)
+                target.samples += b.samples
+                target.node, target.name, target.guest_type = b.node, b.name, b.guest_type
+                touched[key] = target
+            self._write(conn, HOUR, list(touched.values()))
+        logger.debug("Guest metrics: closed %d block(s) into %d rollup block(s)", len(blocks), len(touched))
+
+    @staticmethod
+    def _write(conn, res: int, blocks: List[_Block]) -> None:
+        """Replace the stored rows for *blocks* (same resolution) in one transaction."""
+        from app.models import GuestMetricBlock
+
+        if not blocks:
+            return
+        t = GuestMetricBlock.__table__
+        wanted = {(b.host_id, b.vmid, b.block_start) for b in blocks}
+        existing = conn.execute(
+            select(t.c.id, t.c.host_id, t.c.vmid, t.c.block_start).where(
+                t.c.resolution == res, t.c.block_start.in_({b.block_start for b in blocks}),
+            )
+        ).all()
+        stale = [r.id for r in existing if (r.host_id, r.vmid, r.block_start) in wanted]
+        for i in range(0, len(stale), _DELETE_CHUNK):
+            conn.execute(delete(t).where(t.c.id.in_(stale[i:i + _DELETE_CHUNK])))
+        conn.execute(t.insert(), [b.row() for b in blocks])
+
+    def prune(self, now: Optional[datetime] = None) -> Dict[int, int]:
+        """Drop blocks whose whole span is older than their tier's retention."""
+        from app.core.database import engine
+        from app.models import GuestMetricBlock
+
+        now = now or datetime.utcnow()
+        self._last_prune = time.time()
+        removed = {}
+        with engine.begin() as conn:
+            for res, (span, _) in _TIERS.items():
+                removed[res] = conn.execute(
+                    delete(GuestMetricBlock).where(
+                        GuestMetricBlock.resolution == res,
+                        GuestMetricBlock.block_start < now - RETENTION[res] - timedelta(seconds=span),
+                    )
+                ).rowcount
+        return removed
+
+    def stop(self) -> None:
+        """Checkpoint open blocks on shutdown."""
+        self.checkpoint()
+
+    # ── reads ────────────────────────────────────────────────────────────────
+
+    @staticmethod
+    def pick_resolution(start: datetime, end: datetime, now: Optional[datetime] = None) -> int:
+        now = now or datetime.utcnow()
+        if start >= now - RETENTION[SAMPLE] and end - start <= timedelta(days=2):
+            return SAMPLE
+        return HOUR
+
+    def latest(self, host_id: int, max_age: Optional[float] = None) -> Optional[List[Dict[str, Any]]]:
+        """Most recent per-guest sample for *host_id* (None if missing or older than *max_age* s)."""
+        with self._lock:
+            entry = self._latest.get(host_id)
+        if entry is None or (max_age is not None and time.time() - entry[0] > max_age):
+            return None
+        return entry[1]
+
+    def _blocks(self, db, res: int, start: datetime, end: datetime,
+                host_id: Optional[int] = None, vmid: Optional[int] = None) -> List[_Block]:
+        """Stored blocks overlapping [start, end], with open in-memory blocks taking precedence."""
+        from app.models import GuestMetricBlock
+
+        t = GuestMetricBlock.__table__
+        span = _TIERS[res][0]
+        q = select(t).where(
+            t.c.resolution == res, t.c.block_start >= _floor(start, span), t.c.block_start <= end,
+        )
+        if host_id is not None:
+            q = q.where(t.c.host_id == host_id)
+        if vmid is not None:
+            q = q.where(t.c.vmid == vmid)
+        blocks = {(r.host_id, r.vmid, r.block_start): _Block.from_row(r) for r in db.execute(q).all()}
+        if res == SAMPLE:
+            with self._lock:
+                for b in self._open.values():
+                    if (host_id is None or b.host_id == host_id) and (vmid is None or b.vmid == vmid) \
+                            and _floor(start, span) <= b.block_start <= end:
+                        blocks[(b.host_id, b.vmid, b.block_start)] = b.copy()
+        return sorted(blocks.values(), key=lambda b: b.block_start)
+
+    def history(self, db, host_id: int, vmid: int, start: datetime,
+                end: Optional[datetime] = None, resolution: Optional[int] = None) -> Dict[str, Any]:
+        """One guest's series as parallel arrays.
+
+        Returns ``{"resolution", "guest": {…} | None, "t": [iso…],
+        "cpu": {"avg": […], "max": […]}, "memory": …, "disk_read": …, …}``.
+        Raw samples fill avg and max with the sample value.
+        """
+        end = end or datetime.utcnow()
+        res = resolution or self.pick_resolution(start, end)
+        aggs = _TIERS[res][1]
+        out: Dict[str, Any] = {"resolution": res, "guest": None, "t": [],
+                               **{m: {"avg": [], "max": []} for m in METRICS}}
+        for b in self._blocks(db, res, start, end, host_id, vmid):
+            out["guest"] = {"host_id": b.host_id, "vmid": b.vmid, "type": b.guest_type,
+                            "node": b.node, "name": b.name}
+            columns = {(m, a): b.series(m, a) for m in METRICS for a in aggs}
+            cpu = columns[("cpu", "avg")]
+            for slot in range(b.slots):
+                at = b.slot_time(slot)
+                if cpu[slot] != cpu[slot] or at < _floor(start, res) or at > end:
+                    continue
+                out["t"].append(at.isoformat())
+                for m in METRICS:
+                    out[m]["avg"].append(_clean(columns[(m, "avg")][slot]))
+                    out[m]["max"].append(_clean(columns[(m, aggs[-1])][slot]))
+        return out
+
+    def top(self, db, metric: str, start: datetime, end: Optional[datetime] = None,
+            limit: int = 10, agg: str = "max", host_id: Optional[int] = None,
+            resolution: Optional[int] = None) -> Dict[str, Any]:
+        """Guests ranked by *metric* over [start, end].
+
+        ``agg="max"`` ranks by peak value and reports when it happened;
+        ``agg="avg"`` ranks by the mean over the window.
+        """
+        if metric not in METRICS:
+            raise ValueError(f"Unknown metric {metric!r}")
+        if agg not in ("max", "avg"):
+            raise ValueError(f"Unknown aggregate {agg!r}")
+        end = end or datetime.utcnow()
+        res = resolution or self.pick_resolution(start, end)
+        stored_agg = agg if agg in _TIERS[res][1] else "avg"
+        lo = _floor(start, res)
+
+        ranked: Dict[Tuple[int, int], Dict[str, Any]] = {}
+        for b in self._blocks(db, res, start, end, host_id):
+            values = b.series(metric, stored_agg)
+            entry = ranked.get(b.key)
+            if entry is None:
+                entry = ranked[b.key] = {"host_id": b.host_id, "vmid": b.vmid, "peak": None,
+                                         "at": None, "total": 0.0, "count": 0}
+            entry.update(type=b.guest_type, node=b.node, name=b.name)
+            for slot, v in enumerate(values):
+                if v != v:
+                    continue
+                at = b.slot_time(slot)
+                if at < lo or at > end:
+                    continue
+                entry["total"] += v
+                entry["count"] += 1
+                if entry["peak"] is None or v > entry["peak"]:
+                    entry["peak"], entry["at"] = v, at
+
+        guests = []
+        for entry in ranked.values():
+            if not entry["count"]:
+                continue
+            value = entry["peak"] if agg == "max" else entry["total"] / entry["count"]
+            guests.append({
+                "host_id": entry["host_id"], "vmid": entry["vmid"], "type": entry["type"],
+                "node": entry["node"], "name": entry["name"], "value": _clean(value),
+                "peak_at": entry["at"].isoformat() if agg == "max" else None,
+            })
+        guests.sort(key=lambda g: g["value"], reverse=True)
+        return {"resolution": res, "metric": metric, "agg": agg, "guests": guests[:limit]}
+
+    def percentiles(self, db, host_id: int, start: datetime, end: Optional[datetime] = None,
+                    q: float = 0.95, metrics: Tuple[str, ...] = ("cpu", "memory"),
+                    resolution: Optional[int] = None) -> Dict[int, Dict[str, Any]]:
+        """Per-guest *q*-quantile of *metrics* over [start, end] for one host.
+
+        Returns ``{vmid: {"cpu": …, "memory": …, "samples": n}}`` for guests
+        with at least one sample. Hourly rollups use the hourly averages.
+        """
+        end = end or datetime.utcnow()
+        res = resolution or self.pick_resolution(start, end)
+        lo = _floor(start, res)
+        values: Dict[int, Dict[str, List[float]]] = {}
+        for b in self._blocks(db, res, start, end, host_id):
+            slots = [s for s in range(b.slots) if lo <= b.slot_time(s) <= end]
+            per_guest = values.setdefault(b.vmid, {m: [] for m in metrics})
+            for m in metrics:
+                series = b.series(m)
+                per_guest[m].extend(series[s] for s in slots if series[s] == series[s])
+
+        out: Dict[int, Dict[str, Any]] = {}
+        for vmid, per_metric in values.items():
+            samples = max(len(v) for v in per_metric.values())
+            if not samples:
+                continue
+            out[vmid] = {"samples": samples}
+            for m, v in per_metric.items():
+                v.sort()
+                out[vmid][m] = v[max(0, math.ceil(q * len(v)) - 1)] if v else None
+        return out
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "open_blocks": len(self._open),
+                "tracked_counters": len(self._prev),
+                "hosts": {hid: {"age_seconds": round(time.time() - ts, 1), "guests": len(rows)}
+                          for hid, (ts, rows) in self._latest.items()},
+                "last_run": dict(self._last_run),
+            }
+
+
+# Singleton instance
+guest_metrics = GuestMetricsCollector()
@@ -1,7 +1,7 @@
 """iDRAC / iLO out-of-band management via Redfish API."""
 import ssl
 import requests
-from requests.adapters import HTTPAdapter
+from app.core.telemetry import TimedHTTPAdapter
 import logging
 from typing import Optional, Dict, Any
 from concurrent.futures import ThreadPoolExecutor, as_completed
@@ -13,12 +13,16 @@ import urllib3
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
 
-class _LegacyTLSAdapter(HTTPAdapter):
+class _LegacyTLSAdapter(TimedHTTPAdapter):
     """HTTPAdapter that handles legacy BMC TLS (iDRAC 7/8, iLO 3/4).
 
     OpenSSL 3.0 requires OP_LEGACY_SERVER_CONNECT for servers that use
     unsafe legacy renegotiation (common on older iDRAC firmware).
+    Calls are timed under the "redfish" upstream metrics.
     """
+    def __init__(self, *args, **kwargs):
+        super().__init__("redfish", *args, **kwargs)
+
     def init_poolmanager(self, *args, **kwargs):
         ctx = ssl.create_default_context()
         ctx.check_hostname = False
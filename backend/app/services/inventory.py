@@ -0,0 +1,253 @@
+"""Cluster inventory poller — one ``/cluster/resources`` call per Proxmox host.
+
+Replaces the old per-node walk (``nodes.get()`` followed by ``status``, ``qemu``
+and ``lxc`` per node) with a single request that returns every node, guest and
+storage in the cluster. Hosts are polled concurrently, the result is kept as an
+in-memory snapshot per host, and only ``ProxmoxNode`` rows whose values changed
+since the last poll are rewritten.
+"""
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.models import ProxmoxHost, ProxmoxNode
+
+logger = logging.getLogger(__name__)
+
+# ProxmoxNode columns compared to decide whether a row is rewritten. Uptime
+# grows every poll, so it is stored whenever a row is rewritten but does not
+# by itself count as a change.
+_NODE_FIELDS = (
+    "status", "cpu_cores", "cpu_usage",
+    "memory_total", "memory_used", "disk_total", "disk_used",
+    "vm_count", "lxc_count",
+)
+
+
+# ── data model ──────────────────────────────────────────────────────────────
+
+@dataclass
+class HostInventory:
+    """Everything ``/cluster/resources`` reported for one host at one instant."""
+    host_id: int
+    host_name: str
+    fetched_at: float
+    nodes: Dict[str, Dict[str, Any]] = field(default_factory=dict)   # node_name → ProxmoxNode fields
+    guests: List[Dict[str, Any]] = field(default_factory=list)       # qemu + lxc resources
+    storage: List[Dict[str, Any]] = field(default_factory=list)      # storage resources (one per node)
+    resources: List[Dict[str, Any]] = field(default_factory=list)    # raw response
+
+    def guests_on(self, node_name: str, guest_type: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Guests on *node_name*, optionally filtered to ``qemu`` or ``lxc``."""
+        return [
+            g for g in self.guests
+            if g.get("node") == node_name and (guest_type is None or g.get("type") == guest_type)
+        ]
+
+    def storage_on(self, node_name: str) -> List[Dict[str, Any]]:
+        return [s for s in self.storage if s.get("node") == node_name]
+
+
+# ── fetch / normalise ───────────────────────────────────────────────────────
+
+def build_host_inventory(host_id: int, host_name: str, resources: List[Dict[str, Any]]) -> HostInventory:
+    """Turn a raw ``/cluster/resources`` response into a HostInventory."""
+    inv = HostInventory(host_id=host_id, host_name=host_name, fetched_at=time.time(), resources=resources)
+    vm_counts: Dict[str, int] = {}
+    lxc_counts: Dict[str, int] = {}
+
+    for res in resources:
+        rtype = res.get("type")
+        if rtype in ("qemu", "lxc"):
+            inv.guests.append(res)
+            counts = vm_counts if rtype == "qemu" else lxc_counts
+            node_name = res.get("node") or ""
+            counts[node_name] = counts.get(node_name, 0) + 1
+        elif rtype == "storage":
+            inv.storage.append(res)
+
+    for res in resources:
+        if res.get("type") != "node":
+            continue
+        node_name = res.get("node")
+        if not node_name:
+            continue
+        inv.nodes[node_name] = {
+            "status": res.get("status") or "unknown",
+            "cpu_cores": int(res.get("maxcpu") or 0),
+            "cpu_usage": int((res.get("cpu") or 0) * 100),
+            "memory_total": int(res.get("maxmem") or 0),
+            "memory_used": int(res.get("mem") or 0),
+            "disk_total": int(res.get("maxdisk") or 0),
+            "disk_used": int(res.get("disk") or 0),
+            "uptime": int(res.get("uptime") or 0),
+            "vm_count": vm_counts.get(node_name, 0),
+            "lxc_count": lxc_counts.get(node_name, 0),
+        }
+    return inv
+
+
+def fetch_host_inventory(host: ProxmoxHost) -> HostInventory:
+    """Fetch the full inventory for one host with a single API call."""
+    from app.services.proxmox import ProxmoxService
+    resources = ProxmoxService(host).proxmox.cluster.resources.get()
+    return build_host_inventory(host.id, host.name, resources or [])
+
+
+# ── poller ──────────────────────────────────────────────────────────────────
+
+class InventoryPoller:
+    """Polls every active host concurrently and keeps the latest snapshot per host."""
+
+    def __init__(self, max_workers: int = 8):
+        self._max_workers = max_workers
+        self._snapshots: Dict[int, HostInventory] = {}
+        self._lock = threading.Lock()
+        self._last_run: Dict[str, Any] = {}
+
+    # ── snapshot access ──────────────────────────────────────────────────────
+
+    def get_snapshot(self, host_id: int, max_age: Optional[float] = None) -> Optional[HostInventory]:
+        """Return the last snapshot for *host_id* (None if missing or older than *max_age* s)."""
+        with self._lock:
+            inv = self._snapshots.get(host_id)
+        if inv is None:
+            return None
+        if max_age is not None and time.time() - inv.fetched_at > max_age:
+            return None
+        return inv
+
+    def remember(self, inv: HostInventory) -> None:
+        """Store *inv* as its host's snapshot without touching the database."""
+        with self._lock:
+            self._snapshots[inv.host_id] = inv
+
+    def forget(self, host_id: int) -> None:
+        with self._lock:
+            self._snapshots.pop(host_id, None)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            hosts = {
+                hid: {"age_seconds": round(time.time() - inv.fetched_at, 1),
+                      "nodes": len(inv.nodes), "guests": len(inv.guests)}
+                for hid, inv in self._snapshots.items()
+            }
+            return {"hosts": hosts, "last_run": dict(self._last_run)}
+
+    # ── polling ──────────────────────────────────────────────────────────────
+
+    def poll_all(self, db: Session) -> Dict[int, bool]:
+        """Poll every active host in parallel, then persist changed node rows.
+
+        API calls run in worker threads; DB writes happen afterwards on *db*
+        from the calling thread, one commit per host.
+        """
+        from concurrent.futures import ThreadPoolExecutor
+
+        started = time.time()
+        hosts = db.query(ProxmoxHost).filter(ProxmoxHost.is_active == True).all()  # noqa: E712
+        if not hosts:
+            return {}
+
+        def _fetch(host) -> Tuple[ProxmoxHost, Optional[HostInventory]]:
+            try:
+                return host, fetch_host_inventory(host)
+            except Exception as e:
+                logger.error(f"Inventory poll failed for host {host.name}: {e}")
+                return host, None
+
+        with ThreadPoolExecutor(max_workers=min(self._max_workers, len(hosts))) as pool:
+            fetched = list(pool.map(_fetch, hosts))
+
+        results: Dict[int, bool] = {}
+        rows_written = 0
+        for host, inv in fetched:
+            if inv is None:
+                results[host.id] = False
+                continue
+            try:
+                rows_written += self.apply(db, host, inv)
+                results[host.id] = True
+            except Exception as e:
+                logger.error(f"Inventory apply failed for host {host.name}: {e}")
+                db.rollback()
+                results[host.id] = False
+
+        self._last_run = {
+            "finished_at": datetime.utcnow().isoformat(),
+            "duration_ms": int((time.time() - started) * 1000),
+            "hosts": len(hosts),
+            "hosts_ok": sum(1 for ok in results.values() if ok),
+            "node_rows_written": rows_written,
+        }
+        logger.info(
+            "Inventory poll: %d/%d hosts ok, %d node rows written in %d ms",
+            self._last_run["hosts_ok"], len(hosts), rows_written, self._last_run["duration_ms"],
+        )
+        return results
+
+    def poll_host(self, db: Session, host: ProxmoxHost) -> bool:
+        """Poll a single host synchronously and persist the changes."""
+        try:
+            inv = fetch_host_inventory(host)
+        except Exception as e:
+            logger.error(f"Inventory poll failed for host {host.name}: {e}")
+            return False
+        self.apply(db, host, inv)
+        return True
+
+    def apply(self, db: Session, host: ProxmoxHost, inv: HostInventory) -> int:
+        """Store *inv* as the host's snapshot and write changed ProxmoxNode rows.
+
+        Rows are compared field by field against the stored values; unchanged
+        rows only get their ``last_updated`` heartbeat bumped in one bulk UPDATE
+        (report freshness checks rely on it). Nodes PVE reports as not online
+        are neither written nor heartbeated: their rows keep the last online
+        values and go stale, which is what the offline-node alert looks for.
+        Returns the number of rows rewritten.
+        """
+        self.remember(inv)
+
+        now = datetime.utcnow()
+        rows = {
+            n.node_name: n
+            for n in db.query(ProxmoxNode).filter(ProxmoxNode.host_id == host.id).all()
+        }
+        written = 0
+        unchanged_ids: List[int] = []
+        for node_name, fields in inv.nodes.items():
+            if fields.get("status") != "online":
+                continue
+            row = rows.get(node_name)
+            if row is None:
+                db.add(ProxmoxNode(host_id=host.id, node_name=node_name, last_updated=now, **fields))
+                written += 1
+                continue
+            if any(getattr(row, f) != fields[f] for f in _NODE_FIELDS):
+                for f, v in fields.items():
+                    setattr(row, f, v)
+                row.last_updated = now
+                written += 1
+            else:
+                unchanged_ids.append(row.id)
+
+        if unchanged_ids:
+            db.query(ProxmoxNode).filter(ProxmoxNode.id.in_(unchanged_ids)).update(
+                {ProxmoxNode.last_updated: now}, synchronize_session=False,
+            )
+
+        host.last_poll = now
+        db.commit()
+        return written
+
+
+# Singleton instance
+inventory_poller = InventoryPoller()
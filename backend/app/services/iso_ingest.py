@@ -0,0 +1,242 @@
+"""Single-pass ISO ingest.
+
+Uploaded ISOs are written exactly once: the multipart request body is parsed
+as it streams in and the file part is written to a ``.part`` file next to its
+final location while being SHA-256 hashed, then renamed into place. Disk
+writes and hashing run in worker threads so the event loop keeps serving other
+requests.
+
+Checksum verification reads with large buffers on a reader thread while the
+caller hashes the previous buffer (hashlib releases the GIL), and several
+files can be verified in parallel with ``verify_many``.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Callable, Dict, Iterable, Optional, Tuple
+
+from python_multipart.multipart import MultipartParser, parse_options_header
+
+logger = logging.getLogger(__name__)
+
+# Coalesce incoming body chunks to this size before each write + hash call.
+_WRITE_CHUNK = 8 * 1024 * 1024
+# Buffer size for checksum reads.
+_READ_CHUNK = 8 * 1024 * 1024
+
+_FILE = object()   # marks the file part while parsing
+
+
+class IsoIngestError(Exception):
+    """Client-side problem with an upload (maps to HTTP 400)."""
+
+
+# ── hashing ─────────────────────────────────────────────────────────────────
+
+def hash_file(path: str, chunk_size: int = _READ_CHUNK,
+              progress: Optional[Callable[[int, int], None]] = None) -> str:
+    """SHA-256 of *path*, reading ahead on a second thread while hashing."""
+    total = os.path.getsize(path)
+    buffers: "queue.Queue" = queue.Queue(maxsize=2)
+    error: Dict[str, BaseException] = {}
+
+    def _reader():
+        try:
+            with open(path, "rb", buffering=0) as f:
+                try:
+                    os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+                except (AttributeError, OSError):
+                    pass
+                while True:
+                    chunk = f.read(chunk_size)
+                    if not chunk:
+                        break
+                    buffers.put(chunk)
+        except BaseException as exc:
+            error["exc"] = exc
+        finally:
+            buffers.put(None)
+
+    reader = threading.Thread(target=_reader, daemon=True, name="iso-hash-reader")
+    reader.start()
+    sha = hashlib.sha256()
+    done = 0
+    while True:
+        chunk = buffers.get()
+        if chunk is None:
+            break
+        sha.update(chunk)
+        done += len(chunk)
+        if progress:
+            progress(done, total)
+    reader.join()
+    if "exc" in error:
+        raise error["exc"]
+    return sha.hexdigest()
+
+
+def verify_many(paths: Iterable[str], max_workers: int = 4) -> Dict[str, Optional[str]]:
+    """Hash several files concurrently. Missing or unreadable files map to None."""
+    paths = list(paths)
+
+    def _one(path: str) -> Optional[str]:
+        try:
+            return hash_file(path)
+        except OSError as exc:
+            logger.warning(f"Checksum of {path} failed: {exc}")
+            return None
+
+    if not paths:
+        return {}
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(paths)))) as pool:
+        return dict(zip(paths, pool.map(_one, paths)))
+
+
+# ── upload ingest ───────────────────────────────────────────────────────────
+
+class _PartWriter:
+    """Writes one file part to ``<dest>.part`` and hashes it in the same pass."""
+
+    def __init__(self, part_path: str, max_size: int):
+        # O_EXCL: a concurrent upload of the same filename fails instead of interleaving
+        fd = os.open(part_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+        self.file = os.fdopen(fd, "wb", buffering=0)
+        self.path = part_path
+        self.sha = hashlib.sha256()
+        self.size = 0
+        self._max_size = max_size
+
+    def write(self, data: bytes) -> None:
+        self.size += len(data)
+        if self.size > self._max_size:
+            raise IsoIngestError(
+                f"File too large. Maximum size is {self._max_size / (1024**3)}GB"
+            )
+        self.sha.update(data)
+        view = memoryview(data)
+        while view:
+            written = self.file.write(view)
+            view = view[written:]
+
+    def close(self) -> None:
+        self.file.close()
+
+    def discard(self) -> None:
+        try:
+            self.file.close()
+        finally:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+
+async def receive_iso_upload(
+    stream: AsyncIterator[bytes],
+    content_type: str,
+    dest_dir: str,
+    max_size: int,
+    check_filename: Callable[[str], str],
+    file_field: str = "file",
+    progress: Optional[Callable[[int], None]] = None,
+) -> Tuple[str, Dict[str, str], int, str]:
+    """Stream a multipart upload into *dest_dir*.
+
+    *check_filename* receives the client filename as soon as the part headers
+    arrive, returns the sanitised name to store under, or raises
+    IsoIngestError. Returns ``(final_path, form_fields, size, sha256)``.
+    """
+    ctype, params = parse_options_header(content_type or "")
+    boundary = params.get(b"boundary")
+    if ctype != b"multipart/form-data" or not boundary:
+        raise IsoIngestError("Expected a multipart/form-data request")
+
+    loop = asyncio.get_running_loop()
+    fields: Dict[str, str] = {}
+    state: Dict[str, object] = {"headers": {}, "field": None, "hdr": b"", "val": b""}
+    pending = bytearray()
+    field_data = bytearray()
+    writer: Optional[_PartWriter] = None
+    final_path: Optional[str] = None
+    errors: list = []
+
+    def on_header_field(data, start, end):
+        state["hdr"] += data[start:end]
+
+    def on_header_value(data, start, end):
+        state["val"] += data[start:end]
+
+    def on_header_end():
+        state["headers"][bytes(state["hdr"]).lower()] = bytes(state["val"])
+        state["hdr"], state["val"] = b"", b""
+
+    def on_headers_finished():
+        nonlocal writer, final_path
+        _, disp = parse_options_header(state["headers"].get(b"content-disposition", b""))
+        name = disp.get(b"name", b"").decode("utf-8", "replace")
+        filename = disp.get(b"filename")
+        state["field"] = name
+        field_data.clear()
+        if filename is not None and name == file_field and writer is None:
+            try:
+                stored = check_filename(filename.decode("utf-8", "replace"))
+                final_path = os.path.join(dest_dir, stored)
+                writer = _PartWriter(os.path.join(dest_dir, f".{stored}.part"), max_size)
+                state["field"] = _FILE
+            except FileExistsError:
+                errors.append(IsoIngestError("An upload of this ISO is already in progress"))
+            except IsoIngestError as exc:
+                errors.append(exc)
+
+    def on_part_data(data, start, end):
+        if state["field"] is _FILE:
+            pending.extend(data[start:end])
+        elif len(field_data) < 4096:
+            field_data.extend(data[start:end])
+
+    def on_part_end():
+        if state["field"] not in (None, _FILE):
+            fields[state["field"]] = field_data.decode("utf-8", "replace")
+        state["field"] = None
+        state["headers"] = {}
+
+    parser = MultipartParser(boundary, {
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+        "on_part_data": on_part_data,
+        "on_part_end": on_part_end,
+    })
+
+    received = 0
+    try:
+        async for chunk in stream:
+            parser.write(chunk)
+            received += len(chunk)
+            if errors:
+                raise errors[0]
+            if writer is not None and len(pending) >= _WRITE_CHUNK:
+                data = bytes(pending)
+                pending.clear()
+                await loop.run_in_executor(None, writer.write, data)
+                if progress:
+                    progress(received)
+        parser.finalize()
+        if writer is None:
+            raise IsoIngestError(f"No file found in form field '{file_field}'")
+        if pending:
+            await loop.run_in_executor(None, writer.write, bytes(pending))
+        await loop.run_in_executor(None, writer.close)
+        if os.path.exists(final_path):
+            raise IsoIngestError("ISO file already exists")
+        os.replace(writer.path, final_path)
+    except BaseException:
+        if writer is not None:
+            await loop.run_in_executor(None, writer.discard)
+        raise
+
+    return final_path, fields, writer.size, writer.sha.hexdigest()
+
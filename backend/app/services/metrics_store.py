@@ -0,0 +1,241 @@
+"""Tiered node metric store.
+
+Three tiers, each kept for its own retention window:
+
+- raw 5-minute samples (``node_metric_snapshots``) — 7 days
+- 1-hour rollups (``node_metric_rollups``, resolution 3600) — 90 days
+- 1-day rollups (resolution 86400) — 2 years
+
+Rollups carry min / avg / max / p95 per metric and are built from raw samples
+once their bucket has closed, so both tiers can be produced while the raw data
+is still retained. ``query`` picks the finest tier that covers the requested
+range and returns parallel arrays per node from a single SELECT.
+"""
+import logging
+import math
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional
+
+from sqlalchemy import delete, func, select
+
+logger = logging.getLogger(__name__)
+
+RAW = 300
+HOUR = 3600
+DAY = 86400
+
+RETENTION = {
+    RAW: timedelta(days=7),
+    HOUR: timedelta(days=90),
+    DAY: timedelta(days=730),
+}
+
+# rollup column prefix → raw snapshot column
+_METRICS = (("cpu", "cpu_pct"), ("memory", "memory_pct"), ("disk", "disk_pct"))
+_AGGS = ("min", "avg", "max", "p95")
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def _floor(dt: datetime, seconds: int) -> datetime:
+    return _EPOCH + timedelta(seconds=int((dt - _EPOCH).total_seconds()) // seconds * seconds)
+
+
+def _p95(values: List[float]) -> float:
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(0.95 * len(ordered)) - 1)]
+
+
+def _aggregate(values: List[float]) -> Dict[str, Optional[float]]:
+    if not values:
+        return {agg: None for agg in _AGGS}
+    return {
+        "min": min(values),
+        "avg": round(sum(values) / len(values), 2),
+        "max": max(values),
+        "p95": _p95(values),
+    }
+
+
+class NodeMetricsStore:
+    """Write, downsample, prune and range-query node metrics."""
+
+    # ── writes ───────────────────────────────────────────────────────────────
+
+    def record(self, samples: List[Dict[str, Any]]) -> int:
+        """Bulk-insert one batch of raw samples (NodeMetricSnapshot column dicts)."""
+        if not samples:
+            return 0
+        from app.core.database import engine
+        from app.models import NodeMetricSnapshot
+
+        with engine.begin() as conn:
+            conn.execute(NodeMetricSnapshot.__table__.insert(), samples)
+        return len(samples)
+
+    def rollup(self, now: Optional[datetime] = None) -> Dict[int, int]:
+        """Build hourly and daily rollups for every closed bucket not yet rolled up."""
+        now = now or datetime.utcnow()
+        return {res: self._rollup(res, now) for res in (HOUR, DAY)}
+
+    def prune(self, now: Optional[datetime] = None) -> Dict[int, int]:
+        """Drop samples and rollups older than their tier's retention."""
+        from app.core.database import engine
+        from app.models import NodeMetricRollup, NodeMetricSnapshot
+
+        now = now or datetime.utcnow()
+        removed = {}
+        with engine.begin() as conn:
+            removed[RAW] = conn.execute(
+                delete(NodeMetricSnapshot).where(NodeMetricSnapshot.captured_at < now - RETENTION[RAW])
+            ).rowcount
+            for res in (HOUR, DAY):
+                removed[res] = conn.execute(
+                    delete(NodeMetricRollup).where(
+                        NodeMetricRollup.resolution == res,
+                        NodeMetricRollup.bucket_start < now - RETENTION[res],
+                    )
+                ).rowcount
+        return removed
+
+    def _rollup(self, res: int, now: datetime) -> int:
+        from app.core.database import engine
+        from app.models import NodeMetricRollup, NodeMetricSnapshot
+
+        snap = NodeMetricSnapshot.__table__
+        end = _floor(now, res)   # only buckets that have closed
+        with engine.begin() as conn:
+            last = conn.execute(
+                select(func.max(NodeMetricRollup.bucket_start)).where(NodeMetricRollup.resolution == res)
+            ).scalar()
+            if last is not None:
+                start = last + timedelta(seconds=res)
+            else:
+                oldest = conn.execute(select(func.min(snap.c.captured_at))).scalar()
+                if oldest is None:
+                    return 0
+                start = _floor(oldest, res)
+            # Raw data older than its retention is gone — don't emit empty buckets for it
+            start = max(start, _floor(now - RETENTION[RAW], res))
+            if start >= end:
+                return 0
+
+            rows = conn.execute(
+                select(
+                    snap.c.node_id, snap.c.captured_at, snap.c.cpu_pct, snap.c.memory_pct,
+                    snap.c.disk_pct, snap.c.vm_count, snap.c.lxc_count,
+                )
+                .where(snap.c.captured_at >= start, snap.c.captured_at < end)
+                .order_by(snap.c.node_id, snap.c.captured_at)
+            ).all()
+
+            buckets: Dict[tuple, List] = {}
+            for row in rows:
+                buckets.setdefault((row.node_id, _floor(row.captured_at, res)), []).append(row)
+
+            out = []
+            for (node_id, bucket_start), members in buckets.items():
+                record = {
+                    "node_id": node_id,
+                    "resolution": res,
+                    "bucket_start": bucket_start,
+                    "samples": len(members),
+                    "vm_count": max((m.vm_count or 0) for m in members),
+                    "lxc_count": max((m.lxc_count or 0) for m in members),
+                }
+                for prefix, column in _METRICS:
+                    values = [getattr(m, column) for m in members if getattr(m, column) is not None]
+                    for agg, value in _aggregate(values).items():
+                        record[f"{prefix}_{agg}"] = value
+                out.append(record)
+
+            conn.execute(
+                delete(NodeMetricRollup).where(
+                    NodeMetricRollup.resolution == res,
+                    NodeMetricRollup.bucket_start >= start,
+                    NodeMetricRollup.bucket_start < end,
+                )
+            )
+            if out:
+                conn.execute(NodeMetricRollup.__table__.insert(), out)
+        logger.debug("Node metric rollup (%ds): %d bucket(s) from %d sample(s)", res, len(out), len(rows))
+        return len(out)
+
+    # ── reads ────────────────────────────────────────────────────────────────
+
+    @staticmethod
+    def pick_resolution(start: datetime, end: datetime, now: Optional[datetime] = None) -> int:
+        """Finest tier that still holds data for *start* and keeps the series short."""
+        now = now or datetime.utcnow()
+        span = end - start
+        if start >= now - RETENTION[RAW] and span <= timedelta(days=2):
+            return RAW
+        if start >= now - RETENTION[HOUR] and span <= timedelta(days=31):
+            return HOUR
+        return DAY
+
+    def query(
+        self,
+        db,
+        node_ids: Iterable[int],
+        start: datetime,
+        end: Optional[datetime] = None,
+        resolution: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        """Range query for several nodes in one SELECT.
+
+        Returns ``{"resolution": seconds, "nodes": {node_id: series}}`` where
+        each series is ``{"t": [iso…], "cpu": {"min": […], "avg": […], "max": […],
+        "p95": […]}, "memory": {…}, "disk": {…}, "vm_count": […], "lxc_count": […]}``.
+        Raw samples fill min/avg/max/p95 with the sample value.
+        """
+        from app.models import NodeMetricRollup, NodeMetricSnapshot
+
+        end = end or datetime.utcnow()
+        node_ids = [int(n) for n in node_ids]
+        res = resolution or self.pick_resolution(start, end)
+        series: Dict[int, Dict[str, Any]] = {
+            n: {"t": [], **{p: {a: [] for a in _AGGS} for p, _ in _METRICS}, "vm_count": [], "lxc_count": []}
+            for n in node_ids
+        }
+        if not node_ids:
+            return {"resolution": res, "nodes": series}
+
+        if res == RAW:
+            t = NodeMetricSnapshot.__table__
+            rows = db.execute(
+                select(t.c.node_id, t.c.captured_at, t.c.cpu_pct, t.c.memory_pct, t.c.disk_pct,
+                       t.c.vm_count, t.c.lxc_count)
+                .where(t.c.node_id.in_(node_ids), t.c.captured_at >= start, t.c.captured_at <= end)
+                .order_by(t.c.node_id, t.c.captured_at)
+            ).all()
+            for row in rows:
+                s = series[row.node_id]
+                s["t"].append(row.captured_at.isoformat())
+                for prefix, column in _METRICS:
+                    value = getattr(row, column)
+                    for agg in _AGGS:
+                        s[prefix][agg].append(value)
+                s["vm_count"].append(row.vm_count)
+                s["lxc_count"].append(row.lxc_count)
+        else:
+            t = NodeMetricRollup.__table__
+            rows = db.execute(
+                select(t)
+                .where(t.c.resolution == res, t.c.node_id.in_(node_ids),
+                       t.c.bucket_start >= _floor(start, res), t.c.bucket_start <= end)
+                .order_by(t.c.node_id, t.c.bucket_start)
+            ).all()
+            for row in rows:
+                s = series[row.node_id]
+                s["t"].append(row.bucket_start.isoformat())
+                for prefix, _ in _METRICS:
+                    for agg in _AGGS:
+                        s[prefix][agg].append(getattr(row, f"{prefix}_{agg}"))
+                s["vm_count"].append(row.vm_count)
+                s["lxc_count"].append(row.lxc_count)
+        return {"resolution": res, "nodes": series}
+
+
+# Singleton instance
+node_metrics_store = NodeMetricsStore()
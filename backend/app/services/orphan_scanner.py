@@ -0,0 +1,353 @@
+"""Orphaned-disk scanner — storage volumes that no guest config references.
+
+A scan of a large cluster stays cheap for three reasons:
+
+- each host keeps an index of the volume IDs every guest config references.
+  Guests come from the inventory snapshot (one ``/cluster/resources`` call)
+  and only guests that are new, whose node / disk size / lock changed, whose
+  entry is older than ``max_age``, or that were invalidated through the
+  response cache (every Depl0y mutation calls ``pve_cache.invalidate_vm``)
+  have their config fetched — in parallel
+- storage content is listed once per storage: shared storages (Ceph, NFS, …)
+  from one node that reports them available, local storages on every node
+- the orphan list is cached with the index generation it was built from and
+  reused until the generation moves, a storage is invalidated, or it ages out
+
+A guest whose config can't be fetched keeps its previous references; one that
+was never indexed is reported in ``unresolved_guests`` because volumes it owns
+may show up as false orphans.
+"""
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Dict, FrozenSet, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+_DISK_CONTENT = ("images", "rootdir", "subvol")
+
+_DISK_PREFIXES = (
+    "scsi", "virtio", "ide", "sata",   # QEMU disks
+    "rootfs", "mp",                    # LXC disks
+    "efidisk", "tpmstate",
+)
+
+
+def collect_disk_volids(cfg: Dict[str, Any]) -> Set[str]:
+    """Volume IDs referenced by a Proxmox VM/CT config (disks and unusedN)."""
+    result: Set[str] = set()
+    for key, val in cfg.items():
+        if not isinstance(val, str):
+            continue
+        is_disk = key.startswith("unused") or any(
+            key.startswith(pfx) and (key[len(pfx):].isdigit() or key == pfx)
+            for pfx in _DISK_PREFIXES
+        )
+        if is_disk:
+            # volid is the part before the first comma
+            volid = val.split(",")[0].strip()
+            if ":" in volid:  # valid volid format: storage:volume
+                result.add(volid)
+    return result
+
+
+def _fingerprint(guest: Dict[str, Any]) -> Tuple:
+    """Resource fields that move when a guest's disks may have changed."""
+    return (guest.get("node"), guest.get("maxdisk"), guest.get("lock"), guest.get("template"))
+
+
+@dataclass
+class _GuestRefs:
+    node: str
+    guest_type: str
+    vmid: int
+    fingerprint: Tuple
+    volids: FrozenSet[str]
+    fetched_at: float
+
+
+@dataclass
+class _HostIndex:
+    guests: Dict[str, _GuestRefs] = field(default_factory=dict)   # "qemu/101" → refs
+    dirty_vmids: Set[int] = field(default_factory=set)
+    all_dirty: bool = False
+    storage_dirty: bool = False
+    generation: int = 0
+    result: Optional[Dict[str, Any]] = None
+    result_at: float = 0.0
+    scan_lock: threading.Lock = field(default_factory=threading.Lock)
+
+
+class OrphanScanner:
+    """Per-host referenced-volume index plus a cached orphan list."""
+
+    def __init__(self, max_workers: int = 12, max_age: float = 1800.0, result_ttl: float = 300.0):
+        self._max_workers = max_workers
+        self._max_age = max_age
+        self._result_ttl = result_ttl
+        self._indexes: Dict[int, _HostIndex] = {}
+        self._lock = threading.Lock()
+        self._listening = False
+        self._scans = 0
+        self._cached_hits = 0
+        self._configs_fetched = 0
+
+    # ── public API ───────────────────────────────────────────────────────────
+
+    def scan(self, host, refresh: bool = False) -> Dict[str, Any]:
+        """Orphaned volumes for *host*; ``refresh`` rebuilds the index and listing."""
+        from app.services.inventory import fetch_host_inventory, inventory_poller
+        from app.services.proxmox import ProxmoxService
+
+        self._listen()
+        index = self._index(host.id)
+        with index.scan_lock:
+            started = time.time()
+            inv = inventory_poller.get_snapshot(host.id, max_age=60)
+            if inv is None:
+                inv = fetch_host_inventory(host)
+            pve = ProxmoxService(host).proxmox
+
+            stats = self._sync(index, inv, pve, refresh)
+            with self._lock:
+                reusable = (
+                    not refresh and index.result is not None and not index.storage_dirty
+                    and index.result["generation"] == index.generation
+                    and time.time() - index.result_at < self._result_ttl
+                )
+                if reusable:
+                    self._cached_hits += 1
+                    return {**index.result, "cached": True}
+                generation = index.generation
+                index.storage_dirty = False
+                referenced: Set[str] = set()
+                for refs in index.guests.values():
+                    referenced |= refs.volids
+
+            orphans, storage_stats = self._list_orphans(inv, pve, referenced)
+            result = {
+                "host_id": host.id,
+                "orphans": orphans,
+                "count": len(orphans),
+                "generation": generation,
+                "scanned_at": datetime.utcnow().isoformat(),
+                "cached": False,
+                "unresolved_guests": stats.pop("unresolved"),
+                "stats": {**stats, **storage_stats, "duration_ms": int((time.time() - started) * 1000)},
+            }
+            with self._lock:
+                index.result = result
+                index.result_at = time.time()
+                self._scans += 1
+            logger.info(
+                "Orphan scan host %s: %d orphan(s), %d config(s) fetched, %d storage(s) listed in %d ms",
+                host.id, len(orphans), stats["configs_fetched"], storage_stats["storages_listed"],
+                result["stats"]["duration_ms"],
+            )
+            return result
+
+    def invalidate(self, host_id: Optional[int] = None) -> None:
+        """Force a full rebuild on the next scan of *host_id* (or every host)."""
+        with self._lock:
+            for hid, index in self._indexes.items():
+                if host_id is None or hid == host_id:
+                    index.all_dirty = True
+                    index.storage_dirty = True
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "hosts": {
+                    hid: {"guests": len(ix.guests), "generation": ix.generation,
+                          "dirty_guests": len(ix.dirty_vmids), "all_dirty": ix.all_dirty,
+                          "result_age_seconds": round(time.time() - ix.result_at, 1) if ix.result else None}
+                    for hid, ix in self._indexes.items()
+                },
+                "scans": self._scans,
+                "cached_hits": self._cached_hits,
+                "configs_fetched": self._configs_fetched,
+            }
+
+    # ── index maintenance ────────────────────────────────────────────────────
+
+    def _index(self, host_id: int) -> _HostIndex:
+        with self._lock:
+            return self._indexes.setdefault(host_id, _HostIndex())
+
+    def _listen(self) -> None:
+        if self._listening:
+            return
+        from app.core.cache import pve_cache
+
+        with self._lock:
+            if self._listening:
+                return
+            pve_cache.add_listener(self._on_invalidate)
+            self._listening = True
+
+    def _on_invalidate(self, tags: Tuple[str, ...], prefix: Optional[str]) -> None:
+        """Map response-cache invalidations onto the index."""
+        with self._lock:
+            if prefix is not None:
+                for hid, index in self._indexes.items():
+                    host_prefix = f"pve:{hid}:"
+                    if host_prefix.startswith(prefix):
+                        # "", "pve:" or exactly this host — anything may have changed
+                        index.all_dirty = True
+                        index.storage_dirty = True
+                    elif prefix.startswith(host_prefix):
+                        index.storage_dirty = True
+                return
+            for tag in tags:
+                parts = tag.split(":")
+                # vm_tag(): "pve:{host_id}:vm:{vmid}"
+                if len(parts) == 4 and parts[0] == "pve" and parts[2] == "vm":
+                    index = self._indexes.get(int(parts[1])) if parts[1].isdigit() else None
+                    if index is not None and parts[3].isdigit():
+                        index.dirty_vmids.add(int(parts[3]))
+
+    def _sync(self, index: _HostIndex, inv, pve, refresh: bool) -> Dict[str, Any]:
+        """Bring *index* in line with the inventory, fetching stale configs in parallel."""
+        now = time.time()
+        with self._lock:
+            full = refresh or index.all_dirty
+            dirty = set(index.dirty_vmids)
+            index.dirty_vmids.clear()
+            index.all_dirty = False
+            current = {}
+            stale: List[Dict[str, Any]] = []
+            for guest in inv.guests:
+                if not guest.get("vmid") or not guest.get("node"):
+                    continue
+                key = f"{guest.get('type')}/{guest['vmid']}"
+                current[key] = guest
+                refs = index.guests.get(key)
+                if (full or refs is None or refs.vmid in dirty
+                        or refs.fingerprint != _fingerprint(guest)
+                        or now - refs.fetched_at > self._max_age):
+                    stale.append(guest)
+            removed = [key for key in index.guests if key not in current]
+            for key in removed:
+                del index.guests[key]
+            changed = bool(removed)
+
+        def _fetch(guest) -> Tuple[Dict[str, Any], Optional[Set[str]]]:
+            try:
+                res = getattr(pve.nodes(guest["node"]), guest["type"])(guest["vmid"])
+                return guest, collect_disk_volids(res.config.get() or {})
+            except Exception as e:
+                logger.debug("Orphan scan: config of %s/%s failed: %s", guest["type"], guest["vmid"], e)
+                return guest, None
+
+        fetched: List[Tuple[Dict[str, Any], Optional[Set[str]]]] = []
+        if stale:
+            with ThreadPoolExecutor(max_workers=min(self._max_workers, len(stale))) as pool:
+                fetched = list(pool.map(_fetch, stale))
+
+        errors = 0
+        unresolved = []
+        with self._lock:
+            for guest, volids in fetched:
+                key = f"{guest['type']}/{guest['vmid']}"
+                refs = index.guests.get(key)
+                if volids is None:
+                    errors += 1
+                    if refs is None:
+                        unresolved.append({"vmid": guest["vmid"], "type": guest["type"], "node": guest["node"]})
+                    else:
+                        # Keep the old references, but retry on the next scan
+                        index.dirty_vmids.add(refs.vmid)
+                    continue
+                volids = frozenset(volids)
+                if refs is None or refs.volids != volids:
+                    changed = True
+                index.guests[key] = _GuestRefs(
+                    node=guest["node"], guest_type=guest["type"], vmid=int(guest["vmid"]),
+                    fingerprint=_fingerprint(guest), volids=volids, fetched_at=now,
+                )
+            if changed or unresolved:
+                index.generation += 1
+            self._configs_fetched += len(fetched) - errors
+        return {
+            "guests": len(current),
+            "configs_fetched": len(fetched) - errors,
+            "config_errors": errors,
+            "full_rebuild": full,
+            "unresolved": unresolved,
+        }
+
+    # ── storage listing ──────────────────────────────────────────────────────
+
+    @staticmethod
+    def _storage_targets(inv) -> List[Tuple[str, str, bool]]:
+        """(node, storage, shared) to list — shared storages once, on one node."""
+        online = {name for name, fields in inv.nodes.items() if fields.get("status") == "online"}
+        targets: List[Tuple[str, str, bool]] = []
+        shared_seen: Set[str] = set()
+        for st in sorted(inv.storage, key=lambda s: (s.get("node") or "", s.get("storage") or "")):
+            node, name = st.get("node"), st.get("storage")
+            if not node or not name or (online and node not in online):
+                continue
+            if st.get("status") not in (None, "available"):
+                continue
+            content = st.get("content")
+            if content and not any(c in content.split(",") for c in _DISK_CONTENT):
+                continue
+            shared = bool(st.get("shared"))
+            if shared:
+                if name in shared_seen:
+                    continue
+                shared_seen.add(name)
+            targets.append((node, name, shared))
+        return targets
+
+    def _list_orphans(self, inv, pve, referenced: Set[str]) -> Tuple[List[Dict[str, Any]], Dict[str, int]]:
+        targets = self._storage_targets(inv)
+
+        def _list(target):
+            node, name, shared = target
+            try:
+                return target, pve.nodes(node).storage(name).content.get() or []
+            except Exception as e:
+                logger.debug("Orphan scan: listing %s on %s failed: %s", name, node, e)
+                return target, None
+
+        listed = []
+        if targets:
+            with ThreadPoolExecutor(max_workers=min(self._max_workers, len(targets))) as pool:
+                listed = list(pool.map(_list, targets))
+
+        orphans = []
+        errors = 0
+        for (node, name, shared), volumes in listed:
+            if volumes is None:
+                errors += 1
+                continue
+            for vol in volumes:
+                volid = vol.get("volid", "")
+                content_type = vol.get("content", "")
+                # Only look at disk-type content (images, rootdir, subvol)
+                if content_type not in _DISK_CONTENT:
+                    continue
+                if volid and volid not in referenced:
+                    orphans.append({
+                        "node": node,
+                        "storage": name,
+                        "shared": shared,
+                        "volid": volid,
+                        "vmid": vol.get("vmid"),
+                        "format": vol.get("format", ""),
+                        "size": vol.get("size", 0),
+                        "content": content_type,
+                        "ctime": vol.get("ctime"),
+                    })
+        return orphans, {"storages_listed": len(listed) - errors, "storage_errors": errors}
+
+
+# Singleton instance
+orphan_scanner = OrphanScanner()
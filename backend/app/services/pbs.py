@@ -14,6 +14,7 @@ import requests
 import urllib3
 
 from app.core.security import decrypt_data
+from app.core.telemetry import TimedHTTPAdapter
 from app.models.database import PBSServer
 
 logger = logging.getLogger(__name__)
@@ -34,6 +35,7 @@ class PBSService:
         self.verify_ssl = server.verify_ssl
         self.session = requests.Session()
         self.session.verify = self.verify_ssl
+        self.session.mount("https://", TimedHTTPAdapter("pbs"))
         self._uses_ticket = False
         self.session.headers.update(self._build_auth_header())
 
@@ -0,0 +1,507 @@
+"""Guest placement optimizer — history-aware rebalancing plans for a cluster.
+
+Each running guest gets a demand vector (CPU cores, memory bytes) from the
+percentile of its recorded history (``guest_metrics``), falling back to the
+instantaneous ``/cluster/resources`` value for guests without history. Nodes
+are bins with CPU and memory capacity; a move is only feasible if the target
+stays under both limits, the guest's HA group / node-affinity rules allow the
+target, no anti-affinity partner already runs there, and any local disks have
+the same storage on the target.
+
+The cluster score is the spread (standard deviation, in percentage points) of
+node CPU and memory utilisation plus a penalty for nodes above the limits —
+lower is better. The planner greedily applies the move with the best score
+gain per unit of migration cost (RAM to copy plus local disk to copy) until no
+move improves the score, so the plan is ordered and each step is feasible
+given the steps before it. One move shifts the score by less the more nodes
+and guests a cluster has, so ``min_gain`` applies to the whole plan: a plan
+that improves the score by less than that is noise and is not proposed.
+Per-node sums of utilisation and squared utilisation make a move's score
+delta O(1), and only guests on above-average nodes are tried against
+below-average nodes, so a pass stays cheap with thousands of guests.
+"""
+from __future__ import annotations
+
+import logging
+import math
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+_GiB = 1024 ** 3
+_DIMS = ("cpu", "mem")
+# A single move must improve the score by more than float noise
+_MIN_STEP_GAIN = 1e-6
+
+
+# ── data model ──────────────────────────────────────────────────────────────
+
+@dataclass
+class PlacementNode:
+    name: str
+    cpu_capacity: float                 # cores
+    mem_capacity: float                 # bytes
+    cpu_base: float = 0.0               # load not attributed to any guest
+    mem_base: float = 0.0
+    local_storage: Set[str] = field(default_factory=set)
+
+
+@dataclass
+class PlacementGuest:
+    vmid: int
+    name: str
+    guest_type: str                     # qemu / lxc
+    node: str
+    cpu: float                          # demand in cores
+    mem: float                          # demand in bytes
+    mem_allocated: float = 0.0
+    from_history: bool = False
+    local_disks: Dict[str, float] = field(default_factory=dict)   # storage → bytes
+    allowed_nodes: Optional[Set[str]] = None                      # None = any node
+    anti_affinity: Set[int] = field(default_factory=set)          # vmids that must not share a node
+    movable: bool = True
+    pinned_reason: Optional[str] = None
+
+    @property
+    def migration_bytes(self) -> float:
+        local = sum(self.local_disks.values())
+        # Containers migrate in restart mode — only their volumes are copied
+        return local if self.guest_type == "lxc" else self.mem + local
+
+
+# ── scoring ─────────────────────────────────────────────────────────────────
+
+class _ClusterState:
+    """Node loads plus running sums so one move's score delta is O(1)."""
+
+    def __init__(self, nodes: List[PlacementNode], guests: List[PlacementGuest],
+                 cpu_limit: float, mem_limit: float):
+        self.nodes = {n.name: n for n in nodes}
+        self.limits = {"cpu": cpu_limit, "mem": mem_limit}
+        self.load = {n.name: {"cpu": n.cpu_base, "mem": n.mem_base} for n in nodes}
+        self.placement: Dict[int, str] = {}
+        self.on_node: Dict[str, Set[int]] = {n.name: set() for n in nodes}
+        for g in guests:
+            if g.node in self.load:
+                self.load[g.node]["cpu"] += g.cpu
+                self.load[g.node]["mem"] += g.mem
+                self.placement[g.vmid] = g.node
+                self.on_node[g.node].add(g.vmid)
+        self.s1 = {d: 0.0 for d in _DIMS}
+        self.s2 = {d: 0.0 for d in _DIMS}
+        self.penalty = 0.0
+        for name in self.nodes:
+            self._account(name, 1)
+
+    def util(self, name: str, dim: str, extra: float = 0.0) -> float:
+        node = self.nodes[name]
+        cap = node.cpu_capacity if dim == "cpu" else node.mem_capacity
+        return (self.load[name][dim] + extra) / cap if cap else 0.0
+
+    def _penalty(self, u: float, dim: str) -> float:
+        over = u - self.limits[dim]
+        return over * over * 10 if over > 0 else 0.0
+
+    def _account(self, name: str, sign: int) -> None:
+        for d in _DIMS:
+            u = self.util(name, d)
+            self.s1[d] += sign * u
+            self.s2[d] += sign * u * u
+            self.penalty += sign * self._penalty(u, d)
+
+    def _score(self, s1: Dict[str, float], s2: Dict[str, float], penalty: float) -> float:
+        n = len(self.nodes)
+        if not n:
+            return 0.0
+        variance = sum(max(0.0, s2[d] / n - (s1[d] / n) ** 2) for d in _DIMS) / len(_DIMS)
+        return math.sqrt(variance) * 100 + penalty * 100
+
+    def score(self) -> float:
+        return self._score(self.s1, self.s2, self.penalty)
+
+    def mean(self, dim: str) -> float:
+        return self.s1[dim] / len(self.nodes) if self.nodes else 0.0
+
+    def target_table(self, targets: List[str]) -> Dict[str, Tuple[float, ...]]:
+        """Per-target ``(cpu util, mem util, cpu capacity, mem capacity, penalty)`` for best_target."""
+        table = {}
+        for name in targets:
+            node = self.nodes[name]
+            u_cpu, u_mem = self.util(name, "cpu"), self.util(name, "mem")
+            table[name] = (u_cpu, u_mem, node.cpu_capacity, node.mem_capacity,
+                           self._penalty(u_cpu, "cpu") + self._penalty(u_mem, "mem"))
+        return table
+
+    def best_target(self, g: PlacementGuest, targets: List[str],
+                    table: Dict[str, Tuple[float, ...]]) -> Optional[Tuple[float, str]]:
+        """Lowest projected score over *targets* for moving *g*, as ``(score, node)``.
+
+        The source side of the delta is computed once; each target then costs a
+        handful of float operations on the precomputed *table*.
+        """
+        source = self.placement[g.vmid]
+        n = len(self.nodes)
+        cpu_limit, mem_limit = self.limits["cpu"], self.limits["mem"]
+        pen_base = self.penalty
+        sums = []
+        for d, demand in (("cpu", g.cpu), ("mem", g.mem)):
+            u_old, u_new = self.util(source, d), self.util(source, d, -demand)
+            sums.append((self.s1[d] - u_old + u_new, self.s2[d] - u_old * u_old + u_new * u_new))
+            pen_base += self._penalty(u_new, d) - self._penalty(u_old, d)
+        (s1_cpu, s2_cpu), (s1_mem, s2_mem) = sums
+
+        best: Optional[Tuple[float, str]] = None
+        for target in targets:
+            u_cpu, u_mem, cap_cpu, cap_mem, pen_old = table[target]
+            new_cpu = u_cpu + (g.cpu / cap_cpu if cap_cpu else 0.0)
+            new_mem = u_mem + (g.mem / cap_mem if cap_mem else 0.0)
+            if new_cpu > cpu_limit or new_mem > mem_limit:
+                continue
+            m_cpu = (s1_cpu - u_cpu + new_cpu) / n
+            m_mem = (s1_mem - u_mem + new_mem) / n
+            variance = (max(0.0, (s2_cpu - u_cpu * u_cpu + new_cpu * new_cpu) / n - m_cpu * m_cpu)
+                        + max(0.0, (s2_mem - u_mem * u_mem + new_mem * new_mem) / n - m_mem * m_mem))
+            # Targets are under both limits after the move, so their penalty drops to zero
+            score = math.sqrt(variance / 2) * 100 + (pen_base - pen_old) * 100
+            if best is None or score < best[0]:
+                best = (score, target)
+        return best
+
+    def move(self, g: PlacementGuest, target: str) -> None:
+        source = self.placement[g.vmid]
+        self._account(source, -1)
+        self._account(target, -1)
+        self.load[source]["cpu"] -= g.cpu
+        self.load[source]["mem"] -= g.mem
+        self.load[target]["cpu"] += g.cpu
+        self.load[target]["mem"] += g.mem
+        self._account(source, 1)
+        self._account(target, 1)
+        self.on_node[source].discard(g.vmid)
+        self.on_node[target].add(g.vmid)
+        self.placement[g.vmid] = target
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        return {name: {"cpu_pct": round(self.util(name, "cpu") * 100, 1),
+                       "mem_pct": round(self.util(name, "mem") * 100, 1)}
+                for name in self.nodes}
+
+
+# ── planner ─────────────────────────────────────────────────────────────────
+
+def plan_placement(
+    nodes: List[PlacementNode],
+    guests: List[PlacementGuest],
+    max_moves: int = 10,
+    min_gain: float = 0.1,
+    cpu_limit: float = 0.85,
+    mem_limit: float = 0.90,
+    cost_weight: float = 0.05,
+) -> Dict[str, Any]:
+    """Greedy minimal migration plan for *guests* across *nodes*.
+
+    *min_gain* is the score improvement (percentage points of utilisation
+    spread) the whole plan must reach, otherwise no moves are proposed;
+    *cost_weight* discounts a move's gain per GiB it has to copy.
+    """
+    state = _ClusterState(nodes, guests, cpu_limit, mem_limit)
+    before_nodes = state.snapshot()
+    score_before = state.score()
+    by_vmid = {g.vmid: g for g in guests}
+    moved: Set[int] = set()
+    plan: List[Dict[str, Any]] = []
+
+    while len(plan) < max_moves and len(state.nodes) > 1:
+        current = state.score()
+        means = {d: state.mean(d) for d in _DIMS}
+        sources = [n for n in state.nodes
+                   if any(state.util(n, d) > means[d] or state.util(n, d) > state.limits[d] for d in _DIMS)]
+        targets = [n for n in state.nodes if any(state.util(n, d) < means[d] for d in _DIMS)]
+
+        table = state.target_table(targets)
+        best: Optional[Tuple[float, float, PlacementGuest, str]] = None
+        for source in sources:
+            open_targets = [t for t in targets if t != source]
+            for vmid in sorted(state.on_node[source]):
+                g = by_vmid[vmid]
+                if not g.movable or vmid in moved:
+                    continue
+                if g.allowed_nodes is None and not g.local_disks and not g.anti_affinity:
+                    allowed = open_targets
+                else:
+                    allowed = [
+                        t for t in open_targets
+                        if (g.allowed_nodes is None or t in g.allowed_nodes)
+                        and all(disk in state.nodes[t].local_storage for disk in g.local_disks)
+                        and not (g.anti_affinity & state.on_node[t])
+                    ]
+                found = state.best_target(g, allowed, table) if allowed else None
+                if found is None:
+                    continue
+                gain = current - found[0]
+                if gain <= _MIN_STEP_GAIN:
+                    continue
+                value = gain / (1 + cost_weight * g.migration_bytes / _GiB)
+                if best is None or value > best[0]:
+                    best = (value, gain, g, found[1])
+        if best is None:
+            break
+
+        _, gain, g, target = best
+        source = state.placement[g.vmid]
+        state.move(g, target)
+        moved.add(g.vmid)
+        plan.append({
+            "step": len(plan) + 1,
+            "vmid": g.vmid,
+            "name": g.name,
+            "type": g.guest_type,
+            "from_node": source,
+            "to_node": target,
+            "online": g.guest_type == "qemu",
+            "with_local_disks": bool(g.local_disks),
+            "local_storage": sorted(g.local_disks),
+            "cpu_cores": round(g.cpu, 2),
+            "mem_gb": round(g.mem / _GiB, 2),
+            "migration_gb": round(g.migration_bytes / _GiB, 2),
+            "demand_source": "history" if g.from_history else "instant",
+            "gain": round(gain, 3),
+            "score_after": round(state.score(), 2),
+        })
+
+    after_nodes = state.snapshot()
+    score_after = state.score()
+    if score_before - score_after < min_gain:
+        plan, after_nodes, score_after = [], before_nodes, score_before
+    return {
+        "balance_score_before": round(score_before, 2),
+        "balance_score_after": round(score_after, 2),
+        "plan": plan,
+        "nodes": [
+            {"node": name, **{f"{k}_before": v for k, v in before_nodes[name].items()},
+             **{f"{k}_after": v for k, v in after_nodes[name].items()}}
+            for name in sorted(state.nodes)
+        ],
+        "pinned": sorted(
+            ({"vmid": g.vmid, "name": g.name, "reason": g.pinned_reason}
+             for g in guests if not g.movable and g.pinned_reason),
+            key=lambda p: p["vmid"],
+        ),
+    }
+
+
+# ── input collection ────────────────────────────────────────────────────────
+
+def _parse_node_list(raw: Optional[str]) -> Dict[str, int]:
+    """``"pve1:2,pve2"`` → ``{"pve1": 2, "pve2": 0}``."""
+    out: Dict[str, int] = {}
+    for part in (raw or "").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        name, _, prio = part.partition(":")
+        try:
+            out[name] = int(prio) if prio else 0
+        except ValueError:
+            out[name] = 0
+    return out
+
+
+def _sid_vmid(sid: str) -> Optional[int]:
+    _, _, vmid = str(sid).partition(":")
+    try:
+        return int(vmid)
+    except ValueError:
+        return None
+
+
+def _allowed_from_preferences(prefs: Dict[str, int], strict: bool, failback: bool,
+                              online: Set[str]) -> Optional[Set[str]]:
+    """Nodes an HA-managed guest can be moved to without HA moving it back."""
+    if not prefs:
+        return None
+    candidates = {n for n in prefs if n in online}
+    if failback and candidates:
+        # HA migrates the guest back to its highest-priority online node
+        top = max(prefs[n] for n in candidates)
+        return {n for n in candidates if prefs[n] == top}
+    if strict:
+        return candidates
+    return None
+
+
+def apply_ha_constraints(pve, guests: Dict[int, PlacementGuest], online: Set[str]) -> None:
+    """Restrict targets from HA groups (PVE ≤ 8) and HA rules (PVE 9+)."""
+    try:
+        resources = pve.cluster.ha.resources.get() or []
+    except Exception as e:
+        logger.debug(f"HA resources unavailable: {e}")
+        resources = []
+
+    groups: Dict[str, Dict[str, Any]] = {}
+    try:
+        groups = {g.get("group"): g for g in (pve.cluster.ha.groups.get() or [])}
+    except Exception as e:
+        logger.debug(f"HA groups unavailable: {e}")
+
+    for res in resources:
+        vmid = _sid_vmid(res.get("sid", ""))
+        g = guests.get(vmid)
+        if g is None or res.get("state") == "ignored":
+            continue
+        group = groups.get(res.get("group"))
+        if not group:
+            continue
+        allowed = _allowed_from_preferences(
+            _parse_node_list(group.get("nodes")),
+            strict=bool(int(group.get("restricted") or 0)),
+            failback=not int(group.get("nofailback") or 0),
+            online=online,
+        )
+        if allowed is not None:
+            g.allowed_nodes = allowed if g.allowed_nodes is None else g.allowed_nodes & allowed
+
+    try:
+        rules = pve.cluster.ha.rules.get() or []
+    except Exception:
+        rules = []
+    failback = {_sid_vmid(r.get("sid", "")): bool(int(r.get("failback", 1) or 0)) for r in resources}
+    for rule in rules:
+        if int(rule.get("disable") or 0):
+            continue
+        members = [v for v in (_sid_vmid(s) for s in str(rule.get("resources") or "").split(",")) if v in guests]
+        if rule.get("type") == "node-affinity":
+            prefs = _parse_node_list(rule.get("nodes"))
+            for vmid in members:
+                allowed = _allowed_from_preferences(
+                    prefs, strict=bool(int(rule.get("strict") or 0)),
+                    failback=failback.get(vmid, True), online=online,
+                )
+                if allowed is not None:
+                    g = guests[vmid]
+                    g.allowed_nodes = allowed if g.allowed_nodes is None else g.allowed_nodes & allowed
+        elif rule.get("type") == "resource-affinity":
+            if rule.get("affinity") == "negative":
+                for vmid in members:
+                    guests[vmid].anti_affinity.update(m for m in members if m != vmid)
+            elif rule.get("affinity") == "positive" and len(members) > 1:
+                # Moving one member alone would break the rule — keep the set in place
+                for vmid in members:
+                    guests[vmid].movable = False
+                    guests[vmid].pinned_reason = "HA positive resource affinity"
+
+    for g in guests.values():
+        if g.movable and g.allowed_nodes is not None and not (g.allowed_nodes - {g.node}):
+            g.movable = False
+            g.pinned_reason = "HA placement allows no other node"
+
+
+def collect_local_disks(pve, storage: List[Dict[str, Any]], guests: Dict[int, PlacementGuest]) -> Dict[str, Set[str]]:
+    """Attach local (non-shared) volume sizes to guests; return node → local storage ids.
+
+    One content listing per local storage per node instead of one config read per guest.
+    """
+    local_by_node: Dict[str, Set[str]] = {}
+    for s in storage:
+        if int(s.get("shared") or 0) or s.get("status") not in (None, "available"):
+            continue
+        content = str(s.get("content") or "")
+        if "images" not in content and "rootdir" not in content:
+            continue
+        node, sid = s.get("node"), s.get("storage")
+        if not node or not sid:
+            continue
+        local_by_node.setdefault(node, set()).add(sid)
+        try:
+            volumes = pve.nodes(node).storage(sid).content.get() or []
+        except Exception as e:
+            logger.debug(f"Storage content unavailable for {node}/{sid}: {e}")
+            continue
+        for vol in volumes:
+            if vol.get("content") not in ("images", "rootdir"):
+                continue
+            try:
+                vmid = int(vol.get("vmid"))
+            except (TypeError, ValueError):
+                continue
+            g = guests.get(vmid)
+            if g is not None and g.node == node:
+                g.local_disks[sid] = g.local_disks.get(sid, 0.0) + float(vol.get("size") or 0)
+    return local_by_node
+
+
+def build_placement_inputs(
+    db,
+    host,
+    pve,
+    history_hours: int = 24,
+    percentile: float = 95.0,
+    include_containers: bool = False,
+) -> Tuple[List[PlacementNode], List[PlacementGuest]]:
+    """Read nodes, running guests, HA constraints and storage locality for one host."""
+    from app.services.guest_metrics import guest_metrics
+
+    resources = pve.cluster.resources.get() or []
+    node_res = [r for r in resources if r.get("type") == "node" and r.get("status") == "online"]
+    guest_res = [r for r in resources
+                 if r.get("type") in ("qemu", "lxc") and r.get("status") == "running" and not r.get("template")]
+    storage_res = [r for r in resources if r.get("type") == "storage"]
+    online = {r.get("node") for r in node_res}
+
+    end = datetime.utcnow()
+    try:
+        history = guest_metrics.percentiles(
+            db, host.id, end - timedelta(hours=history_hours), end, q=percentile / 100,
+        )
+    except Exception as e:
+        logger.warning(f"Guest metric history unavailable for host {host.name}: {e}")
+        history = {}
+
+    guests: Dict[int, PlacementGuest] = {}
+    for r in guest_res:
+        if r.get("node") not in online:
+            continue
+        vmid = int(r["vmid"])
+        maxcpu = float(r.get("maxcpu") or 0)
+        maxmem = float(r.get("maxmem") or 0)
+        hist = history.get(vmid) or {}
+        cpu_pct, mem_pct = hist.get("cpu"), hist.get("memory")
+        g = PlacementGuest(
+            vmid=vmid,
+            name=r.get("name") or str(vmid),
+            guest_type=r.get("type"),
+            node=r.get("node"),
+            cpu=(cpu_pct / 100 * maxcpu) if cpu_pct is not None else float(r.get("cpu") or 0) * maxcpu,
+            mem=(mem_pct / 100 * maxmem) if mem_pct is not None and maxmem else float(r.get("mem") or 0),
+            mem_allocated=maxmem,
+            from_history=cpu_pct is not None,
+        )
+        if r.get("lock"):
+            g.movable, g.pinned_reason = False, f"locked ({r.get('lock')})"
+        elif g.guest_type == "lxc" and not include_containers:
+            g.movable, g.pinned_reason = False, "container (migration needs a restart)"
+        guests[vmid] = g
+
+    nodes = []
+    for r in node_res:
+        name = r.get("node")
+        on_node = [gr for gr in guest_res if gr.get("node") == name]
+        guest_cpu = sum(float(gr.get("cpu") or 0) * float(gr.get("maxcpu") or 0) for gr in on_node)
+        guest_mem = sum(float(gr.get("mem") or 0) for gr in on_node)
+        maxcpu = float(r.get("maxcpu") or 0)
+        nodes.append(PlacementNode(
+            name=name,
+            cpu_capacity=maxcpu,
+            mem_capacity=float(r.get("maxmem") or 0),
+            # Host overhead: node usage the guests don't account for
+            cpu_base=max(0.0, float(r.get("cpu") or 0) * maxcpu - guest_cpu),
+            mem_base=max(0.0, float(r.get("mem") or 0) - guest_mem),
+        ))
+
+    apply_ha_constraints(pve, guests, online)
+    local_by_node = collect_local_disks(pve, storage_res, guests)
+    for n in nodes:
+        n.local_storage = local_by_node.get(n.name, set())
+    return nodes, list(guests.values())
@@ -3,9 +3,9 @@ from typing import List, Dict, Optional, Any
 from proxmoxer import ProxmoxAPI
 from proxmoxer.core import ResourceException
 from sqlalchemy.orm import Session
-from app.models import ProxmoxHost, ProxmoxNode
+from app.models import ProxmoxHost
 from app.core.security import decrypt_data
-from datetime import datetime
+from app.services.proxmox_pool import proxmox_pool
 import logging
 
 logger = logging.getLogger(__name__)
@@ -32,56 +32,60 @@ def is_cloud_template(vm: Dict[str, Any]) -> bool:
     return False
 
 
+def _connect(host: ProxmoxHost) -> ProxmoxAPI:
+    """Build a new ProxmoxAPI client for a host (token auth preferred, password fallback)."""
+    # Check if using API token (preferred for 2FA-enabled Proxmox)
+    if host.api_token_id and host.api_token_secret:
+        try:
+            token_secret = decrypt_data(host.api_token_secret)
+        except Exception:
+            token_secret = host.api_token_secret
+
+        # Extract token name and user from token ID
+        # Token ID can be "tokenname" or "user@realm!tokenname"
+        if '!' in host.api_token_id:
+            token_parts = host.api_token_id.split('!')
+            token_user = token_parts[0]  # e.g., "root@pam"
+            token_name = token_parts[1]   # e.g., "depl0y"
+        else:
+            token_user = host.username
+            token_name = host.api_token_id
+
+        logger.info(f"Connecting to Proxmox {host.hostname} with token auth: user={token_user}, token_name={token_name}")
+
+        return ProxmoxAPI(
+            host.hostname,
+            user=token_user,
+            token_name=token_name,
+            token_value=token_secret,
+            port=host.port,
+            verify_ssl=host.verify_ssl,
+            timeout=30,  # Increase timeout to 30 seconds for slow operations
+        )
+
+    # Fall back to password authentication
+    try:
+        password = decrypt_data(host.password)
+    except Exception:
+        password = host.password
+
+    return ProxmoxAPI(
+        host.hostname,
+        user=host.username,
+        password=password,
+        port=host.port,
+        verify_ssl=host.verify_ssl,
+        timeout=30,  # Increase timeout to 30 seconds for slow operations
+    )
+
+
 class ProxmoxService:
     """Service for interacting with Proxmox VE"""
 
     def __init__(self, host: ProxmoxHost):
-        """Initialize Proxmox connection"""
+        """Attach to the pooled Proxmox client for this host (built on first use)."""
         self.host = host
-
-        # Check if using API token (preferred for 2FA-enabled Proxmox)
-        if host.api_token_id and host.api_token_secret:
-            try:
-                token_secret = decrypt_data(host.api_token_secret)
-            except Exception:
-                token_secret = host.api_token_secret
-
-            # Extract token name and user from token ID
-            # Token ID can be "tokenname" or "user@realm!tokenname"
-            if '!' in host.api_token_id:
-                token_parts = host.api_token_id.split('!')
-                token_user = token_parts[0]  # e.g., "root@pam"
-                token_name = token_parts[1]   # e.g., "depl0y"
-            else:
-                token_user = host.username
-                token_name = host.api_token_id
-
-            logger.info(f"Connecting to Proxmox {host.hostname} with token auth: user={token_user}, token_name={token_name}")
-
-            self.proxmox = ProxmoxAPI(
-                host.hostname,
-                user=token_user,
-                token_name=token_name,
-                token_value=token_secret,
-                port=host.port,
-                verify_ssl=host.verify_ssl,
-                timeout=30,  # Increase timeout to 30 seconds for slow operations
-            )
-        else:
-            # Fall back to password authentication
-            try:
-                password = decrypt_data(host.password)
-            except Exception:
-                password = host.password
-
-            self.proxmox = ProxmoxAPI(
-                host.hostname,
-                user=host.username,
-                password=password,
-                port=host.port,
-                verify_ssl=host.verify_ssl,
-                timeout=30,  # Increase timeout to 30 seconds for slow operations
-            )
+        self.proxmox = proxmox_pool.acquire(host, _connect)
 
     def test_connection(self) -> bool:
         """Test connection to Proxmox host"""
@@ -92,6 +96,9 @@ class ProxmoxService:
         except Exception as e:
             logger.error(f"Failed to connect to Proxmox host {self.host.name}: {str(e)}")
             logger.error(f"Connection details: hostname={self.host.hostname}, port={self.host.port}, using_token={bool(self.host.api_token_id)}")
+            # Drop the pooled client so the next call reconnects from scratch
+            if self.host.id is not None:
+                proxmox_pool.invalidate(self.host.id)
             return False
 
     def get_nodes(self) -> List[Dict[str, Any]]:
@@ -854,80 +861,28 @@ class ProxmoxService:
 
 
 def poll_proxmox_resources(db: Session, host_id: int) -> bool:
-    """Poll Proxmox host for current resource status"""
+    """Poll Proxmox host for current resource status.
+
+    Uses a single ``/cluster/resources`` call via the inventory poller; only
+    node rows whose values changed are rewritten.
+    """
+    from app.services.inventory import inventory_poller
+
     try:
         host = db.query(ProxmoxHost).filter(ProxmoxHost.id == host_id).first()
         if not host or not host.is_active:
             return False
 
-        service = ProxmoxService(host)
-
-        if not service.test_connection():
-            logger.error(f"Cannot connect to Proxmox host {host.name}")
+        if not inventory_poller.poll_host(db, host):
+            logger.error(f"Cannot poll Proxmox host {host.name}")
             return False
-
-        # Get nodes and update database
-        nodes = service.get_nodes()
-        for node_data in nodes:
-            node_name = node_data.get("node")
-            resources = service.get_node_resources(node_name)
-
-            if not resources:
-                continue
-
-            # Fetch VM and LXC counts for this node
-            vm_count = len(service.get_vms(node_name))
-            lxc_count = len(service.get_lxc(node_name))
-
-            # Update or create node record
-            node = (
-                db.query(ProxmoxNode)
-                .filter(
-                    ProxmoxNode.host_id == host_id,
-                    ProxmoxNode.node_name == node_name,
-                )
-                .first()
-            )
-
-            if node:
-                node.status = resources["status"]
-                node.cpu_cores = resources["cpu_cores"]
-                node.cpu_usage = resources["cpu_usage"]
-                node.memory_total = resources["memory_total"]
-                node.memory_used = resources["memory_used"]
-                node.disk_total = resources["disk_total"]
-                node.disk_used = resources["disk_used"]
-                node.uptime = resources["uptime"]
-                node.vm_count = vm_count
-                node.lxc_count = lxc_count
-                node.last_updated = datetime.utcnow()
-            else:
-                node = ProxmoxNode(
-                    host_id=host_id,
-                    node_name=node_name,
-                    status=resources["status"],
-                    cpu_cores=resources["cpu_cores"],
-                    cpu_usage=resources["cpu_usage"],
-                    memory_total=resources["memory_total"],
-                    memory_used=resources["memory_used"],
-                    disk_total=resources["disk_total"],
-                    disk_used=resources["disk_used"],
-                    uptime=resources["uptime"],
-                    vm_count=vm_count,
-                    lxc_count=lxc_count,
-                    last_updated=datetime.utcnow(),
-                )
-                db.add(node)
-
-        host.last_poll = datetime.utcnow()
-        db.commit()
         logger.info(f"Successfully polled Proxmox host {host.name}")
 
         # ── Auto-detect cluster membership and remove redundant standalone entry ──
         # If this host has joined a cluster that is already registered as another
         # host in depl0y, delete this host entry (it's now reachable via the cluster).
         try:
-            _auto_delete_if_joined_cluster(db, host, service)
+            _auto_delete_if_joined_cluster(db, host, ProxmoxService(host))
         except Exception as ae:
             logger.warning(f"Auto-delete cluster check failed for host {host.name}: {ae}")
 
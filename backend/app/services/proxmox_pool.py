@@ -0,0 +1,214 @@
+"""Proxmox client registry — keeps one long-lived ProxmoxAPI client per host.
+
+Building a ProxmoxAPI is expensive: the stored secret has to be Fernet-decrypted,
+a new requests session (and TLS handshake) is created, and password-auth hosts
+perform a fresh ``/access/ticket`` login. The registry keeps one client per
+``ProxmoxHost`` so that every ``ProxmoxService`` reuses the same keep-alive
+session and ticket.
+
+Clients are rebuilt when:
+- the host's connection settings or stored credentials change (fingerprint mismatch),
+- a password-auth ticket is close to the 2 h PVE expiry (proxmoxer renews tickets
+  itself after an hour, but only when a request is made before the ticket expires),
+- the client has been idle longer than ``idle_ttl`` seconds,
+- ``invalidate()`` is called (host updated/deleted, manual reconnect).
+"""
+import hashlib
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# PVE tickets are valid for 2 h. Rebuild a little before that so an idle
+# client is never handed out with an expired ticket.
+_TICKET_MAX_AGE = 7200 - 300
+
+# Size of the urllib3 connection pool mounted on each client session. FastAPI
+# runs sync endpoints in a 40-thread pool, so the requests default of 10 would
+# discard connections under load instead of keeping them alive.
+_HTTP_POOL_MAXSIZE = 32
+
+
+def _host_fingerprint(host) -> str:
+    """Digest of every ProxmoxHost field that affects how the client connects."""
+    parts = (
+        host.hostname, host.port, host.username, host.password,
+        host.api_token_id, host.api_token_secret, host.verify_ssl,
+    )
+    return hashlib.sha256(repr(parts).encode()).hexdigest()
+
+
+class _PoolEntry:
+    __slots__ = ("client", "fingerprint", "created", "last_used", "uses", "token_auth")
+
+    def __init__(self, client, fingerprint: str, token_auth: bool):
+        now = time.monotonic()
+        self.client = client
+        self.fingerprint = fingerprint
+        self.created = now
+        self.last_used = now
+        self.uses = 0
+        self.token_auth = token_auth
+
+
+class ProxmoxClientPool:
+    """Thread-safe per-host registry of ProxmoxAPI clients."""
+
+    def __init__(self, idle_ttl: float = 1800.0):
+        self._entries: Dict[int, _PoolEntry] = {}
+        self._build_locks: Dict[int, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self._idle_ttl = idle_ttl
+        self._hits = 0
+        self._misses = 0
+        self._rebuilds = 0
+        self._evictions = 0
+
+    # ── Public API ────────────────────────────────────────────────────────────
+
+    def acquire(self, host, factory: Callable[[Any], Any]):
+        """Return the pooled client for *host*, building it with *factory* if needed.
+
+        Hosts without a primary key (not yet persisted) are never pooled.
+        """
+        if getattr(host, "id", None) is None:
+            return factory(host)
+
+        host_id = host.id
+        fingerprint = _host_fingerprint(host)
+
+        entry = self._lookup(host_id, fingerprint)
+        if entry is not None:
+            return entry.client
+
+        # Serialise builds per host so a burst of concurrent requests after a
+        # restart performs one login instead of one per request.
+        with self._lock:
+            build_lock = self._build_locks.setdefault(host_id, threading.Lock())
+        with build_lock:
+            entry = self._lookup(host_id, fingerprint)
+            if entry is not None:
+                return entry.client
+
+            client = factory(host)
+            self._tune_session(client)
+            token_auth = bool(host.api_token_id and host.api_token_secret)
+            new_entry = _PoolEntry(client, fingerprint, token_auth)
+            new_entry.uses = 1
+            with self._lock:
+                replaced = self._entries.get(host_id)
+                self._entries[host_id] = new_entry
+                self._misses += 1
+            if replaced is not None:
+                self._close(replaced)
+            logger.debug("Proxmox client pool: built client for host %s", host_id)
+            return client
+
+    def invalidate(self, host_id: int) -> None:
+        """Drop the pooled client for *host_id*; the next acquire rebuilds it."""
+        with self._lock:
+            entry = self._entries.pop(host_id, None)
+            if entry is not None:
+                self._evictions += 1
+        if entry is not None:
+            self._close(entry)
+
+    def clear(self) -> None:
+        """Drop every pooled client."""
+        with self._lock:
+            entries = list(self._entries.values())
+            self._evictions += len(entries)
+            self._entries.clear()
+        for entry in entries:
+            self._close(entry)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return pool counters and per-host client details."""
+        now = time.monotonic()
+        with self._lock:
+            hosts = [
+                {
+                    "host_id": host_id,
+                    "auth": "token" if e.token_auth else "ticket",
+                    "age_seconds": int(now - e.created),
+                    "idle_seconds": int(now - e.last_used),
+                    "uses": e.uses,
+                    "ticket_age_seconds": self._ticket_age(e, now),
+                }
+                for host_id, e in sorted(self._entries.items())
+            ]
+            lookups = self._hits + self._misses
+            return {
+                "size": len(self._entries),
+                "hits": self._hits,
+                "misses": self._misses,
+                "rebuilds": self._rebuilds,
+                "evictions": self._evictions,
+                "hit_ratio": round(self._hits / lookups, 4) if lookups else 0.0,
+                "idle_ttl_seconds": self._idle_ttl,
+                "hosts": hosts,
+            }
+
+    # ── Internals ─────────────────────────────────────────────────────────────
+
+    def _lookup(self, host_id: int, fingerprint: str) -> Optional[_PoolEntry]:
+        """Return a usable entry (recording the hit) or None, evicting stale ones."""
+        now = time.monotonic()
+        stale = None
+        with self._lock:
+            entry = self._entries.get(host_id)
+            if entry is None:
+                return None
+            if entry.fingerprint == fingerprint and not self._expired(entry, now):
+                entry.last_used = now
+                entry.uses += 1
+                self._hits += 1
+                return entry
+            stale = self._entries.pop(host_id)
+            if stale.fingerprint != fingerprint:
+                self._rebuilds += 1    # credentials / connection settings changed
+            else:
+                self._evictions += 1   # idle or ticket expiry
+        self._close(stale)
+        return None
+
+    def _expired(self, entry: _PoolEntry, now: float) -> bool:
+        if now - entry.last_used > self._idle_ttl:
+            return True
+        ticket_age = self._ticket_age(entry, now)
+        return ticket_age is not None and ticket_age >= _TICKET_MAX_AGE
+
+    @staticmethod
+    def _ticket_age(entry: _PoolEntry, now: float) -> Optional[int]:
+        """Seconds since the password-auth ticket was issued (None for token auth)."""
+        if entry.token_auth:
+            return None
+        auth = getattr(getattr(entry.client, "_backend", None), "auth", None)
+        birth = getattr(auth, "birth_time", None)
+        if birth is None:
+            return None
+        return int(now - birth)
+
+    @staticmethod
+    def _tune_session(client) -> None:
+        """Mount a larger, instrumented keep-alive connection pool on the client's session."""
+        try:
+            from app.core.telemetry import TimedHTTPAdapter
+            session = client._store["session"]
+            session.mount("https://", TimedHTTPAdapter("proxmox", pool_connections=4,
+                                                       pool_maxsize=_HTTP_POOL_MAXSIZE))
+        except Exception as exc:
+            logger.debug("Proxmox client pool: could not tune session: %s", exc)
+
+    @staticmethod
+    def _close(entry: _PoolEntry) -> None:
+        try:
+            entry.client._store["session"].close()
+        except Exception:
+            pass
+
+
+# Singleton instance
+proxmox_pool = ProxmoxClientPool()
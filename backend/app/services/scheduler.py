@@ -1,9 +1,14 @@
 """Background scheduler for automated VM checks"""
-import json
 import logging
-from datetime import datetime
+import threading
+import time
+from datetime import datetime, timedelta
 
+from apscheduler.events import (
+    EVENT_JOB_ERROR, EVENT_JOB_EXECUTED, EVENT_JOB_MAX_INSTANCES, EVENT_JOB_MISSED, EVENT_JOB_SUBMITTED,
+)
 from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.triggers.date import DateTrigger
 from apscheduler.triggers.interval import IntervalTrigger
 
 logger = logging.getLogger(__name__)
@@ -11,6 +16,10 @@ logger = logging.getLogger(__name__)
 _scheduler = BackgroundScheduler(daemon=True)
 _started = False
 
+# job id → perf_counter() when its current run was submitted (max_instances=1)
+_job_started: dict = {}
+_job_started_lock = threading.Lock()
+
 
 # ── helpers ──────────────────────────────────────────────────────────────────
 
@@ -20,129 +29,115 @@ def _get_setting(db, key, default=None):
     return row.value if row else default
 
 
-def _upsert_cache(db, vm_id: int, scan_type: str, result: dict, severity: str, summary: str):
-    from app.models import VmScanCache
-    cache = (
-        db.query(VmScanCache)
-        .filter(VmScanCache.vm_id == vm_id, VmScanCache.scan_type == scan_type)
-        .first()
+def _schedule_resume(job_id: str, func, minutes: int = 5):
+    """Queue a one-off continuation of a scan that ran out of time budget.
+
+    The scheduler has no explicit timezone, so naive run dates are read as
+    local time — use ``datetime.now()``, not ``utcnow()``.
+    """
+    _scheduler.add_job(
+        func,
+        DateTrigger(run_date=datetime.now() + timedelta(minutes=minutes)),
+        id=f"{job_id}_resume",
+        replace_existing=True,
+        max_instances=1,
+        misfire_grace_time=300,
     )
-    if cache:
-        cache.result_json = json.dumps(result)
-        cache.scanned_at = datetime.utcnow()
-        cache.severity = severity
-        cache.summary = summary
-    else:
-        cache = VmScanCache(
-            vm_id=vm_id,
-            scan_type=scan_type,
-            result_json=json.dumps(result),
-            scanned_at=datetime.utcnow(),
-            severity=severity,
-            summary=summary,
-        )
-        db.add(cache)
-    db.commit()
+
+
+def _on_job_event(event):
+    """Feed job durations, errors and overruns into the Prometheus metrics."""
+    from app.core import telemetry
+
+    job_id = event.job_id
+    if event.code == EVENT_JOB_SUBMITTED:
+        with _job_started_lock:
+            _job_started[job_id] = time.perf_counter()
+    elif event.code in (EVENT_JOB_EXECUTED, EVENT_JOB_ERROR):
+        with _job_started_lock:
+            started = _job_started.pop(job_id, None)
+        if started is not None:
+            telemetry.scheduler_job_duration.observe(time.perf_counter() - started, job_id)
+        if event.code == EVENT_JOB_ERROR:
+            telemetry.scheduler_job_errors.inc(job_id)
+    elif event.code == EVENT_JOB_MAX_INSTANCES:
+        telemetry.scheduler_job_overruns.inc(job_id, "max_instances")
+        logger.warning(f"Scheduled job {job_id} skipped — previous run still in progress")
+    elif event.code == EVENT_JOB_MISSED:
+        telemetry.scheduler_job_overruns.inc(job_id, "missed")
 
 
 # ── scheduled jobs ────────────────────────────────────────────────────────────
 
 def run_auto_update_checks():
-    """Check for OS updates on all managed VMs that have SSH credentials."""
+    """Check for OS updates on managed VMs that have SSH credentials.
+
+    VMs are checked in parallel within a time budget; see ``vm_scans``.
+    """
     from app.core.database import SessionLocal
-    from app.models import VirtualMachine
-    from app.services.updates import UpdateService
+    from app.services.vm_scans import vm_scan_runner
 
     db = SessionLocal()
     try:
         if _get_setting(db, "auto_update_check_enabled", "false") != "true":
             return
+    finally:
+        db.close()
 
-        vms = (
-            db.query(VirtualMachine)
-            .filter(
-                VirtualMachine.ip_address.isnot(None),
-                VirtualMachine.password.isnot(None),
-            )
-            .all()
-        )
-
-        service = UpdateService(db)
-        for vm in vms:
-            try:
-                result = service.check_updates(vm.id)
-                if result:
-                    _upsert_cache(
-                        db, vm.id, "updates", result,
-                        severity="warning" if result["updates_available"] > 0 else "ok",
-                        summary=f"{result['updates_available']} update(s) available",
-                    )
-                    logger.debug(f"Auto update check VM {vm.id}: {result['updates_available']} updates")
-            except Exception as e:
-                logger.error(f"Auto update check failed for VM {vm.id}: {e}")
-
+    try:
+        summary = vm_scan_runner.run("updates")
+        if not summary["complete"]:
+            _schedule_resume("auto_update_checks", run_auto_update_checks)
     except Exception as e:
         logger.error(f"Auto update check job error: {e}")
-    finally:
-        db.close()
 
 
 def run_auto_security_scans():
-    """Run security scans on all managed VMs that have SSH credentials."""
+    """Run security scans on managed VMs that have SSH credentials.
+
+    VMs are scanned in parallel within a time budget; see ``vm_scans``.
+    """
     from app.core.database import SessionLocal
-    from app.models import VirtualMachine
-    from app.services.updates import UpdateService
+    from app.services.vm_scans import vm_scan_runner
 
     db = SessionLocal()
     try:
         if _get_setting(db, "auto_security_scan_enabled", "false") != "true":
             return
+    finally:
+        db.close()
 
-        vms = (
-            db.query(VirtualMachine)
-            .filter(
-                VirtualMachine.ip_address.isnot(None),
-                VirtualMachine.password.isnot(None),
-            )
-            .all()
-        )
-
-        service = UpdateService(db)
-        for vm in vms:
-            try:
-                result = service.scan_security(vm.id)
-                if "error" not in result:
-                    sec = result.get("os_updates", {}).get("security_updates", 0)
-                    failed = result.get("failed_ssh_attempts", 0)
-                    _upsert_cache(
-                        db, vm.id, "security", result,
-                        severity=result.get("severity", "ok"),
-                        summary=f"{sec} security updates, {failed} failed SSH logins",
-                    )
-                    logger.debug(f"Auto security scan VM {vm.id}: severity={result.get('severity')}")
-            except Exception as e:
-                logger.error(f"Auto security scan failed for VM {vm.id}: {e}")
-
+    try:
+        summary = vm_scan_runner.run("security")
+        if not summary["complete"]:
+            _schedule_resume("auto_security_scans", run_auto_security_scans)
     except Exception as e:
         logger.error(f"Auto security scan job error: {e}")
-    finally:
-        db.close()
 
 
 def run_proxmox_node_poll():
-    """Poll all active Proxmox hosts to refresh node disk/CPU/RAM stats in the DB."""
+    """Poll all active Proxmox hosts to refresh node disk/CPU/RAM stats in the DB.
+
+    Hosts are polled concurrently with one ``/cluster/resources`` call each.
+    """
     from app.core.database import SessionLocal
     from app.models.database import ProxmoxHost
-    from app.services.proxmox import poll_proxmox_resources
+    from app.services.inventory import inventory_poller
+    from app.services.proxmox import ProxmoxService, _auto_delete_if_joined_cluster
 
     db = SessionLocal()
     try:
-        hosts = db.query(ProxmoxHost).filter(ProxmoxHost.is_active == True).all()
-        for host in hosts:
+        results = inventory_poller.poll_all(db)
+        for host_id, ok in results.items():
+            if not ok:
+                continue
+            host = db.query(ProxmoxHost).filter(ProxmoxHost.id == host_id).first()
+            if host is None:
+                continue  # removed by an earlier auto-delete in this loop
             try:
-                poll_proxmox_resources(db, host.id)
+                _auto_delete_if_joined_cluster(db, host, ProxmoxService(host))
             except Exception as e:
-                logger.error(f"Node poll failed for host {host.name}: {e}")
+                logger.warning(f"Auto-delete cluster check failed for host {host.name}: {e}")
     except Exception as e:
         logger.error(f"Proxmox node poll job error: {e}")
     finally:
@@ -418,47 +413,63 @@ def run_bmc_poll():
 
 
 def run_node_metric_snapshot():
-    """Every 5 min: capture a NodeMetricSnapshot row for each known node.
-    Prunes snapshots older than 30 days.
+    """Every 5 min: capture one raw metric sample per known node in a single bulk insert,
+    then roll closed buckets up into the hourly/daily tiers and prune expired data.
     """
-    from datetime import timedelta
     from app.core.database import SessionLocal
-    from app.models.database import ProxmoxNode, NodeMetricSnapshot
+    from app.models.database import ProxmoxNode
+    from app.services.metrics_store import node_metrics_store
 
     db = SessionLocal()
     try:
-        cutoff = datetime.utcnow() - timedelta(days=30)
-        try:
-            db.query(NodeMetricSnapshot).filter(NodeMetricSnapshot.captured_at < cutoff).delete()
-            db.commit()
-        except Exception as exc:
-            logger.warning("metric snapshot prune failed: %s", exc)
-            db.rollback()
-
-        nodes = db.query(ProxmoxNode).all()
-        for n in nodes:
-            try:
-                mem_pct = None
-                if n.memory_total and n.memory_used is not None and n.memory_total > 0:
-                    mem_pct = round((n.memory_used / n.memory_total) * 100, 2)
-                disk_pct = None
-                if n.disk_total and n.disk_used is not None and n.disk_total > 0:
-                    disk_pct = round((n.disk_used / n.disk_total) * 100, 2)
-                snap = NodeMetricSnapshot(
-                    node_id=n.id,
-                    captured_at=datetime.utcnow(),
-                    cpu_pct=float(n.cpu_usage) if n.cpu_usage is not None else None,
-                    memory_pct=mem_pct,
-                    disk_pct=disk_pct,
-                    vm_count=n.vm_count or 0,
-                    lxc_count=n.lxc_count or 0,
-                )
-                db.add(snap)
-            except Exception as exc:
-                logger.warning("failed to capture snapshot for node %s: %s", n.node_name, exc)
-        db.commit()
+        now = datetime.utcnow()
+        samples = []
+        for n in db.query(ProxmoxNode).all():
+            mem_pct = None
+            if n.memory_total and n.memory_used is not None and n.memory_total > 0:
+                mem_pct = round((n.memory_used / n.memory_total) * 100, 2)
+            disk_pct = None
+            if n.disk_total and n.disk_used is not None and n.disk_total > 0:
+                disk_pct = round((n.disk_used / n.disk_total) * 100, 2)
+            samples.append({
+                "node_id": n.id,
+                "captured_at": now,
+                "cpu_pct": float(n.cpu_usage) if n.cpu_usage is not None else None,
+                "memory_pct": mem_pct,
+                "disk_pct": disk_pct,
+                "vm_count": n.vm_count or 0,
+                "lxc_count": n.lxc_count or 0,
+            })
     except Exception as exc:
         logger.error("run_node_metric_snapshot failed: %s", exc)
+        return
+    finally:
+        db.close()
+
+    try:
+        node_metrics_store.record(samples)
+    except Exception as exc:
+        logger.error("node metric sample insert failed: %s", exc)
+    try:
+        node_metrics_store.rollup(now)
+    except Exception as exc:
+        logger.warning("node metric rollup failed: %s", exc)
+    try:
+        node_metrics_store.prune(now)
+    except Exception as exc:
+        logger.warning("node metric prune failed: %s", exc)
+
+
+def run_guest_metric_collect():
+    """Every minute: sample every running guest from one /cluster/resources call per host."""
+    from app.core.database import SessionLocal
+    from app.services.guest_metrics import guest_metrics
+
+    db = SessionLocal()
+    try:
+        guest_metrics.collect(db)
+    except Exception as exc:
+        logger.error("run_guest_metric_collect failed: %s", exc)
     finally:
         db.close()
 
@@ -593,7 +604,7 @@ def start_scheduler(update_hours: int = 24, scan_hours: int = 24):
         IntervalTrigger(minutes=5),
         id="proxmox_node_poll",
         max_instances=1,
-        next_run_time=datetime.utcnow(),  # run immediately on startup
+        next_run_time=datetime.now(),  # run immediately on startup
     )
     bmc_minutes = _get_bmc_poll_minutes()
     _scheduler.add_job(
@@ -601,7 +612,7 @@ def start_scheduler(update_hours: int = 24, scan_hours: int = 24):
         IntervalTrigger(minutes=bmc_minutes),
         id="bmc_poll",
         max_instances=1,
-        next_run_time=datetime.utcnow(),  # run immediately on startup
+        next_run_time=datetime.now(),  # run immediately on startup
     )
     _scheduler.add_job(
         run_firmware_update_check,
@@ -614,7 +625,13 @@ def start_scheduler(update_hours: int = 24, scan_hours: int = 24):
         IntervalTrigger(minutes=5),
         id="ai_node_metric_snapshot",
         max_instances=1,
-        next_run_time=datetime.utcnow(),
+        next_run_time=datetime.now(),
+    )
+    _scheduler.add_job(
+        run_guest_metric_collect,
+        IntervalTrigger(seconds=60),
+        id="guest_metric_collect",
+        max_instances=1,
     )
     _scheduler.add_job(
         run_ai_report_schedules,
@@ -628,6 +645,10 @@ def start_scheduler(update_hours: int = 24, scan_hours: int = 24):
         id="time_sync_drift_check",
         max_instances=1,
     )
+    _scheduler.add_listener(
+        _on_job_event,
+        EVENT_JOB_SUBMITTED | EVENT_JOB_EXECUTED | EVENT_JOB_ERROR | EVENT_JOB_MAX_INSTANCES | EVENT_JOB_MISSED,
+    )
     _scheduler.start()
     _started = True
     logger.info(f"Scheduler started — update checks every {update_hours}h, security scans every {scan_hours}h, node poll every 5m, BMC poll every 2m, firmware check every 24h")
@@ -696,6 +717,6 @@ def reschedule_bmc_poll(minutes: int) -> None:
         IntervalTrigger(minutes=minutes),
         id="bmc_poll",
         max_instances=1,
-        next_run_time=datetime.utcnow(),
+        next_run_time=datetime.now(),
     )
     logger.info("BMC poll rescheduled to every %d min", minutes)
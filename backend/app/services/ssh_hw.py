@@ -16,12 +16,10 @@ def _run(client, cmd: str) -> str:
 
 
 def get_ssh_client(hostname: str, username: str, password: str, port: int = 22):
-    import paramiko
-    client = paramiko.SSHClient()
-    client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-    client.connect(hostname, port=port, username=username, password=password,
-                   timeout=10, allow_agent=False, look_for_keys=False)
-    return client
+    """Lease a pooled SSH connection; ``close()`` hands it back to the pool."""
+    from app.services.ssh_pool import ssh_pool
+    return ssh_pool.client(hostname, username, password=password, port=port, timeout=10,
+                           allow_agent=False, look_for_keys=False)
 
 
 def _parse_lscpu(raw: str) -> dict:
@@ -0,0 +1,378 @@
+"""SSH connection pool — one authenticated transport per host, user and credential.
+
+Opening a paramiko connection costs a TCP handshake, key exchange and
+authentication; running a command on a live transport is a single channel
+open. The pool keeps transports alive and hands out leases:
+
+- ``client()`` returns a lease that behaves like ``paramiko.SSHClient`` for
+  ``exec_command`` / ``get_transport`` / ``close``; ``close()`` closes the
+  lease's channels and hands the connection back instead of tearing it down
+- exec channels from every lease on a transport are multiplexed, at most
+  ``max_sessions`` open at once (OpenSSH's MaxSessions defaults to 10). If the
+  server refuses a channel below that, the connection's limit drops to what it
+  accepted and further commands wait for a free slot
+- a transport idle longer than ``health_after`` seconds is probed before it is
+  reused and rebuilt if the probe fails; transports without leases are closed
+  after ``idle_ttl`` seconds
+- connects to the same key are serialised, so a burst of calls to one host
+  performs one key exchange instead of one per call
+- ``allow_agent`` / ``look_for_keys`` default to paramiko's (on) and are part
+  of the pool key, so callers that only accept the stored credential never
+  share a transport authenticated from the agent or ``~/.ssh``
+"""
+import hashlib
+import logging
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+_Key = Tuple[str, int, str, str, bool, bool]
+
+
+def _secret_digest(password: Optional[str], pkey: Any) -> str:
+    """Digest of the credential so a changed password gets a fresh connection."""
+    material = repr((password, pkey if isinstance(pkey, str) else getattr(pkey, "get_base64", lambda: None)()))
+    return hashlib.sha256(material.encode()).hexdigest()[:16]
+
+
+def _load_pkey(text: str):
+    """Parse a PEM/OpenSSH private key of any type paramiko supports."""
+    import paramiko
+    from io import StringIO
+
+    last: Optional[Exception] = None
+    for cls in (paramiko.RSAKey, paramiko.Ed25519Key, paramiko.ECDSAKey):
+        try:
+            return cls.from_private_key(StringIO(text))
+        except Exception as e:
+            last = e
+    raise paramiko.SSHException(f"Unsupported or invalid private key: {last}")
+
+
+class _Conn:
+    __slots__ = ("key", "client", "created", "last_used", "last_ok", "uses", "leases",
+                 "channels", "pending", "max_sessions", "dead")
+
+    def __init__(self, key: _Key, client, max_sessions: int):
+        now = time.monotonic()
+        self.key = key
+        self.client = client
+        self.created = now
+        self.last_used = now
+        self.last_ok = now
+        self.uses = 0
+        self.leases = 0
+        self.channels: List[Any] = []
+        self.pending = 0
+        self.max_sessions = max_sessions
+        self.dead = False
+
+    def alive(self) -> bool:
+        transport = self.client.get_transport()
+        return transport is not None and transport.is_active()
+
+    def open_channels(self) -> int:
+        self.channels = [c for c in self.channels if not c.closed]
+        return len(self.channels) + self.pending
+
+
+class PooledSSHClient:
+    """A lease on a pooled SSH connection; use it like ``paramiko.SSHClient``."""
+
+    def __init__(self, pool: "SSHConnectionPool", conn: _Conn):
+        self._pool = pool
+        self._conn = conn
+        self._channels: List[Any] = []
+        self._closed = False
+
+    def exec_command(self, command: str, bufsize: int = -1, timeout: Optional[float] = None,
+                     get_pty: bool = False, environment: Optional[Dict[str, str]] = None):
+        """Same contract as ``SSHClient.exec_command``: returns (stdin, stdout, stderr)."""
+        import paramiko
+
+        if self._closed:
+            raise paramiko.SSHException("SSH client lease is closed")
+        chan = self._pool._open_channel(self._conn, timeout)
+        self._channels.append(chan)
+        if get_pty:
+            chan.get_pty()
+        chan.settimeout(timeout)
+        if environment:
+            chan.update_environment(environment)
+        chan.exec_command(command)
+        stdin = chan.makefile_stdin("wb", bufsize)
+        stdout = chan.makefile("r", bufsize)
+        stderr = chan.makefile_stderr("r", bufsize)
+        return stdin, stdout, stderr
+
+    def get_transport(self):
+        return self._conn.client.get_transport()
+
+    def close(self) -> None:
+        """Close this lease's channels and return the connection to the pool."""
+        if self._closed:
+            return
+        self._closed = True
+        for chan in self._channels:
+            if not chan.closed:
+                try:
+                    chan.close()
+                except Exception:
+                    pass
+        self._channels = []
+        self._pool._release(self._conn)
+
+    def __enter__(self) -> "PooledSSHClient":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def __del__(self):
+        # A lease dropped without close() (early return, exception) must not
+        # pin its connection forever
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+class SSHConnectionPool:
+    """Thread-safe pool of live paramiko transports keyed by (host, port, user, credential)."""
+
+    def __init__(self, max_sessions: int = 8, idle_ttl: float = 300.0,
+                 health_after: float = 30.0, channel_wait: float = 60.0):
+        self._max_sessions = max_sessions
+        self._idle_ttl = idle_ttl
+        self._health_after = health_after
+        self._channel_wait = channel_wait
+        self._conns: Dict[_Key, _Conn] = {}
+        self._connect_locks: Dict[_Key, threading.Lock] = {}
+        self._cond = threading.Condition()
+        self._connects = 0
+        self._reuses = 0
+        self._health_failures = 0
+        self._evictions = 0
+        self._channel_waits = 0
+        self._session_limit_hits = 0
+
+    # ── Public API ────────────────────────────────────────────────────────────
+
+    def client(self, hostname: str, username: str, password: Optional[str] = None,
+               pkey: Any = None, port: int = 22, timeout: float = 10,
+               allow_agent: bool = True, look_for_keys: bool = True) -> PooledSSHClient:
+        """Lease a connection to *hostname*, connecting and authenticating if needed.
+
+        *pkey* may be a paramiko key or private key text; *allow_agent* and
+        *look_for_keys* are passed to ``SSHClient.connect``. Connection and
+        authentication errors (``paramiko.AuthenticationException`` etc.)
+        propagate unchanged.
+        """
+        key: _Key = (hostname, int(port or 22), username or "", _secret_digest(password, pkey),
+                     allow_agent, look_for_keys)
+        self._sweep()
+        conn = self._checkout(key)
+        if conn is None:
+            with self._cond:
+                connect_lock = self._connect_locks.setdefault(key, threading.Lock())
+            with connect_lock:
+                conn = self._checkout(key)
+                if conn is None:
+                    conn = self._connect(key, password, pkey, timeout)
+        return PooledSSHClient(self, conn)
+
+    def invalidate(self, hostname: Optional[str] = None) -> None:
+        """Close idle connections to *hostname* (or all) and retire busy ones."""
+        with self._cond:
+            keys = [k for k in self._conns if hostname is None or k[0] == hostname]
+            conns = [self._conns.pop(k) for k in keys]
+            self._evictions += len(conns)
+            for conn in conns:
+                conn.dead = True
+        for conn in conns:
+            if conn.leases == 0:
+                self._close(conn)
+
+    def stop(self) -> None:
+        self.invalidate()
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        with self._cond:
+            conns = [
+                {
+                    "host": k[0], "port": k[1], "user": k[2],
+                    "age_seconds": int(now - c.created),
+                    "idle_seconds": int(now - c.last_used),
+                    "uses": c.uses, "leases": c.leases,
+                    "open_channels": c.open_channels(),
+                    "max_sessions": c.max_sessions,
+                }
+                for k, c in sorted(self._conns.items())
+            ]
+            lookups = self._connects + self._reuses
+            return {
+                "size": len(self._conns),
+                "connects": self._connects,
+                "reuses": self._reuses,
+                "reuse_ratio": round(self._reuses / lookups, 4) if lookups else 0.0,
+                "health_failures": self._health_failures,
+                "evictions": self._evictions,
+                "channel_waits": self._channel_waits,
+                "session_limit_hits": self._session_limit_hits,
+                "max_sessions": self._max_sessions,
+                "idle_ttl_seconds": self._idle_ttl,
+                "connections": conns,
+            }
+
+    # ── Internals ─────────────────────────────────────────────────────────────
+
+    def _checkout(self, key: _Key) -> Optional[_Conn]:
+        """Return a healthy pooled connection with a lease taken, or None."""
+        now = time.monotonic()
+        with self._cond:
+            conn = self._conns.get(key)
+            if conn is None:
+                return None
+            healthy = conn.alive()
+            if healthy and now - conn.last_ok > self._health_after:
+                try:
+                    conn.client.get_transport().send_ignore()
+                    healthy = conn.alive()
+                except Exception:
+                    healthy = False
+            if healthy:
+                conn.leases += 1
+                conn.uses += 1
+                conn.last_used = conn.last_ok = now
+                self._reuses += 1
+                return conn
+            del self._conns[key]
+            conn.dead = True
+            self._health_failures += 1
+        logger.debug("SSH pool: dropping dead connection to %s@%s", key[2], key[0])
+        if conn.leases == 0:
+            self._close(conn)
+        return None
+
+    def _connect(self, key: _Key, password: Optional[str], pkey: Any, timeout: float) -> _Conn:
+        import paramiko
+
+        hostname, port, username, _, allow_agent, look_for_keys = key
+        if isinstance(pkey, str):
+            pkey = _load_pkey(pkey)
+        client = paramiko.SSHClient()
+        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        client.connect(
+            hostname, port=port, username=username, password=password, pkey=pkey,
+            timeout=timeout, banner_timeout=timeout, auth_timeout=timeout,
+            allow_agent=allow_agent, look_for_keys=look_for_keys,
+        )
+        # Keepalives let an idle pooled transport notice a dropped peer
+        client.get_transport().set_keepalive(30)
+        conn = _Conn(key, client, self._max_sessions)
+        conn.leases = 1
+        conn.uses = 1
+        with self._cond:
+            replaced = self._conns.get(key)
+            self._conns[key] = conn
+            self._connects += 1
+        if replaced is not None:
+            replaced.dead = True
+            if replaced.leases == 0:
+                self._close(replaced)
+        logger.debug("SSH pool: connected to %s@%s:%s", username, hostname, port)
+        return conn
+
+    def _open_channel(self, conn: _Conn, timeout: Optional[float]):
+        """Open an exec channel on *conn*, waiting for a free session slot."""
+        import paramiko
+
+        deadline = time.monotonic() + self._channel_wait
+        waited = False
+        while True:
+            with self._cond:
+                while conn.open_channels() >= conn.max_sessions:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise paramiko.SSHException(
+                            f"Timed out waiting for a free SSH session on {conn.key[0]}"
+                        )
+                    if not waited:
+                        self._channel_waits += 1
+                        waited = True
+                    # Channels close without notifying the pool — re-check periodically
+                    self._cond.wait(min(remaining, 0.5))
+                conn.pending += 1
+            try:
+                transport = conn.client.get_transport()
+                if transport is None or not transport.is_active():
+                    raise paramiko.SSHException("SSH session not active")
+                chan = transport.open_session(timeout=timeout)
+            except paramiko.SSHException:
+                # A refused channel normally raises ChannelException, but paramiko
+                # keeps the failure in one per-transport slot, so concurrent
+                # refusals can surface as a bare SSHException — only a dead
+                # transport means the connection itself is gone
+                refused = transport is not None and transport.is_active()
+                with self._cond:
+                    conn.pending -= 1
+                    busy = conn.open_channels()
+                    if not refused:
+                        conn.dead = True
+                        if self._conns.get(conn.key) is conn:
+                            del self._conns[conn.key]
+                            self._health_failures += 1
+                    if not refused or busy == 0:
+                        raise
+                    # Server-side MaxSessions is lower than ours; wait for a slot
+                    conn.max_sessions = busy
+                    self._session_limit_hits += 1
+                logger.info("SSH pool: %s allows %d session(s) per connection", conn.key[0], busy)
+                continue
+            except Exception:
+                with self._cond:
+                    conn.pending -= 1
+                    conn.dead = True
+                    if self._conns.get(conn.key) is conn:
+                        del self._conns[conn.key]
+                        self._health_failures += 1
+                raise
+            with self._cond:
+                conn.pending -= 1
+                conn.channels.append(chan)
+                conn.last_used = conn.last_ok = time.monotonic()
+            return chan
+
+    def _release(self, conn: _Conn) -> None:
+        with self._cond:
+            conn.leases -= 1
+            conn.last_used = time.monotonic()
+            close = conn.dead and conn.leases == 0
+            self._cond.notify_all()
+        if close:
+            self._close(conn)
+
+    def _sweep(self) -> None:
+        """Close connections that have had no lease for longer than ``idle_ttl``."""
+        now = time.monotonic()
+        with self._cond:
+            idle = [k for k, c in self._conns.items()
+                    if c.leases == 0 and now - c.last_used > self._idle_ttl]
+            conns = [self._conns.pop(k) for k in idle]
+            self._evictions += len(conns)
+        for conn in conns:
+            self._close(conn)
+
+    @staticmethod
+    def _close(conn: _Conn) -> None:
+        try:
+            conn.client.close()
+        except Exception:
+            pass
+
+
+# Singleton instance
+ssh_pool = SSHConnectionPool()
@@ -0,0 +1,366 @@
+"""Streaming uploads to Proxmox storage.
+
+The browser's ``multipart/form-data`` body is piped to the PVE
+``nodes/{node}/storage/{storage}/upload`` endpoint as it arrives instead of
+being read into memory first. Only the form prefix (the fields before the file
+data) is buffered and rewritten so PVE always receives ``content`` followed by a
+``filename`` file part; the file bytes and everything after them are forwarded
+verbatim, which keeps the outbound ``Content-Length`` exact.
+
+The file payload is SHA-256 hashed on the fly and progress is published under
+an upload ID that clients can poll, like ``upload_progress`` for ISO uploads.
+The outbound POST runs in a worker thread on the host's pooled proxmoxer
+session (ticket / API token auth and keep-alive connection included).
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import queue
+import re
+import threading
+import time
+import uuid
+from typing import AsyncIterator, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Progress entries keyed by upload ID, same shape as isos.upload_progress.
+storage_upload_progress: Dict[str, Dict] = {}
+_PROGRESS_TTL = 3600
+
+# Chunks handed to the sender thread are coalesced to about this size.
+_CHUNK_SIZE = 1024 * 1024
+# Queue depth between the request reader and the sender: bounds memory per
+# upload to roughly _QUEUE_CHUNKS × _CHUNK_SIZE regardless of file size.
+_QUEUE_CHUNKS = 8
+# Maximum size of the multipart prefix (form fields before the file data).
+_MAX_PREFIX = 1024 * 1024
+
+_DONE = object()
+
+
+class UploadError(Exception):
+    """Raised for malformed upload requests (mapped to HTTP 400 by the caller)."""
+
+
+def new_upload_id() -> str:
+    return uuid.uuid4().hex
+
+
+def content_type_for(filename: str) -> str:
+    """Guess the PVE storage content type from a file name."""
+    name = filename.lower()
+    if name.endswith((".tar.gz", ".tar.xz", ".tar.zst", ".tgz", ".tar")):
+        return "vztmpl"
+    return "iso"
+
+
+def _set_progress(upload_id: str, **fields) -> None:
+    entry = storage_upload_progress.setdefault(upload_id, {})
+    entry.update(fields)
+    entry["updated_at"] = time.time()
+
+
+def _prune_progress() -> None:
+    cutoff = time.time() - _PROGRESS_TTL
+    for uid in [u for u, e in storage_upload_progress.items()
+                if e.get("status") in ("completed", "error") and e.get("updated_at", 0) < cutoff]:
+        storage_upload_progress.pop(uid, None)
+
+
+# ── multipart prefix handling ───────────────────────────────────────────────
+
+def _boundary(content_type: str) -> bytes:
+    m = re.search(r'boundary="?([^";]+)"?', content_type or "")
+    if not m or not content_type.lower().startswith("multipart/form-data"):
+        raise UploadError("Expected a multipart/form-data request")
+    return m.group(1).encode()
+
+
+def _disposition(headers: bytes) -> Tuple[Optional[str], Optional[str]]:
+    """Return (field name, filename) from a part's header block."""
+    text = headers.decode("utf-8", "replace")
+    name = re.search(r'\bname="([^"]*)"', text)
+    fname = re.search(r'\bfilename="([^"]*)"', text)
+    return (name.group(1) if name else None, fname.group(1) if fname else None)
+
+
+def _split_prefix(buf: bytes, boundary: bytes) -> Optional[Tuple[int, Dict[str, str], str]]:
+    """Locate the start of the first file part's data in *buf*.
+
+    Returns ``(data_offset, fields_before_file, filename)`` or None when more
+    bytes are needed.
+    """
+    delim = b"--" + boundary
+    pos = buf.find(delim)
+    if pos < 0:
+        return None
+    fields: Dict[str, str] = {}
+    while True:
+        pos += len(delim)
+        if buf[pos:pos + 2] == b"--":
+            raise UploadError("No file found in upload")
+        hdr_end = buf.find(b"\r\n\r\n", pos)
+        if hdr_end < 0:
+            return None
+        name, fname = _disposition(buf[pos:hdr_end])
+        data_start = hdr_end + 4
+        if fname is not None:
+            return data_start, fields, fname
+        nxt = buf.find(b"\r\n" + delim, data_start)
+        if nxt < 0:
+            return None
+        if name:
+            fields[name] = buf[data_start:nxt].decode("utf-8", "replace")
+        pos = nxt + 2
+
+
+def _build_prefix(boundary: bytes, content: str, filename: str) -> bytes:
+    b = boundary.decode()
+    return (
+        f"--{b}\r\n"
+        f'Content-Disposition: form-data; name="content"\r\n\r\n'
+        f"{content}\r\n"
+        f"--{b}\r\n"
+        f'Content-Disposition: form-data; name="filename"; filename="{filename}"\r\n'
+        f"Content-Type: application/octet-stream\r\n\r\n"
+    ).encode()
+
+
+class _PayloadHasher:
+    """SHA-256 of the file part only: stops at the closing ``\\r\\n--boundary``."""
+
+    def __init__(self, boundary: bytes):
+        self._delim = b"\r\n--" + boundary
+        self._tail = b""
+        self._done = False
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    def update(self, chunk: bytes) -> None:
+        if self._done:
+            return
+        data = self._tail + chunk
+        idx = data.find(self._delim)
+        if idx >= 0:
+            self._feed(data[:idx])
+            self._tail = b""
+            self._done = True
+            return
+        keep = len(self._delim) - 1
+        if len(data) > keep:
+            self._feed(data[:-keep])
+            self._tail = data[-keep:]
+        else:
+            self._tail = data
+
+    def _feed(self, data: bytes) -> None:
+        self.sha256.update(data)
+        self.size += len(data)
+
+
+# ── outbound body ───────────────────────────────────────────────────────────
+
+class _QueueBody:
+    """Iterable request body fed from a queue, with a known length.
+
+    Exposing ``__len__`` makes requests send a ``Content-Length`` header
+    instead of chunked transfer encoding, which pveproxy does not accept.
+    """
+
+    def __init__(self, q: "queue.Queue", length: int, on_sent):
+        self._q = q
+        self._length = length
+        self._on_sent = on_sent
+
+    def __len__(self):
+        return self._length
+
+    def __iter__(self):
+        while True:
+            item = self._q.get()
+            if item is _DONE:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+            self._on_sent(len(item))
+
+
+def _post_to_pve(proxmox, node: str, storage: str, content_type: str,
+                 body: _QueueBody, result: dict) -> None:
+    """Worker thread: POST *body* to the PVE upload endpoint on the pooled session."""
+    import requests
+
+    session = proxmox._store["session"]
+    auth = session.auth
+    url = f"{proxmox._store['base_url']}/nodes/{node}/storage/{storage}/upload"
+    try:
+        cookies = auth.get_cookies() if hasattr(auth, "get_cookies") else None
+        # requests.Session.request directly: proxmoxer's override rewrites
+        # ``data`` as a form dict, which a streaming body is not.
+        resp = requests.Session.request(
+            session, "POST", url,
+            data=body,
+            headers={"Content-Type": content_type},
+            cookies=cookies,
+            verify=getattr(auth, "verify_ssl", True),
+            timeout=(30, 3600),
+        )
+        if resp.status_code != 200:
+            raise Exception(f"Upload failed with status {resp.status_code}: {resp.text[:500]}")
+        result["upid"] = (resp.json() or {}).get("data")
+    except Exception as exc:
+        result["error"] = exc
+
+
+async def _put(q: "queue.Queue", item, sender: threading.Thread) -> None:
+    """Hand *item* to the sender, waiting off-loop while its queue is full."""
+    try:
+        q.put_nowait(item)
+        return
+    except queue.Full:
+        pass
+
+    def _blocking_put():
+        while sender.is_alive():
+            try:
+                q.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    if not await asyncio.get_running_loop().run_in_executor(None, _blocking_put):
+        raise UploadError("Proxmox closed the upload connection")
+
+
+# ── public entry point ──────────────────────────────────────────────────────
+
+async def stream_upload(
+    proxmox,
+    node: str,
+    storage: str,
+    stream: AsyncIterator[bytes],
+    request_content_type: str,
+    request_length: Optional[int],
+    upload_id: str,
+    content: Optional[str] = None,
+) -> Dict:
+    """Pipe a multipart request body to Proxmox storage.
+
+    Returns ``{"upid", "filename", "size", "sha256", "upload_id"}``. Raises
+    UploadError for malformed requests and Exception for PVE-side failures.
+    """
+    _prune_progress()
+    if not request_length:
+        raise UploadError("Content-Length header is required for uploads")
+    boundary = _boundary(request_content_type)
+    _set_progress(upload_id, status="receiving", progress=0, message="Waiting for upload data...",
+                  bytes_sent=0, bytes_total=request_length)
+
+    it = stream.__aiter__()
+    buf = b""
+    while True:
+        parsed = _split_prefix(buf, boundary)
+        if parsed is not None:
+            break
+        if len(buf) > _MAX_PREFIX:
+            raise UploadError("Multipart form fields before the file are too large")
+        try:
+            buf += await it.__anext__()
+        except StopAsyncIteration:
+            raise UploadError("Upload ended before any file data")
+
+    data_offset, fields, raw_filename = parsed
+    # Both values are written into the multipart headers sent to PVE — keep
+    # them to a safe character set (no quotes, CR/LF or path separators)
+    filename = re.sub(r"[^a-zA-Z0-9._-]", "_", os.path.basename(raw_filename.replace("\\", "/")))
+    if not filename.strip("._"):
+        raise UploadError("Uploaded file has no name")
+    content = re.sub(r"[^a-z]", "", content or fields.get("content") or "") or content_type_for(filename)
+
+    new_prefix = _build_prefix(boundary, content, filename)
+    out_length = request_length - data_offset + len(new_prefix)
+    file_estimate = max(out_length - len(new_prefix), 1)
+
+    started = time.time()
+    sent = {"bytes": 0, "last": 0.0}
+
+    def _on_sent(n: int) -> None:
+        sent["bytes"] += n
+        now = time.time()
+        if now - sent["last"] < 0.5 and sent["bytes"] < out_length:
+            return
+        sent["last"] = now
+        done = max(sent["bytes"] - len(new_prefix), 0)
+        pct = min(int(done * 100 / file_estimate), 99)
+        mb = done / (1024 * 1024)
+        speed = mb / (now - started) if now > started else 0
+        _set_progress(upload_id, status="uploading", progress=pct, bytes_sent=done,
+                      message=f"Uploading: {pct}% ({mb:.1f} MB @ {speed:.1f} MB/s)")
+
+    q: "queue.Queue" = queue.Queue(maxsize=_QUEUE_CHUNKS)
+    result: dict = {}
+    body = _QueueBody(q, out_length, _on_sent)
+    sender = threading.Thread(
+        target=_post_to_pve,
+        args=(proxmox, node, storage, f"multipart/form-data; boundary={boundary.decode()}", body, result),
+        daemon=True, name=f"pve-upload-{upload_id[:8]}",
+    )
+    hasher = _PayloadHasher(boundary)
+    _set_progress(upload_id, status="uploading", filename=filename, content=content,
+                  message=f"Uploading {filename}...")
+    sender.start()
+
+    try:
+        q.put_nowait(new_prefix)
+        rest = buf[data_offset:]
+        hasher.update(rest)
+        pending = bytearray(rest)
+        received = len(buf)
+        async for chunk in it:
+            received += len(chunk)
+            hasher.update(chunk)
+            pending += chunk
+            if len(pending) >= _CHUNK_SIZE:
+                await _put(q, bytes(pending), sender)
+                pending.clear()
+        if pending:
+            await _put(q, bytes(pending), sender)
+        if received != request_length:
+            raise UploadError(f"Upload truncated ({received} of {request_length} bytes)")
+        await _put(q, _DONE, sender)
+    except BaseException as exc:
+        # Abort the outbound request: we are the only producer, so after
+        # draining the queue the sender is guaranteed to pick up the error.
+        while True:
+            try:
+                q.get_nowait()
+            except queue.Empty:
+                break
+        q.put_nowait(exc if isinstance(exc, Exception) else UploadError("Upload aborted"))
+        # If PVE rejected the upload, report its error rather than the broken pipe
+        pve_error = None if sender.is_alive() else result.get("error")
+        _set_progress(upload_id, status="error", progress=0, message=f"Upload failed: {pve_error or exc}")
+        if pve_error is not None:
+            raise pve_error from exc
+        raise
+
+    _set_progress(upload_id, status="processing", progress=99,
+                  message="Upload transferred! Waiting for Proxmox to write to disk...")
+    await asyncio.get_running_loop().run_in_executor(None, sender.join)
+
+    if "error" in result:
+        _set_progress(upload_id, status="error", progress=0, message=f"Upload failed: {result['error']}")
+        raise result["error"]
+
+    elapsed = time.time() - started
+    checksum = hasher.sha256.hexdigest()
+    logger.info("Streamed %s (%d bytes, sha256 %s) to %s:%s in %.1fs",
+                filename, hasher.size, checksum, node, storage, elapsed)
+    _set_progress(upload_id, status="completed", progress=100, bytes_sent=hasher.size,
+                  message="Upload completed successfully", checksum=checksum, upid=result.get("upid"))
+    return {"upid": result.get("upid"), "filename": filename, "size": hasher.size,
+            "sha256": checksum, "upload_id": upload_id}
@@ -1,9 +1,17 @@
-"""Task tracker — keeps an in-memory registry of all Proxmox UPIDs initiated through Depl0y."""
+"""Task tracker — keeps an in-memory registry of all Proxmox UPIDs initiated through Depl0y.
+
+Running tasks are polled in one batch: a single ``nodes/{node}/tasks?source=active``
+call per node decides which tracked UPIDs are still running, and only tasks
+that dropped off that list get an individual status call. Task logs are read
+incrementally (the next line offset is kept per UPID) so each poll downloads
+only the lines written since the last one. Completed tasks are written to the
+``task_history`` table so history survives restarts.
+"""
 import re
 import threading
+import time
 import logging
-from collections import deque
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
 
 logger = logging.getLogger(__name__)
 
@@ -39,18 +47,25 @@ _TASK_DURATIONS = {
 class TaskTracker:
     """Tracks all Proxmox task UPIDs initiated through Depl0y.
 
-    Thread-safe in-memory registry. A background poller thread calls the
-    Proxmox API every 5 s to update the status of running tasks.
+    Thread-safe in-memory registry of running tasks. A background poller
+    thread refreshes them every 5 s; completed tasks move to the
+    ``task_history`` table.
     """
 
-    def __init__(self, max_history: int = 500):
+    # Log lines fetched per request when catching up on a task log.
+    _LOG_PAGE = 1000
+
+    def __init__(self, history_days: int = 90):
         self._tasks: dict[str, dict] = {}       # upid → task_info
-        self._history: deque = deque(maxlen=max_history)
+        self._history_days = history_days
+        self._last_prune = 0.0
         # Progress cache for tasks not registered through depl0y (e.g. a
         # migration started directly from the Proxmox UI). Keyed by UPID →
         # (timestamp, pct). TTL keeps us from hammering PVE on every UI poll.
         self._ext_progress: dict[str, tuple[float, float]] = {}
         self._ext_progress_ttl = 8.0  # seconds
+        # Incremental log reads: UPID → (last line number read, highest % seen)
+        self._log_state: dict[str, tuple[int, float | None]] = {}
         self._lock = threading.Lock()
         self._poll_thread: threading.Thread | None = None
         self._stop_event = threading.Event()
@@ -90,18 +105,9 @@ class TaskTracker:
 
     def update_status(self, upid: str, status: str, exit_status: str | None = None) -> None:
         """Update task status (called by background poller or manually)."""
-        with self._lock:
-            task = self._tasks.get(upid)
-            if task is None:
-                return
-            task["status"] = status
-            if exit_status is not None:
-                task["exit_status"] = exit_status
-            if status != "running" and task["finished_at"] is None:
-                task["finished_at"] = datetime.now(timezone.utc).isoformat()
-                # Move completed task to history
-                self._history.appendleft(dict(task))
-                del self._tasks[upid]
+        done = self._set_status(upid, status, exit_status)
+        if done is not None:
+            self._persist_history([done])
 
     def get_running(self) -> list[dict]:
         """Return all currently running tasks."""
@@ -110,21 +116,39 @@ class TaskTracker:
 
     def get_history(self, limit: int = 50, user_id: int | None = None) -> list[dict]:
         """Return recent completed tasks, optionally filtered by user."""
-        with self._lock:
-            items = list(self._history)
-        if user_id is not None:
-            items = [t for t in items if t.get("user_id") == user_id]
-        return items[:limit]
+        from app.core.database import SessionLocal
+        from app.models import TaskHistory
+
+        db = SessionLocal()
+        try:
+            q = db.query(TaskHistory)
+            if user_id is not None:
+                q = q.filter(TaskHistory.user_id == user_id)
+            rows = q.order_by(TaskHistory.finished_at.desc(), TaskHistory.id.desc()).limit(limit).all()
+            return [self._row_to_dict(r) for r in rows]
+        except Exception as exc:
+            logger.error("TaskTracker history query failed: %s", exc)
+            return []
+        finally:
+            db.close()
 
     def get_task(self, upid: str) -> dict | None:
         """Return a single task by UPID (running or history)."""
         with self._lock:
             if upid in self._tasks:
                 return dict(self._tasks[upid])
-            for t in self._history:
-                if t["upid"] == upid:
-                    return dict(t)
-        return None
+        from app.core.database import SessionLocal
+        from app.models import TaskHistory
+
+        db = SessionLocal()
+        try:
+            row = db.query(TaskHistory).filter(TaskHistory.upid == upid).first()
+            return self._row_to_dict(row) if row is not None else None
+        except Exception as exc:
+            logger.error("TaskTracker history lookup failed for %s: %s", upid, exc)
+            return None
+        finally:
+            db.close()
 
     def estimate_progress(self, task: dict) -> float:
         """Return an estimated 0–100 progress percentage for a running task.
@@ -172,67 +196,181 @@ class TaskTracker:
             if not running:
                 logger.debug("TaskTracker: no running tasks — poller exiting")
                 return
-            for task in running:
-                self._poll_one(task)
+            try:
+                self._poll_batch(running)
+            except Exception as exc:
+                logger.debug("TaskTracker poll error: %s", exc)
 
-    def _poll_one(self, task: dict) -> None:
-        try:
-            from app.core.database import SessionLocal
-            from app.models import ProxmoxHost
-            from app.services.proxmox import ProxmoxService
+    def _poll_batch(self, running: list[dict]) -> None:
+        """Refresh every running task with one active-task listing per node."""
+        from app.core.database import SessionLocal
+        from app.models import ProxmoxHost
+        from app.services.proxmox import ProxmoxService
 
-            db = SessionLocal()
-            try:
-                host = db.query(ProxmoxHost).filter(
-                    ProxmoxHost.id == task["host_id"],
+        by_host: dict[int, dict[str, list[dict]]] = {}
+        for task in running:
+            by_host.setdefault(task["host_id"], {}).setdefault(task["node"], []).append(task)
+
+        finished: list[dict] = []
+        db = SessionLocal()
+        try:
+            hosts = {
+                h.id: h for h in db.query(ProxmoxHost).filter(
+                    ProxmoxHost.id.in_(list(by_host)),
                     ProxmoxHost.is_active == True,
-                ).first()
+                ).all()
+            }
+            for host_id, nodes in by_host.items():
+                host = hosts.get(host_id)
                 if host is None:
-                    return
-                pve = ProxmoxService(host).proxmox
-                result = pve.nodes(task["node"]).tasks(task["upid"]).status.get()
+                    continue
+                try:
+                    pve = ProxmoxService(host).proxmox
+                except Exception as exc:
+                    logger.debug("TaskTracker client for host %s failed: %s", host_id, exc)
+                    continue
+                for node, tasks in nodes.items():
+                    try:
+                        active = {t.get("upid") for t in pve.nodes(node).tasks.get(source="active")}
+                    except Exception as exc:
+                        logger.debug("TaskTracker active-task list for %s/%s failed: %s", host_id, node, exc)
+                        continue
+                    for task in tasks:
+                        done = self._refresh_task(pve, task, still_active=task["upid"] in active)
+                        if done is not None:
+                            finished.append(done)
+        finally:
+            db.close()
+        self._persist_history(finished)
+
+    def _refresh_task(self, pve, task: dict, still_active: bool) -> dict | None:
+        """Update one task; returns its history record if it has finished."""
+        upid = task["upid"]
+        try:
+            if not still_active:
+                # Dropped off the active list — one status call for the exit code
+                result = pve.nodes(task["node"]).tasks(upid).status.get()
                 status = result.get("status", "unknown")
-                exit_status = result.get("exitstatus")
                 if status != "running":
-                    self.update_status(task["upid"], status, exit_status)
-                    return
+                    return self._set_status(upid, status, result.get("exitstatus"))
+            pct = self._read_log_progress(pve, task["node"], upid, task.get("task_type", ""))
+            if pct is not None:
+                with self._lock:
+                    t = self._tasks.get(upid)
+                    if t is not None:
+                        # Monotonic — never let parsed progress move backwards
+                        t["log_progress"] = max(t.get("log_progress") or 0.0, pct)
+        except Exception as exc:
+            logger.debug("TaskTracker poll error for %s: %s", upid, exc)
+        return None
 
-                # Still running — try to parse real progress from the task log.
-                try:
-                    log_tail = pve.nodes(task["node"]).tasks(task["upid"]).log.get(
-                        start=0, limit=200,
-                    )
-                    pct = self._parse_log_progress(log_tail, task.get("task_type", ""))
-                    if pct is not None:
-                        with self._lock:
-                            t = self._tasks.get(task["upid"])
-                            if t is not None:
-                                # Monotonic — never let parsed progress move backwards
-                                prev = t.get("log_progress") or 0.0
-                                t["log_progress"] = max(prev, pct)
-                except Exception as e:
-                    logger.debug("TaskTracker progress parse for %s: %s", task.get("upid"), e)
-            finally:
-                db.close()
+    def _read_log_progress(self, pve, node: str, upid: str, task_type: str) -> float | None:
+        """Fetch only the log lines written since the last read and return the best % so far."""
+        with self._lock:
+            offset, best = self._log_state.get(upid, (0, None))
+        entries = pve.nodes(node).tasks(upid).log.get(start=offset, limit=self._LOG_PAGE)
+        new = [
+            e for e in (entries or [])
+            if isinstance(e, dict) and (e.get("n") or 0) > offset and e.get("t") != "no content"
+        ]
+        if new:
+            offset = max(e["n"] for e in new)
+            pct = self._parse_log_progress(new, task_type)
+            if pct is not None:
+                best = pct if best is None else max(best, pct)
+        with self._lock:
+            self._log_state[upid] = (offset, best)
+        return best
+
+    def _set_status(self, upid: str, status: str, exit_status: str | None) -> dict | None:
+        """Apply a status change; returns the history record when the task finished."""
+        with self._lock:
+            task = self._tasks.get(upid)
+            if task is None:
+                return None
+            task["status"] = status
+            if exit_status is not None:
+                task["exit_status"] = exit_status
+            if status == "running" or task["finished_at"] is not None:
+                return None
+            task["finished_at"] = datetime.now(timezone.utc).isoformat()
+            del self._tasks[upid]
+            self._log_state.pop(upid, None)
+            return dict(task)
+
+    # ── History persistence ───────────────────────────────────────────────────
+
+    def _persist_history(self, tasks: list[dict]) -> None:
+        """Insert completed tasks into task_history in one transaction."""
+        if not tasks:
+            return
+        from sqlalchemy import delete
+        from app.core.database import engine
+        from app.models import TaskHistory
+
+        rows = [
+            {
+                "upid": t["upid"],
+                "host_id": t.get("host_id"),
+                "node": t.get("node"),
+                "description": t.get("description"),
+                "user_id": t.get("user_id"),
+                "vmid": _as_int(t.get("vmid")),
+                "task_type": t.get("task_type"),
+                "status": t.get("status") or "unknown",
+                "exit_status": t.get("exit_status"),
+                "registered_at": _parse_ts(t.get("registered_at")),
+                "started_at": _parse_ts(t.get("started_at")),
+                "finished_at": _parse_ts(t.get("finished_at")) or datetime.utcnow(),
+            }
+            for t in tasks
+        ]
+        try:
+            with engine.begin() as conn:
+                conn.execute(delete(TaskHistory).where(TaskHistory.upid.in_([r["upid"] for r in rows])))
+                conn.execute(TaskHistory.__table__.insert(), rows)
+                if time.monotonic() - self._last_prune > 3600:
+                    self._last_prune = time.monotonic()
+                    cutoff = datetime.utcnow() - timedelta(days=self._history_days)
+                    conn.execute(delete(TaskHistory).where(TaskHistory.finished_at < cutoff))
         except Exception as exc:
-            logger.debug("TaskTracker poll error for %s: %s", task.get("upid"), exc)
+            logger.error("TaskTracker failed to persist %d history row(s): %s", len(rows), exc)
+
+    @staticmethod
+    def _row_to_dict(row) -> dict:
+        def _iso(dt):
+            return dt.replace(tzinfo=timezone.utc).isoformat() if dt else None
+        return {
+            "upid": row.upid,
+            "host_id": row.host_id,
+            "node": row.node,
+            "description": row.description,
+            "user_id": row.user_id,
+            "vmid": row.vmid,
+            "task_type": row.task_type,
+            "status": row.status,
+            "exit_status": row.exit_status,
+            "registered_at": _iso(row.registered_at),
+            "started_at": _iso(row.started_at),
+            "finished_at": _iso(row.finished_at),
+        }
 
     # Interactive / shell-style tasks have no meaningful progress
     _NO_PROGRESS_TYPES = frozenset({
         "vncshell", "vncproxy", "spiceshell", "spiceproxy", "termproxy",
     })
 
-    def progress_for_external(self, upid: str, host_id: int, node: str, started_at_ts: float | None, task_type: str) -> float | None:
+    def progress_for_external(self, upid: str, host_id: int, node: str, started_at_ts: float | None,
+                              task_type: str, pve=None) -> float | None:
         """Compute a live progress % for a task NOT registered through depl0y.
         Used for tasks pulled straight from Proxmox's cluster/node task list
-        (source=proxmox). Fetches the task log with a short TTL cache and
+        (source=proxmox). Reads new task log lines (short TTL cache) and
         parses the actual percentage out, falling back to a conservative
         time-based estimate. Returns None for interactive/shell tasks where
-        progress is not meaningful.
+        progress is not meaningful. Pass *pve* to reuse the caller's client.
         """
         if task_type in self._NO_PROGRESS_TYPES:
             return None
-        import time
         now = time.time()
         # TTL-cached parsed progress
         cached = self._ext_progress.get(upid)
@@ -242,21 +380,22 @@ class TaskTracker:
         prev = self._ext_progress.get(upid, (0.0, 0.0))[1]
         parsed = None
         try:
-            from app.core.database import SessionLocal
-            from app.models import ProxmoxHost
-            from app.services.proxmox import ProxmoxService
-            db = SessionLocal()
-            try:
-                host = db.query(ProxmoxHost).filter(
-                    ProxmoxHost.id == host_id,
-                    ProxmoxHost.is_active == True,
-                ).first()
-                if host is not None:
-                    pve = ProxmoxService(host).proxmox
-                    log_tail = pve.nodes(node).tasks(upid).log.get(start=0, limit=200)
-                    parsed = self._parse_log_progress(log_tail, task_type)
-            finally:
-                db.close()
+            if pve is None:
+                from app.core.database import SessionLocal
+                from app.models import ProxmoxHost
+                from app.services.proxmox import ProxmoxService
+                db = SessionLocal()
+                try:
+                    host = db.query(ProxmoxHost).filter(
+                        ProxmoxHost.id == host_id,
+                        ProxmoxHost.is_active == True,
+                    ).first()
+                    if host is not None:
+                        pve = ProxmoxService(host).proxmox
+                finally:
+                    db.close()
+            if pve is not None:
+                parsed = self._read_log_progress(pve, node, upid, task_type)
         except Exception as exc:
             logger.debug("external progress fetch failed for %s: %s", upid, exc)
 
@@ -281,6 +420,9 @@ class TaskTracker:
         for upid in list(self._ext_progress.keys()):
             if upid not in keep_upids:
                 self._ext_progress.pop(upid, None)
+                with self._lock:
+                    if upid not in self._tasks:
+                        self._log_state.pop(upid, None)
 
     @staticmethod
     def _parse_log_progress(log_entries, task_type: str) -> float | None:
@@ -333,5 +475,25 @@ class TaskTracker:
         return "unknown"
 
 
+def _parse_ts(value) -> datetime | None:
+    """ISO timestamp (as stored on task dicts) → naive UTC datetime for the DB."""
+    if not value:
+        return None
+    try:
+        dt = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return dt
+
+
+def _as_int(value) -> int | None:
+    try:
+        return int(value) if value not in (None, "") else None
+    except (TypeError, ValueError):
+        return None
+
+
 # Singleton instance
 task_tracker = TaskTracker()
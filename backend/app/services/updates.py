@@ -4,7 +4,7 @@ from sqlalchemy.orm import Session
 from app.models import VirtualMachine, UpdateLog, OSType
 from app.services.proxmox import ProxmoxService
 from app.models import ProxmoxHost, ProxmoxNode
-import paramiko
+from app.services.ssh_pool import PooledSSHClient, ssh_pool
 import logging
 from datetime import datetime
 
@@ -14,8 +14,9 @@ logger = logging.getLogger(__name__)
 class UpdateService:
     """Service for managing VM updates"""
 
-    def __init__(self, db: Session):
+    def __init__(self, db: Session, ssh_timeout: float = 30):
         self.db = db
+        self.ssh_timeout = ssh_timeout
 
     def _get_ssh_password(self, vm: VirtualMachine) -> Optional[str]:
         """Return decrypted password, falling back to raw value for legacy records"""
@@ -27,23 +28,17 @@ class UpdateService:
         except Exception:
             return vm.password  # legacy unencrypted
 
-    def _connect_ssh(self, ip: str, username: str, password: Optional[str], ssh_key: Optional[str] = None) -> Optional[paramiko.SSHClient]:
-        """Create SSH connection with explicit credentials"""
+    def _connect_ssh(self, ip: str, username: str, password: Optional[str], ssh_key: Optional[str] = None) -> Optional[PooledSSHClient]:
+        """Lease a pooled SSH connection with explicit credentials"""
         try:
-            client = paramiko.SSHClient()
-            client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
             if ssh_key:
-                from io import StringIO
-                pkey = paramiko.RSAKey.from_private_key(StringIO(ssh_key))
-                client.connect(hostname=ip, username=username, pkey=pkey, timeout=30)
-            else:
-                client.connect(hostname=ip, username=username, password=password, timeout=30)
-            return client
+                return ssh_pool.client(ip, username, pkey=ssh_key, timeout=self.ssh_timeout)
+            return ssh_pool.client(ip, username, password=password, timeout=self.ssh_timeout)
         except Exception as e:
             logger.error(f"SSH connection to {ip} failed: {e}")
             return None
 
-    def _get_ssh_client(self, vm: VirtualMachine, override_ip: str = None, override_user: str = None, override_pass: str = None) -> Optional[paramiko.SSHClient]:
+    def _get_ssh_client(self, vm: VirtualMachine, override_ip: str = None, override_user: str = None, override_pass: str = None) -> Optional[PooledSSHClient]:
         """Create SSH connection to VM, using overrides if provided"""
         ip = override_ip or vm.ip_address
         username = override_user or vm.username
@@ -53,7 +48,7 @@ class UpdateService:
             return None
         return self._connect_ssh(ip, username, password, vm.ssh_key if not override_pass else None)
 
-    def _sudo_exec(self, client: paramiko.SSHClient, cmd: str, password: Optional[str] = None):
+    def _sudo_exec(self, client: PooledSSHClient, cmd: str, password: Optional[str] = None):
         """Execute a sudo command, supplying password via stdin (sudo -S) when available.
 
         Works with both NOPASSWD sudo (password is ignored) and password-required sudo.
@@ -0,0 +1,248 @@
+"""Scheduled VM update checks and security scans.
+
+A run walks every VM with an IP address and SSH credentials in id order and
+scans them on a bounded worker pool:
+
+- at most ``max_workers`` VMs are scanned at once, each with its own DB
+  session and a short SSH connect timeout so unreachable guests fail fast
+- a VM that runs longer than ``vm_timeout`` seconds is abandoned and counted
+  as timed out; its worker finishes in the background but no longer holds up
+  the run
+- no new VM is started once the run has used ``budget`` seconds. The id of
+  the last VM dispatched is stored as a cursor in ``system_settings`` and the
+  next run starts after it; a run that reaches the end resets the cursor
+- results are written to ``vm_scan_cache`` ``batch_size`` at a time, one
+  query and one commit per batch, together with the cursor
+"""
+import json
+import logging
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class _ScanKind:
+    setting: str            # system_settings key holding the cursor
+    run: Callable[[Any, int], Any]                            # (service, vm_id) → raw result
+    to_cache: Callable[[Any], Optional[Tuple[str, str]]]     # result → (severity, summary) or None
+
+
+def _updates_cache(result) -> Optional[Tuple[str, str]]:
+    if not result:
+        return None
+    count = result["updates_available"]
+    return ("warning" if count > 0 else "ok"), f"{count} update(s) available"
+
+
+def _security_cache(result) -> Optional[Tuple[str, str]]:
+    if not result or "error" in result:
+        return None
+    sec = result.get("os_updates", {}).get("security_updates", 0)
+    failed = result.get("failed_ssh_attempts", 0)
+    return result.get("severity", "ok"), f"{sec} security updates, {failed} failed SSH logins"
+
+
+_KINDS: Dict[str, _ScanKind] = {
+    "updates": _ScanKind("auto_update_check_cursor",
+                         lambda svc, vm_id: svc.check_updates(vm_id), _updates_cache),
+    "security": _ScanKind("auto_security_scan_cursor",
+                          lambda svc, vm_id: svc.scan_security(vm_id), _security_cache),
+}
+
+
+class VmScanRunner:
+    """Bounded, time-budgeted runner for the scheduled update / security scans."""
+
+    def __init__(self, max_workers: int = 16, vm_timeout: float = 300.0, budget: float = 1800.0,
+                 connect_timeout: float = 10.0, batch_size: int = 25):
+        self._max_workers = max_workers
+        self._vm_timeout = vm_timeout
+        self._budget = budget
+        self._connect_timeout = connect_timeout
+        self._batch_size = batch_size
+        self._lock = threading.Lock()
+        self._stopping = False
+        self._last: Dict[str, Dict[str, Any]] = {}
+
+    # ── public API ───────────────────────────────────────────────────────────
+
+    def run(self, scan_type: str) -> Dict[str, Any]:
+        """Scan the next slice of VMs for *scan_type* ("updates" or "security").
+
+        Returns a summary whose ``complete`` flag is False when the time budget
+        ran out before the last VM, i.e. when a follow-up run should resume.
+        """
+        from app.core.database import SessionLocal
+        from app.models import VirtualMachine
+
+        kind = _KINDS[scan_type]
+        started = time.monotonic()
+        db = SessionLocal()
+        try:
+            cursor = _get_cursor(db, kind.setting)
+            vm_ids = [
+                row[0] for row in
+                db.query(VirtualMachine.id)
+                .filter(
+                    VirtualMachine.ip_address.isnot(None),
+                    VirtualMachine.password.isnot(None),
+                    VirtualMachine.id > cursor,
+                )
+                .order_by(VirtualMachine.id)
+                .all()
+            ]
+            summary = {
+                "scan_type": scan_type, "started_at": datetime.utcnow().isoformat(),
+                "cursor_start": cursor, "eligible": len(vm_ids),
+                "scanned": 0, "failed": 0, "timed_out": 0, "written": 0,
+            }
+            pending: List[Tuple[int, Any, Tuple[str, str]]] = []
+            last_dispatched = cursor
+            remaining = list(reversed(vm_ids))
+            running: Dict[Future, Tuple[int, List[float]]] = {}
+            pool = ThreadPoolExecutor(max_workers=self._max_workers, thread_name_prefix=f"scan-{scan_type}")
+            try:
+                while remaining or running:
+                    out_of_time = self._stopping or time.monotonic() - started > self._budget
+                    while remaining and not out_of_time and len(running) < self._max_workers:
+                        vm_id = remaining.pop()
+                        began: List[float] = []
+                        running[pool.submit(self._scan_one, kind, vm_id, began)] = (vm_id, began)
+                        last_dispatched = vm_id
+                    if out_of_time:
+                        remaining = []
+                    if not running:
+                        break
+                    done, _ = wait(list(running), timeout=1.0, return_when=FIRST_COMPLETED)
+                    for fut in done:
+                        vm_id, _ = running.pop(fut)
+                        try:
+                            result = fut.result()
+                        except Exception as e:
+                            logger.error(f"Auto {scan_type} scan failed for VM {vm_id}: {e}")
+                            result = None
+                        cache = kind.to_cache(result)
+                        if cache is None:
+                            summary["failed"] += 1
+                            continue
+                        summary["scanned"] += 1
+                        pending.append((vm_id, result, cache))
+                    now = time.monotonic()
+                    for fut, (vm_id, began) in list(running.items()):
+                        if began and now - began[0] > self._vm_timeout:
+                            # The worker cannot be interrupted; stop waiting for it
+                            del running[fut]
+                            summary["timed_out"] += 1
+                            logger.warning(f"Auto {scan_type} scan of VM {vm_id} exceeded {self._vm_timeout:.0f}s — skipped")
+                    if len(pending) >= self._batch_size:
+                        summary["written"] += _write_batch(db, scan_type, pending, kind.setting, last_dispatched)
+                        pending = []
+            finally:
+                pool.shutdown(wait=False, cancel_futures=True)
+
+            complete = not self._stopping and last_dispatched == (vm_ids[-1] if vm_ids else cursor)
+            summary["written"] += _write_batch(db, scan_type, pending, kind.setting,
+                                               0 if complete else last_dispatched)
+            summary.update({
+                "complete": complete,
+                "cursor_end": 0 if complete else last_dispatched,
+                "duration_seconds": round(time.monotonic() - started, 1),
+            })
+        finally:
+            db.close()
+
+        with self._lock:
+            self._last[scan_type] = summary
+        logger.info(
+            f"Auto {scan_type} scan: {summary['scanned']} ok, {summary['failed']} failed, "
+            f"{summary['timed_out']} timed out in {summary['duration_seconds']}s"
+            + ("" if summary["complete"] else f" — budget reached, resuming after VM {summary['cursor_end']}")
+        )
+        return summary
+
+    def stop(self) -> None:
+        """Stop dispatching VMs; the cursor keeps the position for the next start."""
+        self._stopping = True
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "max_workers": self._max_workers,
+                "vm_timeout_seconds": self._vm_timeout,
+                "budget_seconds": self._budget,
+                "connect_timeout_seconds": self._connect_timeout,
+                "batch_size": self._batch_size,
+                "last_runs": dict(self._last),
+            }
+
+    # ── internals ────────────────────────────────────────────────────────────
+
+    def _scan_one(self, kind: _ScanKind, vm_id: int, began: List[float]):
+        from app.core.database import SessionLocal
+        from app.services.updates import UpdateService
+
+        began.append(time.monotonic())
+        db = SessionLocal()
+        try:
+            return kind.run(UpdateService(db, ssh_timeout=self._connect_timeout), vm_id)
+        finally:
+            db.close()
+
+
+def _get_cursor(db, key: str) -> int:
+    from app.models import SystemSettings
+
+    row = db.query(SystemSettings).filter(SystemSettings.key == key).first()
+    try:
+        return int(row.value) if row else 0
+    except ValueError:
+        return 0
+
+
+def _write_batch(db, scan_type: str, batch: List[Tuple[int, Any, Tuple[str, str]]],
+                 cursor_key: str, cursor: int) -> int:
+    """Upsert *batch* into vm_scan_cache and store the cursor in one commit."""
+    from app.models import SystemSettings, VmScanCache
+
+    try:
+        now = datetime.utcnow()
+        existing = {}
+        if batch:
+            existing = {
+                row.vm_id: row for row in
+                db.query(VmScanCache)
+                .filter(VmScanCache.scan_type == scan_type,
+                        VmScanCache.vm_id.in_([vm_id for vm_id, _, _ in batch]))
+                .all()
+            }
+        for vm_id, result, (severity, summary) in batch:
+            cache = existing.get(vm_id)
+            if cache is None:
+                cache = VmScanCache(vm_id=vm_id, scan_type=scan_type)
+                db.add(cache)
+            cache.result_json = json.dumps(result)
+            cache.scanned_at = now
+            cache.severity = severity
+            cache.summary = summary
+        row = db.query(SystemSettings).filter(SystemSettings.key == cursor_key).first()
+        if row:
+            row.value = str(cursor)
+        else:
+            db.add(SystemSettings(key=cursor_key, value=str(cursor),
+                                  description=f"Last VM id reached by the scheduled {scan_type} scan"))
+        db.commit()
+        return len(batch)
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Failed to write {len(batch)} {scan_type} scan result(s): {e}")
+        return 0
+
+
+# Singleton instance
+vm_scan_runner = VmScanRunner()
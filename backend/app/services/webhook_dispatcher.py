@@ -1,5 +1,10 @@
-"""Webhook dispatcher — automatic event dispatch to configured webhook endpoints, Slack, and PagerDuty"""
-import httpx
+"""Webhook dispatcher — automatic event dispatch to configured webhook endpoints, Slack, and PagerDuty
+
+The HTTP calls themselves go through ``delivery_engine`` (pooled client,
+concurrent per-endpoint delivery, retries, circuit breaking and batched
+delivery logging); ``dispatch*`` methods queue deliveries and return without
+waiting for slow receivers.
+"""
 import hmac
 import hashlib
 import json
@@ -8,8 +13,12 @@ from datetime import datetime, timezone
 from typing import Optional, Any, Dict, List
 from sqlalchemy.orm import Session
 
+from app.services.delivery_engine import Delivery, delivery_engine
+
 logger = logging.getLogger(__name__)
 
+PAGERDUTY_EVENTS_URL = "https://events.pagerduty.com/v2/enqueue"
+
 # ── Canonical event type registry ────────────────────────────────────────────
 
 EVENT_TYPES: List[str] = [
@@ -54,10 +63,11 @@ class WebhookDispatcher:
         host_id: Optional[int] = None,
     ) -> None:
         """
-        Fetch all active webhooks matching this event_type, sign and POST to each,
-        record delivery result in webhook_deliveries table.
+        Fetch all active webhooks matching this event_type, sign each payload and
+        queue it on the delivery engine. Deliveries run concurrently and are
+        recorded in the webhook_deliveries table by the engine.
         """
-        from app.models.database import SystemSettings, WebhookDelivery
+        from app.models.database import SystemSettings
 
         setting = db.query(SystemSettings).filter(SystemSettings.key == "webhooks").first()
         if not setting or not setting.value:
@@ -77,7 +87,7 @@ class WebhookDispatcher:
         body_bytes = json.dumps(envelope).encode()
 
         for hook in webhooks:
-            if not hook.get("enabled", True):
+            if not hook.get("enabled", True) or not hook.get("url"):
                 continue
             hook_events = hook.get("events", [])
             # Accept if the hook subscribes to this event or to a wildcard category
@@ -95,50 +105,21 @@ class WebhookDispatcher:
                 "X-Depl0y-Event": event_type,
                 "X-Depl0y-Delivery": hook_id,
             }
+            content = body_bytes
             if sig:
                 headers["X-Depl0y-Signature"] = f"sha256={sig}"
-                envelope["signature"] = f"sha256={sig}"
-
-            status_code: Optional[int] = None
-            success = False
-            response_text = ""
-            try:
-                async with httpx.AsyncClient() as client:
-                    resp = await client.post(
-                        hook["url"],
-                        content=json.dumps(envelope).encode(),
-                        headers=headers,
-                        timeout=10,
-                    )
-                status_code = resp.status_code
-                success = 200 <= resp.status_code < 300
-                response_text = resp.text[:500]
-                logger.info(
-                    f"Webhook dispatched event={event_type} to {hook['url']}: HTTP {resp.status_code}"
-                )
-            except Exception as exc:
-                response_text = str(exc)[:500]
-                logger.error(
-                    f"Webhook dispatch failed event={event_type} to {hook.get('url')}: {exc}"
-                )
-
-            # Record delivery
-            try:
-                delivery = WebhookDelivery(
-                    webhook_id=hook_id,
-                    event=event_type,
-                    status_code=status_code,
-                    success=success,
-                    response_body=response_text,
-                )
-                db.add(delivery)
-                db.commit()
-            except Exception as exc:
-                logger.error(f"Failed to record webhook delivery: {exc}")
-                try:
-                    db.rollback()
-                except Exception:
-                    pass
+                # Per-hook copy so one hook's signature never leaks into the next body
+                content = json.dumps({**envelope, "signature": f"sha256={sig}"}).encode()
+
+            delivery_engine.submit(Delivery(
+                url=hook["url"],
+                body=content,
+                headers=headers,
+                endpoint=hook["url"],
+                webhook_id=hook_id,
+                event=event_type,
+            ))
+            logger.info(f"Webhook queued event={event_type} to {hook['url']}")
 
     def sign_payload(self, secret: str, payload_bytes: bytes) -> str:
         """HMAC-SHA256 signature of the payload bytes."""
@@ -156,20 +137,21 @@ class WebhookDispatcher:
         Post a message to an arbitrary Slack webhook URL.
         Returns True on success, False on failure.
         """
+        result = await delivery_engine.deliver(self._slack_delivery(webhook_url, message, blocks))
+        if result.success:
+            logger.info(f"Slack message sent: {message[:80]}")
+        return result.success
+
+    def _slack_delivery(self, webhook_url: str, message: str, blocks: Optional[list] = None) -> Delivery:
         payload: Dict[str, Any] = {"text": message}
         if blocks:
             payload["blocks"] = blocks
-        try:
-            async with httpx.AsyncClient() as client:
-                resp = await client.post(webhook_url, json=payload, timeout=10)
-            if resp.status_code >= 400:
-                logger.warning(f"Slack webhook returned HTTP {resp.status_code}: {resp.text[:200]}")
-                return False
-            logger.info(f"Slack message sent: {message[:80]}")
-            return True
-        except Exception as exc:
-            logger.error(f"Failed to send Slack message: {exc}")
-            return False
+        return Delivery(
+            url=webhook_url,
+            body=json.dumps(payload).encode(),
+            headers={"Content-Type": "application/json"},
+            endpoint=webhook_url,
+        )
 
     def _build_vm_slack_blocks(
         self,
@@ -289,7 +271,7 @@ class WebhookDispatcher:
                 except Exception:
                     pass
 
-        await self.send_slack_message(url, message, blocks=blocks)
+        delivery_engine.submit(self._slack_delivery(url, message, blocks))
 
     # ── PagerDuty integration ────────────────────────────────────────────────
 
@@ -312,8 +294,24 @@ class WebhookDispatcher:
           - "acknowledge" — acknowledge an existing incident (requires dedup_key)
           - "resolve"     — resolve an existing incident (requires dedup_key)
         """
-        pd_url = "https://events.pagerduty.com/v2/enqueue"
+        delivery = self._pagerduty_delivery(
+            routing_key, event_action, summary, severity, source, dedup_key, custom_details,
+        )
+        result = await delivery_engine.deliver(delivery)
+        if result.success:
+            logger.info(f"PagerDuty event sent: action={event_action} summary={summary[:60]}")
+        return result.success
 
+    def _pagerduty_delivery(
+        self,
+        routing_key: str,
+        event_action: str,
+        summary: str,
+        severity: str,
+        source: str,
+        dedup_key: Optional[str] = None,
+        custom_details: Optional[Dict[str, Any]] = None,
+    ) -> Delivery:
         payload: Dict[str, Any] = {
             "routing_key": routing_key,
             "event_action": event_action,
@@ -329,23 +327,16 @@ class WebhookDispatcher:
         if custom_details:
             payload["payload"]["custom_details"] = custom_details
 
-        try:
-            async with httpx.AsyncClient() as client:
-                resp = await client.post(
-                    pd_url,
-                    json=payload,
-                    headers={"Content-Type": "application/json"},
-                    timeout=15,
-                )
-            if resp.status_code in (200, 202):
-                logger.info(f"PagerDuty event sent: action={event_action} summary={summary[:60]}")
-                return True
-            else:
-                logger.warning(f"PagerDuty returned HTTP {resp.status_code}: {resp.text[:200]}")
-                return False
-        except Exception as exc:
-            logger.error(f"Failed to send PagerDuty event: {exc}")
-            return False
+        return Delivery(
+            url=PAGERDUTY_EVENTS_URL,
+            body=json.dumps(payload).encode(),
+            headers={"Content-Type": "application/json"},
+            endpoint=PAGERDUTY_EVENTS_URL,
+            # One integration's bad routing key must not trip the others
+            breaker_key=f"pagerduty:{hashlib.sha256(routing_key.encode()).hexdigest()[:12]}",
+            timeout=15,
+            ok_statuses=(200, 202),
+        )
 
     async def dispatch_pagerduty(
         self,
@@ -377,7 +368,7 @@ class WebhookDispatcher:
         }
         pd_severity = pd_severity_map.get(severity.lower(), "error")
 
-        await self.send_pagerduty_event(
+        delivery_engine.submit(self._pagerduty_delivery(
             routing_key=routing_key,
             event_action=event_action,
             summary=summary,
@@ -385,7 +376,7 @@ class WebhookDispatcher:
             source=source,
             dedup_key=dedup_key,
             custom_details=custom_details,
-        )
+        ))
 
     # ── Typed convenience dispatchers ────────────────────────────────────────
 
@@ -494,10 +485,12 @@ class WebhookDispatcher:
         rule_name: Optional[str] = None,
         threshold: Optional[float] = None,
         dedup_key: Optional[str] = None,
+        slack: bool = True,
     ) -> None:
         """
         Dispatch an alert.fired or alert.resolved event to webhooks, Slack,
         and PagerDuty (for critical alerts on trigger, resolve on resolved).
+        ``slack=False`` skips Slack when the caller posts a digest instead.
         """
         payload = {
             "title": title,
@@ -515,7 +508,8 @@ class WebhookDispatcher:
         fallback = f"{emoji} *[{severity.upper()}] {title}*\n{message}"
 
         await self.dispatch(db, event_type, payload)
-        await self.dispatch_slack(db, fallback, blocks=blocks, event_type=event_type)
+        if slack:
+            await self.dispatch_slack(db, fallback, blocks=blocks, event_type=event_type)
 
         # PagerDuty: trigger on critical alert.fired, resolve on alert.resolved
         if event_type == "alert.fired" and severity == "critical":
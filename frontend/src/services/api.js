@@ -955,6 +955,8 @@ export default {
     forceReplication: (hostId, jobId) => api.post(`/cluster/${hostId}/replication/${encodeURIComponent(jobId)}/schedule_now`),
     // Node evacuation (migrate all VMs off node)
     evacuateNode: (hostId, node, data) => api.post(`/cluster/${hostId}/nodes/${node}/evacuate`, data || {}),
+    getEvacuation: (hostId, jobId) => api.get(`/cluster/${hostId}/evacuations/${jobId}`),
+    cancelEvacuation: (hostId, jobId) => api.post(`/cluster/${hostId}/evacuations/${jobId}/cancel`),
     // Cluster-wide event log
     getLog: (hostId, max) => api.get(`/cluster/${hostId}/log`, { params: { max } }),
     // Cluster config / join
@@ -1054,8 +1056,12 @@ export default {
     bulkConfigPreview: (data) => api.post('/pve-vm/bulk/config/preview', data),
     // Migration
     bulkMigrate: (data) => api.post('/pve-vm/bulk/migrate', data),
+    // Bulk jobs — the endpoints above return { job_id }; results stream via `since`
+    listBulkJobs: () => api.get('/pve-vm/bulk/jobs'),
+    getBulkJob: (jobId, since = 0) => api.get(`/pve-vm/bulk/jobs/${jobId}`, { params: { since } }),
+    cancelBulkJob: (jobId) => api.post(`/pve-vm/bulk/jobs/${jobId}/cancel`),
     // Orphaned disks
-    getOrphanedDisks: (hostId) => api.get(`/pve-vm/orphaned-disks/${hostId}`),
+    getOrphanedDisks: (hostId, refresh = false) => api.get(`/pve-vm/orphaned-disks/${hostId}`, { params: { refresh } }),
     // Automation scripts — existing
     scriptCleanupSnapshots: (data) => api.post('/pve-vm/scripts/cleanup-snapshots', data),
     scriptTagCompliance: (data) => api.post('/pve-vm/scripts/tag-compliance', data),
@@ -0,0 +1,121 @@
+// Live state stream — one shared /events/stream connection per browser tab.
+//
+// Widgets subscribe to a topic (nodes, guests, tasks, alerts, notifications)
+// instead of running their own setInterval poller. The backend sends a
+// snapshot per topic followed by deltas; this module keeps the merged state
+// and hands every subscriber the full current item list on each change.
+
+const STREAM_URL = '/api/v1/events/stream'
+const MAX_RETRY_MS = 30_000
+
+const listeners = new Map()   // topic -> Set<callback>
+const state = new Map()       // topic -> Map<key, item>
+
+let controller = null
+let connectedTopics = ''
+let retryMs = 1000
+let reconnectTimer = null
+
+function wantedTopics() {
+  return [...listeners.keys()].filter(t => listeners.get(t).size > 0).sort().join(',')
+}
+
+function emit(topic) {
+  const items = [...(state.get(topic)?.values() || [])]
+  for (const cb of listeners.get(topic) || []) {
+    try { cb(items) } catch (e) { console.error('[liveEvents] listener error', e) }
+  }
+}
+
+function handleEvent(event, data) {
+  if (event === 'snapshot') {
+    state.set(data.topic, new Map(data.items.map(i => [i.key, i])))
+    // An empty not-yet-ready snapshot would flash "nothing found"; wait for the ready one
+    if (data.ready !== false || data.items.length) emit(data.topic)
+  } else if (event === 'delta') {
+    const items = state.get(data.topic) || new Map()
+    for (const key of data.remove || []) items.delete(key)
+    for (const item of data.upsert || []) items.set(item.key, item)
+    state.set(data.topic, items)
+    emit(data.topic)
+  }
+}
+
+function scheduleReconnect(delay) {
+  clearTimeout(reconnectTimer)
+  reconnectTimer = setTimeout(connect, delay)
+}
+
+async function connect() {
+  const topics = wantedTopics()
+  if (controller) controller.abort()
+  controller = null
+  connectedTopics = topics
+  if (!topics) return
+
+  const token = localStorage.getItem('access_token')
+  if (!token) { scheduleReconnect(5000); return }
+
+  const ctrl = new AbortController()
+  controller = ctrl
+  try {
+    const res = await fetch(`${STREAM_URL}?topics=${encodeURIComponent(topics)}`, {
+      headers: { Authorization: `Bearer ${token}`, Accept: 'text/event-stream' },
+      signal: ctrl.signal,
+    })
+    if (!res.ok || !res.body) throw new Error(`HTTP ${res.status}`)
+    retryMs = 1000
+
+    const reader = res.body.getReader()
+    const decoder = new TextDecoder()
+    let buffer = ''
+    for (;;) {
+      const { value, done } = await reader.read()
+      if (done) break
+      buffer += decoder.decode(value, { stream: true })
+      let sep
+      while ((sep = buffer.indexOf('\n\n')) >= 0) {
+        const frame = buffer.slice(0, sep)
+        buffer = buffer.slice(sep + 2)
+        let event = 'message'
+        let data = ''
+        for (const line of frame.split('\n')) {
+          if (line.startsWith('event: ')) event = line.slice(7)
+          else if (line.startsWith('data: ')) data += line.slice(6)
+        }
+        if (data) handleEvent(event, JSON.parse(data))
+      }
+    }
+    // Server ends streams periodically — reconnect straight away with a fresh token
+    if (controller === ctrl) scheduleReconnect(0)
+  } catch (e) {
+    if (ctrl.signal.aborted) return
+    scheduleReconnect(retryMs)
+    retryMs = Math.min(retryMs * 2, MAX_RETRY_MS)
+  }
+}
+
+function ensureConnection() {
+  const topics = wantedTopics()
+  if (topics === connectedTopics && controller) return
+  // Coalesce subscribe/unsubscribe bursts from a page mount into one reconnect
+  scheduleReconnect(50)
+}
+
+/**
+ * Subscribe to a live topic. `callback` receives the full item list (each item
+ * has a `key`) whenever the topic changes. Returns an unsubscribe function.
+ */
+export function subscribe(topic, callback) {
+  if (!listeners.has(topic)) listeners.set(topic, new Set())
+  listeners.get(topic).add(callback)
+  if (state.has(topic)) callback([...state.get(topic).values()])
+  ensureConnection()
+  return () => {
+    listeners.get(topic)?.delete(callback)
+    if (!listeners.get(topic)?.size) state.delete(topic)
+    ensureConnection()
+  }
+}
+
+export default { subscribe }